@@ -0,0 +1,45 @@
+"""billing: checkpointed daily runs
+
+Revision ID: billing_runs_1019i
+Revises: platform_leases_1019h
+Create Date: 2026-10-19
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "billing_runs_1019i"
+down_revision = "platform_leases_1019h"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS billing_runs (
+            run_key     TEXT PRIMARY KEY,
+            now_ts      BIGINT NOT NULL,
+            status      TEXT NOT NULL DEFAULT 'running',
+            started_ts  BIGINT NOT NULL,
+            finished_ts BIGINT NOT NULL DEFAULT 0,
+            attempts    INTEGER NOT NULL DEFAULT 1,
+            stats       TEXT NOT NULL DEFAULT '{}'
+        );
+        """
+    )
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS billing_run_owners (
+            run_key       TEXT NOT NULL,
+            owner_user_id BIGINT NOT NULL,
+            done_ts       BIGINT NOT NULL,
+            PRIMARY KEY (run_key, owner_user_id)
+        );
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS billing_run_owners;")
+    op.execute("DROP TABLE IF EXISTS billing_runs;")
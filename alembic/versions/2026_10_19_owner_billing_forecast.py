@@ -0,0 +1,49 @@
+"""billing: balance depletion forecast (24h / 3h warnings)
+
+Revision ID: owner_billing_forecast_1019j
+Revises: billing_runs_1019i
+Create Date: 2026-10-19
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "owner_billing_forecast_1019j"
+down_revision = "billing_runs_1019i"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS owner_billing_forecast (
+            owner_user_id    BIGINT PRIMARY KEY,
+            balance_kop      BIGINT NOT NULL DEFAULT 0,
+            burn_kop_per_min BIGINT NOT NULL DEFAULT 0,
+            depletes_ts      BIGINT NOT NULL DEFAULT 0,
+            warned_24h_ts    BIGINT NOT NULL DEFAULT 0,
+            warned_3h_ts     BIGINT NOT NULL DEFAULT 0,
+            dirty            BOOLEAN NOT NULL DEFAULT TRUE,
+            updated_ts       BIGINT NOT NULL DEFAULT 0
+        );
+        """
+    )
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_owner_billing_forecast_depletes
+        ON owner_billing_forecast (depletes_ts)
+        WHERE depletes_ts > 0;
+        """
+    )
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_owner_billing_forecast_dirty
+        ON owner_billing_forecast (owner_user_id)
+        WHERE dirty;
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS owner_billing_forecast;")
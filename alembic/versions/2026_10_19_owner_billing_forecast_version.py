@@ -0,0 +1,22 @@
+"""billing: owner state version (cabinet cache invalidation)
+
+Revision ID: owner_billing_version_1019k
+Revises: owner_billing_forecast_1019j
+Create Date: 2026-10-19
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "owner_billing_version_1019k"
+down_revision = "owner_billing_forecast_1019j"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE owner_billing_forecast ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0;")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE owner_billing_forecast DROP COLUMN IF EXISTS version;")
@@ -0,0 +1,32 @@
+"""platform: leader election lease
+
+Revision ID: platform_leases_1019h
+Revises: tg_shop_outbox_digest_idx_1019g
+Create Date: 2026-10-19
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "platform_leases_1019h"
+down_revision = "tg_shop_outbox_digest_idx_1019g"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS platform_leases (
+            name         TEXT PRIMARY KEY,
+            holder       TEXT NOT NULL,
+            acquired_ts  BIGINT NOT NULL,
+            heartbeat_ts BIGINT NOT NULL,
+            expires_ts   BIGINT NOT NULL
+        );
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS platform_leases;")
@@ -0,0 +1,54 @@
+"""referral: commission outbox (written in the topup / billing transaction)
+
+Revision ID: ref_commission_outbox_1019l
+Revises: owner_billing_version_1019k
+Create Date: 2026-10-19
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "ref_commission_outbox_1019l"
+down_revision = "owner_billing_version_1019k"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS ref_commission_outbox (
+            id          BIGSERIAL PRIMARY KEY,
+            event_key   TEXT NOT NULL UNIQUE,
+            user_id     BIGINT NOT NULL,
+            kind        TEXT NOT NULL,
+            amount_kop  BIGINT NOT NULL,
+            title       TEXT NOT NULL DEFAULT '',
+            details     TEXT NOT NULL DEFAULT '',
+            status      TEXT NOT NULL DEFAULT 'pending',
+            attempts    INTEGER NOT NULL DEFAULT 0,
+            created_ts  BIGINT NOT NULL,
+            next_try_ts BIGINT NOT NULL,
+            done_ts     BIGINT NOT NULL DEFAULT 0,
+            last_error  TEXT NULL
+        );
+        """
+    )
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_ref_commission_outbox_pending
+        ON ref_commission_outbox (next_try_ts, id)
+        WHERE status = 'pending';
+        """
+    )
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_ref_commission_outbox_done_ts
+        ON ref_commission_outbox (done_ts)
+        WHERE status = 'done';
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS ref_commission_outbox;")
@@ -0,0 +1,43 @@
+"""telegram_shop: admin orders keyset index + tab counters
+
+Revision ID: tg_shop_admin_orders_keyset_1019c
+Revises: tg_shop_stock_1019b
+Create Date: 2026-10-19
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "tg_shop_admin_orders_keyset_1019c"
+down_revision = "tg_shop_stock_1019b"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS telegram_shop_order_counters (
+            tenant_id     TEXT PRIMARY KEY,
+            new_cnt       INTEGER NOT NULL DEFAULT 0,
+            work_cnt      INTEGER NOT NULL DEFAULT 0,
+            done_cnt      INTEGER NOT NULL DEFAULT 0,
+            arch_cnt      INTEGER NOT NULL DEFAULT 0,
+            reconciled_ts INTEGER NOT NULL DEFAULT 0
+        );
+        """
+    )
+    # telegram_shop_orders велика і жива — індекс без блокування checkout-ів
+    with op.get_context().autocommit_block():
+        op.execute(
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tg_shop_orders_tenant_status_id
+            ON telegram_shop_orders (tenant_id, status, id DESC);
+            """
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_tg_shop_orders_tenant_status_id;")
+    op.execute("DROP TABLE IF EXISTS telegram_shop_order_counters;")
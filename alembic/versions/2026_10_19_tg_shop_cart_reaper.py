@@ -0,0 +1,50 @@
+"""telegram_shop: abandoned carts (reaper + reminders)
+
+Revision ID: tg_shop_cart_reaper_1019a
+Revises: merge_tg_shop_support_pay_0129m
+Create Date: 2026-10-19
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "tg_shop_cart_reaper_1019a"
+down_revision = "merge_tg_shop_support_pay_0129m"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        ALTER TABLE telegram_shop_cart_items
+            ADD COLUMN IF NOT EXISTS reminded_ts INTEGER NOT NULL DEFAULT 0;
+        """
+    )
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS telegram_shop_cart_settings (
+            tenant_id          TEXT PRIMARY KEY,
+            reap_enabled       BOOLEAN NOT NULL DEFAULT TRUE,
+            idle_days          INTEGER NOT NULL DEFAULT 30,
+            remind_enabled     BOOLEAN NOT NULL DEFAULT FALSE,
+            remind_after_hours INTEGER NOT NULL DEFAULT 24,
+            updated_ts         INTEGER NOT NULL DEFAULT 0
+        );
+        """
+    )
+    # кошики живі й великі — індекс без блокування записів
+    with op.get_context().autocommit_block():
+        op.execute(
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tg_shop_cart_updated_ts
+            ON telegram_shop_cart_items (updated_ts);
+            """
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_tg_shop_cart_updated_ts;")
+    op.execute("DROP TABLE IF EXISTS telegram_shop_cart_settings;")
+    op.execute("ALTER TABLE telegram_shop_cart_items DROP COLUMN IF EXISTS reminded_ts;")
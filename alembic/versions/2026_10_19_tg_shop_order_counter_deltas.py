@@ -0,0 +1,41 @@
+"""telegram_shop: append-only deltas for admin order counters
+
+Revision ID: tg_shop_order_counter_deltas_1019m
+Revises: ref_commission_outbox_1019l
+Create Date: 2026-10-19
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "tg_shop_order_counter_deltas_1019m"
+down_revision = "ref_commission_outbox_1019l"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # checkout лише дописує рядок; згортання в telegram_shop_order_counters — цикл звірки
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS telegram_shop_order_counter_deltas (
+            id          BIGSERIAL PRIMARY KEY,
+            tenant_id   TEXT NOT NULL,
+            new_d       INTEGER NOT NULL DEFAULT 0,
+            work_d      INTEGER NOT NULL DEFAULT 0,
+            done_d      INTEGER NOT NULL DEFAULT 0,
+            arch_d      INTEGER NOT NULL DEFAULT 0,
+            created_ts  INTEGER NOT NULL DEFAULT 0
+        );
+        """
+    )
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_tg_shop_order_counter_deltas_tenant
+        ON telegram_shop_order_counter_deltas (tenant_id, id);
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS telegram_shop_order_counter_deltas;")
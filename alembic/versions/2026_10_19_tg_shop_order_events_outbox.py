@@ -0,0 +1,76 @@
+"""telegram_shop: order event history + notification outbox
+
+Revision ID: tg_shop_events_outbox_1019e
+Revises: tg_shop_user_orders_idx_1019d
+Create Date: 2026-10-19
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "tg_shop_events_outbox_1019e"
+down_revision = "tg_shop_user_orders_idx_1019d"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS telegram_shop_order_events (
+            id            BIGSERIAL PRIMARY KEY,
+            tenant_id     TEXT NOT NULL,
+            order_id      INTEGER NOT NULL,
+            kind          TEXT NOT NULL,
+            old_value     TEXT NULL,
+            new_value     TEXT NULL,
+            actor_user_id BIGINT NULL,
+            ts            INTEGER NOT NULL
+        );
+        """
+    )
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_tg_shop_order_events_order
+        ON telegram_shop_order_events (tenant_id, order_id, id);
+        """
+    )
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS telegram_shop_outbox (
+            id           BIGSERIAL PRIMARY KEY,
+            tenant_id    TEXT NOT NULL,
+            chat_id      BIGINT NOT NULL,
+            kind         TEXT NOT NULL DEFAULT '',
+            ref_id       BIGINT NOT NULL DEFAULT 0,
+            text         TEXT NOT NULL,
+            parse_mode   TEXT NULL,
+            reply_markup TEXT NULL,
+            status       TEXT NOT NULL DEFAULT 'pending',
+            attempts     INTEGER NOT NULL DEFAULT 0,
+            created_ts   INTEGER NOT NULL,
+            next_try_ts  INTEGER NOT NULL,
+            sent_ts      INTEGER NOT NULL DEFAULT 0,
+            last_error   TEXT NULL
+        );
+        """
+    )
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_tg_shop_outbox_pending
+        ON telegram_shop_outbox (next_try_ts, id)
+        WHERE status = 'pending';
+        """
+    )
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_tg_shop_outbox_sent_ts
+        ON telegram_shop_outbox (sent_ts)
+        WHERE status = 'sent';
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS telegram_shop_outbox;")
+    op.execute("DROP TABLE IF EXISTS telegram_shop_order_events;")
@@ -0,0 +1,29 @@
+"""telegram_shop: orders (tenant_id, created_ts) index for day-chunked rollup backfill
+
+Revision ID: tg_shop_orders_created_idx_1019o
+Revises: tg_shop_sales_deltas_1019n
+Create Date: 2026-10-19
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "tg_shop_orders_created_idx_1019o"
+down_revision = "tg_shop_sales_deltas_1019n"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute(
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tg_shop_orders_tenant_created
+            ON telegram_shop_orders (tenant_id, created_ts);
+            """
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_tg_shop_orders_tenant_created;")
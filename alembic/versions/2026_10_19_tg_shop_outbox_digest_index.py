@@ -0,0 +1,30 @@
+"""telegram_shop: outbox index for admin new-order digests
+
+Revision ID: tg_shop_outbox_digest_idx_1019g
+Revises: tg_shop_sales_daily_1019f
+Create Date: 2026-10-19
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "tg_shop_outbox_digest_idx_1019g"
+down_revision = "tg_shop_sales_daily_1019f"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # outbox росте з кожним замовленням — індекс без блокування enqueue
+    with op.get_context().autocommit_block():
+        op.execute(
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tg_shop_outbox_tenant_kind_ts
+            ON telegram_shop_outbox (tenant_id, kind, created_ts);
+            """
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_tg_shop_outbox_tenant_kind_ts;")
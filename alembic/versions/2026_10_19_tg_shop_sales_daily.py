@@ -0,0 +1,49 @@
+"""telegram_shop: daily sales rollups
+
+Revision ID: tg_shop_sales_daily_1019f
+Revises: tg_shop_events_outbox_1019e
+Create Date: 2026-10-19
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "tg_shop_sales_daily_1019f"
+down_revision = "tg_shop_events_outbox_1019e"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS telegram_shop_sales_daily (
+            tenant_id   TEXT NOT NULL,
+            day         DATE NOT NULL,
+            orders_cnt  INTEGER NOT NULL DEFAULT 0,
+            revenue_kop BIGINT NOT NULL DEFAULT 0,
+            items_qty   INTEGER NOT NULL DEFAULT 0,
+            void_cnt    INTEGER NOT NULL DEFAULT 0,
+            void_kop    BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (tenant_id, day)
+        );
+        """
+    )
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS telegram_shop_sales_daily_products (
+            tenant_id   TEXT NOT NULL,
+            day         DATE NOT NULL,
+            product_id  INTEGER NOT NULL,
+            name        TEXT NOT NULL DEFAULT '',
+            qty         INTEGER NOT NULL DEFAULT 0,
+            revenue_kop BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (tenant_id, day, product_id)
+        );
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS telegram_shop_sales_daily_products;")
+    op.execute("DROP TABLE IF EXISTS telegram_shop_sales_daily;")
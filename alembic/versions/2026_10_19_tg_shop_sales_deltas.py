@@ -0,0 +1,62 @@
+"""telegram_shop: append-only deltas for daily sales rollups
+
+Revision ID: tg_shop_sales_deltas_1019n
+Revises: tg_shop_order_counter_deltas_1019m
+Create Date: 2026-10-19
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "tg_shop_sales_deltas_1019n"
+down_revision = "tg_shop_order_counter_deltas_1019m"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # замовлення лише дописує рядки; згортання в telegram_shop_sales_daily* — окремий цикл
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS telegram_shop_sales_daily_deltas (
+            id          BIGSERIAL PRIMARY KEY,
+            tenant_id   TEXT NOT NULL,
+            day         DATE NOT NULL,
+            orders_cnt  INTEGER NOT NULL DEFAULT 0,
+            revenue_kop BIGINT NOT NULL DEFAULT 0,
+            items_qty   INTEGER NOT NULL DEFAULT 0,
+            void_cnt    INTEGER NOT NULL DEFAULT 0,
+            void_kop    BIGINT NOT NULL DEFAULT 0
+        );
+        """
+    )
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_tg_shop_sales_daily_deltas_tenant
+        ON telegram_shop_sales_daily_deltas (tenant_id, day);
+        """
+    )
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS telegram_shop_sales_daily_products_deltas (
+            id          BIGSERIAL PRIMARY KEY,
+            tenant_id   TEXT NOT NULL,
+            day         DATE NOT NULL,
+            product_id  INTEGER NOT NULL,
+            name        TEXT NOT NULL DEFAULT '',
+            qty         INTEGER NOT NULL DEFAULT 0,
+            revenue_kop BIGINT NOT NULL DEFAULT 0
+        );
+        """
+    )
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_tg_shop_sales_daily_products_deltas_tenant
+        ON telegram_shop_sales_daily_products_deltas (tenant_id, day);
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS telegram_shop_sales_daily_products_deltas;")
+    op.execute("DROP TABLE IF EXISTS telegram_shop_sales_daily_deltas;")
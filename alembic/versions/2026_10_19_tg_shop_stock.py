@@ -0,0 +1,31 @@
+"""telegram_shop: stock tracking + reservation at checkout
+
+Revision ID: tg_shop_stock_1019b
+Revises: tg_shop_cart_reaper_1019a
+Create Date: 2026-10-19
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "tg_shop_stock_1019b"
+down_revision = "tg_shop_cart_reaper_1019a"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # stock_qty NULL = без обліку залишку
+    op.execute("ALTER TABLE telegram_shop_products ADD COLUMN IF NOT EXISTS stock_qty INTEGER;")
+    op.execute(
+        "ALTER TABLE telegram_shop_orders ADD COLUMN IF NOT EXISTS stock_reserved BOOLEAN NOT NULL DEFAULT FALSE;"
+    )
+    op.execute(
+        "ALTER TABLE telegram_shop_order_items ADD COLUMN IF NOT EXISTS reserved_qty INTEGER NOT NULL DEFAULT 0;"
+    )
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE telegram_shop_order_items DROP COLUMN IF EXISTS reserved_qty;")
+    op.execute("ALTER TABLE telegram_shop_orders DROP COLUMN IF EXISTS stock_reserved;")
+    op.execute("ALTER TABLE telegram_shop_products DROP COLUMN IF EXISTS stock_qty;")
@@ -0,0 +1,30 @@
+"""telegram_shop: user order history page index
+
+Revision ID: tg_shop_user_orders_idx_1019d
+Revises: tg_shop_admin_orders_keyset_1019c
+Create Date: 2026-10-19
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "tg_shop_user_orders_idx_1019d"
+down_revision = "tg_shop_admin_orders_keyset_1019c"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # сторінка історії: WHERE tenant_id, user_id ORDER BY id DESC
+    with op.get_context().autocommit_block():
+        op.execute(
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tg_shop_orders_tenant_user_id
+            ON telegram_shop_orders (tenant_id, user_id, id DESC);
+            """
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_tg_shop_orders_tenant_user_id;")
@@ -0,0 +1,24 @@
+import argparse
+import asyncio
+import datetime as _dt
+
+from rent_platform.modules.telegram_shop.repo.sales_rollup import backfill_all
+
+
+def main() -> None:
+    # Перерахунок денних rollup-ів продажів (ідемпотентно, можна запускати повторно).
+    # Таблиці — з alembic: спершу `python run_migrations.py` (alembic upgrade head).
+    # Кожен день — окрема коротка транзакція, магазин при цьому працює.
+    p = argparse.ArgumentParser(description="Backfill telegram_shop sales rollups")
+    p.add_argument("--tenant", default=None, help="tenant_id (за замовчуванням — усі з telegram_shop)")
+    p.add_argument("--since", default=None, help="YYYY-MM-DD (за замовчуванням — уся історія)")
+    args = p.parse_args()
+
+    since = _dt.date.fromisoformat(args.since) if args.since else None
+
+    n = asyncio.run(backfill_all(since=since, tenant_id=args.tenant))
+    print(f"✅ sales rollups backfilled for {n} tenant(s)")
+
+
+if __name__ == "__main__":
+    main()
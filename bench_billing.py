@@ -0,0 +1,321 @@
+import argparse
+import asyncio
+import random
+import time
+import uuid
+
+from sqlalchemy import event
+
+from rent_platform.config import settings
+from rent_platform.core.billing import MAX_MINUTES_PER_RUN, NEGATIVE_LIMIT_KOP, billing_run_daily
+from rent_platform.db.migrations import run_migrations
+from rent_platform.db.session import db_execute, db_fetch_all, db_fetch_one, engine
+from rent_platform.products.catalog import PRODUCT_CATALOG
+
+# =========================================================
+# Бенчмарк / симуляція добового білінгу на ЛОКАЛЬНІЙ БД (не тест, не для прода)
+#
+#   alembic upgrade head
+#   python bench_billing.py --owners 2000 --tenants 10000 --confirm
+#   python bench_billing.py --new-share 0.1 --catchup-days 3 --confirm   # catch-up + нові tenants
+#
+# Сідить N owner-ів і M tenants (id "bench_*"), баланси за сценаріями
+# full / partial / pause, запускає billing_run_daily з фейковим platform_bot,
+# міряє час і кількість SQL-запитів і звіряє результат з еталонною
+# послідовною моделлю (стара логіка циклу по tenants).
+# --catchup-days N: N прогонів з now_ts = now - (N-1..0) діб, як billing_catch_up;
+# --new-share: частка tenants з last_billed_ts = 0 (щойно куплені) — їх не можна списати
+# за доби до появи, а last_billed_ts не має їхати назад.
+# =========================================================
+
+BENCH_PREFIX = "bench_"
+BENCH_OWNER_BASE = 2_000_000_000  # tenants.owner_user_id — INTEGER
+
+
+class FakeBot:
+    """Замість platform_bot: рахує повідомлення, опційно імітує затримку Telegram."""
+
+    def __init__(self, latency_ms: int = 0) -> None:
+        self.latency = max(0, int(latency_ms)) / 1000.0
+        self.sent: list[tuple[int, str]] = []
+
+    async def send_message(self, chat_id: int, text: str, **_kw) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent.append((int(chat_id), str(text)))
+
+
+class QueryCounter:
+    def __init__(self) -> None:
+        self.n = 0
+
+    def __call__(self, *_a, **_kw) -> None:
+        self.n += 1
+
+
+def _parse_mix(raw: str) -> dict[str, float]:
+    mix = {"full": 0.0, "partial": 0.0, "pause": 0.0}
+    for part in raw.split(","):
+        k, _, v = part.partition("=")
+        if k.strip() in mix:
+            mix[k.strip()] = float(v)
+    total = sum(mix.values()) or 1.0
+    return {k: v / total for k, v in mix.items()}
+
+
+def _seed_plan(
+    owners: int, tenants: int, mix: dict[str, float], now: int, rnd: random.Random, *, new_share: float = 0.0
+) -> dict:
+    pk = next(iter(PRODUCT_CATALOG.keys()), None) or "bench"
+    owner_ids = [BENCH_OWNER_BASE + i for i in range(owners)]
+    by_owner: dict[int, list[dict]] = {o: [] for o in owner_ids}
+    rows: list[dict] = []
+    for i in range(tenants):
+        oid = owner_ids[i % owners] if i < owners else rnd.choice(owner_ids)
+        # частина tenants "простояла" більше доби — перевіряємо clamp MAX_MINUTES_PER_RUN
+        minutes = rnd.randint(60, MAX_MINUTES_PER_RUN + 180)
+        t = {
+            "id": f"{BENCH_PREFIX}{i:08d}",
+            "owner": oid,
+            "rate": rnd.randint(1, 5),
+            # new_share: щойно куплений tenant — ще жодного прогону (init)
+            "last": 0 if rnd.random() < new_share else now - minutes * 60 - rnd.randint(0, 59),
+            "created": now - 86400 * 30 + i,
+            "pk": pk,
+        }
+        rows.append(t)
+        by_owner[oid].append(t)
+
+    kinds = list(mix.keys())
+    weights = [mix[k] for k in kinds]
+    balances: dict[int, int] = {}
+    scenario: dict[int, str] = {}
+    for oid, items in by_owner.items():
+        need = sum(t["rate"] * min(MAX_MINUTES_PER_RUN, (now - t["last"]) // 60) for t in items if t["last"] > 0)
+        kind = rnd.choices(kinds, weights=weights)[0]
+        scenario[oid] = kind
+        if kind == "full":
+            balances[oid] = need + NEGATIVE_LIMIT_KOP + rnd.randint(0, 5000)
+        elif kind == "partial":
+            balances[oid] = NEGATIVE_LIMIT_KOP + rnd.randint(1, max(1, need - 1))
+        else:
+            balances[oid] = NEGATIVE_LIMIT_KOP - rnd.randint(0, 500)
+    return {"tenants": rows, "balances": balances, "scenario": scenario, "by_owner": by_owner}
+
+
+def _expected(plan: dict, runs: list[int], now: int) -> dict:
+    """
+    Еталон: послідовна логіка старого billing_run_daily (по owner-у, tenants за created_ts),
+    по черзі для кожного now_ts з runs. last_billed_ts ніколи не їде назад; init (last = 0)
+    стартує з реального "зараз" (>= now), тож прогони за минулі доби його не списують.
+    """
+    bal = dict(plan["balances"])
+    status: dict[str, str] = {t["id"]: "active" for t in plan["tenants"]}
+    last: dict[str, int] = {t["id"]: int(t["last"]) for t in plan["tenants"]}
+    ledger: dict[int, int] = {o: 0 for o in bal}
+    ledger_rows = 0
+    for run_now in runs:
+        for oid, items in plan["by_owner"].items():
+            for t in sorted(items, key=lambda x: (x["created"], x["id"])):
+                tid = t["id"]
+                if status[tid] != "active":
+                    continue
+                if last[tid] <= 0:
+                    last[tid] = max(run_now, now)
+                    continue
+                minutes = min(MAX_MINUTES_PER_RUN, max(0, (run_now - last[tid]) // 60))
+                if minutes <= 0:
+                    continue
+                last[tid] = max(last[tid], run_now)
+                need = t["rate"] * minutes
+                if bal[oid] - need >= NEGATIVE_LIMIT_KOP:
+                    bal[oid] -= need
+                    ledger[oid] -= need
+                    ledger_rows += 1
+                    continue
+                paid = min(minutes, max(0, bal[oid] - NEGATIVE_LIMIT_KOP) // t["rate"])
+                if paid > 0:
+                    bal[oid] -= paid * t["rate"]
+                    ledger[oid] -= paid * t["rate"]
+                    ledger_rows += 1
+                status[tid] = "paused"
+    return {"balances": bal, "status": status, "ledger": ledger, "ledger_rows": ledger_rows, "last": last}
+
+
+async def _cleanup() -> None:
+    params = {"p": f"{BENCH_PREFIX}%", "lo": BENCH_OWNER_BASE, "hi": BENCH_OWNER_BASE + 100_000_000}
+    await db_execute("DELETE FROM billing_ledger WHERE owner_user_id BETWEEN :lo AND :hi", params)
+    await db_execute("DELETE FROM billing_run_owners WHERE run_key LIKE 'bench:%'", {})
+    await db_execute("DELETE FROM ref_commission_outbox WHERE event_key LIKE 'billing:bench:%'", {})
+    await db_execute("DELETE FROM ref_applied_events WHERE event_key LIKE 'billing:bench:%'", {})
+    await db_execute("DELETE FROM ref_ledger WHERE user_id BETWEEN :lo AND :hi", params)
+    await db_execute("DELETE FROM owner_billing_forecast WHERE owner_user_id BETWEEN :lo AND :hi", params)
+    await db_execute("DELETE FROM tenants WHERE id LIKE :p", params)
+    await db_execute("DELETE FROM owner_accounts WHERE owner_user_id BETWEEN :lo AND :hi", params)
+
+
+async def _seed(plan: dict, now: int) -> None:
+    ts = plan["tenants"]
+    q_t = """
+    INSERT INTO tenants (
+        id, owner_user_id, bot_token, secret, status, created_ts,
+        plan_key, paid_until_ts, product_key, rate_per_min_kop, last_billed_ts
+    )
+    SELECT x.id, x.owner, 'bench', x.id, 'active', x.created, 'free', 0, x.pk, x.rate, x.last
+    FROM unnest(
+        CAST(:ids AS TEXT[]), CAST(:owners AS INTEGER[]), CAST(:created AS INTEGER[]),
+        CAST(:pks AS TEXT[]), CAST(:rates AS BIGINT[]), CAST(:lasts AS BIGINT[])
+    ) AS x(id, owner, created, pk, rate, last)
+    """
+    await db_execute(
+        q_t,
+        {
+            "ids": [t["id"] for t in ts],
+            "owners": [t["owner"] for t in ts],
+            "created": [t["created"] for t in ts],
+            "pks": [t["pk"] for t in ts],
+            "rates": [t["rate"] for t in ts],
+            "lasts": [t["last"] for t in ts],
+        },
+    )
+    q_a = """
+    INSERT INTO owner_accounts (owner_user_id, balance_kop, withdraw_balance_kop, updated_ts)
+    SELECT o, b, 0, :now
+    FROM unnest(CAST(:owners AS BIGINT[]), CAST(:bals AS BIGINT[])) AS x(o, b)
+    """
+    bals = plan["balances"]
+    await db_execute(q_a, {"owners": list(bals.keys()), "bals": list(bals.values()), "now": int(now)})
+
+
+async def _verify(exp: dict) -> list[str]:
+    errors: list[str] = []
+    lo, hi = BENCH_OWNER_BASE, BENCH_OWNER_BASE + 100_000_000
+    accs = await db_fetch_all(
+        "SELECT owner_user_id, balance_kop FROM owner_accounts WHERE owner_user_id BETWEEN :lo AND :hi",
+        {"lo": lo, "hi": hi},
+    )
+    for a in accs:
+        oid = int(a["owner_user_id"])
+        if int(a["balance_kop"]) != exp["balances"].get(oid):
+            errors.append(f"balance owner={oid} got={a['balance_kop']} want={exp['balances'].get(oid)}")
+
+    led = await db_fetch_all(
+        """
+        SELECT owner_user_id, SUM(amount_kop) AS s, COUNT(*) AS n
+        FROM billing_ledger
+        WHERE owner_user_id BETWEEN :lo AND :hi
+        GROUP BY owner_user_id
+        """,
+        {"lo": lo, "hi": hi},
+    )
+    got_rows = 0
+    for r in led:
+        oid = int(r["owner_user_id"])
+        got_rows += int(r["n"])
+        if int(r["s"]) != exp["ledger"].get(oid):
+            errors.append(f"ledger owner={oid} got={r['s']} want={exp['ledger'].get(oid)}")
+    if got_rows != exp["ledger_rows"]:
+        errors.append(f"ledger rows got={got_rows} want={exp['ledger_rows']}")
+
+    st = await db_fetch_all(
+        "SELECT id, status, last_billed_ts FROM tenants WHERE id LIKE :p", {"p": f"{BENCH_PREFIX}%"}
+    )
+    for r in st:
+        if str(r["status"]) != exp["status"].get(str(r["id"])):
+            errors.append(f"status tenant={r['id']} got={r['status']} want={exp['status'].get(str(r['id']))}")
+        # init стартує з реального часу прогону — точне значення не відоме, лише нижня межа
+        want_last = int(exp["last"].get(str(r["id"])) or 0)
+        if int(r.get("last_billed_ts") or 0) < want_last:
+            errors.append(f"last_billed_ts tenant={r['id']} got={r['last_billed_ts']} want>={want_last}")
+    return errors
+
+
+async def _run(args: argparse.Namespace) -> int:
+    await run_migrations()
+
+    foreign = await db_fetch_one(
+        "SELECT COUNT(*) AS n FROM tenants WHERE status = 'active' AND product_key IS NOT NULL AND id NOT LIKE :p",
+        {"p": f"{BENCH_PREFIX}%"},
+    )
+    if int((foreign or {}).get("n") or 0) > 0:
+        print("❌ У БД є не-bench активні tenants — білінг їх теж списав би. Потрібна окрема локальна БД.")
+        return 2
+
+    if args.workers:
+        settings.BILLING_WORKERS = int(args.workers)
+    if args.per_tx:
+        settings.BILLING_OWNERS_PER_TX = int(args.per_tx)
+
+    now = int(time.time())
+    rnd = random.Random(args.seed)
+    plan = _seed_plan(args.owners, args.tenants, _parse_mix(args.mix), now, rnd, new_share=args.new_share)
+    runs = [now - d * 86400 for d in range(max(1, args.catchup_days) - 1, -1, -1)]
+    exp = _expected(plan, runs, now)
+
+    await _cleanup()
+    t0 = time.monotonic()
+    await _seed(plan, now)
+    seed_sec = time.monotonic() - t0
+
+    bot = FakeBot(latency_ms=args.notify_latency_ms)
+    counter = QueryCounter()
+    event.listen(engine.sync_engine, "before_cursor_execute", counter)
+    t0 = time.monotonic()
+    try:
+        for run_now in runs:
+            run_key = f"bench:{uuid.uuid4().hex[:8]}" if args.engine == "checkpointed" else None
+            stats = await billing_run_daily(bot, now_ts=run_now, run_key=run_key)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", counter)
+    wall = time.monotonic() - t0
+
+    errors = await _verify(exp)
+    scen = plan["scenario"]
+    print(
+        f"engine={args.engine} owners={args.owners} tenants={args.tenants} runs={len(runs)} "
+        f"new={sum(1 for t in plan['tenants'] if t['last'] <= 0)} seed={seed_sec:.2f}s"
+    )
+    print(
+        "scenarios: "
+        + ", ".join(f"{k}={sum(1 for v in scen.values() if v == k)}" for k in ("full", "partial", "pause"))
+    )
+    print(f"wall={wall:.3f}s queries={counter.n} messages={len(bot.sent)}")
+    print(f"stats={stats}")
+    if errors:
+        print(f"❌ {len(errors)} mismatch(es):")
+        for e in errors[:20]:
+            print("  " + e)
+    else:
+        print("✅ balances / ledger / statuses match the sequential reference")
+
+    if not args.keep:
+        await _cleanup()
+    return 1 if errors else 0
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Benchmark / simulate daily billing on a local database")
+    p.add_argument("--owners", type=int, default=1000)
+    p.add_argument("--tenants", type=int, default=5000)
+    p.add_argument("--mix", default="full=0.7,partial=0.2,pause=0.1", help="частки сценаріїв балансу owner-ів")
+    p.add_argument("--engine", choices=["daily", "checkpointed"], default="daily")
+    p.add_argument("--workers", type=int, default=0, help="override BILLING_WORKERS")
+    p.add_argument("--per-tx", type=int, default=0, help="override BILLING_OWNERS_PER_TX")
+    p.add_argument("--notify-latency-ms", type=int, default=0, help="імітація затримки Telegram")
+    p.add_argument("--new-share", type=float, default=0.0, help="частка щойно куплених tenants (last_billed_ts = 0)")
+    p.add_argument("--catchup-days", type=int, default=1, help="прогонів за минулі доби, як billing_catch_up")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--keep", action="store_true", help="не прибирати bench-дані після прогону")
+    p.add_argument("--confirm", action="store_true", help="так, це локальна БД і в неї можна писати")
+    args = p.parse_args()
+
+    if not args.confirm:
+        p.error("--confirm is required: the harness writes tenants / balances / ledger into DATABASE_URL")
+    if args.owners <= 0 or args.tenants < args.owners:
+        p.error("need --owners > 0 and --tenants >= --owners")
+
+    raise SystemExit(asyncio.run(_run(args)))
+
+
+if __name__ == "__main__":
+    main()
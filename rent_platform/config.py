@@ -18,6 +18,56 @@ class Settings(BaseSettings):
     PORT: int = 8080
     DEBUG: bool = False
 
+    # ✅ Startup warm-up (кеш маршрутів + каталогів найактивніших tenant-ів)
+    WARMUP_ENABLED: bool = False
+    WARMUP_TOP_TENANTS: int = 50
+    WARMUP_ACTIVITY_DAYS: int = 7
+    WARMUP_CONCURRENCY: int = 5
+    WARMUP_BUDGET_SEC: float = 10.0
+
+    # ✅ Abandoned carts (telegram_shop): чистка + нагадування
+    CART_REAPER_ENABLED: bool = True
+    CART_REAPER_INTERVAL_SEC: int = 3600
+    CART_IDLE_DAYS_DEFAULT: int = 30          # якщо tenant не налаштував свій поріг
+    CART_REAPER_BATCH: int = 1000             # рядків за один DELETE
+    CART_REMIND_MAX_PER_RUN: int = 500
+    CART_REMIND_PER_SEC: float = 20.0         # глобальний throttle надсилань
+    # ➕/➖ у кошику копляться в RAM процесу і пишуться пачкою. Лише для ОДНОГО процесу вебхуків:
+    # кілька інстансів за балансувальником => False (кожен тап одразу в БД)
+    CART_TAP_COALESCE: bool = True
+
+    # ✅ Експорт замовлень (telegram_shop admin)
+    ORDERS_EXPORT_MAX_PER_TENANT: int = 1     # одночасних експортів на tenant
+
+    # ✅ Outbox сповіщень магазину (асинхронна доставка)
+    OUTBOX_ENABLED: bool = True
+    OUTBOX_PER_SEC: float = 25.0              # глобальний throttle надсилань (на процес)
+    OUTBOX_BATCH: int = 200
+    OUTBOX_MAX_ATTEMPTS: int = 5
+    OUTBOX_RETENTION_DAYS: int = 7            # скільки тримати надіслані рядки
+    SHOP_ADMIN_DIGEST_WINDOW_SEC: int = 30    # нові замовлення в межах вікна => один дайджест адміну
+
+    # ✅ Leader election: singleton-и (білінг, reaper, звірки) — в одному процесі
+    LEADER_ELECTION_ENABLED: bool = True
+    LEADER_LEASE_TTL_SEC: int = 15            # failover після смерті лідера ~ TTL
+
+    # ✅ Добовий білінг
+    BILLING_WORKERS: int = 4                  # паралельних транзакцій білінгу
+    BILLING_OWNERS_PER_TX: int = 100          # owner-ів в одній транзакції
+    BILLING_OWNER_RETRIES: int = 2            # повтори для owner-а, що впав
+    BILLING_NOTIFY_CONCURRENCY: int = 10      # паралельних повідомлень owner-ам
+    BILLING_CATCHUP_MAX_DAYS: int = 3         # скільки пропущених 00:00 доганяти після простою
+
+    # ✅ Прогноз вичерпання балансу (попередження 24h / 3h)
+    FORECAST_TICK_SEC: int = 60
+    FORECAST_BATCH: int = 1000
+    FORECAST_RECONCILE_SEC: int = 6 * 3600    # повний перерахунок від дрейфу
+
+    # ✅ Outbox партнерських комісій (нарахування поза транзакцією поповнення / білінгу)
+    REF_OUTBOX_BATCH: int = 2000              # подій в одному запиті нарахування
+    REF_OUTBOX_MAX_ATTEMPTS: int = 10
+    REF_OUTBOX_RETENTION_DAYS: int = 30
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding="utf-8",
@@ -0,0 +1,111 @@
+# rent_platform/core/balance_forecast.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any
+
+from aiogram import Bot
+
+from rent_platform.config import settings
+from rent_platform.core.billing import NEGATIVE_LIMIT_KOP
+from rent_platform.db.repo import BillingForecastRepo
+from rent_platform.products.catalog import catalog_rates_kop
+
+log = logging.getLogger(__name__)
+
+# =========================================================
+# Попередження "баланс скоро закінчиться" (24h / 3h)
+#
+# Прогноз depletes_ts на owner-а живе в owner_billing_forecast і перераховується
+# лише для dirty-рядків (поповнення / списання / статус чи тариф tenant-а).
+# Кожен тік: перерахунок dirty пачками + два індексні запити по depletes_ts —
+# без сканування всіх tenants щохвилини.
+# =========================================================
+
+WARN_WINDOWS: dict[str, int] = {"24h": 24 * 3600, "3h": 3 * 3600}
+
+
+async def _send(platform_bot: Bot, user_id: int, text: str) -> None:
+    try:
+        await platform_bot.send_message(chat_id=user_id, text=text)
+    except Exception as e:
+        log.warning("balance warning notify failed user=%s err=%s", user_id, e)
+
+
+def _fmt_left(sec: int) -> str:
+    if sec <= 0:
+        return "вже вичерпано"
+    h, m = divmod(int(sec) // 60, 60)
+    return f"~{h} год {m:02d} хв" if h else f"~{m} хв"
+
+
+async def _warn(platform_bot: Bot, kind: str, row: dict[str, Any], now: int) -> None:
+    left = int(row.get("depletes_ts") or 0) - now
+    per_day = int(row.get("burn_kop_per_min") or 0) * 1440
+    head = "⚠️ Баланс закінчується" if kind == "24h" else "🚨 Баланс майже вичерпано"
+    await _send(
+        platform_bot,
+        int(row["owner_user_id"]),
+        f"{head}\n\n"
+        f"Баланс: {int(row.get('balance_kop') or 0)/100:.2f} грн\n"
+        f"Витрата: {per_day/100:.2f} грн/добу\n"
+        f"Вистачить: {_fmt_left(left)}\n\n"
+        f"Після цього оренда стане на паузу. Поповніть баланс у кабінеті.",
+    )
+
+
+async def forecast_tick(platform_bot: Bot) -> dict[str, int]:
+    now = int(time.time())
+    batch = max(1, int(settings.FORECAST_BATCH))
+    windows = (WARN_WINDOWS["24h"], WARN_WINDOWS["3h"])
+    rates = catalog_rates_kop()
+
+    recomputed = 0
+    while True:
+        n = await BillingForecastRepo.recompute_dirty(
+            now_ts=now,
+            product_rates=rates,
+            negative_limit_kop=NEGATIVE_LIMIT_KOP,
+            warn_windows=windows,
+            limit=batch,
+        )
+        recomputed += int(n or 0)
+        if int(n or 0) < batch:
+            break
+
+    warned = 0
+    # спершу 3h: воно ж закриває 24h, щоб не слати обидва за раз
+    for kind in ("3h", "24h"):
+        rows = await BillingForecastRepo.list_to_warn(kind, now_ts=now, window_sec=WARN_WINDOWS[kind], limit=batch)
+        if not rows:
+            continue
+        await BillingForecastRepo.mark_warned([int(r["owner_user_id"]) for r in rows], kind, now_ts=now)
+        for r in rows:
+            await _warn(platform_bot, kind, r, now)
+        warned += len(rows)
+
+    return {"recomputed": recomputed, "warned": warned}
+
+
+async def balance_forecast_loop(platform_bot: Bot, stop_event: asyncio.Event) -> None:
+    log.info("balance forecast loop started")
+    last_full = 0.0
+    while not stop_event.is_set():
+        try:
+            # звірка: раз на FORECAST_RECONCILE_SEC (і на старті) — усі owner-и у dirty
+            if time.monotonic() - last_full >= max(60, int(settings.FORECAST_RECONCILE_SEC)) or not last_full:
+                last_full = time.monotonic()
+                await BillingForecastRepo.mark_all_dirty()
+            res = await forecast_tick(platform_bot)
+            if res["recomputed"] or res["warned"]:
+                log.info("balance forecast: %s", res)
+        except Exception as e:
+            log.exception("balance forecast tick failed: %s", e)
+
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=max(5, int(settings.FORECAST_TICK_SEC)))
+        except asyncio.TimeoutError:
+            pass
+    log.info("balance forecast loop stopped")
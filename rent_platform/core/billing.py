@@ -1,15 +1,17 @@
 from __future__ import annotations
 
 import asyncio
-import json
+import datetime as _dt
 import logging
 import time
 from typing import Any
 
 from aiogram import Bot
 
-from rent_platform.db.repo import TenantRepo, AccountRepo, LedgerRepo
-from rent_platform.products.catalog import PRODUCT_CATALOG
+from rent_platform.config import settings
+from rent_platform.core.referral_outbox import ref_outbox_wake
+from rent_platform.db.repo import BillingRepo, BillingRunRepo, TenantRepo
+from rent_platform.products.catalog import catalog_rates_kop, product_rate_kop
 
 log = logging.getLogger(__name__)
 
@@ -24,25 +26,7 @@ def _floor_minutes(a_ts: int, b_ts: int) -> int:
     return int((b_ts - a_ts) // 60)
 
 
-def _product_rate_kop(product_key: str) -> int:
-    meta = PRODUCT_CATALOG.get(product_key) or {}
-
-    # 1) новий формат: int коп/хв
-    if meta.get("rate_per_min_kop") is not None:
-        try:
-            return max(0, int(meta.get("rate_per_min_kop") or 0))
-        except Exception:
-            return 0
-
-    # 2) старий формат: float грн/хв -> коп/хв
-    try:
-        uah = float(meta.get("rate_per_min_uah", 0) or 0)
-    except Exception:
-        uah = 0.0
-    return max(0, int(round(uah * 100)))
-
-
-def _tenant_rate_kop(t: dict[str, Any]) -> int:
+def tenant_rate_kop(t: dict[str, Any]) -> int:
     """
     Пріоритет тарифу:
     1) tenants.rate_per_min_kop (override) якщо > 0
@@ -60,7 +44,7 @@ def _tenant_rate_kop(t: dict[str, Any]) -> int:
     if override > 0:
         return override
 
-    return _product_rate_kop(str(pk))
+    return product_rate_kop(str(pk))
 
 
 async def _send(platform_bot: Bot, user_id: int, text: str) -> None:
@@ -81,168 +65,225 @@ def _seconds_to_next_midnight_local() -> int:
     return max(1, int(tomorrow - now))
 
 
-async def billing_run_daily(platform_bot: Bot) -> None:
+async def _notify_owner(platform_bot: Bot, owner_id: int, items: list[dict[str, Any]]) -> None:
+    charged_total = sum(int(r.get("charge_kop") or 0) for r in items)
+    charged_cnt = sum(1 for r in items if int(r.get("charge_kop") or 0) > 0)
+    paused = [r for r in items if r.get("outcome") == "pause"]
+
+    for r in paused:
+        await _send(
+            platform_bot,
+            owner_id,
+            f"⏸ Оренда зупинена через недостатній баланс.\n"
+            f"Бот: {r['tenant_id']}\nПродукт: {r.get('product_key')}\nЛіміт мінуса: 3 грн.",
+        )
+
+    # зведення: тільки якщо реально щось списали або когось зупинили
+    if charged_total > 0 or paused:
+        await _send(
+            platform_bot,
+            owner_id,
+            f"🧾 Білінг за добу виконано.\n"
+            f"Списано: {charged_total/100:.2f} грн\n"
+            f"Оренд списано: {charged_cnt}\n"
+            f"Зупинено через баланс: {len(paused)}",
+        )
+
+
+async def _apply_for_owners(now: int, owner_ids: list[int], run_key: str | None) -> list[dict[str, Any]]:
+    return await BillingRepo.apply_daily_charges(
+        now_ts=now,
+        product_rates=catalog_rates_kop(),
+        negative_limit_kop=NEGATIVE_LIMIT_KOP,
+        max_minutes=MAX_MINUTES_PER_RUN,
+        owner_ids=owner_ids,
+        run_key=run_key,
+    )
+
+
+async def billing_run_daily(
+    platform_bot: Bot,
+    *,
+    now_ts: int | None = None,
+    run_key: str | None = None,
+) -> dict[str, Any]:
     """
     Раз на добу о 00:00:
     - беремо активні tenants (status='active' AND product_key not null)
-    - рахуємо хвилини від last_billed_ts до now
+    - рахуємо хвилини від last_billed_ts до now (максимум MAX_MINUTES_PER_RUN)
     - списуємо rate_per_min * minutes
-    - дозволяємо мінус до -3 грн
+    - дозволяємо мінус до NEGATIVE_LIMIT_KOP
     - якщо не вистачає — частково списуємо до ліміту і ставимо pause billing
-    - last_billed_ts:
-        * full: now
-        * partial: last_billed_ts + minutes_paid*60
-        * pause: now (щоб у паузі не накопичувались хвилини)
-    """
-    now = int(time.time())
-    tenants = await TenantRepo.list_active_for_billing()
-    if not tenants:
-        return
-
-    # групуємо по owner
-    by_owner: dict[int, list[dict[str, Any]]] = {}
-    for t in tenants:
-        by_owner.setdefault(int(t["owner_user_id"]), []).append(t)
-
-    for owner_id, items in by_owner.items():
-        await AccountRepo.ensure(owner_id)
-        acc = await AccountRepo.get(owner_id)
-        # локальний кеш балансу для partial-математики
-        balance = int((acc or {}).get("balance_kop") or 0)
-
-        charged_total = 0
-        paused_cnt = 0
-        charged_cnt = 0
-
-        for t in items:
-            tenant_id = str(t["id"])
-            pk = t.get("product_key")
-            if not pk:
-                continue
+    - last_billed_ts = now (у паузі хвилини не накопичуються)
 
-            rate = _tenant_rate_kop(t)
-            last_billed_ts = int(t.get("last_billed_ts") or 0)
+    Математика — set-based у BillingRepo.apply_daily_charges. Owner-и йдуть пачками
+    (BILLING_OWNERS_PER_TX) у BILLING_WORKERS паралельних транзакціях під advisory lock-ами owner-ів.
+    Пачка впала => її owner-и повторюються поодинці (BILLING_OWNER_RETRIES): один "битий"
+    owner не зупиняє інших. Сповіщення шлються у фоні одразу після коміту своєї пачки.
 
-            # 1) якщо тариф 0 — просто синхронізуємо last_billed_ts, щоб не накопичувалось
-            if rate <= 0:
-                await TenantRepo.set_rate_and_last_billed(owner_id, tenant_id, 0, now)
-                continue
-
-            # 2) якщо last_billed_ts = 0 (новий/старий запис) — ініціалізуємо і не списуємо
-            if last_billed_ts <= 0:
-                await TenantRepo.set_rate_and_last_billed(owner_id, tenant_id, int(rate), now)
-                continue
-
-            minutes = _floor_minutes(last_billed_ts, now)
-            if minutes <= 0:
-                continue
-
-            # політика: максимум 1 доба за прогін (можна зняти clamp, якщо хочеш доганяти)
-            if minutes > MAX_MINUTES_PER_RUN:
-                minutes = MAX_MINUTES_PER_RUN
-
-            need = int(rate) * int(minutes)
-            if need <= 0:
-                await TenantRepo.set_rate_and_last_billed(owner_id, tenant_id, int(rate), now)
+    run_key => checkpoint на кожного owner-а (див. billing_run_for_day): повтор лише дочищає решту.
+    """
+    now = int(now_ts or time.time())
+    t_run = time.monotonic()
+
+    # legacy paid_until_ts: прострочені — на паузу тут, а не в tenant webhook
+    expired = await TenantRepo.system_pause_expired_paid_until(int(time.time()))
+    if expired:
+        log.info("billing: paused %s tenant(s) with expired paid_until_ts", len(expired))
+
+    owners = await BillingRepo.list_billable_owners(run_key)
+    if not owners:
+        return {"owners": 0, "failed_owners": []}
+
+    per_tx = max(1, int(settings.BILLING_OWNERS_PER_TX))
+    retries = max(0, int(settings.BILLING_OWNER_RETRIES))
+    sem = asyncio.Semaphore(max(1, int(settings.BILLING_WORKERS)))
+    notify_sem = asyncio.Semaphore(max(1, int(settings.BILLING_NOTIFY_CONCURRENCY)))
+
+    rows_all: list[dict[str, Any]] = []
+    # (owner-и пачки, секунди): пачка — одна транзакція, тож час є лише на пачку
+    timings: list[tuple[list[int], float]] = []
+    failed: list[int] = []
+    notify_tasks: list[asyncio.Task] = []
+
+    async def _notify(owner_id: int, items: list[dict[str, Any]]) -> None:
+        async with notify_sem:
+            await _notify_owner(platform_bot, owner_id, items)
+
+    def _done(rows: list[dict[str, Any]]) -> None:
+        rows_all.extend(rows)
+        by_owner: dict[int, list[dict[str, Any]]] = {}
+        for r in rows:
+            by_owner.setdefault(int(r["owner_user_id"]), []).append(r)
+        for owner_id, items in by_owner.items():
+            notify_tasks.append(asyncio.create_task(_notify(owner_id, items)))
+
+    async def _run_owner(owner_id: int) -> None:
+        for attempt in range(retries + 1):
+            t0 = time.monotonic()
+            try:
+                async with sem:
+                    rows = await _apply_for_owners(now, [owner_id], run_key)
+            except Exception as e:
+                log.warning("billing owner=%s attempt=%s failed: %s", owner_id, attempt + 1, e)
+                await asyncio.sleep(min(5.0, 0.5 * (2 ** attempt)))
                 continue
+            timings.append(([owner_id], time.monotonic() - t0))
+            _done(rows)
+            return
+        failed.append(owner_id)
+        log.error("billing owner=%s failed after %s attempts", owner_id, retries + 1)
+
+    async def _run_chunk(chunk: list[int]) -> None:
+        t0 = time.monotonic()
+        try:
+            async with sem:
+                rows = await _apply_for_owners(now, chunk, run_key)
+        except Exception as e:
+            # ізоляція: пачка відкотилась цілком — повторюємо owner-ів поодинці
+            log.warning("billing chunk of %s owners failed, retrying one by one: %s", len(chunk), e)
+            for owner_id in chunk:
+                await _run_owner(owner_id)
+            return
+        timings.append((list(chunk), time.monotonic() - t0))
+        _done(rows)
+
+    chunks = [owners[i : i + per_tx] for i in range(0, len(owners), per_tx)]
+    await asyncio.gather(*(_run_chunk(c) for c in chunks))
+    billed_sec = time.monotonic() - t_run
+    # партнерка з білінгу вже в ref_commission_outbox (у транзакціях списання)
+    if run_key:
+        ref_outbox_wake()
+
+    if notify_tasks:
+        await asyncio.gather(*notify_tasks, return_exceptions=True)
+
+    slowest = sorted(timings, key=lambda kv: kv[1], reverse=True)[:5]
+    stats: dict[str, Any] = {
+        "owners": len(owners),
+        "tenants": len(rows_all),
+        "charged_cnt": sum(1 for r in rows_all if int(r.get("charge_kop") or 0) > 0),
+        "charged_total_kop": sum(int(r.get("charge_kop") or 0) for r in rows_all),
+        "paused_cnt": sum(1 for r in rows_all if r.get("outcome") == "pause"),
+        "failed_owners": failed,
+        "billed_sec": round(billed_sec, 3),
+        "total_sec": round(time.monotonic() - t_run, 3),
+        "slowest_batches": [(o, round(t, 3)) for o, t in slowest],
+    }
+    log.info("billing daily run: %s", stats)
+    return stats
+
+
+def _local_midnight_ts(day: _dt.date) -> int:
+    return int(time.mktime((day.year, day.month, day.day, 0, 0, 0, 0, 0, -1)))
+
+
+def next_billing_ts(ts: int) -> int:
+    """Найближча локальна 00:00 (прогін білінгу) не раніше за ts."""
+    day = _dt.date.fromtimestamp(int(ts))
+    at = _local_midnight_ts(day)
+    return at if at >= int(ts) else _local_midnight_ts(day + _dt.timedelta(days=1))
+
+
+def _run_key(day: _dt.date) -> str:
+    return f"daily:{day.isoformat()}"
+
+
+async def billing_run_for_day(platform_bot: Bot, day: _dt.date) -> dict[str, Any]:
+    """
+    Прогін "за 00:00 дня day": now_ts = локальна північ цього дня.
+    Вже done => no-op; впав посередині => resume (owner-и з checkpoint-ом пропускаються).
+    """
+    run_key = _run_key(day)
+    run = await BillingRunRepo.start(run_key, _local_midnight_ts(day))
+    if run.get("status") == "done":
+        log.info("billing run %s already done, skip", run_key)
+        return {"run_key": run_key, "noop": True}
 
-            # 3) пробуємо списати повністю (атомарно з лімітом)
-            new_balance = await AccountRepo.try_charge(owner_id, need, NEGATIVE_LIMIT_KOP)
-            if new_balance is not None:
-                # успіх: оновлюємо кеш і пишемо ledger
-                balance = int(new_balance)
-                charged_total += need
-                charged_cnt += 1
-
-                await TenantRepo.set_rate_and_last_billed(owner_id, tenant_id, int(rate), now)
-
-                try:
-                    await LedgerRepo.add(
-                        owner_id,
-                        "daily_charge",
-                        -need,
-                        tenant_id=tenant_id,
-                        meta={"product_key": pk, "minutes": minutes, "rate_kop": int(rate), "from_ts": last_billed_ts, "to_ts": now},
-                    )
-                except Exception:
-                    log.exception("ledger add failed owner=%s tenant=%s", owner_id, tenant_id)
+    stats = await billing_run_daily(platform_bot, now_ts=int(run["now_ts"]), run_key=run_key)
+    stats["run_key"] = run_key
+    stats["attempt"] = int(run.get("attempts") or 1)
+    await BillingRunRepo.finish(run_key, ok=not stats.get("failed_owners"), stats=stats)
+    return stats
 
-                continue
 
-            # 4) не вистачає: partial до ліміту (рахуємо по нашому кешу)
-            max_charge = int(balance - NEGATIVE_LIMIT_KOP)  # скільки можемо списати, щоб не піти нижче ліміту
-            if max_charge > 0:
-                minutes_paid = int(max_charge // rate)
-            else:
-                minutes_paid = 0
-
-            if minutes_paid > minutes:
-                minutes_paid = minutes
-
-            if minutes_paid > 0:
-                charge = int(minutes_paid * rate)
-
-                new_balance2 = await AccountRepo.try_charge(owner_id, charge, NEGATIVE_LIMIT_KOP)
-                if new_balance2 is not None:
-                    balance = int(new_balance2)
-                    charged_total += charge
-                    charged_cnt += 1
-
-                    new_last = int(last_billed_ts + minutes_paid * 60)
-                    await TenantRepo.set_rate_and_last_billed(owner_id, tenant_id, int(rate), new_last)
-
-                    try:
-                        await LedgerRepo.add(
-                            owner_id,
-                            "daily_charge_partial",
-                            -charge,
-                            tenant_id=tenant_id,
-                            meta={
-                                "product_key": pk,
-                                "minutes_paid": minutes_paid,
-                                "minutes_total": minutes,
-                                "rate_kop": int(rate),
-                                "limit_kop": NEGATIVE_LIMIT_KOP,
-                                "from_ts": last_billed_ts,
-                                "to_ts": now,
-                            },
-                        )
-                    except Exception:
-                        log.exception("ledger add partial failed owner=%s tenant=%s", owner_id, tenant_id)
-
-            # 5) ставимо pause billing і “обнуляємо” накопичення часу в паузі (last_billed_ts = now)
-            await TenantRepo.system_pause_billing(tenant_id)
-            await TenantRepo.set_rate_and_last_billed(owner_id, tenant_id, int(rate), now)
-            paused_cnt += 1
-
-            await _send(
-                platform_bot,
-                owner_id,
-                f"⏸ Оренда зупинена через недостатній баланс.\n"
-                f"Бот: {tenant_id}\nПродукт: {pk}\nЛіміт мінуса: 3 грн.",
-            )
-
-        # зведення: тільки якщо реально щось списали або когось зупинили
-        if charged_total > 0 or paused_cnt > 0:
-            try:
-                await _send(
-                    platform_bot,
-                    owner_id,
-                    f"🧾 Білінг за добу виконано.\n"
-                    f"Списано: {charged_total/100:.2f} грн\n"
-                    f"Оренд списано: {charged_cnt}\n"
-                    f"Зупинено через баланс: {paused_cnt}",
-                )
-            except Exception:
-                pass
+async def billing_catch_up(platform_bot: Bot) -> int:
+    """
+    Незавершені / пропущені прогони за останні BILLING_CATCHUP_MAX_DAYS днів (включно з сьогодні),
+    від старішого до новішого: кожен доганяє свою добу (MAX_MINUTES_PER_RUN).
+    Старші пропуски не доганяємо — як і раніше, вони зрізаються clamp-ом.
+    -> скільки прогонів виконано.
+    """
+    days_back = max(1, int(settings.BILLING_CATCHUP_MAX_DAYS))
+    today = _dt.date.today()
+    days = [today - _dt.timedelta(days=i) for i in range(days_back - 1, -1, -1)]
+    runs = await BillingRunRepo.get_many([_run_key(d) for d in days])
+
+    done = 0
+    for d in days:
+        if (runs.get(_run_key(d)) or {}).get("status") == "done":
+            continue
+        try:
+            await billing_run_for_day(platform_bot, d)
+            done += 1
+        except Exception as e:
+            log.exception("billing run %s failed: %s", _run_key(d), e)
+    return done
 
 
 async def billing_daemon_daily_midnight(platform_bot: Bot, stop_event: asyncio.Event) -> None:
     """
-    Фоновий демон: чекає до 00:00 і запускає billing_run_daily().
+    Фоновий демон: на старті доганяє пропущене (billing_catch_up), далі чекає до 00:00.
     """
     log.info("billing daily daemon started")
     while not stop_event.is_set():
+        try:
+            n = await billing_catch_up(platform_bot)
+            if n:
+                log.info("billing daily daemon: %s run(s) executed", n)
+        except Exception as e:
+            log.exception("billing daily run failed: %s", e)
+
         try:
             sec = _seconds_to_next_midnight_local()
             log.info("billing daily daemon sleeping %s sec until midnight", sec)
@@ -251,14 +292,6 @@ async def billing_daemon_daily_midnight(platform_bot: Bot, stop_event: asyncio.E
         except asyncio.TimeoutError:
             pass
 
-        if stop_event.is_set():
-            break
-
-        try:
-            await billing_run_daily(platform_bot)
-        except Exception as e:
-            log.exception("billing daily run failed: %s", e)
-
     log.info("billing daily daemon stopped")
 
 
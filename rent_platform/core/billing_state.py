@@ -0,0 +1,106 @@
+# rent_platform/core/billing_state.py
+from __future__ import annotations
+
+import time
+from typing import Any
+
+from rent_platform.core.billing import MAX_MINUTES_PER_RUN, NEGATIVE_LIMIT_KOP, next_billing_ts, tenant_rate_kop
+from rent_platform.db.repo import AccountRepo, BillingForecastRepo, TenantRepo
+
+# =========================================================
+# Стан білінгу owner-а для кабінету (кеш на процес)
+#
+# Знімок = рахунок + tenants з ефективними тарифами; живі цифри (накопичено з
+# last_billed_ts, баланс "зараз", коли пауза) рахуються арифметикою від now.
+# Знімок валідний, поки не змінилась owner_billing_forecast.version — її збільшує
+# кожен запис у баланс / ledger / статус чи тариф tenant-а (у будь-якому процесі).
+# Тож відкриття кабінету = 1 запит по PK замість рахунку + списку ботів.
+# =========================================================
+
+BILLING_STATE_MAX_CACHED = 10000
+
+# cache[owner_user_id] = snapshot
+_STATES: dict[int, dict[str, Any]] = {}
+
+
+async def _load_snapshot(owner_user_id: int, version: int) -> dict[str, Any]:
+    await AccountRepo.ensure(owner_user_id)
+    acc = await AccountRepo.get(owner_user_id) or {}
+    rows = await TenantRepo.list_billing_by_owner(owner_user_id)
+
+    bots: list[dict[str, Any]] = []
+    for r in rows:
+        st = (r.get("status") or "active").lower()
+        bots.append(
+            {
+                "id": r["id"],
+                "name": r.get("display_name") or "Bot",
+                "status": st,
+                "paused_reason": r.get("paused_reason"),
+                "plan_key": r.get("plan_key") or "free",
+                "paid_until_ts": int(r.get("paid_until_ts") or 0),
+                "product_key": r.get("product_key"),
+                "rate_kop": tenant_rate_kop(r),
+                "last_billed_ts": int(r.get("last_billed_ts") or 0),
+                # білиться лише active з продуктом (як у BillingRepo.apply_daily_charges)
+                "billable": st == "active" and bool(r.get("product_key")),
+            }
+        )
+
+    if len(_STATES) >= BILLING_STATE_MAX_CACHED:
+        _STATES.clear()
+    snap = {
+        "version": int(version),
+        "balance_kop": int(acc.get("balance_kop") or 0),
+        "withdraw_balance_kop": int(acc.get("withdraw_balance_kop") or 0),
+        "bots": bots,
+    }
+    _STATES[int(owner_user_id)] = snap
+    return snap
+
+
+def _project(owner_user_id: int, snap: dict[str, Any], now: int) -> dict[str, Any]:
+    burn = 0
+    accrued = 0
+    rl = 0
+    bots: list[dict[str, Any]] = []
+    for b in snap["bots"]:
+        rate = int(b["rate_kop"]) if b["billable"] else 0
+        last = int(b["last_billed_ts"]) or now
+        acc_kop = rate * min(MAX_MINUTES_PER_RUN, max(0, (now - last) // 60))
+        burn += rate
+        accrued += acc_kop
+        rl += rate * last
+        bots.append({**b, "accrued_kop": acc_kop})
+
+    balance = int(snap["balance_kop"])
+    # та сама формула, що й у BillingForecastRepo: коли баланс дійде до ліміту мінуса
+    depletes_ts = max(1, ((balance - NEGATIVE_LIMIT_KOP) * 60 + rl) // burn) if burn > 0 else 0
+    # пауза ставиться прогоном 00:00 — першим після вичерпання (або найближчим, якщо вже вичерпано)
+    pause_at_ts = next_billing_ts(max(depletes_ts, now)) if depletes_ts else 0
+
+    return {
+        "owner_user_id": int(owner_user_id),
+        "now": now,
+        "balance_kop": balance,
+        "withdraw_balance_kop": int(snap["withdraw_balance_kop"]),
+        "burn_kop_per_min": burn,
+        "accrued_kop": accrued,
+        "projected_balance_kop": balance - accrued,
+        "depletes_ts": depletes_ts,
+        "pause_at_ts": pause_at_ts,
+        "time_to_pause_sec": max(0, pause_at_ts - now) if pause_at_ts else 0,
+        "bots": bots,
+    }
+
+
+async def get_billing_state(owner_user_id: int, *, now: int | None = None) -> dict[str, Any]:
+    """
+    Баланс, витрата коп/хв, накопичене-але-не-списане, прогноз паузи — одним викликом.
+    """
+    uid = int(owner_user_id)
+    version = await BillingForecastRepo.get_version(uid)
+    snap = _STATES.get(uid)
+    if snap is None or int(snap["version"]) != version:
+        snap = await _load_snapshot(uid, version)
+    return _project(uid, snap, int(now or time.time()))
@@ -0,0 +1,150 @@
+# rent_platform/core/leader.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import secrets
+import socket
+from typing import Callable
+
+from rent_platform.config import settings
+from rent_platform.db.session import db_execute, db_fetch_one
+
+log = logging.getLogger(__name__)
+
+# =========================================================
+# Leader election між процесами / репліками (lease-рядок з heartbeat)
+#
+# platform_leases(name) — хто зараз лідер і до якого часу.
+# Лідер продовжує оренду кожні TTL/3 сек; інші процеси пробують її взяти
+# з тією ж частотою і отримують, щойно expires_ts минув (лідер помер) або
+# лідер відпустив її на shutdown. Час — з БД (now()), не з годинника процесу.
+#
+# Тільки лідер запускає singleton-и (добовий білінг, reaper кошиків,
+# звірка лічильників). Outbox — у всіх процесах (claim з SKIP LOCKED).
+# =========================================================
+
+LEASE_NAME = "platform_singletons"
+
+_HOLDER = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+_IS_LEADER = False
+
+StartSingletons = Callable[[asyncio.Event], list[asyncio.Task]]
+
+
+def is_leader() -> bool:
+    return _IS_LEADER
+
+
+def holder_id() -> str:
+    return _HOLDER
+
+
+async def _acquire_or_renew(name: str, ttl_sec: int) -> int | None:
+    """
+    -> expires_ts (epoch сек, час БД), якщо оренда наша; None — тримає хтось інший.
+    """
+    q = """
+    INSERT INTO platform_leases (name, holder, acquired_ts, heartbeat_ts, expires_ts)
+    VALUES (
+        :n, :h,
+        EXTRACT(EPOCH FROM now())::bigint,
+        EXTRACT(EPOCH FROM now())::bigint,
+        EXTRACT(EPOCH FROM now())::bigint + :ttl
+    )
+    ON CONFLICT (name) DO UPDATE
+    SET holder = EXCLUDED.holder,
+        acquired_ts = CASE
+            WHEN platform_leases.holder = EXCLUDED.holder THEN platform_leases.acquired_ts
+            ELSE EXCLUDED.acquired_ts
+        END,
+        heartbeat_ts = EXCLUDED.heartbeat_ts,
+        expires_ts = EXCLUDED.expires_ts
+    WHERE platform_leases.holder = EXCLUDED.holder
+       OR platform_leases.expires_ts < EXCLUDED.heartbeat_ts
+    RETURNING expires_ts
+    """
+    row = await db_fetch_one(q, {"n": name, "h": _HOLDER, "ttl": int(ttl_sec)})
+    return int(row["expires_ts"]) if row else None
+
+
+async def _release(name: str) -> None:
+    q = """
+    DELETE FROM platform_leases
+    WHERE name = :n AND holder = :h
+    """
+    await db_execute(q, {"n": name, "h": _HOLDER})
+
+
+async def _stop_term(term_stop: asyncio.Event | None, tasks: list[asyncio.Task]) -> None:
+    if term_stop is not None:
+        term_stop.set()
+    for t in tasks:
+        try:
+            await t
+        except Exception:
+            pass
+
+
+async def leader_loop(stop_event: asyncio.Event, start_singletons: StartSingletons) -> None:
+    """
+    Поки процес живий: тримати/ловити оренду. Став лідером => start_singletons(term_stop);
+    втратив оренду або shutdown => term_stop.set() і чекаємо, поки singleton-и зупиняться.
+    LEADER_ELECTION_ENABLED=False => один процес, singleton-и стартують одразу.
+    """
+    global _IS_LEADER
+
+    if not settings.LEADER_ELECTION_ENABLED:
+        _IS_LEADER = True
+        tasks = start_singletons(stop_event)
+        await stop_event.wait()
+        await _stop_term(None, tasks)
+        return
+
+    ttl = max(3, int(settings.LEADER_LEASE_TTL_SEC))
+    beat = max(1.0, ttl / 3)
+    loop = asyncio.get_running_loop()
+
+    term_stop: asyncio.Event | None = None
+    tasks: list[asyncio.Task] = []
+    # до якого моменту (monotonic) оренда точно наша — з запасом в один heartbeat
+    safe_until = 0.0
+
+    log.info("leader election started holder=%s ttl=%ss", _HOLDER, ttl)
+    while not stop_event.is_set():
+        t0 = loop.time()
+        try:
+            held = await _acquire_or_renew(LEASE_NAME, ttl) is not None
+            if held:
+                safe_until = t0 + ttl - beat
+        except Exception as e:
+            log.warning("leader lease heartbeat failed: %s", e)
+            # БД недоступна: лишаємось лідером, лише поки оренда гарантовано не минула
+            held = _IS_LEADER and loop.time() < safe_until
+
+        if held and not _IS_LEADER:
+            _IS_LEADER = True
+            term_stop = asyncio.Event()
+            tasks = start_singletons(term_stop)
+            log.info("leader: acquired lease %s, started %s singleton(s)", LEASE_NAME, len(tasks))
+        elif not held and _IS_LEADER:
+            _IS_LEADER = False
+            log.warning("leader: lost lease %s, stopping singletons", LEASE_NAME)
+            await _stop_term(term_stop, tasks)
+            term_stop, tasks = None, []
+
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=beat)
+        except asyncio.TimeoutError:
+            pass
+
+    if _IS_LEADER:
+        _IS_LEADER = False
+        await _stop_term(term_stop, tasks)
+        try:
+            # швидкий failover: інші процеси підхоплять оренду на наступному heartbeat
+            await _release(LEASE_NAME)
+        except Exception as e:
+            log.warning("leader lease release failed: %s", e)
+    log.info("leader election stopped holder=%s", _HOLDER)
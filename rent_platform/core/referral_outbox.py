@@ -0,0 +1,107 @@
+# rent_platform/core/referral_outbox.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any
+
+from rent_platform.config import settings
+from rent_platform.db.repo import RefOutboxRepo, ReferralRepo
+
+log = logging.getLogger(__name__)
+
+# =========================================================
+# Outbox партнерських комісій
+#
+# Грошова подія (поповнення, добове списання) лише пише рядок у ref_commission_outbox
+# у своїй транзакції; нарахування рефереру — тут, після коміту, пачками одним запитом.
+# Збій рефералки більше не лишає поповнення "наполовину", а повтор нічого не подвоїть (event_key).
+# Працює в кожному процесі: claim з SKIP LOCKED.
+# =========================================================
+
+REF_OUTBOX_POLL_SEC = 5.0
+REF_OUTBOX_LEASE_SEC = 120
+REF_OUTBOX_RETRY_BASE_SEC = 10
+REF_OUTBOX_RETRY_MAX_SEC = 1800
+REF_OUTBOX_PURGE_EVERY_SEC = 3600
+
+_WAKE = asyncio.Event()
+
+
+def ref_outbox_wake() -> None:
+    """Викликати ПІСЛЯ коміту транзакції з подією — нарахування без очікування polling-у."""
+    _WAKE.set()
+
+
+def _backoff(attempts: int) -> int:
+    return min(REF_OUTBOX_RETRY_MAX_SEC, REF_OUTBOX_RETRY_BASE_SEC * (2 ** max(0, int(attempts) - 1)))
+
+
+async def _apply_one(r: dict[str, Any]) -> None:
+    await ReferralRepo.apply_commissions_batch([r])
+
+
+async def dispatch_once() -> int:
+    """
+    Одна пачка. -> скільки рядків взято (== REF_OUTBOX_BATCH => є ще).
+    Пачка нараховується одним запитом; якщо він впав — по одному, щоб кривий рядок
+    не тримав решту.
+    """
+    now = int(time.time())
+    rows = await RefOutboxRepo.claim(
+        now=now, limit=max(1, int(settings.REF_OUTBOX_BATCH)), lease_sec=REF_OUTBOX_LEASE_SEC
+    )
+    if not rows:
+        return 0
+
+    try:
+        await ReferralRepo.apply_commissions_batch(rows)
+        await RefOutboxRepo.mark_done([int(r["id"]) for r in rows], now=int(time.time()))
+        return len(rows)
+    except Exception as e:
+        log.warning("ref commission batch failed (%s rows), falling back to one by one: %s", len(rows), e)
+
+    max_attempts = max(1, int(settings.REF_OUTBOX_MAX_ATTEMPTS))
+    done: list[int] = []
+    for r in rows:
+        try:
+            await _apply_one(r)
+            done.append(int(r["id"]))
+        except Exception as e:
+            attempts = int(r.get("attempts") or 0)
+            if attempts >= max_attempts:
+                await RefOutboxRepo.mark_failed([int(r["id"])], error=str(e))
+                log.warning("ref commission failed for good event=%s err=%s", r.get("event_key"), e)
+            else:
+                await RefOutboxRepo.mark_retry(
+                    [int(r["id"])], next_try_ts=int(time.time()) + _backoff(attempts), error=str(e)
+                )
+
+    await RefOutboxRepo.mark_done(done, now=int(time.time()))
+    return len(rows)
+
+
+async def referral_outbox_loop(stop_event: asyncio.Event) -> None:
+    log.info("referral outbox dispatcher started")
+    batch = max(1, int(settings.REF_OUTBOX_BATCH))
+    last_purge = 0.0
+    while not stop_event.is_set():
+        _WAKE.clear()
+        taken = 0
+        try:
+            taken = await dispatch_once()
+            if time.monotonic() - last_purge >= REF_OUTBOX_PURGE_EVERY_SEC:
+                last_purge = time.monotonic()
+                days = max(1, int(settings.REF_OUTBOX_RETENTION_DAYS))
+                await RefOutboxRepo.purge_done(int(time.time()) - days * 86400)
+        except Exception as e:
+            log.exception("referral outbox dispatch failed: %s", e)
+
+        if taken >= batch:
+            continue
+        try:
+            await asyncio.wait_for(_WAKE.wait(), timeout=REF_OUTBOX_POLL_SEC)
+        except asyncio.TimeoutError:
+            pass
+    log.info("referral outbox dispatcher stopped")
@@ -0,0 +1,122 @@
+# rent_platform/core/tenant_routing.py
+from __future__ import annotations
+
+import time
+from typing import Any
+
+from rent_platform.db.session import db_fetch_all
+
+# =========================================================
+# Tenant routing cache (на процес)
+# route = {"tenant": <row tenants>, "modules": [module_key, ...]}
+#
+# tenant webhook раніше робив 2 запити на КОЖЕН апдейт (tenant + modules).
+# Тепер — з RAM; записи в tenants/tenant_modules викликають invalidate_route*.
+# TTL — страховка для кількох процесів.
+# =========================================================
+
+ROUTE_CACHE_TTL_SEC = 30
+
+# cache[tenant_id] = (expires_ts, route)
+_ROUTES: dict[str, tuple[int, dict[str, Any]]] = {}
+
+_TENANT_COLS = """
+    id,
+    owner_user_id,
+    bot_token,
+    secret,
+    status,
+    created_ts,
+    plan_key,
+    paid_until_ts,
+    paused_reason,
+    display_name,
+    product_key,
+    warned_24h_ts,
+    warned_3h_ts
+"""
+
+
+def billing_gate(tenant: dict[str, Any]) -> dict[str, Any]:
+    """
+    Рішення для tenant webhook-а, пораховане при завантаженні маршруту:
+      blocked_reason — deleted / paused (reason) / None
+      expires_ts     — legacy paid_until_ts активного tenant-а (0 = нема): після нього блокуємо
+    Webhook лише порівнює з now — без запитів і записів у БД.
+    """
+    st = (tenant.get("status") or "active").lower()
+    pr = (tenant.get("paused_reason") or "").lower()
+    reason = None
+    if st == "deleted":
+        reason = "deleted"
+    elif st == "paused":
+        reason = pr or "paused"
+    paid_until = int(tenant.get("paid_until_ts") or 0)
+    return {"blocked_reason": reason, "expires_ts": paid_until if reason is None and paid_until > 0 else 0}
+
+
+def invalidate_route(tenant_id: str) -> None:
+    _ROUTES.pop(str(tenant_id), None)
+
+
+def invalidate_routes_for_owner(owner_user_id: int) -> None:
+    uid = int(owner_user_id)
+    for tid, (_exp, route) in list(_ROUTES.items()):
+        try:
+            if int((route.get("tenant") or {}).get("owner_user_id") or 0) == uid:
+                _ROUTES.pop(tid, None)
+        except Exception:
+            _ROUTES.pop(tid, None)
+
+
+async def load_routes(tenant_ids: list[str]) -> dict[str, dict[str, Any]]:
+    """
+    Батч: tenants + enabled modules для багатьох tenant-ів (2 запити) і кладе в кеш.
+    """
+    ids = sorted({str(t) for t in tenant_ids or [] if t})
+    if not ids:
+        return {}
+
+    q_t = f"""
+    SELECT {_TENANT_COLS}
+    FROM tenants
+    WHERE id = ANY(:ids)
+    """
+    q_m = """
+    SELECT tenant_id, module_key
+    FROM tenant_modules
+    WHERE tenant_id = ANY(:ids) AND enabled = true
+    ORDER BY tenant_id, module_key
+    """
+    tenants = await db_fetch_all(q_t, {"ids": ids}) or []
+    mods = await db_fetch_all(q_m, {"ids": ids}) or []
+
+    by_tid: dict[str, list[str]] = {}
+    for m in mods:
+        by_tid.setdefault(str(m["tenant_id"]), []).append(str(m["module_key"]))
+
+    exp = int(time.time()) + ROUTE_CACHE_TTL_SEC
+    out: dict[str, dict[str, Any]] = {}
+    for t in tenants:
+        tid = str(t["id"])
+        route = {"tenant": dict(t), "modules": by_tid.get(tid, []), "gate": billing_gate(t)}
+        _ROUTES[tid] = (exp, route)
+        out[tid] = route
+    return out
+
+
+async def get_route(tenant_id: str) -> dict[str, Any] | None:
+    """
+    -> {"tenant": dict, "modules": list[str], "gate": dict} або None (tenant не існує).
+    Повертає КОПІЮ tenant-словника: викликач може його мутувати.
+    """
+    tid = str(tenant_id)
+    item = _ROUTES.get(tid)
+    if item and item[0] > int(time.time()):
+        route = item[1]
+    else:
+        route = (await load_routes([tid])).get(tid)
+        if not route:
+            return None
+
+    return {"tenant": dict(route["tenant"]), "modules": list(route["modules"]), "gate": dict(route["gate"])}
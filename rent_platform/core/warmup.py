@@ -0,0 +1,121 @@
+# rent_platform/core/warmup.py
+from __future__ import annotations
+
+import asyncio
+import importlib
+import logging
+import time
+from typing import Any
+
+from rent_platform.config import settings
+from rent_platform.core.tenant_routing import load_routes
+from rent_platform.products.catalog import PRODUCT_CATALOG
+
+log = logging.getLogger(__name__)
+
+
+def _load_fn(path: str):
+    """
+    path format: "package.module:callable"
+    """
+    mod_path, fn_name = path.split(":", 1)
+    return getattr(importlib.import_module(mod_path), fn_name)
+
+
+def _warmup_hooks() -> list[dict[str, Any]]:
+    hooks: list[dict[str, Any]] = []
+    for product_key, meta in PRODUCT_CATALOG.items():
+        if not meta.get("warmup"):
+            continue
+        try:
+            hooks.append(
+                {
+                    "module_key": meta.get("module_key") or product_key,
+                    "activity": _load_fn(meta["warmup_activity"]) if meta.get("warmup_activity") else None,
+                    "warm": _load_fn(meta["warmup"]),
+                }
+            )
+        except Exception as e:
+            log.warning("warmup hook load failed product=%s err=%s", product_key, e)
+    return hooks
+
+
+async def _warmup(stats: dict[str, Any]) -> None:
+    hooks = _warmup_hooks()
+    if not hooks:
+        return
+
+    since = int(time.time()) - max(1, int(settings.WARMUP_ACTIVITY_DAYS)) * 86400
+    top_n = max(1, int(settings.WARMUP_TOP_TENANTS))
+
+    # 1) рейтинг активності (сума по всіх продуктах)
+    scores: dict[str, int] = {}
+    for h in hooks:
+        if not h["activity"]:
+            continue
+        try:
+            for tid, score in await h["activity"](since, top_n):
+                scores[str(tid)] = scores.get(str(tid), 0) + int(score or 0)
+        except Exception as e:
+            log.warning("warmup activity failed module=%s err=%s", h["module_key"], e)
+
+    top = sorted(scores, key=lambda t: scores[t], reverse=True)[:top_n]
+    if not top:
+        return
+
+    # 2) routing table одним батчем
+    routes = await load_routes(top)
+    stats["routes"] = len(routes)
+
+    # 3) кеші модулів — паралельно, але не більше WARMUP_CONCURRENCY одночасно
+    sem = asyncio.Semaphore(max(1, int(settings.WARMUP_CONCURRENCY)))
+
+    async def _one(tid: str, h: dict[str, Any]) -> None:
+        async with sem:
+            try:
+                await h["warm"](tid)
+                stats["warmed"] += 1
+            except Exception as e:
+                stats["failed"] += 1
+                log.warning("warmup failed tenant=%s module=%s err=%s", tid, h["module_key"], e)
+
+    jobs = []
+    for tid in top:
+        route = routes.get(tid)
+        if not route:
+            continue
+        st = str((route["tenant"].get("status") or "active")).lower()
+        if st != "active":
+            continue
+        for h in hooks:
+            if h["module_key"] in route["modules"]:
+                jobs.append(_one(tid, h))
+
+    await asyncio.gather(*jobs)
+
+
+async def run_startup_warmup() -> None:
+    """
+    Опційний warm-up на старті (settings.WARMUP_ENABLED).
+    Ніколи не тримає старт довше за WARMUP_BUDGET_SEC і ніколи не валить старт.
+    """
+    if not settings.WARMUP_ENABLED:
+        return
+
+    started = time.monotonic()
+    stats: dict[str, Any] = {"routes": 0, "warmed": 0, "failed": 0, "timeout": False}
+    try:
+        await asyncio.wait_for(_warmup(stats), timeout=max(0.1, float(settings.WARMUP_BUDGET_SEC)))
+    except asyncio.TimeoutError:
+        stats["timeout"] = True
+    except Exception as e:
+        log.exception("warmup crashed: %s", e)
+
+    log.info(
+        "warmup done in %.2fs routes=%s warmed=%s failed=%s timeout=%s",
+        time.monotonic() - started,
+        stats["routes"],
+        stats["warmed"],
+        stats["failed"],
+        stats["timeout"],
+    )
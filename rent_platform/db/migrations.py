@@ -5,6 +5,9 @@ from rent_platform.db.session import db_execute
 
 log = logging.getLogger(__name__)
 
+# Runtime DDL — лише platform_settings + рефералка (0–5).
+# Схема магазину і білінгу — ревізії alembic/versions (з downgrade, індекси на великих
+# таблицях — CONCURRENTLY), а не тут на кожному старті.
 DDL: list[str] = [
     # =========================================================
     # 0) platform_settings (MUST exist before any ALTER/Repo use)
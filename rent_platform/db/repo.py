@@ -5,7 +5,8 @@ import secrets
 import time
 from typing import Any
 
-from rent_platform.db.session import db_fetch_one, db_fetch_all, db_execute
+from rent_platform.core.tenant_routing import invalidate_route, invalidate_routes_for_owner
+from rent_platform.db.session import db_fetch_one, db_fetch_all, db_execute, db_transaction
 
 
 class TenantRepo:
@@ -61,6 +62,7 @@ class TenantRepo:
         WHERE id = :id AND owner_user_id = :uid
         """
         res = await db_execute(q, {"r": int(rate_per_min_kop), "lb": int(last_billed_ts), "id": tenant_id, "uid": int(owner_user_id)})
+        await BillingForecastRepo.mark_owner_dirty(owner_user_id)
         if res is None:
             row = await TenantRepo.get_token_secret_for_owner(owner_user_id, tenant_id)
             return bool(row)
@@ -78,6 +80,31 @@ class TenantRepo:
         WHERE id = :id
         """
         await db_execute(q, {"id": tenant_id})
+        invalidate_route(tenant_id)
+        await BillingForecastRepo.mark_tenant_dirty(tenant_id)
+
+    @staticmethod
+    async def system_pause_expired_paid_until(now_ts: int, tenant_id: str | None = None) -> list[str]:
+        """
+        Legacy paid_until_ts минув => pause billing (усі такі tenants або один tenant_id).
+        Викликається з білінгу та фоновою задачею webhook-а — не з request path.
+        """
+        q = """
+        UPDATE tenants
+        SET status = 'paused',
+            paused_reason = 'billing'
+        WHERE status = 'active'
+          AND paid_until_ts > 0
+          AND paid_until_ts <= :now
+          AND (CAST(:id AS TEXT) IS NULL OR id = :id)
+        RETURNING id
+        """
+        rows = await db_fetch_all(q, {"now": int(now_ts), "id": tenant_id})
+        ids = [str(r["id"]) for r in rows]
+        for tid in ids:
+            invalidate_route(tid)
+            await BillingForecastRepo.mark_tenant_dirty(tid)
+        return ids
 
     @staticmethod
     async def system_resume_if_billing(tenant_id: str) -> None:
@@ -89,6 +116,8 @@ class TenantRepo:
         WHERE id = :id AND status='paused' AND paused_reason='billing'
         """
         await db_execute(q, {"id": tenant_id})
+        invalidate_route(tenant_id)
+        await BillingForecastRepo.mark_tenant_dirty(tenant_id)
 
     @staticmethod
     async def system_resume_all_billing_for_owner(owner_user_id: int) -> int:
@@ -105,6 +134,8 @@ class TenantRepo:
           AND paused_reason = 'billing'
         """
         res = await db_execute(q, {"uid": int(owner_user_id)})
+        invalidate_routes_for_owner(owner_user_id)
+        await BillingForecastRepo.mark_owner_dirty(owner_user_id)
 
         try:
             return int(res or 0)
@@ -150,6 +181,26 @@ class TenantRepo:
             for r in rows
         ]
 
+    @staticmethod
+    async def list_billing_by_owner(owner_user_id: int) -> list[dict[str, Any]]:
+        """Сирі рядки для стану білінгу кабінету (core/billing_state): + тариф і last_billed_ts."""
+        q = """
+        SELECT
+            id,
+            display_name,
+            status,
+            paused_reason,
+            plan_key,
+            paid_until_ts,
+            product_key,
+            rate_per_min_kop,
+            last_billed_ts
+        FROM tenants
+        WHERE owner_user_id = :uid
+        ORDER BY created_ts DESC
+        """
+        return await db_fetch_all(q, {"uid": int(owner_user_id)})
+
     @staticmethod
     async def create(owner_user_id: int, bot_token: str) -> dict[str, Any]:
         tenant_id = secrets.token_hex(4)
@@ -180,6 +231,7 @@ class TenantRepo:
             q,
             {"id": tenant_id, "uid": owner_user_id, "token": bot_token, "secret": secret, "ts": created_ts},
         )
+        await BillingForecastRepo.mark_owner_dirty(owner_user_id)
 
         return {
             "id": tenant_id,
@@ -224,6 +276,8 @@ class TenantRepo:
         WHERE id = :id AND owner_user_id = :uid
         """
         res = await db_execute(q, {"st": status, "pr": paused_reason, "id": tenant_id, "uid": owner_user_id})
+        invalidate_route(tenant_id)
+        await BillingForecastRepo.mark_owner_dirty(owner_user_id)
         if res is None:
             exists = await TenantRepo.get_token_secret_for_owner(owner_user_id, tenant_id)
             return bool(exists)
@@ -245,6 +299,7 @@ class TenantRepo:
         WHERE id = :id AND owner_user_id = :uid
         """
         res = await db_execute(q, {"sec": new_secret, "id": tenant_id, "uid": owner_user_id})
+        invalidate_route(tenant_id)
         if res is None:
             row = await TenantRepo.get_token_secret_for_owner(owner_user_id, tenant_id)
             return new_secret if row else None
@@ -258,6 +313,8 @@ class TenantRepo:
         WHERE id = :id AND owner_user_id = :uid
         """
         res = await db_execute(q, {"p": int(paid_until_ts), "plan": plan_key, "id": tenant_id, "uid": owner_user_id})
+        invalidate_route(tenant_id)
+        await BillingForecastRepo.mark_owner_dirty(owner_user_id)
         if res is None:
             row = await TenantRepo.get_token_secret_for_owner(owner_user_id, tenant_id)
             return bool(row)
@@ -277,6 +334,7 @@ class TenantRepo:
             q,
             {"dn": (display_name or "Bot").strip()[:128], "id": tenant_id, "uid": owner_user_id},
         )
+        await BillingForecastRepo.mark_owner_dirty(owner_user_id)
         if res is None:
             row = await TenantRepo.get_token_secret_for_owner(owner_user_id, tenant_id)
             return bool(row)
@@ -293,6 +351,8 @@ class TenantRepo:
         WHERE id = :id AND owner_user_id = :uid
         """
         res = await db_execute(q, {"pk": product_key, "id": tenant_id, "uid": owner_user_id})
+        invalidate_route(tenant_id)
+        await BillingForecastRepo.mark_owner_dirty(owner_user_id)
         if res is None:
             row = await TenantRepo.get_token_secret_for_owner(owner_user_id, tenant_id)
             return bool(row)
@@ -360,6 +420,7 @@ class ModuleRepo:
         DO UPDATE SET enabled = true
         """
         await db_execute(q, {"tid": tenant_id, "mk": module_key})
+        invalidate_route(tenant_id)
 
     @staticmethod
     async def disable(tenant_id: str, module_key: str) -> None:
@@ -369,6 +430,7 @@ class ModuleRepo:
         WHERE tenant_id = :tid AND module_key = :mk
         """
         await db_execute(q, {"tid": tenant_id, "mk": module_key})
+        invalidate_route(tenant_id)
 
     @staticmethod
     async def ensure_defaults(tenant_id: str, product_key: str | None = None) -> None:
@@ -505,6 +567,7 @@ class AccountRepo:
         WHERE owner_user_id = :uid
         """
         await db_execute(q, {"uid": int(owner_user_id), "d": int(delta_kop), "ts": int(time.time())})
+        await BillingForecastRepo.mark_owner_dirty(owner_user_id)
 
     @staticmethod
     async def set_balance(owner_user_id: int, new_balance_kop: int) -> None:
@@ -516,6 +579,7 @@ class AccountRepo:
         WHERE owner_user_id = :uid
         """
         await db_execute(q, {"uid": int(owner_user_id), "b": int(new_balance_kop), "ts": int(time.time())})
+        await BillingForecastRepo.mark_owner_dirty(owner_user_id)
 
     @staticmethod
     async def add_withdraw_balance(owner_user_id: int, delta_kop: int) -> None:
@@ -527,6 +591,7 @@ class AccountRepo:
         WHERE owner_user_id = :uid
         """
         await db_execute(q, {"uid": int(owner_user_id), "d": int(delta_kop), "ts": int(time.time())})
+        await BillingForecastRepo.mark_owner_dirty(owner_user_id)
 
     @staticmethod
     async def set_withdraw_balance(owner_user_id: int, new_withdraw_kop: int) -> None:
@@ -538,6 +603,7 @@ class AccountRepo:
         WHERE owner_user_id = :uid
         """
         await db_execute(q, {"uid": int(owner_user_id), "w": int(new_withdraw_kop), "ts": int(time.time())})
+        await BillingForecastRepo.mark_owner_dirty(owner_user_id)
 
     @staticmethod
     async def charge_with_ledger(
@@ -582,6 +648,8 @@ class AccountRepo:
                 "m": meta_json,
             },
         )
+        if row:
+            await BillingForecastRepo.mark_owner_dirty(owner_user_id)
         return int(row["balance_kop"]) if row and row.get("balance_kop") is not None else None
 
     @staticmethod
@@ -601,6 +669,8 @@ class AccountRepo:
             "min_bal": int(min_balance_kop),
             "ts": int(time.time()),
         })
+        if row:
+            await BillingForecastRepo.mark_owner_dirty(owner_user_id)
         return int(row["balance_kop"]) if row else None
 
 
@@ -654,6 +724,539 @@ class LedgerRepo:
                 "ts": int(time.time()),
             },
         )
+        await BillingForecastRepo.mark_owner_dirty(owner_user_id)
+
+
+# =========================================================
+# Set-based добовий білінг: усі tenants за кілька запитів в ОДНІЙ транзакції.
+#
+# План рахується одним WITH RECURSIVE: по кожному owner tenants ідуть у тому ж
+# порядку, що й у старому циклі (created_ts), баланс "тече" від рядка до рядка —
+# тож full / partial / pause збігаються з послідовною логікою 1-в-1.
+# План кладемо в temp-таблицю і з неї робимо 3 bulk-записи
+# (owner_accounts, tenants, billing_ledger).
+# =========================================================
+
+# хвилини, оплачені з балансу {bal}: усі (full) або скільки влазить до ліміту (partial)
+_BILL_PAID_SQL = """
+CAST(
+    CASE
+        WHEN b.minutes <= 0 THEN 0
+        WHEN {bal} - b.rate * b.minutes >= :lim THEN b.minutes
+        ELSE LEAST(b.minutes, GREATEST({bal} - :lim, 0) / b.rate)
+    END
+AS BIGINT)
+"""
+
+_BILL_ELIGIBLE_SQL = """
+    t.status = 'active'
+    AND t.product_key IS NOT NULL
+    AND t.owner_user_id IS NOT NULL
+    AND (CAST(:owners AS BIGINT[]) IS NULL OR t.owner_user_id = ANY(CAST(:owners AS BIGINT[])))
+"""
+
+
+class BillingRepo:
+    @staticmethod
+    def owner_lock_key(owner_user_id: int) -> str:
+        return f"billing_owner:{int(owner_user_id)}"
+
+    @staticmethod
+    async def list_billable_owners(run_key: str | None = None) -> list[int]:
+        """
+        run_key => без owner-ів, які в цьому прогоні вже мають checkpoint (resume).
+        """
+        q = f"""
+        SELECT DISTINCT t.owner_user_id
+        FROM tenants t
+        WHERE {_BILL_ELIGIBLE_SQL}
+          AND NOT EXISTS (
+              SELECT 1 FROM billing_run_owners r
+              WHERE r.run_key = :rk AND r.owner_user_id = t.owner_user_id
+          )
+        ORDER BY t.owner_user_id
+        """
+        rows = await db_fetch_all(q, {"owners": None, "rk": run_key or ""})
+        return [int(r["owner_user_id"]) for r in rows]
+
+    @staticmethod
+    async def apply_daily_charges(
+        *,
+        now_ts: int,
+        product_rates: dict[str, int],
+        negative_limit_kop: int,
+        max_minutes: int,
+        owner_ids: list[int] | None = None,
+        run_key: str | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        Списання за хвилини від last_billed_ts до now_ts для активних tenants
+        (owner_ids=None => усі owner-и).
+        Повертає рядки плану з outcome:
+          full  — списано все, last_billed_ts = now
+          pause — списано частково (charge_kop може бути 0) + pause billing
+          init  — тариф 0 або last_billed_ts = 0: лише синхронізуємо last_billed_ts
+        (skip — хвилин ще не набралось — не повертається)
+        З owner_ids транзакція спершу бере advisory lock кожного owner-а (у порядку id):
+        паралельні прогони по тому ж owner-у чекають, а не рахують баланс удвох.
+        run_key (разом з owner_ids) => checkpoint: у тій же транзакції пишемо billing_run_owners;
+        owner-и, які в цьому прогоні вже є, пропускаються (повтор прогону — no-op).
+        """
+        params: dict[str, Any] = {
+            "now": int(now_ts),
+            # init (новий tenant / ще без тарифу) стартує з реального "зараз", а не з північ
+            # минулого дня catch-up-у: інакше наступні прогони спишуть доби до його появи
+            "real_now": int(time.time()),
+            "lim": int(negative_limit_kop),
+            "maxm": int(max_minutes),
+            "owners": [int(x) for x in owner_ids] if owner_ids is not None else None,
+            "pks": [str(k) for k in product_rates.keys()],
+            "rates": [int(v) for v in product_rates.values()],
+        }
+
+        q_ensure = f"""
+        INSERT INTO owner_accounts (owner_user_id, balance_kop, withdraw_balance_kop, updated_ts)
+        SELECT DISTINCT t.owner_user_id, 0, 0, :now
+        FROM tenants t
+        WHERE {_BILL_ELIGIBLE_SQL}
+        ON CONFLICT (owner_user_id) DO NOTHING
+        """
+        # порядок локів той самий, що в topup-і: спершу рахунок, потім tenants
+        q_lock = f"""
+        SELECT a.owner_user_id
+        FROM owner_accounts a
+        WHERE a.owner_user_id IN (SELECT t.owner_user_id FROM tenants t WHERE {_BILL_ELIGIBLE_SQL})
+        ORDER BY a.owner_user_id
+        FOR UPDATE
+        """
+        q_lock_t = f"""
+        SELECT t.id
+        FROM tenants t
+        WHERE {_BILL_ELIGIBLE_SQL}
+        ORDER BY t.id
+        FOR UPDATE
+        """
+        q_plan = f"""
+        CREATE TEMP TABLE _bill_plan ON COMMIT DROP AS
+        WITH RECURSIVE
+        cat AS (
+            SELECT *
+            FROM unnest(CAST(:pks AS TEXT[]), CAST(:rates AS BIGINT[])) AS c(product_key, rate)
+        ),
+        b AS (
+            SELECT
+                x.*,
+                CAST(
+                    CASE
+                        WHEN x.rate <= 0 OR x.last_ts <= 0 OR x.last_ts >= :now THEN 0
+                        ELSE LEAST((:now - x.last_ts) / 60, :maxm)
+                    END
+                AS BIGINT) AS minutes
+            FROM (
+                SELECT
+                    t.id AS tenant_id,
+                    CAST(t.owner_user_id AS BIGINT) AS owner_user_id,
+                    t.product_key,
+                    CAST(COALESCE(t.last_billed_ts, 0) AS BIGINT) AS last_ts,
+                    CAST(
+                        CASE WHEN COALESCE(t.rate_per_min_kop, 0) > 0 THEN t.rate_per_min_kop ELSE COALESCE(c.rate, 0) END
+                    AS BIGINT) AS rate,
+                    ROW_NUMBER() OVER (PARTITION BY t.owner_user_id ORDER BY t.created_ts ASC, t.id ASC) AS rn
+                FROM tenants t
+                LEFT JOIN cat c ON c.product_key = t.product_key
+                WHERE {_BILL_ELIGIBLE_SQL}
+            ) x
+        ),
+        walk AS (
+            SELECT b.*, CAST(a.balance_kop AS BIGINT) AS bal, {_BILL_PAID_SQL.format(bal="a.balance_kop")} AS paid_min
+            FROM b
+            JOIN owner_accounts a ON a.owner_user_id = b.owner_user_id
+            WHERE b.rn = 1
+            UNION ALL
+            SELECT
+                b.*,
+                CAST(w.bal - w.paid_min * w.rate AS BIGINT),
+                {_BILL_PAID_SQL.format(bal="(w.bal - w.paid_min * w.rate)")}
+            FROM walk w
+            JOIN b ON b.owner_user_id = w.owner_user_id AND b.rn = w.rn + 1
+        )
+        SELECT
+            tenant_id,
+            owner_user_id,
+            product_key,
+            rn,
+            rate,
+            last_ts,
+            minutes,
+            paid_min,
+            paid_min * rate AS charge_kop,
+            CASE
+                WHEN rate <= 0 OR last_ts <= 0 THEN 'init'
+                WHEN minutes <= 0 THEN 'skip'
+                WHEN paid_min = minutes THEN 'full'
+                ELSE 'pause'
+            END AS outcome
+        FROM walk
+        """
+        q_acc = """
+        UPDATE owner_accounts a
+        SET balance_kop = a.balance_kop - p.charge_kop,
+            updated_ts = :now
+        FROM (
+            SELECT owner_user_id, SUM(charge_kop) AS charge_kop
+            FROM _bill_plan
+            GROUP BY owner_user_id
+            HAVING SUM(charge_kop) > 0
+        ) p
+        WHERE a.owner_user_id = p.owner_user_id
+        """
+        q_ten = """
+        UPDATE tenants t
+        SET rate_per_min_kop = p.rate,
+            last_billed_ts = GREATEST(
+                COALESCE(t.last_billed_ts, 0),
+                CASE WHEN p.outcome = 'init' THEN GREATEST(:now, :real_now) ELSE :now END
+            ),
+            status = CASE WHEN p.outcome = 'pause' THEN 'paused' ELSE t.status END,
+            paused_reason = CASE WHEN p.outcome = 'pause' THEN 'billing' ELSE t.paused_reason END
+        FROM _bill_plan p
+        WHERE t.id = p.tenant_id
+          AND p.outcome <> 'skip'
+        """
+        q_led = """
+        INSERT INTO billing_ledger (owner_user_id, tenant_id, kind, amount_kop, meta, created_ts)
+        SELECT
+            owner_user_id,
+            tenant_id,
+            CASE WHEN outcome = 'full' THEN 'daily_charge' ELSE 'daily_charge_partial' END,
+            -charge_kop,
+            CASE
+                WHEN outcome = 'full' THEN json_build_object(
+                    'product_key', product_key, 'minutes', minutes, 'rate_kop', rate,
+                    'from_ts', last_ts, 'to_ts', CAST(:now AS BIGINT)
+                )::text
+                ELSE json_build_object(
+                    'product_key', product_key, 'minutes_paid', paid_min, 'minutes_total', minutes,
+                    'rate_kop', rate, 'limit_kop', CAST(:lim AS BIGINT),
+                    'from_ts', last_ts, 'to_ts', CAST(:now AS BIGINT)
+                )::text
+            END,
+            :now
+        FROM _bill_plan
+        WHERE charge_kop > 0
+        ORDER BY owner_user_id, rn
+        """
+        q_dirty = """
+        INSERT INTO owner_billing_forecast (owner_user_id, dirty, version)
+        SELECT DISTINCT owner_user_id, true, 1
+        FROM _bill_plan
+        WHERE outcome <> 'skip'
+        ON CONFLICT (owner_user_id) DO UPDATE
+        SET dirty = true, version = owner_billing_forecast.version + 1
+        """
+        # партнерка з білінгу: одна подія на owner-а за прогін (ключ стабільний => повтор no-op),
+        # нараховує core/referral_outbox пачкою через ReferralRepo.apply_commissions_batch
+        q_ref = """
+        INSERT INTO ref_commission_outbox
+            (event_key, user_id, kind, amount_kop, title, details, created_ts, next_try_ts)
+        SELECT
+            'billing:' || :rk || ':' || owner_user_id,
+            owner_user_id,
+            'billing',
+            SUM(charge_kop),
+            :title,
+            :rk || ', bots=' || COUNT(*),
+            :now,
+            :now
+        FROM _bill_plan
+        WHERE charge_kop > 0
+        GROUP BY owner_user_id
+        ON CONFLICT (event_key) DO NOTHING
+        """
+        q_out = """
+        SELECT tenant_id, owner_user_id, product_key, outcome, rate, minutes, paid_min, charge_kop
+        FROM _bill_plan
+        WHERE outcome <> 'skip'
+        ORDER BY owner_user_id, rn
+        """
+        q_claim = """
+        INSERT INTO billing_run_owners (run_key, owner_user_id, done_ts)
+        SELECT :rk, o, :now
+        FROM unnest(CAST(:owners AS BIGINT[])) AS o
+        ON CONFLICT (run_key, owner_user_id) DO NOTHING
+        RETURNING owner_user_id
+        """
+        async with db_transaction() as tx:
+            if owner_ids:
+                for oid in sorted({int(x) for x in owner_ids}):
+                    await tx.fetch_one("SELECT pg_advisory_xact_lock(hashtext(:k))", {"k": BillingRepo.owner_lock_key(oid)})
+            if run_key and owner_ids:
+                claimed = await tx.fetch_all(q_claim, {"rk": str(run_key), "now": params["now"], "owners": params["owners"]})
+                params["owners"] = [int(r["owner_user_id"]) for r in claimed]
+                if not params["owners"]:
+                    return []
+            await tx.execute(q_ensure, params)
+            await tx.fetch_all(q_lock, params)
+            await tx.fetch_all(q_lock_t, params)
+            await tx.execute(q_plan, params)
+            await tx.execute(q_acc, params)
+            await tx.execute(q_ten, params)
+            await tx.execute(q_led, params)
+            await tx.execute(q_dirty, {})
+            if run_key:
+                await tx.execute(q_ref, {"rk": str(run_key), "now": params["now"], "title": "Партнерка з білінгу"})
+            rows = await tx.fetch_all(q_out, {})
+
+        for r in rows:
+            if r.get("outcome") == "pause":
+                invalidate_route(str(r["tenant_id"]))
+        return rows
+
+
+class BillingRunRepo:
+    """
+    billing_runs — один рядок на прогін (run_key = "daily:YYYY-MM-DD"), now_ts фіксований:
+    resume після падіння рахує до того ж моменту.
+    billing_run_owners — checkpoint-и (пише BillingRepo.apply_daily_charges у транзакції списання).
+    """
+
+    @staticmethod
+    async def start(run_key: str, now_ts: int, owners_total: int = 0) -> dict[str, Any]:
+        q = """
+        INSERT INTO billing_runs (run_key, now_ts, status, started_ts, finished_ts, attempts, stats)
+        VALUES (:rk, :now, 'running', :ts, 0, 1, '{}')
+        ON CONFLICT (run_key) DO UPDATE
+        SET attempts = billing_runs.attempts + CASE WHEN billing_runs.status = 'done' THEN 0 ELSE 1 END,
+            status = CASE WHEN billing_runs.status = 'done' THEN 'done' ELSE 'running' END
+        RETURNING run_key, now_ts, status, started_ts, finished_ts, attempts
+        """
+        row = await db_fetch_one(q, {"rk": str(run_key), "now": int(now_ts), "ts": int(time.time())})
+        return row or {}
+
+    @staticmethod
+    async def finish(run_key: str, *, ok: bool, stats: dict[str, Any]) -> None:
+        q = """
+        UPDATE billing_runs
+        SET status = :st,
+            finished_ts = :ts,
+            stats = :stats
+        WHERE run_key = :rk
+        """
+        await db_execute(
+            q,
+            {
+                "rk": str(run_key),
+                "st": "done" if ok else "failed",
+                "ts": int(time.time()),
+                "stats": json.dumps(stats, ensure_ascii=False, default=str),
+            },
+        )
+
+    @staticmethod
+    async def get_many(run_keys: list[str]) -> dict[str, dict[str, Any]]:
+        if not run_keys:
+            return {}
+        q = """
+        SELECT run_key, now_ts, status, started_ts, finished_ts, attempts
+        FROM billing_runs
+        WHERE run_key = ANY(:rks)
+        """
+        rows = await db_fetch_all(q, {"rks": [str(k) for k in run_keys]})
+        return {str(r["run_key"]): r for r in rows}
+
+
+
+class BillingForecastRepo:
+    """
+    owner_billing_forecast — прогноз, коли баланс owner-а дійде до ліміту мінуса.
+
+    depletes_ts не залежить від "зараз": баланс B, ліміт L, активні тарифи r_i,
+    last_billed_ts l_i  =>  B - L = Σ r_i·(T - l_i)/60  =>  T = ((B - L)·60 + Σ r_i·l_i) / Σ r_i.
+    Тож перераховувати треба лише після подій (поповнення, списання, статус/тариф tenant-а):
+    такі записи ставлять dirty=true, а планувальник (core/balance_forecast) перераховує
+    лише dirty-рядки і шукає попередження індексом по depletes_ts.
+    Кожна позначка ще й збільшує version — по ній кеш стану кабінету (core/billing_state)
+    бачить, що його знімок застарів (і в інших процесах теж).
+    """
+
+    @staticmethod
+    async def get_version(owner_user_id: int) -> int:
+        q = "SELECT version FROM owner_billing_forecast WHERE owner_user_id = :uid"
+        row = await db_fetch_one(q, {"uid": int(owner_user_id)})
+        return int(row["version"]) if row else 0
+
+    @staticmethod
+    async def mark_owner_dirty(owner_user_id: int) -> None:
+        q = """
+        INSERT INTO owner_billing_forecast (owner_user_id, dirty, version)
+        VALUES (:uid, true, 1)
+        ON CONFLICT (owner_user_id) DO UPDATE
+        SET dirty = true, version = owner_billing_forecast.version + 1
+        """
+        try:
+            await db_execute(q, {"uid": int(owner_user_id)})
+        except Exception as e:
+            log.warning("forecast mark dirty failed owner=%s err=%s", owner_user_id, e)
+
+    @staticmethod
+    async def mark_tenant_dirty(tenant_id: str) -> None:
+        q = """
+        INSERT INTO owner_billing_forecast (owner_user_id, dirty, version)
+        SELECT owner_user_id, true, 1
+        FROM tenants
+        WHERE id = :id AND owner_user_id IS NOT NULL
+        ON CONFLICT (owner_user_id) DO UPDATE
+        SET dirty = true, version = owner_billing_forecast.version + 1
+        """
+        try:
+            await db_execute(q, {"id": str(tenant_id)})
+        except Exception as e:
+            log.warning("forecast mark dirty failed tenant=%s err=%s", tenant_id, e)
+
+    @staticmethod
+    async def mark_all_dirty() -> int:
+        """Звірка / перший запуск: усі owner-и з активними tenants або вже відомим прогнозом."""
+        q = """
+        INSERT INTO owner_billing_forecast (owner_user_id, dirty)
+        SELECT DISTINCT owner_user_id, true
+        FROM tenants
+        WHERE status = 'active' AND product_key IS NOT NULL AND owner_user_id IS NOT NULL
+        ON CONFLICT (owner_user_id) DO UPDATE SET dirty = true
+        """
+        n = await db_execute(q, {})
+        await db_execute("UPDATE owner_billing_forecast SET dirty = true WHERE depletes_ts > 0 AND NOT dirty", {})
+        return n
+
+    @staticmethod
+    async def recompute_dirty(
+        *,
+        now_ts: int,
+        product_rates: dict[str, int],
+        negative_limit_kop: int,
+        warn_windows: tuple[int, int],
+        limit: int = 1000,
+    ) -> int:
+        """
+        Перерахувати до limit dirty-рядків одним запитом. Позначки попереджень скидаються,
+        коли прогноз вийшов за своє вікно (наприклад, після поповнення).
+        FOR UPDATE SKIP LOCKED: нова позначка dirty, що прийшла під час перерахунку,
+        чекає на коміт і не губиться.
+        """
+        q = """
+        WITH d AS (
+            SELECT owner_user_id
+            FROM owner_billing_forecast
+            WHERE dirty
+            ORDER BY owner_user_id
+            LIMIT :lim
+            FOR UPDATE SKIP LOCKED
+        ),
+        cat AS (
+            SELECT *
+            FROM unnest(CAST(:pks AS TEXT[]), CAST(:rates AS BIGINT[])) AS c(product_key, rate)
+        ),
+        agg AS (
+            SELECT
+                x.owner_user_id,
+                SUM(x.rate) AS burn,
+                SUM(x.rate * x.last_ts) AS rl
+            FROM (
+                SELECT
+                    CAST(t.owner_user_id AS BIGINT) AS owner_user_id,
+                    CAST(
+                        CASE WHEN COALESCE(t.rate_per_min_kop, 0) > 0 THEN t.rate_per_min_kop ELSE COALESCE(c.rate, 0) END
+                    AS BIGINT) AS rate,
+                    CAST(CASE WHEN COALESCE(t.last_billed_ts, 0) > 0 THEN t.last_billed_ts ELSE :now END AS BIGINT) AS last_ts
+                FROM tenants t
+                LEFT JOIN cat c ON c.product_key = t.product_key
+                WHERE t.owner_user_id IN (SELECT owner_user_id FROM d)
+                  AND t.status = 'active'
+                  AND t.product_key IS NOT NULL
+            ) x
+            WHERE x.rate > 0
+            GROUP BY x.owner_user_id
+        ),
+        calc AS (
+            SELECT
+                d.owner_user_id,
+                COALESCE(a.balance_kop, 0) AS balance_kop,
+                COALESCE(g.burn, 0) AS burn,
+                CASE
+                    WHEN COALESCE(g.burn, 0) > 0
+                        THEN GREATEST(1, ((COALESCE(a.balance_kop, 0) - :lim_kop) * 60 + g.rl) / g.burn)
+                    ELSE 0
+                END AS depletes_ts
+            FROM d
+            LEFT JOIN agg g ON g.owner_user_id = d.owner_user_id
+            LEFT JOIN owner_accounts a ON a.owner_user_id = d.owner_user_id
+        )
+        UPDATE owner_billing_forecast f
+        SET balance_kop = c.balance_kop,
+            burn_kop_per_min = c.burn,
+            depletes_ts = c.depletes_ts,
+            warned_24h_ts = CASE WHEN c.depletes_ts = 0 OR c.depletes_ts > :now + :w24 THEN 0 ELSE f.warned_24h_ts END,
+            warned_3h_ts = CASE WHEN c.depletes_ts = 0 OR c.depletes_ts > :now + :w3 THEN 0 ELSE f.warned_3h_ts END,
+            dirty = false,
+            updated_ts = :now
+        FROM calc c
+        WHERE f.owner_user_id = c.owner_user_id
+        """
+        return await db_execute(
+            q,
+            {
+                "now": int(now_ts),
+                "lim": int(limit),
+                "lim_kop": int(negative_limit_kop),
+                "w24": int(warn_windows[0]),
+                "w3": int(warn_windows[1]),
+                "pks": [str(k) for k in product_rates.keys()],
+                "rates": [int(v) for v in product_rates.values()],
+            },
+        )
+
+    @staticmethod
+    async def list_to_warn(kind: str, *, now_ts: int, window_sec: int, limit: int = 500) -> list[dict[str, Any]]:
+        col = "warned_24h_ts" if kind == "24h" else "warned_3h_ts"
+        q = f"""
+        SELECT owner_user_id, balance_kop, burn_kop_per_min, depletes_ts
+        FROM owner_billing_forecast
+        WHERE depletes_ts > 0
+          AND depletes_ts <= :until
+          AND {col} = 0
+          AND NOT dirty
+        ORDER BY depletes_ts
+        LIMIT :lim
+        """
+        return await db_fetch_all(q, {"until": int(now_ts) + int(window_sec), "lim": int(limit)})
+
+    @staticmethod
+    async def mark_warned(owner_ids: list[int], kind: str, *, now_ts: int) -> None:
+        """3h-попередження закриває і 24h (пізно слати "залишилась доба"). Дзеркалимо в tenants.warned_*."""
+        if not owner_ids:
+            return
+        ids = [int(x) for x in owner_ids]
+        if kind == "24h":
+            q_f = "UPDATE owner_billing_forecast SET warned_24h_ts = :ts WHERE owner_user_id = ANY(:ids)"
+            q_t = """
+            UPDATE tenants SET warned_24h_ts = :ts
+            WHERE owner_user_id = ANY(:ids) AND status = 'active' AND product_key IS NOT NULL
+            """
+        else:
+            q_f = """
+            UPDATE owner_billing_forecast
+            SET warned_3h_ts = :ts,
+                warned_24h_ts = CASE WHEN warned_24h_ts = 0 THEN :ts ELSE warned_24h_ts END
+            WHERE owner_user_id = ANY(:ids)
+            """
+            q_t = """
+            UPDATE tenants
+            SET warned_3h_ts = :ts,
+                warned_24h_ts = CASE WHEN warned_24h_ts = 0 THEN :ts ELSE warned_24h_ts END
+            WHERE owner_user_id = ANY(:ids) AND status = 'active' AND product_key IS NOT NULL
+            """
+        async with db_transaction() as tx:
+            await tx.execute(q_f, {"ids": ids, "ts": int(now_ts)})
+            await tx.execute(q_t, {"ids": ids, "ts": int(now_ts)})
 
 
 import logging
@@ -705,6 +1308,118 @@ class InvoiceRepo:
         """
         await db_execute(q, {"id": int(invoice_id), "uid": int(owner_user_id), "ts": int(time.time())})
 
+    @staticmethod
+    async def apply_paid_topup(owner_user_id: int, invoice_id: int) -> dict[str, Any] | None:
+        """
+        Підтвердження оплати інвойса — одним CTE-ланцюжком в одній транзакції:
+        pending -> paid, баланс +amount, ledger 'topup', auto-resume billing-пауз,
+        подія комісії в ref_commission_outbox, dirty/version прогнозу.
+        Перший крок (UPDATE ... WHERE status='pending') пускає далі лише один виклик —
+        решта бачать порожній inv і нічого не пишуть (no double credit).
+        Data-modifying CTE виконуються завжди, навіть якщо фінальний SELECT їх не читає.
+        Транзакція бере advisory lock owner-а, як добовий білінг: не перетинаємось з ним.
+
+        -> None (інвойса нема / чужий) або
+           {applied, status, amount_kop, balance_kop, resumed_ids, paused_billing_ids}
+        """
+        q = f"""
+        WITH inv AS (
+            UPDATE {InvoiceRepo.TABLE}
+            SET status = 'paid',
+                paid_ts = :ts
+            WHERE id = :id
+              AND owner_user_id = :uid
+              AND status = 'pending'
+              AND amount_kop > 0
+            RETURNING id, owner_user_id, provider, amount_kop
+        ),
+        acc AS (
+            INSERT INTO owner_accounts (owner_user_id, balance_kop, withdraw_balance_kop, updated_ts)
+            SELECT owner_user_id, amount_kop, 0, :ts FROM inv
+            ON CONFLICT (owner_user_id) DO UPDATE
+            SET balance_kop = owner_accounts.balance_kop + EXCLUDED.balance_kop,
+                updated_ts = EXCLUDED.updated_ts
+            RETURNING balance_kop
+        ),
+        led AS (
+            INSERT INTO billing_ledger (owner_user_id, tenant_id, kind, amount_kop, meta, created_ts)
+            SELECT owner_user_id, NULL, 'topup', amount_kop,
+                   json_build_object('invoice_id', id, 'provider', provider)::text, :ts
+            FROM inv
+        ),
+        res AS (
+            UPDATE tenants
+            SET status = 'active',
+                paused_reason = NULL
+            WHERE owner_user_id = :uid
+              AND status = 'paused'
+              AND paused_reason = 'billing'
+              AND EXISTS (SELECT 1 FROM inv)
+            RETURNING id
+        ),
+        ref AS (
+            INSERT INTO ref_commission_outbox
+                (event_key, user_id, kind, amount_kop, title, details, created_ts, next_try_ts)
+            SELECT 'topup:' || id, owner_user_id, 'topup', amount_kop, :ref_title,
+                   'invoice_id=' || id || ', provider=' || COALESCE(provider, ''), :ts, :ts
+            FROM inv
+            ON CONFLICT (event_key) DO NOTHING
+        ),
+        fc AS (
+            INSERT INTO owner_billing_forecast (owner_user_id, dirty, version)
+            SELECT owner_user_id, true, 1 FROM inv
+            ON CONFLICT (owner_user_id) DO UPDATE
+            SET dirty = true, version = owner_billing_forecast.version + 1
+        )
+        SELECT
+            i.status,
+            (SELECT amount_kop FROM inv) AS amount_kop,
+            COALESCE(
+                (SELECT balance_kop FROM acc),
+                (SELECT balance_kop FROM owner_accounts WHERE owner_user_id = :uid),
+                0
+            ) AS balance_kop,
+            ARRAY(SELECT id FROM res ORDER BY id) AS resumed_ids,
+            ARRAY(
+                SELECT t.id FROM tenants t
+                WHERE t.owner_user_id = :uid
+                  AND t.status = 'paused'
+                  AND t.paused_reason = 'billing'
+                  AND t.id NOT IN (SELECT id FROM res)
+                ORDER BY t.id
+            ) AS paused_billing_ids
+        FROM {InvoiceRepo.TABLE} i
+        WHERE i.id = :id AND i.owner_user_id = :uid
+        """
+        async with db_transaction() as tx:
+            await tx.fetch_one("SELECT pg_advisory_xact_lock(hashtext(:k))", {"k": BillingRepo.owner_lock_key(owner_user_id)})
+            row = await tx.fetch_one(
+                q,
+                {
+                    "id": int(invoice_id),
+                    "uid": int(owner_user_id),
+                    "ts": int(time.time()),
+                    "ref_title": "Партнерка з поповнення",
+                },
+            )
+        if not row:
+            return None
+
+        applied = row.get("amount_kop") is not None
+        resumed_ids = [str(x) for x in (row.get("resumed_ids") or [])]
+        # після коміту: кешовані маршрути піднятих ботів ще пам'ятають паузу
+        for tid in resumed_ids:
+            invalidate_route(tid)
+        return {
+            "applied": applied,
+            # i.status — знімок ДО цього запиту (для already: paid / canceled / ...)
+            "status": "paid" if applied else str(row.get("status") or "").lower(),
+            "amount_kop": int(row.get("amount_kop") or 0),
+            "balance_kop": int(row.get("balance_kop") or 0),
+            "resumed_ids": resumed_ids,
+            "paused_billing_ids": [str(x) for x in (row.get("paused_billing_ids") or [])],
+        }
+
 class WithdrawRepo:
     TABLE = "withdraw_requests"
 
@@ -927,6 +1642,7 @@ class PlatformSettingsRepo:
                       updated_ts = EXCLUDED.updated_ts
         """
         await db_execute(q, {"rj": json.dumps(payload or {}, ensure_ascii=False), "ts": int(time.time())})
+        ReferralRepo.invalidate_settings()
 
     @staticmethod
     async def get_marketplace_overrides() -> dict:
@@ -966,6 +1682,11 @@ class PlatformSettingsRepo:
         """
         await db_execute(q, {"rj": json.dumps(data, ensure_ascii=False), "ts": int(time.time())})
 
+
+# подій комісії в одному запиті (розмір масивів-параметрів)
+REF_COMMISSION_CHUNK = 5000
+
+
 class ReferralRepo:
     @staticmethod
     async def bind(user_id: int, referrer_id: int) -> bool:
@@ -999,12 +1720,26 @@ class ReferralRepo:
         row = await db_fetch_one("SELECT referrer_id FROM ref_users WHERE user_id = :u", {"u": int(user_id)})
         return int(row["referrer_id"]) if row else None
 
+    # кеш налаштувань на процес: get_settings() кличеться на кожну подію комісії
+    # і в хендлерах; set_settings() скидає кеш одразу, інші процеси — через TTL
+    SETTINGS_TTL_SEC = 60
+    _settings_cache: dict | None = None
+    _settings_loaded_at = 0.0
+
+    @staticmethod
+    def invalidate_settings() -> None:
+        ReferralRepo._settings_cache = None
+
     @staticmethod
     async def get_settings() -> dict:
         """
         Беремо ref_json з platform_settings(id=1).
-        Якщо пусто — дефолти.
+        Якщо пусто — дефолти. Повертає копію (можна міняти й віддавати в set_settings).
         """
+        cached = ReferralRepo._settings_cache
+        if cached is not None and time.monotonic() - ReferralRepo._settings_loaded_at < ReferralRepo.SETTINGS_TTL_SEC:
+            return dict(cached)
+
         row = await PlatformSettingsRepo.get()
         raw = (row.get("ref_json") if row else "") or ""
         try:
@@ -1012,12 +1747,15 @@ class ReferralRepo:
         except Exception:
             data = {}
 
-        return {
+        cached = {
             "enabled": bool(data.get("enabled", True)),
             "percent_topup_bps": int(data.get("percent_topup_bps", 500)),     # 5%
             "percent_billing_bps": int(data.get("percent_billing_bps", 200)), # 2%
             "min_payout_kop": int(data.get("min_payout_kop", 10000)),         # 100 грн
         }
+        ReferralRepo._settings_cache = cached
+        ReferralRepo._settings_loaded_at = time.monotonic()
+        return dict(cached)
 
     @staticmethod
     async def set_settings(payload: dict) -> None:
@@ -1048,6 +1786,7 @@ class ReferralRepo:
         DO UPDATE SET ref_json = EXCLUDED.ref_json, updated_ts = EXCLUDED.updated_ts
         """
         await db_execute(q, {"rj": json.dumps(cur, ensure_ascii=False), "ts": int(time.time())})
+        ReferralRepo.invalidate_settings()
 
     @staticmethod
     async def _ensure_balance(referrer_id: int) -> None:
@@ -1068,27 +1807,6 @@ class ReferralRepo:
         """
         return await db_fetch_one(q, {"r": int(referrer_id)})
 
-    # далі — твій apply_commission/stats без змін
-
-  
-    @staticmethod
-    async def _try_mark_event_once(event_key: str) -> bool:
-        """
-        Idempotency: True тільки якщо ми ВПЕРШЕ вставили event_key.
-        """
-        ek = (event_key or "").strip()[:128]
-        if not ek:
-            return False
-
-        q = """
-        INSERT INTO ref_applied_events (event_key, created_ts)
-        VALUES (:k, :ts)
-        ON CONFLICT (event_key) DO NOTHING
-        RETURNING event_key
-        """
-        row = await db_fetch_one(q, {"k": ek, "ts": int(time.time())})
-        return bool(row)
-
     @staticmethod
     async def apply_commission(
         user_id: int,
@@ -1104,66 +1822,133 @@ class ReferralRepo:
         amount_kop: позитивне число (скільки user заплатив/було списано)
         event_key: унікальний ключ події (щоб не нарахувати двічі)
         """
-        user_id = int(user_id)
-        amount_kop = int(amount_kop)
-
-        if amount_kop <= 0:
-            return 0
+        applied = await ReferralRepo.apply_commissions_batch(
+            [
+                {
+                    "event_key": event_key,
+                    "user_id": user_id,
+                    "kind": kind,
+                    "amount_kop": amount_kop,
+                    "title": title,
+                    "details": details,
+                }
+            ]
+        )
+        return sum(applied.values())
 
+    @staticmethod
+    async def apply_commissions_batch(events: list[dict[str, Any]]) -> dict[str, int]:
+        """
+        Пачка подій {event_key, user_id, kind, amount_kop, title?, details?} — один запит
+        на REF_COMMISSION_CHUNK подій (білінг / outbox шлють тисячі за раз).
+        Семантика та сама, що була в послідовному apply_commission:
+        - подія без реферера (або сам собі реферер) — пропускається і НЕ позначається;
+        - подія з реферером позначається в ref_applied_events (навіть якщо комісія 0);
+        - вже позначена — нічого (повтор безпечний);
+        - комісія = amount * bps // 10000, bps за kind ('topup' / інше = billing).
+        -> {event_key: комісія} лише для щойно нарахованих (> 0).
+        """
         settings = await ReferralRepo.get_settings()
         if not settings["enabled"]:
-            return 0
-
-        referrer_id = await ReferralRepo.get_referrer(user_id)
-        if not referrer_id or referrer_id == user_id:
-            return 0
-
-        # idempotency: якщо вже застосовано — виходимо
-        # але! _try_mark_event_once поверне True навіть якщо був раніше.
-        # нам треба відрізнити "щойно вставив" чи "вже було":
-        # простий варіант — спочатку перевірити існування.
-        ok_mark = await ReferralRepo._try_mark_event_once(event_key)
-        if not ok_mark:
-            return 0
-
-        bps = settings["percent_topup_bps"] if kind == "topup" else settings["percent_billing_bps"]
-        bps = max(0, int(bps))
-
-        commission = (amount_kop * bps) // 10000
-        if commission <= 0:
-            return 0
+            return {}
 
-        await ReferralRepo._ensure_balance(referrer_id)
+        seen: set[str] = set()
+        clean: list[dict[str, Any]] = []
+        for e in events or []:
+            ek = str(e.get("event_key") or "").strip()[:128]
+            amount = int(e.get("amount_kop") or 0)
+            if not ek or amount <= 0 or ek in seen:
+                continue
+            seen.add(ek)
+            clean.append(
+                {
+                    "k": ek,
+                    "u": int(e["user_id"]),
+                    "kind": str(e.get("kind") or ""),
+                    "a": amount,
+                    "t": str(e.get("title") or "")[:128],
+                    "d": str(e.get("details") or "")[:512],
+                }
+            )
+        if not clean:
+            return {}
 
-        # баланс партнера
         q = """
-        UPDATE ref_balances
-        SET available_kop = available_kop + :c,
-            total_earned_kop = total_earned_kop + :c,
-            updated_ts = :ts
-        WHERE referrer_id = :r
-        """
-        await db_execute(q, {"c": int(commission), "ts": int(time.time()), "r": int(referrer_id)})
-
-        # ledger
-        ql = """
-        INSERT INTO ref_ledger (referrer_id, user_id, kind, amount_kop, title, details, created_ts)
-        VALUES (:r, :u, :k, :a, :t, :d, :ts)
-        """
-        await db_execute(
-            ql,
-            {
-                "r": int(referrer_id),
-                "u": int(user_id),
-                "k": str(kind),
-                "a": int(commission),
-                "t": (title or "")[:128],
-                "d": (details or "")[:512],
-                "ts": int(time.time()),
-            },
+        WITH ev AS (
+            SELECT *
+            FROM unnest(
+                CAST(:keys AS TEXT[]),
+                CAST(:uids AS BIGINT[]),
+                CAST(:kinds AS TEXT[]),
+                CAST(:amounts AS BIGINT[]),
+                CAST(:titles AS TEXT[]),
+                CAST(:details AS TEXT[])
+            ) AS e(event_key, user_id, kind, amount_kop, title, details)
+        ),
+        src AS (
+            SELECT
+                ev.*,
+                u.referrer_id,
+                ev.amount_kop * (
+                    CASE WHEN ev.kind = 'topup' THEN CAST(:bps_topup AS BIGINT) ELSE CAST(:bps_billing AS BIGINT) END
+                ) / 10000 AS commission
+            FROM ev
+            JOIN ref_users u ON u.user_id = ev.user_id
+            WHERE u.referrer_id <> ev.user_id
+        ),
+        marked AS (
+            INSERT INTO ref_applied_events (event_key, created_ts)
+            SELECT event_key, :ts FROM src
+            ON CONFLICT (event_key) DO NOTHING
+            RETURNING event_key
+        ),
+        fresh AS (
+            SELECT src.*
+            FROM src
+            JOIN marked ON marked.event_key = src.event_key
+            WHERE src.commission > 0
+        ),
+        bal AS (
+            INSERT INTO ref_balances (referrer_id, available_kop, total_earned_kop, total_paid_kop, updated_ts)
+            SELECT referrer_id, SUM(commission), SUM(commission), 0, :ts
+            FROM fresh
+            GROUP BY referrer_id
+            ORDER BY referrer_id
+            ON CONFLICT (referrer_id) DO UPDATE
+            SET available_kop = ref_balances.available_kop + EXCLUDED.available_kop,
+                total_earned_kop = ref_balances.total_earned_kop + EXCLUDED.total_earned_kop,
+                updated_ts = EXCLUDED.updated_ts
+        ),
+        led AS (
+            INSERT INTO ref_ledger (referrer_id, user_id, kind, amount_kop, title, details, created_ts)
+            SELECT referrer_id, user_id, kind, commission, title, details, :ts
+            FROM fresh
+            ORDER BY event_key
         )
-
-        return int(commission)
+        SELECT event_key, commission FROM fresh
+        """
+        bps_topup = max(0, int(settings["percent_topup_bps"]))
+        bps_billing = max(0, int(settings["percent_billing_bps"]))
+
+        applied: dict[str, int] = {}
+        for i in range(0, len(clean), REF_COMMISSION_CHUNK):
+            chunk = clean[i : i + REF_COMMISSION_CHUNK]
+            rows = await db_fetch_all(
+                q,
+                {
+                    "keys": [c["k"] for c in chunk],
+                    "uids": [c["u"] for c in chunk],
+                    "kinds": [c["kind"] for c in chunk],
+                    "amounts": [c["a"] for c in chunk],
+                    "titles": [c["t"] for c in chunk],
+                    "details": [c["d"] for c in chunk],
+                    "bps_topup": bps_topup,
+                    "bps_billing": bps_billing,
+                    "ts": int(time.time()),
+                },
+            )
+            applied.update({str(r["event_key"]): int(r["commission"]) for r in rows or []})
+        return applied
 
     @staticmethod
     async def stats(referrer_id: int) -> dict:
@@ -1193,6 +1978,76 @@ class ReferralRepo:
         }
 
 
+class RefOutboxRepo:
+    """
+    Таблиця: ref_commission_outbox — події для нарахування партнерки.
+    Пишеться в транзакції грошової події (InvoiceRepo.apply_paid_topup), event_key унікальний.
+    Нарахування — core/referral_outbox: claim() бере пачку з "орендою" next_try_ts;
+    повторне застосування безпечне (ref_applied_events), тож впалий процес нічого не подвоїть.
+    """
+
+    @staticmethod
+    async def claim(*, now: int, limit: int, lease_sec: int) -> list[dict[str, Any]]:
+        q = """
+        UPDATE ref_commission_outbox o
+        SET next_try_ts = :lease_until,
+            attempts = o.attempts + 1
+        WHERE o.id IN (
+            SELECT id
+            FROM ref_commission_outbox
+            WHERE status = 'pending' AND next_try_ts <= :now
+            ORDER BY id
+            LIMIT :lim
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING o.id, o.event_key, o.user_id, o.kind, o.amount_kop, o.title, o.details, o.attempts
+        """
+        rows = await db_fetch_all(q, {"now": int(now), "lease_until": int(now) + int(lease_sec), "lim": int(limit)}) or []
+        rows.sort(key=lambda r: int(r["id"]))
+        return rows
+
+    @staticmethod
+    async def mark_done(ids: list[int], *, now: int) -> None:
+        if not ids:
+            return
+        q = """
+        UPDATE ref_commission_outbox
+        SET status = 'done', done_ts = :now, last_error = NULL
+        WHERE id = ANY(CAST(:ids AS BIGINT[]))
+        """
+        await db_execute(q, {"ids": [int(i) for i in ids], "now": int(now)})
+
+    @staticmethod
+    async def mark_retry(ids: list[int], *, next_try_ts: int, error: str) -> None:
+        if not ids:
+            return
+        q = """
+        UPDATE ref_commission_outbox
+        SET next_try_ts = :nt, last_error = :err
+        WHERE id = ANY(CAST(:ids AS BIGINT[]))
+        """
+        await db_execute(q, {"ids": [int(i) for i in ids], "nt": int(next_try_ts), "err": str(error)[:500]})
+
+    @staticmethod
+    async def mark_failed(ids: list[int], *, error: str) -> None:
+        if not ids:
+            return
+        q = """
+        UPDATE ref_commission_outbox
+        SET status = 'failed', last_error = :err
+        WHERE id = ANY(CAST(:ids AS BIGINT[]))
+        """
+        await db_execute(q, {"ids": [int(i) for i in ids], "err": str(error)[:500]})
+
+    @staticmethod
+    async def purge_done(before_ts: int) -> int:
+        q = """
+        DELETE FROM ref_commission_outbox
+        WHERE status = 'done' AND done_ts < :ts
+        """
+        return await db_execute(q, {"ts": int(before_ts)})
+
+
 class RefPayoutRepo:
     @staticmethod
     async def list_pending(limit: int = 20) -> list[dict]:
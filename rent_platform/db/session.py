@@ -1,6 +1,9 @@
 from __future__ import annotations
 
 import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy import text
 
@@ -36,4 +39,45 @@ async def db_execute(query: str, params: dict | None = None) -> int:
     params = params or {}
     async with engine.begin() as conn:
         res = await conn.execute(text(query), params)
-        return int(getattr(res, "rowcount", 0) or 0)
\ No newline at end of file
+        return int(getattr(res, "rowcount", 0) or 0)
+
+
+async def db_stream(query: str, params: dict | None = None, *, chunk_size: int = 500) -> AsyncIterator[list[dict]]:
+    """
+    Server-side cursor: рядки пачками по chunk_size, без вичитки всього результату в RAM.
+    Зʼєднання тримається до кінця ітерації — споживай швидко.
+    """
+    params = params or {}
+    async with engine.connect() as conn:
+        res = await conn.stream(text(query), params)
+        async for part in res.mappings().partitions(int(chunk_size)):
+            yield [dict(r) for r in part]
+
+
+class DbTx:
+    """
+    Ті самі fetch_one / fetch_all / execute, але в ОДНІЙ транзакції (одне зʼєднання).
+    """
+
+    def __init__(self, conn) -> None:
+        self.conn = conn
+
+    async def fetch_one(self, query: str, params: dict | None = None) -> dict | None:
+        res = await self.conn.execute(text(query), params or {})
+        row = res.mappings().first()
+        return dict(row) if row else None
+
+    async def fetch_all(self, query: str, params: dict | None = None) -> list[dict]:
+        res = await self.conn.execute(text(query), params or {})
+        return [dict(r) for r in res.mappings().all()]
+
+    async def execute(self, query: str, params: dict | None = None) -> int:
+        res = await self.conn.execute(text(query), params or {})
+        return int(getattr(res, "rowcount", 0) or 0)
+
+
+@asynccontextmanager
+async def db_transaction() -> AsyncIterator[DbTx]:
+    # commit при виході, rollback при винятку
+    async with engine.begin() as conn:
+        yield DbTx(conn)
@@ -12,12 +12,20 @@ from aiogram.types import Update
 from rent_platform.config import settings
 from rent_platform.core.modules import init_modules
 from rent_platform.core.tenant_ctx import init_tenants
+from rent_platform.core.tenant_routing import get_route
 from rent_platform.core.registry import get_module
-from rent_platform.db.repo import TenantRepo, ModuleRepo
+from rent_platform.core.warmup import run_startup_warmup
 from rent_platform.db.migrations import run_migrations
-from rent_platform.db.session import db_execute  # ✅ напряму в БД (без owner_user_id)
+from rent_platform.db.repo import TenantRepo
 
+from rent_platform.core.balance_forecast import balance_forecast_loop
 from rent_platform.core.billing import billing_daemon_daily_midnight, billing_loop
+from rent_platform.core.leader import leader_loop
+from rent_platform.core.referral_outbox import referral_outbox_loop
+from rent_platform.modules.telegram_shop.cart_reaper import cart_reaper_loop
+from rent_platform.modules.telegram_shop.outbox import outbox_loop
+from rent_platform.modules.telegram_shop.repo.orders_counters import order_counters_reconcile_loop
+from rent_platform.modules.telegram_shop.repo.sales_rollup import sales_rollup_fold_loop
 from rent_platform.platform.admin_router import router as admin_router  # FastAPI router
 
 log = logging.getLogger(__name__)
@@ -48,7 +56,9 @@ _TENANT_BOTS: dict[str, Bot] = {}
 
 _BILL_STOP = asyncio.Event()
 _BILL_TASK: asyncio.Task | None = None
-_DAILY_TASK: asyncio.Task | None = None
+_LEADER_TASK: asyncio.Task | None = None
+_OUTBOX_TASK: asyncio.Task | None = None
+_REF_OUTBOX_TASK: asyncio.Task | None = None
 
 
 def _get_tenant_bot(tenant_id: str, token: str) -> Bot:
@@ -60,63 +70,72 @@ def _get_tenant_bot(tenant_id: str, token: str) -> Bot:
     return bot
 
 
-async def _system_set_status(tenant_id: str, status: str, paused_reason: str | None) -> None:
-    """
-    Системне оновлення статусу без owner_user_id.
-    Використовуємо тут, бо в tenant webhook нема user_id.
-    """
-    q = """
-    UPDATE tenants
-    SET status = :st, paused_reason = :pr
-    WHERE id = :id
-    """
-    await db_execute(q, {"st": status, "pr": paused_reason, "id": tenant_id})
+# tenant-и, для яких уже запущена фонова пауза (одна задача на tenant)
+_PAUSE_PENDING: set[str] = set()
+# посилання на фонові задачі паузи, щоб їх не прибрав GC
+_PAUSE_TASKS: set[asyncio.Task] = set()
+
 
+async def _pause_expired_tenant(tenant_id: str) -> None:
+    try:
+        await TenantRepo.system_pause_expired_paid_until(int(time.time()), tenant_id=tenant_id)
+    except Exception as e:
+        log.warning("expired tenant pause failed tenant=%s err=%s", tenant_id, e)
+    finally:
+        _PAUSE_PENDING.discard(tenant_id)
 
-async def _maybe_apply_billing_pause(tenant: dict) -> tuple[bool, str | None]:
+
+def _billing_gate(tenant_id: str, route: dict) -> tuple[bool, str | None]:
     """
     blocked=True: tenant webhook не обробляємо (віддаємо 200 OK).
-    ВАЖЛИВО: тут НЕ робимо auto-resume для billing pause.
-    Auto-resume робиться після поповнення балансу/оплати.
+    Рішення пораховане при завантаженні маршруту (tenant_routing.billing_gate) — тут лише RAM.
+    Прострочений legacy paid_until_ts: блокуємо одразу, а статус у БД ставить фонова задача
+    (раз на tenant) або добовий білінг.
+    ВАЖЛИВО: тут НЕ робимо auto-resume для billing pause — він після поповнення балансу/оплати.
     """
-    st = (tenant.get("status") or "active").lower()
-    pr = (tenant.get("paused_reason") or "").lower()
-
-    if st == "deleted":
-        return True, "deleted"
-
-    if st == "paused":
-        return True, pr or "paused"
-
-    # legacy: якщо paid_until_ts ще використовується
-    now = int(time.time())
-    paid_until = int(tenant.get("paid_until_ts") or 0)
-    expired = paid_until > 0 and paid_until <= now
-    if expired:
-        await _system_set_status(tenant["id"], "paused", "billing")
-        tenant["status"] = "paused"
-        tenant["paused_reason"] = "billing"
+    gate = route.get("gate") or {}
+    if gate.get("blocked_reason"):
+        return True, str(gate["blocked_reason"])
+
+    expires_ts = int(gate.get("expires_ts") or 0)
+    if expires_ts and expires_ts <= int(time.time()):
+        if tenant_id not in _PAUSE_PENDING:
+            _PAUSE_PENDING.add(tenant_id)
+            task = asyncio.create_task(_pause_expired_tenant(tenant_id))
+            _PAUSE_TASKS.add(task)
+            task.add_done_callback(_PAUSE_TASKS.discard)
         return True, "billing"
 
     return False, None
 
-    # якщо баланс/оплата знову ок — авто-resume після billing pause
-    if st == "paused" and pr == "billing":
-        await _system_set_status(tenant["id"], "active", None)
-        tenant["status"] = "active"
-        tenant["paused_reason"] = None
-        return False, None
 
-    # manual pause лишається manual pause
-    if st == "paused":
-        return True, pr or "paused"
+def _start_singletons(stop_event: asyncio.Event) -> list[asyncio.Task]:
+    """
+    Фонові задачі, які мають працювати рівно в одному процесі (запускає лише лідер).
+    """
+    tasks: list[asyncio.Task] = []
 
-    return False, None
+    # ✅ Daily billing daemon (00:00)
+    tasks.append(asyncio.create_task(billing_daemon_daily_midnight(platform_bot, stop_event)))
+
+    # ✅ Abandoned carts (telegram_shop): нагадування + чистка
+    if settings.CART_REAPER_ENABLED:
+        tasks.append(asyncio.create_task(cart_reaper_loop(stop_event)))
+
+    # ✅ Лічильники вкладок адмінки замовлень: звірка від дрейфу
+    tasks.append(asyncio.create_task(order_counters_reconcile_loop(stop_event)))
+
+    # ✅ Rollup-и продажів: згортання дельт замовлень у денні рядки
+    tasks.append(asyncio.create_task(sales_rollup_fold_loop(stop_event)))
+
+    # ✅ Прогноз вичерпання балансу: попередження owner-ам за 24h / 3h
+    tasks.append(asyncio.create_task(balance_forecast_loop(platform_bot, stop_event)))
+    return tasks
 
 
 @app.on_event("startup")
 async def on_startup():
-    global _BILL_TASK, _DAILY_TASK, _webhook_inited
+    global _BILL_TASK, _LEADER_TASK, _OUTBOX_TASK, _REF_OUTBOX_TASK, _webhook_inited
 
     # ✅ міграції
     await run_migrations()
@@ -125,10 +144,20 @@ async def on_startup():
     init_tenants()
     init_modules()
 
-    # ✅ Daily billing daemon (00:00)
-    if _DAILY_TASK is None:
-        _DAILY_TASK = asyncio.create_task(billing_daemon_daily_midnight(platform_bot, _BILL_STOP))
-        log.info("billing daily daemon started")
+    # ✅ warm-up кешів для найактивніших tenant-ів (опційно, з бюджетом часу)
+    await run_startup_warmup()
+
+    # ✅ Singleton-и (білінг 00:00, reaper кошиків, звірка лічильників) — лише в процесі-лідері
+    if _LEADER_TASK is None:
+        _LEADER_TASK = asyncio.create_task(leader_loop(_BILL_STOP, _start_singletons))
+
+    # ✅ Outbox сповіщень магазину (статуси / оплати): доставка поза хендлерами
+    if _OUTBOX_TASK is None and settings.OUTBOX_ENABLED:
+        _OUTBOX_TASK = asyncio.create_task(outbox_loop(_BILL_STOP))
+
+    # ✅ Outbox партнерських комісій (подія пишеться в транзакції поповнення)
+    if _REF_OUTBOX_TASK is None:
+        _REF_OUTBOX_TASK = asyncio.create_task(referral_outbox_loop(_BILL_STOP))
 
     webhook_full = settings.WEBHOOK_URL.rstrip("/") + settings.WEBHOOK_PATH
     log.info("Platform webhook target: %s", webhook_full)
@@ -168,7 +197,7 @@ async def on_startup():
 
 @app.on_event("shutdown")
 async def on_shutdown():
-    global _BILL_TASK, _DAILY_TASK
+    global _BILL_TASK, _LEADER_TASK, _OUTBOX_TASK, _REF_OUTBOX_TASK
 
     _BILL_STOP.set()
 
@@ -179,12 +208,26 @@ async def on_shutdown():
             pass
         _BILL_TASK = None
 
-    if _DAILY_TASK:
+    if _LEADER_TASK:
+        try:
+            await _LEADER_TASK
+        except Exception:
+            pass
+        _LEADER_TASK = None
+
+    if _OUTBOX_TASK:
+        try:
+            await _OUTBOX_TASK
+        except Exception:
+            pass
+        _OUTBOX_TASK = None
+
+    if _REF_OUTBOX_TASK:
         try:
-            await _DAILY_TASK
+            await _REF_OUTBOX_TASK
         except Exception:
             pass
-        _DAILY_TASK = None
+        _REF_OUTBOX_TASK = None
 
     await platform_bot.session.close()
 
@@ -230,9 +273,10 @@ async def telegram_webhook(req: Request):
 async def tenant_webhook(bot_id: str, secret: str, req: Request):
     data = await req.json()
 
-    tenant = await TenantRepo.get_by_id(bot_id)
-    if not tenant:
+    route = await get_route(bot_id)
+    if not route:
         raise HTTPException(status_code=404, detail="tenant not found")
+    tenant = route["tenant"]
 
     if tenant.get("secret") != secret:
         raise HTTPException(status_code=403, detail="bad secret")
@@ -241,14 +285,13 @@ async def tenant_webhook(bot_id: str, secret: str, req: Request):
     if st == "deleted":
         raise HTTPException(status_code=410, detail="tenant deleted")
 
-    blocked, reason = await _maybe_apply_billing_pause(tenant)
+    blocked, reason = _billing_gate(bot_id, route)
     if blocked:
         return {"ok": True, "blocked": True, "reason": reason}
 
     tenant_bot = _get_tenant_bot(bot_id, tenant["bot_token"])
 
-    enabled = await ModuleRepo.list_enabled(bot_id)
-    for module_key in enabled:
+    for module_key in route["modules"]:
         handler = get_module(module_key)
         if not handler:
             continue
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
+import asyncio
+import logging
 import time
 import json
 import hmac
@@ -12,9 +14,18 @@ from aiogram import Bot
 from aiogram.types import InputMediaPhoto
 
 from rent_platform.db.session import db_fetch_all, db_fetch_one, db_execute
+from rent_platform.modules.telegram_shop import admin_products_io, orders_export
 from rent_platform.modules.telegram_shop.admin_orders import admin_orders_handle_update
+from rent_platform.modules.telegram_shop.admin_products_io import (
+    export_products,
+    import_help_text,
+    import_products,
+)
+from rent_platform.modules.telegram_shop.cart_reaper import reaper_metrics, tenant_reaper_metrics
 from rent_platform.modules.telegram_shop.channel_announce import maybe_post_new_product
+from rent_platform.modules.telegram_shop.repo.cart_settings import TelegramShopCartSettingsRepo
 from rent_platform.modules.telegram_shop.repo.products import ProductsRepo
+from rent_platform.modules.telegram_shop.repo.sales_rollup import TelegramShopSalesRollupRepo
 from rent_platform.modules.telegram_shop.repo.support_links import TelegramShopSupportLinksRepo
 from rent_platform.modules.telegram_shop.ui.user_kb import BTN_ADMIN
 
@@ -24,6 +35,8 @@ try:
 except Exception:  # pragma: no cover
     CategoriesRepo = None  # type: ignore
 
+log = logging.getLogger(__name__)
+
 
 # ============================================================
 # In-memory state
@@ -75,6 +88,101 @@ def is_admin_user(*, tenant: dict, user_id: int) -> bool:
     return False
 
 
+# ============================================================
+# Album (media group) ingestion
+# Telegram шле альбом окремими повідомленнями з однаковим media_group_id.
+# Збираємо їх ALBUM_DEBOUNCE_SEC після останнього і пишемо одним запитом.
+# ============================================================
+ALBUM_DEBOUNCE_SEC = 1.2
+
+# buf[(tenant_id, chat_id, media_group_id)] = {"items": [(message_id, file_id)], "last": monotonic, ...}
+_ALBUM_BUF: dict[tuple[str, int, str], dict[str, Any]] = {}
+
+
+def _album_collect(
+    bot: Bot,
+    tenant_id: str,
+    chat_id: int,
+    group_id: str,
+    *,
+    file_id: str,
+    message_id: int,
+    product_id: int,
+    mode: str,
+) -> None:
+    key = (tenant_id, chat_id, group_id)
+    buf = _ALBUM_BUF.get(key)
+    if buf:
+        buf["items"].append((message_id, file_id))
+        buf["last"] = time.monotonic()
+        return
+
+    buf = {
+        "items": [(message_id, file_id)],
+        "last": time.monotonic(),
+        "product_id": int(product_id),
+        "mode": mode,
+    }
+    _ALBUM_BUF[key] = buf
+    # посилання на task тримаємо в buf, щоб GC не прибив його раніше часу
+    buf["task"] = asyncio.create_task(_album_flush_later(bot, key))
+
+
+async def _album_flush_later(bot: Bot, key: tuple[str, int, str]) -> None:
+    tenant_id, chat_id, _group_id = key
+    buf = _ALBUM_BUF.get(key)
+    if not buf:
+        return
+
+    product_id = int(buf["product_id"])
+    try:
+        while True:
+            wait = buf["last"] + ALBUM_DEBOUNCE_SEC - time.monotonic()
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+
+        _ALBUM_BUF.pop(key, None)
+        file_ids = [fid for _mid, fid in sorted(buf["items"])]
+        await ProductsRepo.add_product_photos(tenant_id, product_id, file_ids)
+        await _after_photos_added(bot, tenant_id, chat_id, product_id, mode=str(buf["mode"]), count=len(file_ids))
+    except Exception:
+        _ALBUM_BUF.pop(key, None)
+        log.exception("album flush failed tenant=%s chat=%s product=%s", tenant_id, chat_id, product_id)
+        try:
+            await bot.send_message(chat_id, f"❌ Не вдалося зберегти альбом для #{product_id}. Спробуй ще раз.")
+        except Exception:
+            pass
+
+
+async def _after_photos_added(bot: Bot, tenant_id: str, chat_id: int, product_id: int, *, mode: str, count: int) -> None:
+    st = _state_get(tenant_id, chat_id) or {}
+    what = "Фото додано" if count == 1 else f"Додано {count} фото"
+
+    if mode == "wiz_photo" and not bool(st.get("announced")):
+        try:
+            await maybe_post_new_product(bot, tenant_id, product_id)
+            if st.get("mode") == "wiz_photo":
+                st["announced"] = True
+                _state_set(tenant_id, chat_id, st)
+        except Exception:
+            pass
+
+    if mode == "wiz_photo":
+        await bot.send_message(
+            chat_id,
+            f"✅ {what} до *#{product_id}*.\nНадсилай ще або натисни *Готово* ✅",
+            parse_mode="Markdown",
+            reply_markup=_wiz_photos_kb(product_id=product_id),
+            disable_web_page_preview=True,
+        )
+        return
+
+    if st.get("mode") == mode and int(st.get("product_id") or 0) == int(product_id):
+        _state_clear(tenant_id, chat_id)
+    await bot.send_message(chat_id, f"✅ {what} до *#{product_id}*.", parse_mode="Markdown", reply_markup=_catalog_kb())
+
+
 # ============================================================
 # Utils
 # ============================================================
@@ -423,6 +531,8 @@ def _admin_home_kb() -> dict:
             [("🧾 Замовлення", "tgadm:ord_menu:0")],
             [("🔑 IP ключі", "tgadm:keys_menu")],
             [("🆘 Підтримка", "tgadm:sup_menu")],
+            [("🛒 Покинуті кошики", "tgadm:carts")],
+            [("📊 Статистика", "tgadm:stats:7")],
             [("❌ Скинути дію", "tgadm:cancel")],
         ]
     )
@@ -443,6 +553,8 @@ def _products_menu_kb() -> dict:
         [
             [("➕ Додати товар", "tgadm:wiz_start"), ("📦 Список активних", "tgadm:listp:0")],
             [("⛔ Вимкнути (ID)", "tgadm:disable"), ("✅ Увімкнути (ID)", "tgadm:enable")],
+            [("📥 Імпорт", "tgadm:imp_csv")]
+            + [(f"📤 Експорт {f.upper()}", f"tgadm:exp_{f}") for f in admin_products_io.formats()],
             [("⬅️ Назад", "tgadm:catalog")],
         ]
     )
@@ -588,7 +700,8 @@ def _admin_product_card_kb(*, product_id: int, category_id: int, has_prev: bool,
             [("🔥 Акція", f"tgadm:promo_open:{product_id}:{cid}"), ("🏷 SKU", f"tgadm:psku:{product_id}:{cid}")],
             [("📁 Категорія", f"tgadm:p_setcat:{product_id}:{cid}"), ("📝 Опис", f"tgadm:wiz_desc_edit:{product_id}")],
             [("📷 Додати фото", f"tgadm:p_photo:{product_id}:{cid}"), ("💰 Ціна", f"tgadm:pprice:{product_id}:{cid}")],
-            [("✏️ Назва", f"tgadm:pname:{product_id}:{cid}"), ("⬅️ Категорії", "tgadm:cat_manage")],
+            [("✏️ Назва", f"tgadm:pname:{product_id}:{cid}"), ("📦 Залишок", f"tgadm:pstock:{product_id}:{cid}")],
+            [("⬅️ Категорії", "tgadm:cat_manage")],
         ]
     )
 
@@ -712,6 +825,99 @@ async def _send_support_edit_prompt(bot: Bot, chat_id: int, tenant_id: str, key:
     )
 
 
+# ============================================================
+# ABANDONED CARTS (admin) - чистка / нагадування
+# ============================================================
+def _carts_settings_kb(st: dict[str, Any]) -> dict:
+    reap = "✅" if st.get("reap_enabled") else "🚫"
+    rem = "✅" if st.get("remind_enabled") else "🚫"
+    return _kb(
+        [
+            [(f"{reap} Чистити покинуті", "tgadm:cart_reap"), (f"⏳ Через {int(st['idle_days'])} дн.", "tgadm:cart_days")],
+            [(f"{rem} Нагадування", "tgadm:cart_rem"), (f"⏰ Через {int(st['remind_after_hours'])} год.", "tgadm:cart_remh")],
+            [("⬅️ В адмін-меню", "tgadm:home")],
+        ]
+    )
+
+
+async def _send_carts_settings(bot: Bot, chat_id: int, tenant_id: str, *, edit_message_id: int | None = None) -> int:
+    st = await TelegramShopCartSettingsRepo.get(tenant_id)
+    tm = tenant_reaper_metrics(tenant_id)
+    gm = reaper_metrics()
+
+    last = time.strftime("%d.%m %H:%M", time.localtime(int(gm["last_run_ts"]))) if gm.get("last_run_ts") else "—"
+    text = (
+        "🛒 Покинуті кошики\n\n"
+        f"• Кошик без змін {int(st['idle_days'])} дн. — видаляється\n"
+        f"• Нагадування через {int(st['remind_after_hours'])} год. тиші (1 раз)\n\n"
+        "📊 Твій магазин (з останнього рестарту):\n"
+        f"• нагадувань: {int(tm['reminded'])}\n"
+        f"• очищено рядків: {int(tm['deleted'])}\n\n"
+        f"Останній прохід: {last} ({int(gm.get('last_duration_ms') or 0)} мс)"
+    )
+    return await _send_or_edit(
+        bot,
+        chat_id=chat_id,
+        text=text,
+        message_id=edit_message_id,
+        reply_markup=_carts_settings_kb(st),
+        parse_mode=None,
+    )
+
+
+# ============================================================
+# STATS (admin) - лише rollup-таблиці, без сканування замовлень
+# ============================================================
+_STATS_PERIODS = (1, 7, 30, 90)
+
+
+def _stats_kb(days: int) -> dict:
+    def _t(d: int) -> str:
+        title = "Сьогодні" if d == 1 else f"{d} дн."
+        return f"• {title}" if d == days else title
+
+    return _kb(
+        [
+            [(_t(d), f"tgadm:stats:{d}") for d in _STATS_PERIODS],
+            [("⬅️ В адмін-меню", "tgadm:home")],
+        ]
+    )
+
+
+async def _send_stats(bot: Bot, chat_id: int, tenant_id: str, *, days: int, edit_message_id: int | None = None) -> int:
+    days = days if days in _STATS_PERIODS else 7
+    st = await TelegramShopSalesRollupRepo.summary(tenant_id, days=days)
+
+    period = st["until"].strftime("%d.%m.%Y") if days == 1 else f"{st['since']:%d.%m} – {st['until']:%d.%m.%Y}"
+    lines = [
+        f"📊 Статистика ({period})",
+        "",
+        f"• Замовлень: {st['orders_cnt']}",
+        f"• Виручка: {_fmt_money(st['revenue_kop'])}",
+        f"• Середній чек: {_fmt_money(st['avg_kop'])}",
+        f"• Продано штук: {st['items_qty']}",
+        f"• Скасовано/повернено: {st['void_cnt']} ({_fmt_money(st['void_kop'])})",
+    ]
+    if days > 1 and st["by_day"]:
+        lines += ["", "📅 По днях:"]
+        for r in st["by_day"]:
+            lines.append(f"• {r['day']:%d.%m} — {int(r['orders_cnt'])} зам. — {_fmt_money(int(r['revenue_kop']))}")
+    if st["top"]:
+        lines += ["", "🏆 Топ товарів:"]
+        for i, r in enumerate(st["top"], 1):
+            name = str(r.get("name") or f"#{r.get('product_id')}")
+            lines.append(f"{i}. {name} — {int(r['qty'])} шт. — {_fmt_money(int(r['revenue_kop']))}")
+
+    return await _send_or_edit(
+        bot,
+        chat_id=chat_id,
+        text="\n".join(lines),
+        message_id=edit_message_id,
+        reply_markup=_stats_kb(days),
+        parse_mode=None,
+    )
+
+
 # ============================================================
 # KEYS (admin) - IP ключі / оплати / allowlist
 # ============================================================
@@ -1168,9 +1374,12 @@ async def _build_admin_product_card(tenant_id: str, product_id: int, category_id
 
     cover_file_id = await ProductsRepo.get_cover_photo_file_id(tenant_id, pid)
 
+    stock = p.get("stock_qty")
+
     text = f"🛍 *{name}*\n\nЦіна: *{_fmt_money(price)}*\nID: `{pid}`"
     if sku:
         text += f"\nSKU: `{sku}`"
+    text += f"\nЗалишок: *{int(stock)} шт.*" if stock is not None else "\nЗалишок: без обліку"
     if desc:
         text += f"\n\n{desc}"
 
@@ -1245,6 +1454,21 @@ async def handle_update(*, tenant: dict, data: dict[str, Any], bot: Bot) -> bool
             except Exception:
                 pass
 
+        # 📅 експорт за довільні дати: чекаємо текст "від до" (нижче, mode == "ord_xp_dates")
+        if payload.startswith("tgadm:ord_xpdates:"):
+            parts = payload.split(":")
+            group = parts[2] if len(parts) > 2 else "all"
+            fmt = parts[3] if len(parts) > 3 else "csv"
+            _state_set(tenant_id, chat_id, {"mode": "ord_xp_dates", "group": group, "fmt": fmt})
+            await bot.send_message(
+                chat_id,
+                "📅 Введи період *від–до* (за Києвом, включно):\n"
+                "`01.03.2026 31.03.2026` або `2026-03-01 2026-03-31`\n\n"
+                "Одна дата — один день. /cancel — скасувати.",
+                parse_mode="Markdown",
+            )
+            return True
+
         # ✅ Orders admin module (separate file)
         if payload.startswith("tgadm:ord"):
             handled = await admin_orders_handle_update(tenant=tenant, data=data, bot=bot)
@@ -1306,6 +1530,36 @@ async def handle_update(*, tenant: dict, data: dict[str, Any], bot: Bot) -> bool
             await _send_categories_menu(bot, chat_id, tenant_id)
             return True
 
+        # 📊 STATS
+        if action == "stats":
+            _state_clear(tenant_id, chat_id)
+            days = int(arg) if arg.isdigit() else 7
+            await _send_stats(bot, chat_id, tenant_id, days=days, edit_message_id=msg_id)
+            return True
+
+        # 🛒 ABANDONED CARTS
+        if action == "carts":
+            _state_clear(tenant_id, chat_id)
+            await _send_carts_settings(bot, chat_id, tenant_id, edit_message_id=msg_id)
+            return True
+
+        if action in ("cart_reap", "cart_days", "cart_rem", "cart_remh"):
+            st = await TelegramShopCartSettingsRepo.get(tenant_id)
+            if action == "cart_reap":
+                await TelegramShopCartSettingsRepo.upsert(tenant_id, reap_enabled=not bool(st["reap_enabled"]))
+            elif action == "cart_days":
+                nxt = TelegramShopCartSettingsRepo.next_choice(st["idle_days"], TelegramShopCartSettingsRepo.IDLE_DAYS_CHOICES)
+                await TelegramShopCartSettingsRepo.upsert(tenant_id, idle_days=nxt)
+            elif action == "cart_rem":
+                await TelegramShopCartSettingsRepo.upsert(tenant_id, remind_enabled=not bool(st["remind_enabled"]))
+            else:
+                nxt = TelegramShopCartSettingsRepo.next_choice(
+                    st["remind_after_hours"], TelegramShopCartSettingsRepo.REMIND_HOURS_CHOICES
+                )
+                await TelegramShopCartSettingsRepo.upsert(tenant_id, remind_after_hours=nxt)
+            await _send_carts_settings(bot, chat_id, tenant_id, edit_message_id=msg_id)
+            return True
+
         # SUPPORT (admin)
         if action == "sup_menu":
             _state_clear(tenant_id, chat_id)
@@ -1472,6 +1726,17 @@ async def handle_update(*, tenant: dict, data: dict[str, Any], bot: Bot) -> bool
             await bot.send_message(chat_id, "Надішли ID товару (цифрою), який увімкнути:", reply_markup=_wiz_nav_kb())
             return True
 
+        # Bulk CSV / XLSX import / export
+        if action == "imp_csv":
+            _state_set(tenant_id, chat_id, {"mode": "import_csv"})
+            await bot.send_message(chat_id, import_help_text(), parse_mode="Markdown", reply_markup=_wiz_nav_kb())
+            return True
+
+        if action in ("exp_csv", "exp_xlsx"):
+            _state_clear(tenant_id, chat_id)
+            await export_products(bot, chat_id, tenant_id, fmt=action[len("exp_"):])
+            return True
+
         # Create category
         if action == "cat_create":
             _state_set(tenant_id, chat_id, {"mode": "cat_create_name"})
@@ -1542,7 +1807,7 @@ async def handle_update(*, tenant: dict, data: dict[str, Any], bot: Bot) -> bool
             return True
 
         # Product cards actions (admin + promos)
-        if action in ("pc_prev", "pc_next", "p_to_arch", "p_enable", "p_setcat", "pprice", "pname", "p_photo", "psku", "pp_prev", "pp_next"):
+        if action in ("pc_prev", "pc_next", "p_to_arch", "p_enable", "p_setcat", "pprice", "pname", "pstock", "p_photo", "psku", "pp_prev", "pp_next"):
             if not (arg.isdigit() and arg2.isdigit()):
                 return True
 
@@ -1614,6 +1879,16 @@ async def handle_update(*, tenant: dict, data: dict[str, Any], bot: Bot) -> bool
                 await bot.send_message(chat_id, f"✏️ Надішли нову назву для товару #{pid}:", reply_markup=_wiz_nav_kb())
                 return True
 
+            if action == "pstock":
+                _state_set(tenant_id, chat_id, {"mode": "edit_stock", "product_id": pid, "category_id": cid})
+                await bot.send_message(
+                    chat_id,
+                    f"📦 Надішли залишок для товару #{pid} (ціле число, `-` — без обліку):",
+                    parse_mode="Markdown",
+                    reply_markup=_wiz_nav_kb(),
+                )
+                return True
+
             if action == "p_photo":
                 _state_set(tenant_id, chat_id, {"mode": "add_photo_to_pid", "product_id": pid})
                 await bot.send_message(chat_id, f"📷 Надішли фото для товару #{pid}:", reply_markup=_wiz_nav_kb())
@@ -1719,6 +1994,28 @@ async def handle_update(*, tenant: dict, data: dict[str, Any], bot: Bot) -> bool
 
     mode = str(st.get("mode") or "")
 
+    # orders export: довільний період
+    if mode == "ord_xp_dates":
+        rng = orders_export.parse_day_range(text)
+        if rng is None:
+            await bot.send_message(
+                chat_id, "Дати не розпізнані. Приклад: `01.03.2026 31.03.2026` або /cancel", parse_mode="Markdown"
+            )
+            return True
+        _state_clear(tenant_id, chat_id)
+        started = orders_export.start_export(
+            bot,
+            chat_id,
+            tenant_id,
+            group=str(st.get("group") or "all"),
+            fmt=str(st.get("fmt") or "csv"),
+            date_from=rng[0],
+            date_to=rng[1],
+        )
+        if not started:
+            await bot.send_message(chat_id, "⏳ Експорт уже формується — дочекайся файлу.")
+        return True
+
     # SUPPORT (admin) message modes
     if mode == "sup_edit":
         key = str(st.get("key") or "").strip()
@@ -1757,6 +2054,19 @@ async def handle_update(*, tenant: dict, data: dict[str, Any], bot: Bot) -> bool
         _KEYS_MENU_MSG_ID[(tenant_id, chat_id)] = int(mid2)
         return True
 
+    # bulk CSV / XLSX import
+    if mode == "import_csv":
+        doc = msg.get("document")
+        if not doc:
+            await bot.send_message(chat_id, "Надішли CSV/XLSX-файл *документом* або /cancel.", parse_mode="Markdown")
+            return True
+
+        _state_clear(tenant_id, chat_id)
+        await bot.send_message(chat_id, "⏳ Імпортую…")
+        await import_products(bot, chat_id, tenant_id, doc)
+        await bot.send_message(chat_id, "📦 *Товари*", parse_mode="Markdown", reply_markup=_products_menu_kb())
+        return True
+
     # photo modes
     if mode in ("wiz_photo", "add_photo_to_pid", "arch_add_photo"):
         product_id = int(st.get("product_id") or 0)
@@ -1770,28 +2080,23 @@ async def handle_update(*, tenant: dict, data: dict[str, Any], bot: Bot) -> bool
             await bot.send_message(chat_id, "Надішли *фото*.", parse_mode="Markdown", reply_markup=_wiz_nav_kb())
             return True
 
-        await ProductsRepo.add_product_photo(tenant_id, product_id, file_id)
-
-        if mode == "wiz_photo" and not bool(st.get("announced")):
-            try:
-                await maybe_post_new_product(bot, tenant_id, product_id)
-                st["announced"] = True
-                _state_set(tenant_id, chat_id, st)
-            except Exception:
-                pass
-
-        if mode == "wiz_photo":
-            await bot.send_message(
+        # альбом: збираємо всі повідомлення media group і пишемо одним INSERT
+        group_id = str(msg.get("media_group_id") or "")
+        if group_id:
+            _album_collect(
+                bot,
+                tenant_id,
                 chat_id,
-                f"✅ Фото додано до *#{product_id}*.\nНадсилай ще або натисни *Готово* ✅",
-                parse_mode="Markdown",
-                reply_markup=_wiz_photos_kb(product_id=product_id),
-                disable_web_page_preview=True,
+                group_id,
+                file_id=file_id,
+                message_id=int(msg.get("message_id") or 0),
+                product_id=product_id,
+                mode=mode,
             )
             return True
 
-        _state_clear(tenant_id, chat_id)
-        await bot.send_message(chat_id, f"✅ Фото додано до *#{product_id}*.", parse_mode="Markdown", reply_markup=_catalog_kb())
+        await ProductsRepo.add_product_photos(tenant_id, product_id, [file_id])
+        await _after_photos_added(bot, tenant_id, chat_id, product_id, mode=mode, count=1)
         return True
 
     # enable/disable by id
@@ -1956,6 +2261,25 @@ async def handle_update(*, tenant: dict, data: dict[str, Any], bot: Bot) -> bool
             await _send_admin_category_first_product(bot, chat_id, tenant_id, cid)
         return True
 
+    if mode == "edit_stock":
+        pid = int(st.get("product_id") or 0)
+        cid = int(st.get("category_id") or 0)
+        raw = (text or "").strip()
+        if raw == "-":
+            stock: int | None = None
+        elif raw.isdigit():
+            stock = int(raw)
+        else:
+            await bot.send_message(chat_id, "Надішли ціле число (напр. `25`) або `-`.", parse_mode="Markdown")
+            return True
+        await ProductsRepo.set_stock_qty(tenant_id, pid, stock)
+        _state_clear(tenant_id, chat_id)
+        what = "без обліку" if stock is None else f"{stock} шт."
+        await bot.send_message(chat_id, f"✅ Залишок #{pid}: {what}.", reply_markup=_catalog_kb())
+        if cid:
+            await _send_admin_category_first_product(bot, chat_id, tenant_id, cid)
+        return True
+
     if mode == "edit_name":
         pid = int(st.get("product_id") or 0)
         cid = int(st.get("category_id") or 0)
@@ -2,15 +2,24 @@
 from __future__ import annotations
 
 import datetime as _dt
-import io
 from typing import Any
 
 from aiogram import Bot
-from aiogram.types import BufferedInputFile
 
-from rent_platform.db.session import db_fetch_all, db_fetch_one, db_execute
-from rent_platform.modules.telegram_shop.repo.orders import TelegramShopOrdersRepo
+from rent_platform.db.session import db_fetch_all
+from rent_platform.modules.telegram_shop import orders_export
+from rent_platform.modules.telegram_shop.outbox import outbox_wake
+from rent_platform.modules.telegram_shop.repo.order_events import TelegramShopOrderEventsRepo
+from rent_platform.modules.telegram_shop.repo.orders import TelegramShopOrdersRepo, TelegramShopOutOfStock
 from rent_platform.modules.telegram_shop.repo.orders_admin_archive import TelegramShopOrdersAdminArchiveRepo
+from rent_platform.modules.telegram_shop.repo.orders_counters import (
+    DONE_STATUSES,
+    NEW_STATUSES,
+    WORK_STATUSES,
+    TelegramShopOrderCountersRepo,
+)
+
+from rent_platform.modules.telegram_shop.ui.orders_status import event_label
 
 try:
     from rent_platform.modules.telegram_shop.ui.orders_status import status_label  # type: ignore
@@ -25,11 +34,6 @@ TAB_WORK = "work"
 TAB_DONE = "done"
 TAB_ARCH = "arch"
 
-# status groups
-NEW_STATUSES = ("new",)
-WORK_STATUSES = ("accepted", "packed", "shipped")
-DONE_STATUSES = ("delivered", "not_received", "returned", "cancelled")
-
 STATUSES: list[tuple[str, str]] = [
     ("new", "🆕 Створено"),
     ("accepted", "✅ Прийнято"),
@@ -135,14 +139,38 @@ async def _send_or_edit(
 
 # ---------------- data queries ----------------
 
-async def _count_orders(tenant_id: str, *, tab: str) -> int:
+def _parse_cursor(token: Any) -> tuple[int, str, int]:
+    """
+    Курсор сторінки в callback: "<page>" | "<page>b<id>" | "<page>a<id>"
+      b<id> — наступна сторінка: id < <id>
+      a<id> — попередня сторінка: id > <id>
+    Номер сторінки — лише для підпису "показано X-Y". Старі callback-и з числом => верх списку.
+    """
+    t = str(token or "0").strip()
+    for d in ("b", "a"):
+        if d in t:
+            pg, _, oid = t.partition(d)
+            if pg.isdigit() and oid.isdigit() and int(oid) > 0:
+                return int(pg), d, int(oid)
+    return 0, "", 0
+
+
+def _cursor_arg(parts: list[str], idx: int) -> str:
+    v = str(parts[idx]) if len(parts) > idx else "0"
+    page, d, oid = _parse_cursor(v)
+    return f"{page}{d}{oid}" if d else "0"
+
+
+async def _list_orders_page(tenant_id: str, *, cursor: str, tab: str) -> tuple[list[dict], bool, bool]:
+    """
+    Keyset по (tenant_id, status, id DESC): без OFFSET, ціна сторінки не залежить від її номера.
+    -> (rows id DESC, has_prev, has_next)
+    """
+    page, direction, edge_id = _parse_cursor(cursor)
     tab = _tab_norm(tab)
 
     if tab == TAB_ARCH:
-        q = """
-        SELECT COUNT(*) AS cnt
-        FROM telegram_shop_orders o
-        WHERE o.tenant_id = :tid
+        where = """
           AND EXISTS (
               SELECT 1
               FROM telegram_shop_orders_admin_archive a
@@ -150,78 +178,57 @@ async def _count_orders(tenant_id: str, *, tab: str) -> int:
                 AND a.order_id = o.id
           )
         """
-        row = await db_fetch_one(q, {"tid": tenant_id}) or {}
-        return _to_int(row.get("cnt"), 0)
-
-    statuses = _statuses_for_tab(tab) or ()
-    q = """
-    SELECT COUNT(*) AS cnt
-    FROM telegram_shop_orders o
-    WHERE o.tenant_id = :tid
-      AND o.status = ANY(:sts)
-      AND NOT EXISTS (
-          SELECT 1
-          FROM telegram_shop_orders_admin_archive a
-          WHERE a.tenant_id = o.tenant_id
-            AND a.order_id = o.id
-      )
-    """
-    row = await db_fetch_one(q, {"tid": tenant_id, "sts": list(statuses)}) or {}
-    return _to_int(row.get("cnt"), 0)
-
-
-async def _list_orders_page(tenant_id: str, *, page: int, tab: str) -> list[dict]:
-    page = max(0, int(page or 0))
-    tab = _tab_norm(tab)
-
-    if tab == TAB_ARCH:
-        q = """
-        SELECT o.id, o.user_id, o.status, o.total_kop, o.created_ts
-        FROM telegram_shop_orders o
-        WHERE o.tenant_id = :tid
-          AND EXISTS (
+        params: dict[str, Any] = {"tid": tenant_id}
+    else:
+        where = """
+          AND o.status = ANY(:sts)
+          AND NOT EXISTS (
               SELECT 1
               FROM telegram_shop_orders_admin_archive a
               WHERE a.tenant_id = o.tenant_id
                 AND a.order_id = o.id
           )
-        ORDER BY o.id DESC
-        LIMIT :lim OFFSET :off
         """
-        return await db_fetch_all(
-            q,
-            {"tid": tenant_id, "lim": int(PAGE_SIZE), "off": int(page * PAGE_SIZE)},
-        ) or []
+        params = {"tid": tenant_id, "sts": list(_statuses_for_tab(tab) or ())}
 
-    statuses = _statuses_for_tab(tab) or ()
-    q = """
+    if direction == "a":
+        keyset, order = "AND o.id > :edge", "ASC"
+    elif direction == "b":
+        keyset, order = "AND o.id < :edge", "DESC"
+    else:
+        keyset, order = "", "DESC"
+
+    q = f"""
     SELECT o.id, o.user_id, o.status, o.total_kop, o.created_ts
     FROM telegram_shop_orders o
     WHERE o.tenant_id = :tid
-      AND o.status = ANY(:sts)
-      AND NOT EXISTS (
-          SELECT 1
-          FROM telegram_shop_orders_admin_archive a
-          WHERE a.tenant_id = o.tenant_id
-            AND a.order_id = o.id
-      )
-    ORDER BY o.id DESC
-    LIMIT :lim OFFSET :off
+      {where}
+      {keyset}
+    ORDER BY o.id {order}
+    LIMIT :lim
     """
-    return await db_fetch_all(
-        q,
-        {"tid": tenant_id, "sts": list(statuses), "lim": int(PAGE_SIZE), "off": int(page * PAGE_SIZE)},
-    ) or []
+    rows = await db_fetch_all(q, {**params, "edge": int(edge_id), "lim": int(PAGE_SIZE) + 1}) or []
+    more = len(rows) > PAGE_SIZE
+    rows = rows[:PAGE_SIZE]
+
+    if direction == "a":
+        rows.reverse()
+        # повернулись назад: сторінка, з якої прийшли, існує
+        return rows, more and page > 0, True
+    return rows, page > 0 and direction == "b", more
 
 
 # ---------------- keyboards ----------------
 
-def _tabs_row(active_tab: str, page: int) -> list[tuple[str, str]]:
+def _tabs_row(active_tab: str, counts: dict[str, int] | None = None) -> list[tuple[str, str]]:
     t = _tab_norm(active_tab)
+    counts = counts or {}
 
     def _btn(title: str, tab: str) -> tuple[str, str]:
         prefix = "• " if t == tab else ""
-        return (f"{prefix}{title}", f"tgadm:ord_tab:{tab}:{page}")
+        cnt = f" ({int(counts[tab])})" if tab in counts else ""
+        # курсор належить вкладці => інша вкладка завжди з верху
+        return (f"{prefix}{title}{cnt}", f"tgadm:ord_tab:{tab}:0")
 
     return [
         _btn("🆕 Нові", TAB_NEW),
@@ -231,29 +238,39 @@ def _tabs_row(active_tab: str, page: int) -> list[tuple[str, str]]:
     ]
 
 
-def _orders_list_kb(order_ids: list[int], *, page: int, has_prev: bool, has_next: bool, tab: str) -> dict:
+def _orders_list_kb(
+    order_ids: list[int],
+    *,
+    page: str,
+    prev_page: str,
+    next_page: str,
+    tab: str,
+    counts: dict[str, int],
+) -> dict:
     tab = _tab_norm(tab)
     rows: list[list[tuple[str, str]]] = []
 
-    rows.append(_tabs_row(tab, page))
+    rows.append(_tabs_row(tab, counts))
 
     if tab == TAB_NEW:
         rows.append([("📦 Скачати накладну (Нові)", f"tgadm:ord_export:new:{page}")])
+    xp_group = tab if tab in orders_export.STATUS_GROUPS else "all"
+    rows.append([("📤 Експорт замовлень", f"tgadm:ord_xp:{xp_group}:30d:csv")])
 
     for oid in order_ids:
         rows.append([(f"🧾 Замовлення #{oid}", f"tgadm:ord_open:{oid}:{page}:{tab}")])
 
     rows.append(
         [
-            ("⬅️", f"tgadm:ord_tab:{tab}:{page-1}") if has_prev else ("·", "tgadm:noop"),
-            ("➡️", f"tgadm:ord_tab:{tab}:{page+1}") if has_next else ("·", "tgadm:noop"),
+            ("⬅️", f"tgadm:ord_tab:{tab}:{prev_page}") if prev_page else ("·", "tgadm:noop"),
+            ("➡️", f"tgadm:ord_tab:{tab}:{next_page}") if next_page else ("·", "tgadm:noop"),
         ]
     )
     rows.append([("⬅️ В адмін-меню", "tgadm:home:0")])
     return _kb(rows)
 
 
-def _order_detail_kb(order_id: int, *, page: int, tab: str, is_archived: bool) -> dict:
+def _order_detail_kb(order_id: int, *, page: str, tab: str, is_archived: bool) -> dict:
     tab = _tab_norm(tab)
 
     # ✅ UX: different label depending on archived state
@@ -262,6 +279,7 @@ def _order_detail_kb(order_id: int, *, page: int, tab: str, is_archived: bool) -
     return _kb(
         [
             [("📦 Товари", f"tgadm:ord_items:{order_id}:{page}:{tab}")],
+            [("🕓 Історія", f"tgadm:ord_hist:{order_id}:{page}:{tab}")],
             [(arch_txt, f"tgadm:ord_arch:{order_id}:{page}:{tab}")],
             [("✏️ Змінити статус", f"tgadm:ord_status_menu:{order_id}:{page}:{tab}")],
             [("⬅️ Назад", f"tgadm:ord_tab:{tab}:{page}")],
@@ -269,12 +287,12 @@ def _order_detail_kb(order_id: int, *, page: int, tab: str, is_archived: bool) -
     )
 
 
-def _order_items_kb(order_id: int, *, page: int, tab: str) -> dict:
+def _order_items_kb(order_id: int, *, page: str, tab: str) -> dict:
     tab = _tab_norm(tab)
     return _kb([[("⬅️ Назад", f"tgadm:ord_open:{order_id}:{page}:{tab}")]])
 
 
-def _order_status_menu_kb(order_id: int, *, page: int, tab: str) -> dict:
+def _order_status_menu_kb(order_id: int, *, page: str, tab: str) -> dict:
     tab = _tab_norm(tab)
     rows: list[list[tuple[str, str]]] = []
     for st, title in STATUSES:
@@ -306,15 +324,15 @@ async def _send_orders_list(
     chat_id: int,
     tenant_id: str,
     *,
-    page: int,
+    page: str,
     tab: str,
     message_id: int | None,
 ) -> None:
-    page = max(0, int(page or 0))
     tab = _tab_norm(tab)
+    page_no, _, _ = _parse_cursor(page)
 
-    total = await _count_orders(tenant_id, tab=tab)
-    rows = await _list_orders_page(tenant_id, page=page, tab=tab)
+    counts = await TelegramShopOrderCountersRepo.get(tenant_id)
+    rows, has_prev, has_next = await _list_orders_page(tenant_id, cursor=page, tab=tab)
     title = _tab_title(tab)
 
     if not rows:
@@ -323,15 +341,16 @@ async def _send_orders_list(
             chat_id=chat_id,
             message_id=message_id,
             text=f"{title}\n\nПоки що порожньо.",
-            reply_markup=_kb([_tabs_row(tab, page), [("⬅️ В адмін-меню", "tgadm:home:0")]]),
+            reply_markup=_kb([_tabs_row(tab, counts), [("⬅️ В адмін-меню", "tgadm:home:0")]]),
         )
         return
 
     order_ids: list[int] = [int(r["id"]) for r in rows if _to_int(r.get("id")) > 0]
-    shown_from = page * PAGE_SIZE + 1
-    shown_to = page * PAGE_SIZE + len(order_ids)
+    total = int(counts.get(tab) or 0)
+    shown_from = page_no * PAGE_SIZE + 1
+    shown_to = page_no * PAGE_SIZE + len(order_ids)
 
-    lines = [f"{title} (показано {shown_from}-{shown_to} із {total})\n"]
+    lines = [f"{title} (показано {shown_from}-{shown_to} із {max(total, shown_to)})\n"]
     for r in rows:
         oid = _to_int(r.get("id"))
         uid = _to_int(r.get("user_id"))
@@ -340,15 +359,24 @@ async def _send_orders_list(
         created = _fmt_dt(_to_int(r.get("created_ts")))
         lines.append(f"• #{oid} — `{uid}` — {st} — *{total_uah}* — _{created}_")
 
-    has_prev = page > 0
-    has_next = shown_to < total
+    # курсор поточної сторінки: "Назад" з картки замовлення повертає саме сюди
+    cur = f"{page_no}b{order_ids[0] + 1}" if page_no > 0 and order_ids else "0"
+    prev_page = ("0" if page_no <= 1 else f"{page_no - 1}a{order_ids[0]}") if has_prev and order_ids else ""
+    next_page = f"{page_no + 1}b{order_ids[-1]}" if has_next and order_ids else ""
 
     await _send_or_edit(
         bot,
         chat_id=chat_id,
         message_id=message_id,
         text="\n".join(lines),
-        reply_markup=_orders_list_kb(order_ids, page=page, has_prev=has_prev, has_next=has_next, tab=tab),
+        reply_markup=_orders_list_kb(
+            order_ids,
+            page=cur,
+            prev_page=prev_page,
+            next_page=next_page,
+            tab=tab,
+            counts=counts,
+        ),
     )
 
 
@@ -358,7 +386,7 @@ async def _send_order_detail(
     tenant_id: str,
     order_id: int,
     *,
-    page: int,
+    page: str,
     tab: str,
     message_id: int | None,
 ) -> None:
@@ -407,7 +435,7 @@ async def _send_order_items(
     tenant_id: str,
     order_id: int,
     *,
-    page: int,
+    page: str,
     tab: str,
     message_id: int | None,
 ) -> None:
@@ -442,111 +470,135 @@ async def _send_order_items(
     )
 
 
-async def _set_order_status(bot: Bot, tenant_id: str, order_id: int, new_status: str) -> bool:
+async def _send_order_history(
+    bot: Bot,
+    chat_id: int,
+    tenant_id: str,
+    order_id: int,
+    *,
+    page: str,
+    tab: str,
+    message_id: int | None,
+) -> None:
+    events = await TelegramShopOrderEventsRepo.list_for_order(tenant_id, int(order_id))
+
+    lines = [f"🕓 *Історія замовлення #{int(order_id)}*\n"]
+    for ev in events:
+        who = _to_int(ev.get("actor_user_id"))
+        who_part = f" — `{who}`" if who else ""
+        lines.append(
+            f"• _{_fmt_dt(_to_int(ev.get('ts')))}_ — "
+            f"{event_label(str(ev.get('kind') or ''), ev.get('new_value'), label=_st_label)}{who_part}"
+        )
+    if not events:
+        lines.append("Подій ще немає.")
+
+    await _send_or_edit(
+        bot,
+        chat_id=chat_id,
+        message_id=message_id,
+        text="\n".join(lines),
+        reply_markup=_order_items_kb(int(order_id), page=page, tab=tab),
+    )
+
+
+async def _set_order_status(
+    bot: Bot, chat_id: int, tenant_id: str, order_id: int, new_status: str, *, actor_user_id: int | None = None
+) -> bool:
     new_status = (new_status or "").strip()
     if not new_status:
         return False
 
-    o = await TelegramShopOrdersRepo.get_order(tenant_id, int(order_id))
-    if not o:
+    # статус + подія + лічильники + залишок на складі + сповіщення покупцю (outbox) — одна транзакція;
+    # сама доставка — асинхронно, кнопка адміна не чекає на Telegram
+    try:
+        old = await TelegramShopOrdersRepo.set_status(
+            tenant_id,
+            int(order_id),
+            new_status,
+            actor_user_id=actor_user_id,
+            notify_text=f"🧾 Статус вашого замовлення #{int(order_id)} оновлено: *{_st_label(new_status)}*",
+            notify_parse_mode="Markdown",
+        )
+    except TelegramShopOutOfStock as e:
+        # повернення з cancelled/returned: товар уже розпродано — статус лишається
+        lines = [f"• {ln['name'] or ln['product_id']}: треба {ln['want']}, є {ln['available']}" for ln in e.lines]
+        await bot.send_message(
+            chat_id,
+            f"⚠️ Замовлення #{int(order_id)}: не вистачає залишку, статус не змінено.\n\n" + "\n".join(lines),
+        )
         return False
-
-    q = """
-    UPDATE telegram_shop_orders
-    SET status = :st
-    WHERE tenant_id = :tid AND id = :oid
-    """
-    await db_execute(q, {"st": new_status, "tid": tenant_id, "oid": int(order_id)})
-
-    # optional notify user
-    user_id = _to_int(o.get("user_id"), 0)
-    if user_id > 0:
-        try:
-            st = _st_label(new_status)
-            await bot.send_message(
-                user_id,
-                f"🧾 Статус вашого замовлення #{int(order_id)} оновлено: *{st}*",
-                parse_mode="Markdown",
-            )
-        except Exception:
-            pass
-
+    if old is None:
+        return False
+    outbox_wake()
     return True
 
 
 async def _export_new_orders_picklist(bot: Bot, chat_id: int, tenant_id: str) -> None:
     """
     TSV pick-list for NEW orders (not archived in admin archive).
-    Optimized: 1 query for orders + 1 query for items.
+    Потоково через orders_export, без ліміту в 200 замовлень.
     """
-    q_orders = """
-    SELECT o.id, o.user_id, o.created_ts
-    FROM telegram_shop_orders o
-    WHERE o.tenant_id = :tid
-      AND o.status = 'new'
-      AND NOT EXISTS (
-          SELECT 1 FROM telegram_shop_orders_admin_archive a
-          WHERE a.tenant_id = o.tenant_id AND a.order_id = o.id
-      )
-    ORDER BY o.id ASC
-    LIMIT 200
-    """
-    orders = await db_fetch_all(q_orders, {"tid": tenant_id}) or []
-    if not orders:
-        await bot.send_message(chat_id, "🆕 Нових замовлень немає.")
-        return
+    started = orders_export.start_export(
+        bot,
+        chat_id,
+        tenant_id,
+        group="new",
+        period="all",
+        fmt="tsv",
+        exclude_archived=True,
+        filename="new_orders_picklist",
+        caption="📦 Накладна (pick-list) по *Нових* замовленнях",
+    )
+    if not started:
+        await bot.send_message(chat_id, "⏳ Експорт уже формується — дочекайся файлу.")
 
-    order_ids = [int(o["id"]) for o in orders if _to_int(o.get("id")) > 0]
-    if not order_ids:
-        await bot.send_message(chat_id, "🆕 Нових замовлень немає.")
-        return
 
-    # items snapshot (sku may exist)
-    q_items_with_sku = """
-    SELECT order_id, COALESCE(sku,'') AS sku, COALESCE(name,'') AS name, COALESCE(qty,0) AS qty, COALESCE(price_kop,0) AS price_kop
-    FROM telegram_shop_order_items
-    WHERE order_id = ANY(:oids)
-    ORDER BY order_id ASC, id ASC
-    """
-    q_items = """
-    SELECT order_id, '' AS sku, COALESCE(name,'') AS name, COALESCE(qty,0) AS qty, COALESCE(price_kop,0) AS price_kop
-    FROM telegram_shop_order_items
-    WHERE order_id = ANY(:oids)
-    ORDER BY order_id ASC, id ASC
-    """
+def _export_menu_kb(group: str, period: str, fmt: str) -> dict:
+    def _sel(title: str, on: bool) -> str:
+        return f"• {title}" if on else title
 
-    try:
-        items = await db_fetch_all(q_items_with_sku, {"oids": order_ids}) or []
-    except Exception:
-        items = await db_fetch_all(q_items, {"oids": order_ids}) or []
+    g_row = [
+        (_sel(orders_export.GROUP_TITLES[g], g == group), f"tgadm:ord_xp:{g}:{period}:{fmt}")
+        for g in orders_export.STATUS_GROUPS
+    ]
+    p_row = [
+        (_sel(orders_export.PERIOD_TITLES[p], p == period), f"tgadm:ord_xp:{group}:{p}:{fmt}")
+        for p in orders_export.PERIODS
+    ]
+    f_row = [(_sel(f.upper(), f == fmt), f"tgadm:ord_xp:{group}:{period}:{f}") for f in orders_export.formats()]
+    return _kb(
+        [
+            g_row[:2],
+            g_row[2:],
+            p_row[:3],
+            p_row[3:],
+            [("📅 Свої дати (від–до)", f"tgadm:ord_xpdates:{group}:{fmt}")],
+            f_row,
+            [("📤 Сформувати файл", f"tgadm:ord_xpgo:{group}:{period}:{fmt}")],
+            [("⬅️ Назад", f"tgadm:ord_tab:{TAB_NEW}:0")],
+        ]
+    )
 
-    items_by_order: dict[int, list[dict]] = {}
-    for it in items:
-        oid = _to_int(it.get("order_id"))
-        items_by_order.setdefault(oid, []).append(it)
-
-    # TSV
-    out = io.StringIO()
-    out.write("order_id\tuser_id\tcreated\tsku\tname\tqty\tprice_uah\n")
-
-    for o in orders:
-        oid = _to_int(o.get("id"))
-        uid = _to_int(o.get("user_id"))
-        created = _fmt_dt(_to_int(o.get("created_ts")))
-        for it in items_by_order.get(oid, []):
-            sku = str(it.get("sku") or "").strip()
-            name = str(it.get("name") or "")
-            qty = _to_int(it.get("qty"))
-            price = _fmt_money(_to_int(it.get("price_kop")))
-            out.write(f"{oid}\t{uid}\t{created}\t{sku}\t{name}\t{qty}\t{price}\n")
-
-    data = out.getvalue().encode("utf-8")
-    file = BufferedInputFile(data, filename="new_orders_picklist.tsv")
-    await bot.send_document(
-        chat_id,
-        file,
-        caption="📦 Накладна (pick-list) по *Нових* замовленнях",
-        parse_mode="Markdown",
+
+async def _send_export_menu(
+    bot: Bot, chat_id: int, *, group: str, period: str, fmt: str, message_id: int | None
+) -> None:
+    group = group if group in orders_export.STATUS_GROUPS else "all"
+    period = period if period in orders_export.PERIODS else "30d"
+    fmt = fmt if fmt in orders_export.formats() else "csv"
+    await _send_or_edit(
+        bot,
+        chat_id=chat_id,
+        message_id=message_id,
+        text=(
+            "📤 *Експорт замовлень*\n\n"
+            f"Статус: *{orders_export.GROUP_TITLES[group]}*\n"
+            f"Період: *{orders_export.PERIOD_TITLES[period]}*\n"
+            f"Формат: *{fmt.upper()}*\n\n"
+            "Файл прийде документом; великі вибірки — з прогресом."
+        ),
+        reply_markup=_export_menu_kb(group, period, fmt),
     )
 
 
@@ -572,6 +624,7 @@ async def admin_orders_handle_update(*, tenant: dict, data: dict[str, Any], bot:
     chat_id = int(cb["message"]["chat"]["id"])
     msg_id = int(cb["message"]["message_id"])
     tenant_id = str(tenant["id"])
+    actor_id = _to_int((cb.get("from") or {}).get("id"), 0)
 
     parts = payload.split(":")
     action = parts[1] if len(parts) > 1 else ""
@@ -581,10 +634,10 @@ async def admin_orders_handle_update(*, tenant: dict, data: dict[str, Any], bot:
         await _send_admin_orders_menu(bot, chat_id, message_id=msg_id)
         return True
 
-    # tgadm:ord_tab:<tab>:<page>
+    # tgadm:ord_tab:<tab>:<cursor>
     if action == "ord_tab":
         tab = str(parts[2]) if len(parts) > 2 else TAB_NEW
-        page = int(parts[3]) if len(parts) > 3 and str(parts[3]).lstrip("-").isdigit() else 0
+        page = _cursor_arg(parts, 3)
         await _send_orders_list(bot, chat_id, tenant_id, page=page, tab=tab, message_id=msg_id)
         return True
 
@@ -595,10 +648,23 @@ async def admin_orders_handle_update(*, tenant: dict, data: dict[str, Any], bot:
             await _export_new_orders_picklist(bot, chat_id, tenant_id)
         return True
 
+    # tgadm:ord_xp:<group>:<period>:<fmt>  (екран параметрів)
+    # tgadm:ord_xpgo:<group>:<period>:<fmt> (запуск)
+    if action in ("ord_xp", "ord_xpgo"):
+        group = str(parts[2]) if len(parts) > 2 else "all"
+        period = str(parts[3]) if len(parts) > 3 else "30d"
+        fmt = str(parts[4]) if len(parts) > 4 else "csv"
+        if action == "ord_xp":
+            await _send_export_menu(bot, chat_id, group=group, period=period, fmt=fmt, message_id=msg_id)
+            return True
+        if not orders_export.start_export(bot, chat_id, tenant_id, group=group, period=period, fmt=fmt):
+            await bot.send_message(chat_id, "⏳ Експорт уже формується — дочекайся файлу.")
+        return True
+
     # tgadm:ord_open:<oid>:<page>:<tab>
     if action == "ord_open":
         oid = int(parts[2]) if len(parts) > 2 and str(parts[2]).isdigit() else 0
-        page = int(parts[3]) if len(parts) > 3 and str(parts[3]).lstrip("-").isdigit() else 0
+        page = _cursor_arg(parts, 3)
         tab = str(parts[4]) if len(parts) > 4 else TAB_NEW
         if oid > 0:
             await _send_order_detail(bot, chat_id, tenant_id, oid, page=page, tab=tab, message_id=msg_id)
@@ -607,26 +673,35 @@ async def admin_orders_handle_update(*, tenant: dict, data: dict[str, Any], bot:
     # tgadm:ord_items:<oid>:<page>:<tab>
     if action == "ord_items":
         oid = int(parts[2]) if len(parts) > 2 and str(parts[2]).isdigit() else 0
-        page = int(parts[3]) if len(parts) > 3 and str(parts[3]).lstrip("-").isdigit() else 0
+        page = _cursor_arg(parts, 3)
         tab = str(parts[4]) if len(parts) > 4 else TAB_NEW
         if oid > 0:
             await _send_order_items(bot, chat_id, tenant_id, oid, page=page, tab=tab, message_id=msg_id)
         return True
 
+    # tgadm:ord_hist:<oid>:<page>:<tab>
+    if action == "ord_hist":
+        oid = int(parts[2]) if len(parts) > 2 and str(parts[2]).isdigit() else 0
+        page = _cursor_arg(parts, 3)
+        tab = str(parts[4]) if len(parts) > 4 else TAB_NEW
+        if oid > 0:
+            await _send_order_history(bot, chat_id, tenant_id, oid, page=page, tab=tab, message_id=msg_id)
+        return True
+
     # tgadm:ord_arch:<oid>:<page>:<tab>
     if action == "ord_arch":
         oid = int(parts[2]) if len(parts) > 2 and str(parts[2]).isdigit() else 0
-        page = int(parts[3]) if len(parts) > 3 and str(parts[3]).lstrip("-").isdigit() else 0
+        page = _cursor_arg(parts, 3)
         tab = str(parts[4]) if len(parts) > 4 else TAB_NEW
         if oid > 0:
-            await TelegramShopOrdersAdminArchiveRepo.toggle(tenant_id, int(oid))
+            await TelegramShopOrdersAdminArchiveRepo.toggle(tenant_id, int(oid), actor_user_id=actor_id or None)
             await _send_order_detail(bot, chat_id, tenant_id, oid, page=page, tab=tab, message_id=msg_id)
         return True
 
     # tgadm:ord_status_menu:<oid>:<page>:<tab>
     if action == "ord_status_menu":
         oid = int(parts[2]) if len(parts) > 2 and str(parts[2]).isdigit() else 0
-        page = int(parts[3]) if len(parts) > 3 and str(parts[3]).lstrip("-").isdigit() else 0
+        page = _cursor_arg(parts, 3)
         tab = str(parts[4]) if len(parts) > 4 else TAB_NEW
         if oid > 0:
             await _send_or_edit(
@@ -642,10 +717,10 @@ async def admin_orders_handle_update(*, tenant: dict, data: dict[str, Any], bot:
     if action == "ord_setst":
         oid = int(parts[2]) if len(parts) > 2 and str(parts[2]).isdigit() else 0
         new_st = str(parts[3]) if len(parts) > 3 else ""
-        page = int(parts[4]) if len(parts) > 4 and str(parts[4]).lstrip("-").isdigit() else 0
+        page = _cursor_arg(parts, 4)
         tab = str(parts[5]) if len(parts) > 5 else TAB_NEW
         if oid > 0:
-            await _set_order_status(bot, tenant_id, oid, new_st)
+            await _set_order_status(bot, chat_id, tenant_id, oid, new_st, actor_user_id=actor_id or None)
             await _send_order_detail(bot, chat_id, tenant_id, oid, page=page, tab=tab, message_id=msg_id)
         return True
 
@@ -673,7 +748,7 @@ async def admin_orders_send_list(bot: Bot, chat_id: int, tenant_id: str, *, scop
         bot,
         chat_id,
         tenant_id,
-        page=0,
+        page="0",
         tab=tab,
         message_id=None,
     )
\ No newline at end of file
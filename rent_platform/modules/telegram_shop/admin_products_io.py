@@ -0,0 +1,427 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import asyncio
+import csv
+import io
+import itertools
+import os
+import tempfile
+import time
+from typing import Any, Iterator
+
+from aiogram import Bot
+from aiogram.types import BufferedInputFile, FSInputFile
+
+from rent_platform.modules.telegram_shop.repo.products import ProductsRepo
+
+try:
+    from rent_platform.modules.telegram_shop.repo.categories import CategoriesRepo  # type: ignore
+except Exception:  # pragma: no cover
+    CategoriesRepo = None  # type: ignore
+
+try:
+    from openpyxl import Workbook, load_workbook  # type: ignore
+except Exception:  # pragma: no cover
+    Workbook = None  # type: ignore
+    load_workbook = None  # type: ignore
+
+# =========================================================
+# Bulk CSV / XLSX import / export товарів (адмінка)
+#
+# Формат (перший рядок — заголовок; у CSV роздільник ";" або ","):
+#   sku;name;price;category;description;is_active;is_hit;promo_price
+# Обовʼязкові: sku, name, price. Порожня клітинка = "не чіпати" (для існуючого SKU).
+# promo_price = 0 — зняти акцію (експорт пише 0 для товарів без акції).
+# XLSX — лише якщо встановлено openpyxl.
+# =========================================================
+
+CSV_COLUMNS = ("sku", "name", "price", "category", "description", "is_active", "is_hit", "promo_price")
+REQUIRED_COLUMNS = ("sku", "name", "price")
+
+IMPORT_BATCH_SIZE = 500
+EXPORT_CHUNK_SIZE = 500
+MAX_IMPORT_BYTES = 20 * 1024 * 1024  # ліміт Bot API на download
+MAX_ERRORS_IN_MESSAGE = 20
+# price_kop / promo_price_kop — INTEGER у БД: більше значення зірвало б upsert усієї пачки
+MAX_PRICE_KOP = 2_147_483_647
+
+# один імпорт/експорт на tenant одночасно
+_RUNNING: set[str] = set()
+
+
+# ---------------- helpers ----------------
+
+def formats() -> tuple[str, ...]:
+    return ("csv", "xlsx") if Workbook is not None else ("csv",)
+
+
+def _fmt_money(kop: int) -> str:
+    kop = int(kop or 0)
+    return f"{kop // 100}.{kop % 100:02d}"
+
+
+def _parse_price_kop(raw: str) -> int | None:
+    """
+    "199", "199.9", "199,90", "1 299.00 грн" -> копійки. Від'ємні / сміття -> None.
+    """
+    s = (raw or "").lower().replace("грн", "").replace("uah", "").strip()
+    s = s.replace(" ", "").replace("\u00a0", "").replace(",", ".")
+    if not s:
+        return None
+
+    left, _, right = s.partition(".")
+    if not left.isdigit() or (right and not right.isdigit()):
+        return None
+    cents = int((right + "00")[:2]) if right else 0
+    return int(left) * 100 + cents
+
+
+def _parse_bool(raw: str) -> bool | None:
+    s = (raw or "").strip().lower()
+    if not s:
+        return None
+    if s in ("1", "true", "yes", "y", "так", "+", "on"):
+        return True
+    if s in ("0", "false", "no", "n", "ні", "-", "off"):
+        return False
+    raise ValueError(f"незрозуміле значення '{raw}' (очікую 1/0)")
+
+
+def import_help_text() -> str:
+    return (
+        f"📥 *Імпорт товарів ({'/'.join(f.upper() for f in formats())})*\n\n"
+        "Надішли файл *документом*.\n"
+        "Перший рядок — заголовок (у CSV роздільник `;` або `,`):\n"
+        f"`{';'.join(CSV_COLUMNS)}`\n\n"
+        "• Обовʼязкові: `sku`, `name`, `price` (грн, напр. `199.90`)\n"
+        "• Товар з існуючим SKU — оновлюється, новий — створюється\n"
+        "• `category` — назва (створимо, якщо нема)\n"
+        "• `is_active`, `is_hit` — `1`/`0`\n"
+        "• `promo_price` — акційна ціна, `0` — зняти акцію\n"
+        "• Порожня клітинка — не змінювати\n\n"
+        "Підказка: зроби *📤 Експорт*, відредагуй і завантаж назад.\n"
+        "Скасувати: /cancel"
+    )
+
+
+class _RowError(Exception):
+    pass
+
+
+async def _category_id_by_name(tenant_id: str, name: str, cache: dict[str, int]) -> int | None:
+    nm = (name or "").strip()[:64]
+    if not nm or CategoriesRepo is None:
+        return None
+    key = nm.lower()
+    if key not in cache:
+        cache[key] = int(await CategoriesRepo.create(tenant_id, nm))  # type: ignore[misc]
+    return cache[key]
+
+
+async def _parse_row(
+    tenant_id: str,
+    row: dict[str, str],
+    cat_cache: dict[str, int],
+) -> dict[str, Any]:
+    sku = (row.get("sku") or "").strip()
+    if not sku:
+        raise _RowError("порожній sku")
+    if len(sku) > 64:
+        raise _RowError("sku довший за 64 символи")
+
+    name = (row.get("name") or "").strip()
+    if not name:
+        raise _RowError("порожня назва")
+
+    price_kop = _parse_price_kop(row.get("price") or "")
+    if price_kop is None or price_kop <= 0:
+        raise _RowError(f"некоректна ціна '{row.get('price') or ''}'")
+    if price_kop > MAX_PRICE_KOP:
+        raise _RowError(f"завелика ціна '{row.get('price') or ''}' (макс. {_fmt_money(MAX_PRICE_KOP)})")
+
+    promo_raw = (row.get("promo_price") or "").strip()
+    promo_kop: int | None = None
+    if promo_raw:
+        promo_kop = _parse_price_kop(promo_raw)
+        if promo_kop is None:
+            raise _RowError(f"некоректна акційна ціна '{promo_raw}'")
+        if promo_kop > MAX_PRICE_KOP:
+            raise _RowError(f"завелика акційна ціна '{promo_raw}' (макс. {_fmt_money(MAX_PRICE_KOP)})")
+        # 0 проходить далі як є: COALESCE у upsert перезапише акцію нулем (зняти)
+        if promo_kop >= price_kop:
+            raise _RowError("акційна ціна має бути меншою за звичайну")
+
+    try:
+        is_active = _parse_bool(row.get("is_active") or "")
+        is_hit = _parse_bool(row.get("is_hit") or "")
+    except ValueError as e:
+        raise _RowError(str(e)) from e
+
+    desc_raw = row.get("description")
+    description = desc_raw.strip() if desc_raw and desc_raw.strip() else None
+
+    return {
+        "sku": sku,
+        "name": name[:128],
+        "price_kop": price_kop,
+        "category_id": await _category_id_by_name(tenant_id, row.get("category") or "", cat_cache),
+        "description": description,
+        "is_active": is_active,
+        "is_hit": is_hit,
+        "promo_price_kop": promo_kop,
+    }
+
+
+# ---------------- import ----------------
+
+def _csv_rows(text_io: Any) -> tuple[list[str], Iterator[list[str]]]:
+    head = text_io.readline()
+    delim = ";" if head.count(";") >= head.count(",") else ","
+    header = [h.strip().lower() for h in next(csv.reader([head], delimiter=delim), [])]
+    return header, csv.reader(text_io, delimiter=delim)
+
+
+def _cell_str(v: Any) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, bool):
+        return "1" if v else "0"
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v)
+
+
+def _xlsx_rows(wb: Any) -> tuple[list[str], Iterator[list[str]]]:
+    it = wb.active.iter_rows(values_only=True)
+    header = [_cell_str(h).strip().lower() for h in next(it, ())]
+    return header, ([_cell_str(v) for v in r] for r in it)
+
+
+def _take(it: Iterator[list[str]], n: int) -> list[list[str]]:
+    return list(itertools.islice(it, n))
+
+
+async def import_products(bot: Bot, chat_id: int, tenant_id: str, document: dict[str, Any]) -> None:
+    """
+    Стрімінговий імпорт: файл качаємо у spooled temp-файл, читаємо построково
+    (csv або openpyxl read_only), upsert пачками по IMPORT_BATCH_SIZE одним запитом на пачку.
+    """
+    file_id = str(document.get("file_id") or "")
+    size = int(document.get("file_size") or 0)
+    fname = str(document.get("file_name") or "").lower()
+    is_xlsx = fname.endswith(".xlsx")
+
+    if not file_id:
+        await bot.send_message(chat_id, "❌ Не бачу файл. Надішли CSV/XLSX документом.")
+        return
+    if is_xlsx and load_workbook is None:
+        await bot.send_message(chat_id, "❌ XLSX тут не підтримується — надішли *.csv*.", parse_mode="Markdown")
+        return
+    if fname and not is_xlsx and not fname.endswith((".csv", ".txt")):
+        await bot.send_message(chat_id, "❌ Потрібен файл *.csv* або *.xlsx*.", parse_mode="Markdown")
+        return
+    if size > MAX_IMPORT_BYTES:
+        await bot.send_message(chat_id, "❌ Файл завеликий (макс. 20 МБ).")
+        return
+
+    if tenant_id in _RUNNING:
+        await bot.send_message(chat_id, "⏳ Імпорт/експорт вже виконується. Зачекай завершення.")
+        return
+    _RUNNING.add(tenant_id)
+
+    started = time.monotonic()
+    inserted = updated = total = 0
+    errors: list[tuple[int, str]] = []
+
+    try:
+        with tempfile.SpooledTemporaryFile(max_size=1024 * 1024, mode="w+b") as raw:
+            await bot.download(file_id, destination=raw)
+            raw.seek(0)
+
+            text_io: Any = None
+            wb: Any = None
+            try:
+                if is_xlsx:
+                    # read_only: openpyxl читає аркуш потоком, а не вантажить у RAM
+                    wb = await asyncio.to_thread(load_workbook, raw, read_only=True, data_only=True)
+                    header, rows_it = await asyncio.to_thread(_xlsx_rows, wb)
+                else:
+                    text_io = io.TextIOWrapper(raw, encoding="utf-8-sig", errors="replace", newline="")
+                    header, rows_it = _csv_rows(text_io)
+
+                missing = [c for c in REQUIRED_COLUMNS if c not in header]
+                if missing:
+                    await bot.send_message(
+                        chat_id,
+                        f"❌ У заголовку немає колонок: `{', '.join(missing)}`\n\n" + import_help_text(),
+                        parse_mode="Markdown",
+                    )
+                    return
+
+                cat_cache: dict[str, int] = {}
+                batch: dict[str, dict[str, Any]] = {}
+                line_no = 1
+
+                while True:
+                    # розбір файлу (особливо xlsx) — синхронний: пачку рядків читаємо у потоці
+                    chunk = await asyncio.to_thread(_take, rows_it, IMPORT_BATCH_SIZE)
+                    if not chunk:
+                        break
+                    for values in chunk:
+                        line_no += 1
+                        if not any(v.strip() for v in values):
+                            continue
+                        total += 1
+                        row = dict(zip(header, values))
+                        try:
+                            item = await _parse_row(tenant_id, row, cat_cache)
+                        except _RowError as e:
+                            errors.append((line_no, str(e)))
+                            continue
+
+                        # дубль SKU у файлі: останній рядок виграє
+                        batch[item["sku"]] = item
+                        if len(batch) >= IMPORT_BATCH_SIZE:
+                            res = await ProductsRepo.upsert_by_sku_batch(tenant_id, list(batch.values()))
+                            inserted += res["inserted"]
+                            updated += res["updated"]
+                            batch.clear()
+
+                if batch:
+                    res = await ProductsRepo.upsert_by_sku_batch(tenant_id, list(batch.values()))
+                    inserted += res["inserted"]
+                    updated += res["updated"]
+            finally:
+                if text_io is not None:
+                    text_io.detach()
+                if wb is not None:
+                    wb.close()
+    except Exception as e:
+        await bot.send_message(
+            chat_id,
+            f"❌ Імпорт перервано: {e}\n"
+            f"Встигли: створено {inserted}, оновлено {updated}.",
+        )
+        return
+    finally:
+        _RUNNING.discard(tenant_id)
+
+    took = time.monotonic() - started
+    lines = [
+        "📥 Імпорт завершено",
+        "",
+        f"Рядків: {total}",
+        f"➕ Створено: {inserted}",
+        f"♻️ Оновлено: {updated}",
+        f"⚠️ Помилок: {len(errors)}",
+        f"⏱ {took:.1f} с",
+    ]
+    if errors:
+        lines.append("")
+        for line_no, err in errors[:MAX_ERRORS_IN_MESSAGE]:
+            lines.append(f"• рядок {line_no}: {err}")
+        if len(errors) > MAX_ERRORS_IN_MESSAGE:
+            lines.append(f"… і ще {len(errors) - MAX_ERRORS_IN_MESSAGE} (див. файл)")
+
+    # без Markdown: у текстах помилок можуть бути сирі значення з файлу
+    await bot.send_message(chat_id, "\n".join(lines))
+
+    if len(errors) > MAX_ERRORS_IN_MESSAGE:
+        out = io.StringIO()
+        w = csv.writer(out, delimiter=";")
+        w.writerow(["line", "error"])
+        w.writerows(errors)
+        await bot.send_document(
+            chat_id,
+            document=BufferedInputFile(out.getvalue().encode("utf-8-sig"), filename="import_errors.csv"),
+            caption="⚠️ Помилки імпорту",
+        )
+
+
+# ---------------- export ----------------
+
+def _export_row(r: dict[str, Any]) -> list[Any]:
+    return [
+        r.get("sku") or "",
+        r.get("name") or "",
+        _fmt_money(int(r.get("price_kop") or 0)),
+        r.get("category") or "",
+        r.get("description") or "",
+        1 if r.get("is_active") else 0,
+        1 if r.get("is_hit") else 0,
+        # явний 0, а не порожньо: при імпорті назад порожня клітинка лишила б стару акцію
+        _fmt_money(int(r.get("promo_price_kop") or 0)),
+    ]
+
+
+def _append_rows(ws: Any, rows: list[dict[str, Any]]) -> None:
+    for r in rows:
+        ws.append(_export_row(r))
+
+
+async def export_products(bot: Bot, chat_id: int, tenant_id: str, fmt: str = "csv") -> None:
+    """
+    Стрімінговий експорт: keyset-чанки з БД -> csv/xlsx у temp-файл на диску -> send_document.
+    Формат сумісний з імпортом. fmt="xlsx" — лише якщо встановлено openpyxl, інакше csv.
+    """
+    fmt = fmt if fmt in formats() else "csv"
+    if tenant_id in _RUNNING:
+        await bot.send_message(chat_id, "⏳ Імпорт/експорт вже виконується. Зачекай завершення.")
+        return
+    _RUNNING.add(tenant_id)
+
+    path = ""
+    total = 0
+    try:
+        with tempfile.NamedTemporaryFile(mode="w+b", suffix=f".{fmt}", delete=False) as fb:
+            path = fb.name
+            w: Any = None
+            ws: Any = None
+            wb: Any = None
+            if fmt == "xlsx":
+                # write_only: рядки скидаються у тимчасові файли openpyxl, а не тримаються в RAM
+                wb = Workbook(write_only=True)
+                ws = wb.create_sheet("products")
+                ws.append(list(CSV_COLUMNS))
+            else:
+                f = io.TextIOWrapper(fb, encoding="utf-8-sig", newline="")
+                w = csv.writer(f, delimiter=";")
+                w.writerow(CSV_COLUMNS)
+
+            after_id = 0
+            while True:
+                rows = await ProductsRepo.list_for_export(tenant_id, after_id=after_id, limit=EXPORT_CHUNK_SIZE)
+                if not rows:
+                    break
+                if ws is not None:
+                    await asyncio.to_thread(_append_rows, ws, rows)
+                else:
+                    w.writerows(_export_row(r) for r in rows)
+                total += len(rows)
+                after_id = int(rows[-1]["id"])
+                if len(rows) < EXPORT_CHUNK_SIZE:
+                    break
+
+            if wb is not None:
+                await asyncio.to_thread(wb.save, fb)
+            else:
+                f.flush()
+                f.detach()  # fb закриє with
+
+        if total == 0:
+            await bot.send_message(chat_id, "📤 Каталог порожній — нема чого експортувати.")
+            return
+
+        await bot.send_document(
+            chat_id,
+            document=FSInputFile(path, filename=f"products_{tenant_id}.{fmt}"),
+            caption=f"📤 Експорт каталогу: {total} товарів",
+        )
+    finally:
+        _RUNNING.discard(tenant_id)
+        if path:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any
+
+from aiogram import Bot
+
+from rent_platform.config import settings
+from rent_platform.core.tenant_routing import load_routes
+from rent_platform.db.session import db_execute, db_fetch_all, db_fetch_one
+from rent_platform.modules.telegram_shop.repo.cart import invalidate_cart_summary
+from rent_platform.modules.telegram_shop.ui.user_kb import BTN_CART, main_menu_kb
+
+log = logging.getLogger(__name__)
+
+# =========================================================
+# Abandoned carts: нагадування + чистка telegram_shop_cart_items
+#
+# Кошик (tenant, user) покинутий, якщо ЖОДЕН його рядок не оновлювався
+# idle_days (налаштування tenant-а, telegram_shop_cart_settings).
+# DELETE — пачками по CART_REAPER_BATCH з SKIP LOCKED: коротка транзакція,
+# не чекаємо на рядки, які саме зараз змінює користувач.
+# =========================================================
+
+REAPER_MAX_BATCHES_PER_RUN = 50
+REAPER_BATCH_PAUSE_SEC = 0.05
+# нагадуємо лише кошикам, що затихли нещодавно (а не всім старим після увімкнення)
+REMIND_WINDOW_SEC = 3 * 86400
+
+MODULE_KEY = "telegram_shop"
+
+_METRICS: dict[str, Any] = {
+    "runs": 0,
+    "errors": 0,
+    "last_run_ts": 0,
+    "last_duration_ms": 0,
+    "last_reminded": 0,
+    "last_remind_failed": 0,
+    "last_deleted": 0,
+    "total_reminded": 0,
+    "total_deleted": 0,
+}
+# per-tenant (з моменту старту процесу): {"reminded", "deleted", "last_ts"}
+_TENANT_METRICS: dict[str, dict[str, int]] = {}
+
+
+def reaper_metrics() -> dict[str, Any]:
+    return dict(_METRICS)
+
+
+def tenant_reaper_metrics(tenant_id: str) -> dict[str, int]:
+    return dict(_TENANT_METRICS.get(str(tenant_id)) or {"reminded": 0, "deleted": 0, "last_ts": 0})
+
+
+def _tenant_add(tenant_id: str, key: str, n: int, now: int) -> None:
+    m = _TENANT_METRICS.setdefault(str(tenant_id), {"reminded": 0, "deleted": 0, "last_ts": 0})
+    m[key] += int(n)
+    m["last_ts"] = now
+
+
+# ---------------- reminders ----------------
+
+def _remind_text(qty: int) -> str:
+    return (
+        f"🛒 У кошику чекають товари: <b>{int(qty)} шт.</b>\n\n"
+        f"Натисни «{BTN_CART}», щоб переглянути й оформити замовлення 👇"
+    )
+
+
+async def _send_reminders(now: int) -> tuple[int, int]:
+    """
+    -> (sent, failed). Кожен кандидат позначається reminded_ts, навіть якщо
+    надіслати не вдалось (бот заблоковано) — один раз на період тиші.
+    """
+    q = """
+    SELECT c.tenant_id, c.user_id, SUM(c.qty) AS qty
+    FROM telegram_shop_cart_items c
+    JOIN telegram_shop_cart_settings s
+      ON s.tenant_id = c.tenant_id AND s.remind_enabled = true
+    GROUP BY c.tenant_id, c.user_id, s.remind_after_hours, s.idle_days
+    HAVING MAX(c.updated_ts) < :now - s.remind_after_hours * 3600
+       AND MAX(c.updated_ts) >= :now - s.remind_after_hours * 3600 - :win
+       AND MAX(c.updated_ts) >= :now - s.idle_days * 86400
+       AND MAX(c.reminded_ts) < MAX(c.updated_ts)
+    ORDER BY MAX(c.updated_ts) ASC
+    LIMIT :lim
+    """
+    rows = await db_fetch_all(
+        q,
+        {"now": now, "win": REMIND_WINDOW_SEC, "lim": max(1, int(settings.CART_REMIND_MAX_PER_RUN))},
+    ) or []
+    if not rows:
+        return 0, 0
+
+    by_tid: dict[str, list[dict[str, Any]]] = {}
+    for r in rows:
+        by_tid.setdefault(str(r["tenant_id"]), []).append(r)
+
+    routes = await load_routes(list(by_tid.keys()))
+    pause = 1.0 / max(0.1, float(settings.CART_REMIND_PER_SEC))
+
+    sent = failed = 0
+    for tid, items in by_tid.items():
+        route = routes.get(tid) or {}
+        tenant = route.get("tenant") or {}
+        token = str(tenant.get("bot_token") or "")
+        active = str(tenant.get("status") or "").lower() == "active" and MODULE_KEY in (route.get("modules") or [])
+        if not token or not active:
+            failed += len(items)
+            continue
+
+        bot = Bot(token=token)
+        try:
+            for r in items:
+                qty = int(r.get("qty") or 0)
+                try:
+                    await bot.send_message(
+                        int(r["user_id"]),
+                        _remind_text(qty),
+                        parse_mode="HTML",
+                        reply_markup=main_menu_kb(),
+                    )
+                    sent += 1
+                    _tenant_add(tid, "reminded", 1, now)
+                except Exception as e:
+                    failed += 1
+                    log.debug("cart remind failed tenant=%s user=%s err=%s", tid, r.get("user_id"), e)
+                await asyncio.sleep(pause)
+        finally:
+            try:
+                await bot.session.close()
+            except Exception:
+                pass
+
+    q_mark = """
+    UPDATE telegram_shop_cart_items c
+    SET reminded_ts = :now
+    FROM unnest(CAST(:tids AS TEXT[]), CAST(:uids AS BIGINT[])) AS x(tid, uid)
+    WHERE c.tenant_id = x.tid AND c.user_id = x.uid
+    """
+    await db_execute(
+        q_mark,
+        {
+            "now": now,
+            "tids": [str(r["tenant_id"]) for r in rows],
+            "uids": [int(r["user_id"]) for r in rows],
+        },
+    )
+    return sent, failed
+
+
+# ---------------- reaper ----------------
+
+async def _reap_stale(now: int) -> int:
+    def_days = max(1, int(settings.CART_IDLE_DAYS_DEFAULT))
+    lim = max(1, int(settings.CART_REAPER_BATCH))
+
+    # найменший поріг серед tenant-ів => діапазон по idx_tg_shop_cart_updated_ts
+    row = await db_fetch_one(
+        "SELECT MIN(idle_days) AS d FROM telegram_shop_cart_settings WHERE reap_enabled = true"
+    ) or {}
+    min_days = min(def_days, max(1, int(row.get("d") or def_days)))
+
+    q = """
+    DELETE FROM telegram_shop_cart_items
+    WHERE ctid IN (
+        SELECT c.ctid
+        FROM telegram_shop_cart_items c
+        LEFT JOIN telegram_shop_cart_settings s ON s.tenant_id = c.tenant_id
+        WHERE c.updated_ts < :max_cutoff
+          AND COALESCE(s.reap_enabled, true) = true
+          AND c.updated_ts < :now - COALESCE(s.idle_days, :def_days) * 86400
+          AND NOT EXISTS (
+              SELECT 1
+              FROM telegram_shop_cart_items c2
+              WHERE c2.tenant_id = c.tenant_id
+                AND c2.user_id = c.user_id
+                AND c2.updated_ts >= :now - COALESCE(s.idle_days, :def_days) * 86400
+          )
+        LIMIT :lim
+        FOR UPDATE OF c SKIP LOCKED
+    )
+    RETURNING tenant_id, user_id
+    """
+    params = {"now": now, "max_cutoff": now - min_days * 86400, "def_days": def_days, "lim": lim}
+
+    total = 0
+    for _ in range(REAPER_MAX_BATCHES_PER_RUN):
+        rows = await db_fetch_all(q, params) or []
+        per_tid: dict[str, int] = {}
+        for r in rows:
+            invalidate_cart_summary(str(r["tenant_id"]), int(r["user_id"]))
+            per_tid[str(r["tenant_id"])] = per_tid.get(str(r["tenant_id"]), 0) + 1
+        for tid, n in per_tid.items():
+            _tenant_add(tid, "deleted", n, now)
+
+        total += len(rows)
+        if len(rows) < lim:
+            break
+        await asyncio.sleep(REAPER_BATCH_PAUSE_SEC)
+    return total
+
+
+async def run_cart_reaper_once() -> dict[str, Any]:
+    now = int(time.time())
+    started = time.monotonic()
+
+    sent = failed = deleted = 0
+    try:
+        sent, failed = await _send_reminders(now)
+        deleted = await _reap_stale(now)
+    except Exception as e:
+        _METRICS["errors"] += 1
+        log.exception("cart reaper run failed: %s", e)
+
+    took_ms = int((time.monotonic() - started) * 1000)
+    _METRICS.update(
+        {
+            "runs": _METRICS["runs"] + 1,
+            "last_run_ts": now,
+            "last_duration_ms": took_ms,
+            "last_reminded": sent,
+            "last_remind_failed": failed,
+            "last_deleted": deleted,
+            "total_reminded": _METRICS["total_reminded"] + sent,
+            "total_deleted": _METRICS["total_deleted"] + deleted,
+        }
+    )
+    log.info("cart reaper done in %sms reminded=%s failed=%s deleted=%s", took_ms, sent, failed, deleted)
+    return reaper_metrics()
+
+
+async def cart_reaper_loop(stop_event: asyncio.Event) -> None:
+    """
+    Фоновий цикл: раз на CART_REAPER_INTERVAL_SEC.
+    """
+    log.info("cart reaper started")
+    interval = max(60, int(settings.CART_REAPER_INTERVAL_SEC))
+    while not stop_event.is_set():
+        await run_cart_reaper_once()
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+    log.info("cart reaper stopped")
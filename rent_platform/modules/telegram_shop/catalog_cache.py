@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import time
+from typing import Any
+
+# =========================================================
+# Catalog version + RAM cache (per tenant)
+#
+# Будь-який запис у товари/категорії піднімає версію каталогу tenant-а,
+# тому закешоване з попередньою версією автоматично стає невалідним.
+# TTL — страховка на випадок кількох процесів (версія живе в RAM процесу).
+# =========================================================
+
+CATALOG_CACHE_TTL_SEC = 300
+
+_CATALOG_VER: dict[str, int] = {}
+
+# cache[(tenant_id, key)] = (version, expires_ts, value)
+_CATALOG_CACHE: dict[tuple[str, str], tuple[int, int, Any]] = {}
+
+
+def catalog_version(tenant_id: str) -> int:
+    return int(_CATALOG_VER.get(str(tenant_id), 0))
+
+
+def bump_catalog_version(tenant_id: str) -> int:
+    tid = str(tenant_id)
+    v = int(_CATALOG_VER.get(tid, 0)) + 1
+    _CATALOG_VER[tid] = v
+    return v
+
+
+def catalog_cache_get(tenant_id: str, key: str) -> tuple[bool, Any]:
+    """
+    -> (hit, value). value може бути None (наприклад, "порожньо") — тому окремий hit.
+    """
+    k = (str(tenant_id), str(key))
+    item = _CATALOG_CACHE.get(k)
+    if not item:
+        return False, None
+
+    ver, expires_ts, value = item
+    if ver != catalog_version(tenant_id) or expires_ts <= int(time.time()):
+        _CATALOG_CACHE.pop(k, None)
+        return False, None
+    return True, value
+
+
+def catalog_cache_put(tenant_id: str, key: str, value: Any, *, expires_ts: int | None = None) -> None:
+    now = int(time.time())
+    exp = now + CATALOG_CACHE_TTL_SEC
+    if expires_ts is not None and int(expires_ts) > now:
+        exp = min(exp, int(expires_ts))
+    _CATALOG_CACHE[(str(tenant_id), str(key))] = (catalog_version(tenant_id), exp, value)
+
+
+# =========================================================
+# Product photos cache (per product version)
+# Фото змінюються лише через ProductsRepo.add_product_photos -> bump_product_version.
+# Обидва словники обмежені PHOTOS_MAX_CACHED; версії скидаються лише разом з кешем фото,
+# інакше старий запис з версією 0 знову став би валідним.
+# =========================================================
+
+PHOTOS_MAX_CACHED = 20000
+
+_PRODUCT_VER: dict[tuple[str, int], int] = {}
+
+# cache[(tenant_id, product_id)] = (version, expires_ts, [file_id, ...])
+_PHOTOS_CACHE: dict[tuple[str, int], tuple[int, int, list[str]]] = {}
+
+
+def product_version(tenant_id: str, product_id: int) -> int:
+    return int(_PRODUCT_VER.get((str(tenant_id), int(product_id)), 0))
+
+
+def bump_product_version(tenant_id: str, product_id: int) -> int:
+    k = (str(tenant_id), int(product_id))
+    if k not in _PRODUCT_VER and len(_PRODUCT_VER) >= PHOTOS_MAX_CACHED:
+        _PRODUCT_VER.clear()
+        _PHOTOS_CACHE.clear()
+    v = int(_PRODUCT_VER.get(k, 0)) + 1
+    _PRODUCT_VER[k] = v
+    _PHOTOS_CACHE.pop(k, None)
+    return v
+
+
+def photos_cache_get_many(tenant_id: str, product_ids: list[int]) -> tuple[dict[int, list[str]], list[int]]:
+    """
+    -> (found, missing)
+    """
+    now = int(time.time())
+    found: dict[int, list[str]] = {}
+    missing: list[int] = []
+    for pid in product_ids:
+        k = (str(tenant_id), int(pid))
+        item = _PHOTOS_CACHE.get(k)
+        if item and item[0] == product_version(tenant_id, pid) and item[1] > now:
+            found[int(pid)] = item[2]
+        else:
+            missing.append(int(pid))
+    return found, missing
+
+
+def photos_cache_put(tenant_id: str, product_id: int, file_ids: list[str]) -> None:
+    now = int(time.time())
+    if len(_PHOTOS_CACHE) >= PHOTOS_MAX_CACHED:
+        # спершу викидаємо протерміновані; якщо не допомогло — скидаємо все
+        for k in [k for k, v in _PHOTOS_CACHE.items() if v[1] <= now]:
+            _PHOTOS_CACHE.pop(k, None)
+        if len(_PHOTOS_CACHE) >= PHOTOS_MAX_CACHED:
+            _PHOTOS_CACHE.clear()
+    exp = now + CATALOG_CACHE_TTL_SEC
+    _PHOTOS_CACHE[(str(tenant_id), int(product_id))] = (
+        product_version(tenant_id, product_id),
+        exp,
+        list(file_ids),
+    )
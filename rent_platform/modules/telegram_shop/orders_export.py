@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import asyncio
+import csv
+import datetime as _dt
+import io
+import logging
+import tempfile
+import time
+from typing import Any, AsyncGenerator
+from zoneinfo import ZoneInfo
+
+from aiogram import Bot
+from aiogram.types import InputFile
+
+from rent_platform.config import settings
+from rent_platform.db.session import db_stream
+from rent_platform.modules.telegram_shop.repo.orders_counters import DONE_STATUSES, NEW_STATUSES, WORK_STATUSES
+
+try:
+    from openpyxl import Workbook  # type: ignore
+except Exception:  # pragma: no cover
+    Workbook = None  # type: ignore
+
+log = logging.getLogger(__name__)
+
+# =========================================================
+# Експорт замовлень (адмінка telegram_shop)
+#
+# Один потоковий запит orders LEFT JOIN items (server-side cursor, пачки по
+# EXPORT_CHUNK_ROWS) -> рядки одразу пишуться у SpooledTemporaryFile
+# (до EXPORT_SPOOL_MAX_BYTES у RAM, далі на диск) -> файл віддається
+# документом частинами. Памʼять не залежить від кількості замовлень.
+# Поки курсор відкритий — жодних await-ів Telegram: прогрес редагується фоновою задачею.
+# Період — пресет (PERIODS) або довільні дати від–до (date_from / date_to);
+# межі днів і дати у файлі — за Києвом (EXPORT_TZ), як rollup-и продажів.
+# =========================================================
+
+EXPORT_CHUNK_ROWS = 1000
+EXPORT_SPOOL_MAX_BYTES = 4 * 1024 * 1024
+EXPORT_PROGRESS_EVERY_ROWS = 5000
+EXPORT_PROGRESS_MIN_SEC = 3.0
+# ліміт Bot API на send_document
+EXPORT_MAX_FILE_BYTES = 50 * 1024 * 1024
+
+STATUS_GROUPS: dict[str, tuple[str, ...] | None] = {
+    "new": NEW_STATUSES,
+    "work": WORK_STATUSES,
+    "done": DONE_STATUSES,
+    "all": None,
+}
+GROUP_TITLES = {"new": "🆕 Нові", "work": "⚙️ В роботі", "done": "✅ Завершені", "all": "📚 Усі"}
+
+EXPORT_TZ = "Europe/Kyiv"
+
+PERIODS = ("today", "7d", "30d", "90d", "all")
+PERIOD_TITLES = {"today": "Сьогодні", "7d": "7 днів", "30d": "30 днів", "90d": "90 днів", "all": "Весь час"}
+
+COLUMNS = ("order_id", "user_id", "status", "created", "sku", "name", "qty", "price_uah", "order_total_uah")
+
+# активні експорти на tenant (на процес)
+_ACTIVE: dict[str, int] = {}
+# посилання на фонові задачі, щоб їх не прибрав GC
+_TASKS: set[asyncio.Task] = set()
+
+
+def formats() -> tuple[str, ...]:
+    return ("csv", "xlsx") if Workbook is not None else ("csv",)
+
+
+def _tz() -> ZoneInfo:
+    return ZoneInfo(EXPORT_TZ)
+
+
+def period_range(period: str, *, now: int | None = None) -> tuple[int, int]:
+    """
+    -> (since_ts, until_ts) за Києвом (EXPORT_TZ). until — виключно.
+    """
+    now = int(now or time.time())
+    if period not in PERIODS or period == "all":
+        return 0, now + 1
+    midnight = _dt.datetime.fromtimestamp(now, _tz()).replace(hour=0, minute=0, second=0, microsecond=0)
+    days = {"today": 0, "7d": 6, "30d": 29, "90d": 89}[period]
+    return int((midnight - _dt.timedelta(days=days)).timestamp()), now + 1
+
+
+def day_range(date_from: _dt.date, date_to: _dt.date) -> tuple[int, int]:
+    """
+    Дні від–до включно (за Києвом) -> (since_ts, until_ts), until — виключно.
+    """
+    if date_to < date_from:
+        date_from, date_to = date_to, date_from
+    since = _dt.datetime.combine(date_from, _dt.time(), _tz())
+    until = _dt.datetime.combine(date_to + _dt.timedelta(days=1), _dt.time(), _tz())
+    return int(since.timestamp()), int(until.timestamp())
+
+
+def parse_day_range(text: str) -> tuple[_dt.date, _dt.date] | None:
+    """
+    "01.03.2026 31.03.2026" / "2026-03-01 - 2026-03-31" -> (from, to); одна дата => один день.
+    """
+    parts = [p for p in (text or "").replace("—", " ").replace("–", " ").replace(" - ", " ").split() if p != "-"]
+    if not 1 <= len(parts) <= 2:
+        return None
+    days: list[_dt.date] = []
+    for p in parts:
+        d = None
+        for f in ("%d.%m.%Y", "%Y-%m-%d"):
+            try:
+                d = _dt.datetime.strptime(p, f).date()
+                break
+            except ValueError:
+                continue
+        if d is None:
+            return None
+        days.append(d)
+    d_from, d_to = days[0], days[-1]
+    return (d_from, d_to) if d_from <= d_to else (d_to, d_from)
+
+
+def day_range_title(date_from: _dt.date, date_to: _dt.date) -> str:
+    if date_from == date_to:
+        return date_from.strftime("%d.%m.%Y")
+    return f"{date_from.strftime('%d.%m.%Y')}–{date_to.strftime('%d.%m.%Y')}"
+
+
+def active_exports(tenant_id: str) -> int:
+    return int(_ACTIVE.get(str(tenant_id)) or 0)
+
+
+def _money(kop: Any) -> str:
+    kop = int(kop or 0)
+    sign = "-" if kop < 0 else ""
+    kop = abs(kop)
+    return f"{sign}{kop // 100}.{kop % 100:02d}"
+
+
+def _dt_str(ts: Any) -> str:
+    ts = int(ts or 0)
+    if ts <= 0:
+        return ""
+    return _dt.datetime.fromtimestamp(ts, _tz()).strftime("%Y-%m-%d %H:%M")
+
+
+def _row(r: dict[str, Any]) -> list[Any]:
+    return [
+        int(r.get("id") or 0),
+        int(r.get("user_id") or 0),
+        str(r.get("status") or ""),
+        _dt_str(r.get("created_ts")),
+        str(r.get("sku") or ""),
+        str(r.get("name") or ""),
+        int(r.get("qty") or 0),
+        _money(r.get("price_kop")),
+        _money(r.get("total_kop")),
+    ]
+
+
+class _SpooledInputFile(InputFile):
+    """
+    Документ з уже записаного тимчасового файлу — читається частинами, без bytes цілком.
+    """
+
+    def __init__(self, fp: Any, filename: str, chunk_size: int = 64 * 1024) -> None:
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.fp = fp
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        self.fp.seek(0)
+        while chunk := self.fp.read(self.chunk_size):
+            yield chunk
+
+
+def _build_query(*, statuses: tuple[str, ...] | None, exclude_archived: bool) -> str:
+    st_filter = "AND o.status = ANY(:sts)" if statuses else ""
+    arch_filter = (
+        """
+      AND NOT EXISTS (
+          SELECT 1 FROM telegram_shop_orders_admin_archive a
+          WHERE a.tenant_id = o.tenant_id AND a.order_id = o.id
+      )
+        """
+        if exclude_archived
+        else ""
+    )
+    return f"""
+    SELECT o.id, o.user_id, o.status, o.total_kop, o.created_ts,
+           i.sku, i.name, i.qty, i.price_kop
+    FROM telegram_shop_orders o
+    LEFT JOIN telegram_shop_order_items i ON i.order_id = o.id
+    WHERE o.tenant_id = :tid
+      AND o.created_ts >= :since AND o.created_ts < :until
+      {st_filter}
+      {arch_filter}
+    ORDER BY o.id ASC, i.id ASC
+    """
+
+
+class _Progress:
+    """
+    tick() не чекає Telegram: редагування йде фоновою задачею (не більше однієї),
+    тож server-side курсор не висить відкритим на мережевих затримках.
+    """
+
+    def __init__(self, bot: Bot, chat_id: int, title: str) -> None:
+        self.bot = bot
+        self.chat_id = int(chat_id)
+        self.title = title
+        self.message_id: int | None = None
+        self._last_rows = 0
+        self._last_ts = 0.0
+        self._task: asyncio.Task | None = None
+
+    async def _say(self, text: str) -> None:
+        if self.message_id:
+            try:
+                await self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.message_id)
+                return
+            except Exception:
+                pass
+        try:
+            m = await self.bot.send_message(self.chat_id, text)
+            self.message_id = int(m.message_id)
+        except Exception:
+            pass
+
+    async def start(self) -> None:
+        await self._say(f"⏳ {self.title}: готую файл…")
+        self._last_ts = time.monotonic()
+
+    def tick(self, rows: int, orders: int) -> None:
+        # великі експорти: не частіше ніж раз на N рядків і M секунд
+        if rows - self._last_rows < EXPORT_PROGRESS_EVERY_ROWS:
+            return
+        if time.monotonic() - self._last_ts < EXPORT_PROGRESS_MIN_SEC:
+            return
+        if self._task is not None and not self._task.done():
+            return
+        self._last_rows = rows
+        self._last_ts = time.monotonic()
+        self._task = asyncio.create_task(self._say(f"⏳ {self.title}: оброблено замовлень {orders} (рядків {rows})…"))
+        _TASKS.add(self._task)
+        self._task.add_done_callback(_TASKS.discard)
+
+    async def done(self, text: str) -> None:
+        if self._task is not None and not self._task.done():
+            try:
+                await self._task
+            except Exception:
+                pass
+        await self._say(text)
+
+
+async def _write_csv(
+    fp: Any, q: str, params: dict[str, Any], progress: _Progress, *, delimiter: str
+) -> tuple[int, int]:
+    # utf-8-sig: Excel коректно відкриває кирилицю
+    w = io.TextIOWrapper(fp, encoding="utf-8-sig", newline="")
+    out = csv.writer(w, delimiter=delimiter)
+    out.writerow(COLUMNS)
+
+    rows = orders = 0
+    last_oid = 0
+    async for chunk in db_stream(q, params, chunk_size=EXPORT_CHUNK_ROWS):
+        for r in chunk:
+            if int(r.get("id") or 0) != last_oid:
+                last_oid = int(r.get("id") or 0)
+                orders += 1
+            out.writerow(_row(r))
+        rows += len(chunk)
+        w.flush()
+        progress.tick(rows, orders)
+
+    w.flush()
+    w.detach()  # fp лишається відкритим для відправки
+    return rows, orders
+
+
+def _append_chunk(ws: Any, chunk: list[dict[str, Any]], last_oid: int) -> tuple[int, int]:
+    orders = 0
+    for r in chunk:
+        if int(r.get("id") or 0) != last_oid:
+            last_oid = int(r.get("id") or 0)
+            orders += 1
+        ws.append(_row(r))
+    return orders, last_oid
+
+
+async def _write_xlsx(fp: Any, q: str, params: dict[str, Any], progress: _Progress) -> tuple[int, int]:
+    # write_only: рядки скидаються у тимчасові файли openpyxl, а не тримаються в RAM.
+    # openpyxl — синхронний і CPU-важкий: append пачки та save — у потоці, event loop вільний
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("orders")
+    ws.append(list(COLUMNS))
+
+    rows = orders = 0
+    last_oid = 0
+    async for chunk in db_stream(q, params, chunk_size=EXPORT_CHUNK_ROWS):
+        n, last_oid = await asyncio.to_thread(_append_chunk, ws, chunk, last_oid)
+        orders += n
+        rows += len(chunk)
+        progress.tick(rows, orders)
+
+    await asyncio.to_thread(wb.save, fp)
+    return rows, orders
+
+
+async def export_orders(
+    bot: Bot,
+    chat_id: int,
+    tenant_id: str,
+    *,
+    group: str = "all",
+    period: str = "all",
+    fmt: str = "csv",
+    exclude_archived: bool = False,
+    date_from: _dt.date | None = None,
+    date_to: _dt.date | None = None,
+    filename: str | None = None,
+    caption: str | None = None,
+) -> int:
+    """
+    Потоковий експорт. -> кількість замовлень у файлі.
+    fmt: "csv" | "tsv" | "xlsx" (xlsx — лише якщо встановлено openpyxl, інакше csv)
+    date_from / date_to (обидва) — довільний період замість пресету period.
+    """
+    tid = str(tenant_id)
+    group = group if group in STATUS_GROUPS else "all"
+    fmt = fmt if fmt in ("csv", "tsv", "xlsx") else "csv"
+    if fmt == "xlsx" and Workbook is None:
+        fmt = "csv"
+
+    if date_from and date_to:
+        since, until = day_range(date_from, date_to)
+        period_title = day_range_title(min(date_from, date_to), max(date_from, date_to))
+        period = f"{min(date_from, date_to):%Y%m%d}_{max(date_from, date_to):%Y%m%d}"
+    else:
+        since, until = period_range(period)
+        period_title = PERIOD_TITLES.get(period, period)
+    statuses = STATUS_GROUPS[group]
+    q = _build_query(statuses=statuses, exclude_archived=exclude_archived)
+    params: dict[str, Any] = {"tid": tid, "since": since, "until": until}
+    if statuses:
+        params["sts"] = list(statuses)
+
+    title = f"Експорт {GROUP_TITLES.get(group, group)} • {period_title}"
+    progress = _Progress(bot, chat_id, title)
+    await progress.start()
+
+    started = time.monotonic()
+    with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_BYTES, mode="w+b") as fp:
+        if fmt == "xlsx":
+            rows, orders = await _write_xlsx(fp, q, params, progress)
+        else:
+            rows, orders = await _write_csv(fp, q, params, progress, delimiter="\t" if fmt == "tsv" else ",")
+
+        size = fp.tell()
+        log.info(
+            "orders export tenant=%s group=%s period=%s fmt=%s orders=%s rows=%s bytes=%s in %.2fs",
+            tid, group, period, fmt, orders, rows, size, time.monotonic() - started,
+        )
+
+        if orders <= 0:
+            await progress.done(f"📭 {title}: замовлень немає.")
+            return 0
+        if size > EXPORT_MAX_FILE_BYTES:
+            await progress.done(f"⚠️ {title}: файл завеликий для Telegram ({size // (1024 * 1024)} МБ). Обери менший період.")
+            return 0
+
+        stamp = _dt.datetime.now(_tz()).strftime("%Y%m%d_%H%M")
+        name = f"{filename or f'orders_{group}_{period}_{stamp}'}.{fmt}"
+        await progress.done(f"✅ {title}: замовлень {orders}, рядків {rows}.")
+        await bot.send_document(
+            chat_id,
+            _SpooledInputFile(fp, filename=name),
+            caption=caption or f"📤 {title}",
+            parse_mode="Markdown" if caption else None,
+        )
+    return orders
+
+
+def start_export(bot: Bot, chat_id: int, tenant_id: str, **kwargs: Any) -> bool:
+    """
+    Фоновий експорт (апдейт не чекає на файл). False => ліміт одночасних експортів tenant-а.
+    """
+    tid = str(tenant_id)
+    cap = max(1, int(settings.ORDERS_EXPORT_MAX_PER_TENANT))
+    if active_exports(tid) >= cap:
+        return False
+    _ACTIVE[tid] = active_exports(tid) + 1
+
+    async def _run() -> None:
+        try:
+            await export_orders(bot, chat_id, tid, **kwargs)
+        except Exception as e:
+            log.exception("orders export failed tenant=%s: %s", tid, e)
+            try:
+                await bot.send_message(chat_id, "⚠️ Експорт не вдався, спробуй пізніше.")
+            except Exception:
+                pass
+        finally:
+            n = active_exports(tid) - 1
+            if n > 0:
+                _ACTIVE[tid] = n
+            else:
+                _ACTIVE.pop(tid, None)
+
+    task = asyncio.create_task(_run())
+    _TASKS.add(task)
+    task.add_done_callback(_TASKS.discard)
+    return True
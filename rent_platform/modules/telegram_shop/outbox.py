@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from rent_platform.config import settings
+from rent_platform.core.tenant_routing import load_routes
+from rent_platform.modules.telegram_shop.repo.outbox import KIND_ADMIN_NEW_ORDER, TelegramShopOutboxRepo
+
+log = logging.getLogger(__name__)
+
+# =========================================================
+# Outbox dispatcher: асинхронна доставка сповіщень магазину
+#
+# Хендлер (кнопка адміна, checkout) лише пише рядок у telegram_shop_outbox
+# в своїй транзакції і будить цикл через outbox_wake() — затримка Telegram
+# більше не сидить у відповіді на натискання.
+# =========================================================
+
+OUTBOX_POLL_SEC = 2.0
+OUTBOX_LEASE_SEC = 120
+OUTBOX_LEASE_MARGIN_SEC = 15
+OUTBOX_RETRY_BASE_SEC = 5
+OUTBOX_RETRY_MAX_SEC = 600
+OUTBOX_PURGE_EVERY_SEC = 3600
+# Telegram: ~1 повідомлення/сек в один чат
+PER_CHAT_MIN_INTERVAL_SEC = 1.0
+# дайджест нових замовлень адміну
+DIGEST_MAX_LINES = 20
+DIGEST_MAX_BUTTONS = 6
+
+MODULE_KEY = "telegram_shop"
+
+_WAKE = asyncio.Event()
+
+_METRICS: dict[str, Any] = {"sent": 0, "retried": 0, "failed": 0, "last_batch": 0, "last_run_ts": 0}
+
+
+def outbox_metrics() -> dict[str, Any]:
+    return dict(_METRICS)
+
+
+def outbox_wake() -> None:
+    """Викликати ПІСЛЯ коміту транзакції з enqueue — доставка без очікування polling-у."""
+    _WAKE.set()
+
+
+class RateLimiter:
+    """
+    Token bucket на процес (rate/сек, burst) + мінімальний інтервал на chat_id.
+    """
+
+    def __init__(self, rate: float, burst: int | None = None) -> None:
+        self.rate = max(0.1, float(rate))
+        self.capacity = float(burst or max(1, int(self.rate)))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._chat_next: dict[int, float] = {}
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, chat_id: int) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                wait_chat = self._chat_next.get(int(chat_id), 0.0) - now
+                wait_bucket = (1.0 - self.tokens) / self.rate if self.tokens < 1.0 else 0.0
+                wait = max(wait_chat, wait_bucket)
+                if wait <= 0:
+                    self.tokens -= 1.0
+                    self._chat_next[int(chat_id)] = now + PER_CHAT_MIN_INTERVAL_SEC
+                    if len(self._chat_next) > 10000:
+                        self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+                    return
+                await asyncio.sleep(wait)
+
+
+_LIMITER: RateLimiter | None = None
+
+
+def _limiter() -> RateLimiter:
+    global _LIMITER
+    if _LIMITER is None:
+        _LIMITER = RateLimiter(float(settings.OUTBOX_PER_SEC))
+    return _LIMITER
+
+
+# tenant_id -> (token, Bot): одна HTTP-сесія на tenant між пачками, а не нова на кожну
+_BOTS: dict[str, tuple[str, Bot]] = {}
+
+
+async def _tenant_bot(tenant_id: str, token: str) -> Bot:
+    cached = _BOTS.get(tenant_id)
+    if cached and cached[0] == token:
+        return cached[1]
+    if cached:
+        # токен змінився (перепідключення бота) — стару сесію закриваємо
+        try:
+            await cached[1].session.close()
+        except Exception:
+            pass
+    bot = Bot(token=token)
+    _BOTS[tenant_id] = (token, bot)
+    return bot
+
+
+def _backoff(attempts: int) -> int:
+    return min(OUTBOX_RETRY_MAX_SEC, OUTBOX_RETRY_BASE_SEC * (2 ** max(0, int(attempts) - 1)))
+
+
+def _ikb(rows: list[list[tuple[str, str]]]) -> dict[str, Any]:
+    return {"inline_keyboard": [[{"text": t, "callback_data": d} for (t, d) in row] for row in rows]}
+
+
+def _admin_new_orders_unit(rows: list[dict[str, Any]]) -> dict[str, Any]:
+    """
+    Один рядок => звичайне сповіщення; кілька (сплеск у межах вікна) => один дайджест.
+    Кнопки ведуть в admin_orders (tgadm:ord_*).
+    """
+    rows = sorted(rows, key=lambda r: int(r.get("ref_id") or 0))
+    oids = [int(r.get("ref_id") or 0) for r in rows]
+    if len(rows) == 1:
+        text = f"🆕 Нове замовлення\n\n{rows[0].get('text') or ''}"
+        kb = _ikb(
+            [
+                [(f"🧾 Відкрити #{oids[0]}", f"tgadm:ord_open:{oids[0]}:0:new")],
+                [("📋 Нові замовлення", "tgadm:ord_tab:new:0")],
+            ]
+        )
+    else:
+        lines = [f"🆕 Нових замовлень: {len(rows)}", ""]
+        lines += [f"• {r.get('text') or ''}" for r in rows[:DIGEST_MAX_LINES]]
+        if len(rows) > DIGEST_MAX_LINES:
+            lines.append(f"… і ще {len(rows) - DIGEST_MAX_LINES}")
+        btns = [(f"🧾 #{oid}", f"tgadm:ord_open:{oid}:0:new") for oid in oids[-DIGEST_MAX_BUTTONS:]]
+        text = "\n".join(lines)
+        kb = _ikb([btns[i : i + 3] for i in range(0, len(btns), 3)] + [[("📋 Усі нові", "tgadm:ord_tab:new:0")]])
+    return {
+        "ids": [int(r["id"]) for r in rows],
+        "chat_id": int(rows[0]["chat_id"]),
+        "text": text,
+        "parse_mode": None,
+        "reply_markup": kb,
+        "attempts": max(int(r.get("attempts") or 0) for r in rows),
+    }
+
+
+def _units(items: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """
+    Рядки outbox -> повідомлення до відправки (кожне покриває 1+ рядків).
+    """
+    out: list[dict[str, Any]] = []
+    admin: dict[int, list[dict[str, Any]]] = {}
+    for r in items:
+        if str(r.get("kind") or "") == KIND_ADMIN_NEW_ORDER:
+            admin.setdefault(int(r["chat_id"]), []).append(r)
+            continue
+        kb = r.get("reply_markup")
+        out.append(
+            {
+                "ids": [int(r["id"])],
+                "chat_id": int(r["chat_id"]),
+                "text": str(r.get("text") or ""),
+                "parse_mode": r.get("parse_mode") or None,
+                "reply_markup": json.loads(kb) if kb else None,
+                "attempts": int(r.get("attempts") or 0),
+            }
+        )
+    out.extend(_admin_new_orders_unit(rows) for rows in admin.values())
+    return out
+
+
+async def _deliver(bot: Bot, u: dict[str, Any]) -> None:
+    await bot.send_message(
+        int(u["chat_id"]),
+        str(u["text"]),
+        parse_mode=u.get("parse_mode"),
+        reply_markup=u.get("reply_markup"),
+    )
+
+
+async def _mark_retry(ids: list[int], *, next_try_ts: int, error: str) -> None:
+    for oid in ids:
+        await TelegramShopOutboxRepo.mark_retry(oid, next_try_ts=next_try_ts, error=error)
+    _METRICS["retried"] += len(ids)
+
+
+async def _mark_failed(ids: list[int], *, error: str) -> None:
+    for oid in ids:
+        await TelegramShopOutboxRepo.mark_failed(oid, error=error)
+    _METRICS["failed"] += len(ids)
+
+
+async def dispatch_once() -> int:
+    """
+    Одна пачка. -> скільки рядків взято (== OUTBOX_BATCH => є ще).
+    """
+    now = int(time.time())
+    rows = await TelegramShopOutboxRepo.claim(
+        now=now, limit=max(1, int(settings.OUTBOX_BATCH)), lease_sec=OUTBOX_LEASE_SEC
+    )
+    _METRICS["last_batch"] = len(rows)
+    _METRICS["last_run_ts"] = now
+    if not rows:
+        return 0
+
+    by_tid: dict[str, list[dict[str, Any]]] = {}
+    for r in rows:
+        by_tid.setdefault(str(r["tenant_id"]), []).append(r)
+    routes = await load_routes(list(by_tid.keys()))
+
+    limiter = _limiter()
+    max_attempts = max(1, int(settings.OUTBOX_MAX_ATTEMPTS))
+    sent = 0
+    # не виходимо за оренду: після неї рядки може взяти інший процес (дубль)
+    deadline = time.monotonic() + OUTBOX_LEASE_SEC - OUTBOX_LEASE_MARGIN_SEC
+
+    for tid, items in by_tid.items():
+        route = routes.get(tid) or {}
+        tenant = route.get("tenant") or {}
+        token = str(tenant.get("bot_token") or "")
+        active = str(tenant.get("status") or "").lower() == "active" and MODULE_KEY in (route.get("modules") or [])
+        if not token or not active:
+            # бот на паузі: не губимо, спробуємо пізніше (поки є спроби)
+            spent = [int(r["id"]) for r in items if int(r.get("attempts") or 0) >= max_attempts]
+            later = [int(r["id"]) for r in items if int(r.get("attempts") or 0) < max_attempts]
+            await _mark_failed(spent, error="tenant inactive")
+            await _mark_retry(later, next_try_ts=now + OUTBOX_RETRY_MAX_SEC, error="tenant inactive")
+            continue
+
+        bot = await _tenant_bot(tid, token)
+        for u in _units(items):
+            ids = u["ids"]
+            if time.monotonic() >= deadline:
+                # решту віддаємо назад одразу, без очікування кінця оренди
+                await _mark_retry(ids, next_try_ts=int(time.time()), error="lease budget exhausted")
+                continue
+            await limiter.acquire(int(u["chat_id"]))
+            try:
+                await _deliver(bot, u)
+            except TelegramRetryAfter as e:
+                await _mark_retry(
+                    ids, next_try_ts=int(time.time()) + int(e.retry_after) + 1, error=f"retry_after {e.retry_after}"
+                )
+                continue
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # блок бота / чат не існує / кривий текст — повтори не допоможуть
+                await _mark_failed(ids, error=str(e))
+                continue
+            except Exception as e:
+                attempts = int(u["attempts"])
+                if attempts >= max_attempts:
+                    await _mark_failed(ids, error=str(e))
+                else:
+                    await _mark_retry(ids, next_try_ts=int(time.time()) + _backoff(attempts), error=str(e))
+                log.debug("outbox send failed ids=%s tenant=%s err=%s", ids, tid, e)
+                continue
+            # одразу після відправки: перевищена оренда чи падіння посеред пачки
+            # повторить лише ще не надіслане
+            await TelegramShopOutboxRepo.mark_sent(ids, now=int(time.time()))
+            sent += len(ids)
+
+    _METRICS["sent"] += sent
+    return len(rows)
+
+
+async def outbox_loop(stop_event: asyncio.Event) -> None:
+    log.info("shop outbox dispatcher started")
+    batch = max(1, int(settings.OUTBOX_BATCH))
+    last_purge = 0.0
+    while not stop_event.is_set():
+        _WAKE.clear()
+        taken = 0
+        try:
+            taken = await dispatch_once()
+            if time.monotonic() - last_purge >= OUTBOX_PURGE_EVERY_SEC:
+                last_purge = time.monotonic()
+                days = max(1, int(settings.OUTBOX_RETENTION_DAYS))
+                await TelegramShopOutboxRepo.purge_sent(int(time.time()) - days * 86400)
+        except Exception as e:
+            log.exception("shop outbox dispatch failed: %s", e)
+
+        if taken >= batch:
+            continue
+        try:
+            await asyncio.wait_for(_WAKE.wait(), timeout=OUTBOX_POLL_SEC)
+        except asyncio.TimeoutError:
+            pass
+
+    for _, bot in list(_BOTS.values()):
+        try:
+            await bot.session.close()
+        except Exception:
+            pass
+    _BOTS.clear()
+    log.info("shop outbox dispatcher stopped")
@@ -4,7 +4,29 @@ from __future__ import annotations
 import time
 from typing import Any
 
-from rent_platform.db.session import db_fetch_all, db_fetch_one, db_execute
+from rent_platform.db.session import db_fetch_all, db_fetch_one, db_execute, db_transaction
+from rent_platform.modules.telegram_shop.catalog_cache import catalog_version
+
+# =========================================================
+# Cart summary cache (per user, на процес)
+# Будь-який запис у кошик інвалідує; зміна товарів/цін — через версію каталогу.
+# =========================================================
+
+CART_SUMMARY_TTL_SEC = 15
+CART_SUMMARY_MAX_CACHED = 10000
+
+# cache[(tenant_id, user_id)] = (catalog_version, expires_ts, summary)
+_SUMMARY_CACHE: dict[tuple[str, int], tuple[int, int, dict[str, Any]]] = {}
+
+
+def invalidate_cart_summary(tenant_id: str, user_id: int) -> None:
+    _SUMMARY_CACHE.pop((str(tenant_id), int(user_id)), None)
+
+
+def _copy_summary(summary: dict[str, Any]) -> dict[str, Any]:
+    out = dict(summary)
+    out["items"] = [dict(it) for it in summary.get("items") or []]
+    return out
 
 
 class TelegramShopCartRepo:
@@ -31,6 +53,7 @@ class TelegramShopCartRepo:
                 "ts": int(time.time()),
             },
         )
+        invalidate_cart_summary(tenant_id, user_id)
 
     @staticmethod
     async def cart_inc(tenant_id: str, user_id: int, product_id: int, delta: int) -> int:
@@ -69,6 +92,7 @@ class TelegramShopCartRepo:
             },
         )
         qty = int(row["qty"]) if row and row.get("qty") is not None else 0
+        invalidate_cart_summary(tenant_id, user_id)
 
         if qty <= 0:
             await TelegramShopCartRepo.cart_delete_item(tenant_id, user_id, product_id)
@@ -76,6 +100,51 @@ class TelegramShopCartRepo:
 
         return qty
 
+    @staticmethod
+    async def cart_apply_deltas(tenant_id: str, user_id: int, deltas: dict[int, int]) -> dict[int, int]:
+        """
+        Батч дельт {product_id: delta} одним multi-row upsert (коалесовані тапи ➕/➖).
+        Рядки з qty <= 0 видаляються в тій самій транзакції.
+        -> {product_id: нова qty} (0 = позиції більше нема)
+        """
+        items = {int(pid): int(d) for pid, d in (deltas or {}).items() if int(d) != 0}
+        if not items:
+            return {}
+
+        pids = list(items.keys())
+        q = """
+        INSERT INTO telegram_shop_cart_items (tenant_id, user_id, product_id, qty, updated_ts)
+        SELECT :tid, :uid, d.pid, d.delta, :ts
+        FROM unnest(CAST(:pids AS INTEGER[]), CAST(:ds AS INTEGER[])) AS d(pid, delta)
+        ON CONFLICT (tenant_id, user_id, product_id)
+        DO UPDATE SET
+            qty = telegram_shop_cart_items.qty + EXCLUDED.qty,
+            updated_ts = EXCLUDED.updated_ts
+        RETURNING product_id, qty
+        """
+        q_del = """
+        DELETE FROM telegram_shop_cart_items
+        WHERE tenant_id = :tid AND user_id = :uid AND product_id = ANY(:pids) AND qty <= 0
+        """
+        async with db_transaction() as tx:
+            rows = await tx.fetch_all(
+                q,
+                {
+                    "tid": tenant_id,
+                    "uid": int(user_id),
+                    "pids": pids,
+                    "ds": [items[pid] for pid in pids],
+                    "ts": int(time.time()),
+                },
+            )
+            await tx.execute(q_del, {"tid": tenant_id, "uid": int(user_id), "pids": pids})
+        invalidate_cart_summary(tenant_id, user_id)
+
+        out = {pid: 0 for pid in pids}
+        for r in rows:
+            out[int(r["product_id"])] = max(int(r.get("qty") or 0), 0)
+        return out
+
     @staticmethod
     async def cart_get_qty(tenant_id: str, user_id: int, product_id: int) -> int:
         q = """
@@ -94,70 +163,109 @@ class TelegramShopCartRepo:
         WHERE tenant_id = :tid AND user_id = :uid AND product_id = :pid
         """
         await db_execute(q, {"tid": tenant_id, "uid": int(user_id), "pid": int(product_id)})
+        invalidate_cart_summary(tenant_id, user_id)
 
     @staticmethod
     async def cart_clear(tenant_id: str, user_id: int) -> None:
         q = "DELETE FROM telegram_shop_cart_items WHERE tenant_id = :tid AND user_id = :uid"
         await db_execute(q, {"tid": tenant_id, "uid": int(user_id)})
+        invalidate_cart_summary(tenant_id, user_id)
 
     @staticmethod
-    async def cart_list(tenant_id: str, user_id: int, *, include_sku: bool = False) -> list[dict[str, Any]]:
+    async def cart_summary(tenant_id: str, user_id: int, *, cached: bool = True) -> dict[str, Any]:
         """
-        Join products and return:
-          - base_price_kop (звичайна)
-          - price_kop (effective: promo if active, else base)
-          - optional sku
+        Кошик + підсумки ОДНИМ запитом (віконні SUM поверх тих самих рядків):
+          {
+            "items": [{product_id, qty, name, sku, base_price_kop, price_kop}],  # updated_ts DESC
+            "total_kop",        # effective (promo-aware)
+            "base_total_kop",   # за звичайними цінами
+            "saved_kop",        # економія на акціях
+            "items_count",      # сума qty (для бейджа)
+            "lines_count",      # к-сть позицій
+          }
+        cached=False — завжди з БД (checkout).
         """
+        key = (str(tenant_id), int(user_id))
         now = int(time.time())
 
-        sku_select = ", COALESCE(p.sku,'') AS sku" if include_sku else ""
-        q = f"""
+        if cached:
+            item = _SUMMARY_CACHE.get(key)
+            if item and item[0] == catalog_version(tenant_id) and item[1] > now:
+                return _copy_summary(item[2])
+
+        ver = catalog_version(tenant_id)
+        q = """
+        WITH x AS (
+            SELECT
+                c.product_id,
+                c.qty,
+                c.updated_ts,
+                p.name,
+                COALESCE(p.sku, '') AS sku,
+                COALESCE(p.price_kop, 0) AS base_price_kop,
+                CASE
+                  WHEN COALESCE(p.promo_price_kop, 0) > 0
+                   AND (COALESCE(p.promo_until_ts, 0) = 0 OR COALESCE(p.promo_until_ts, 0) > :now)
+                  THEN COALESCE(p.promo_price_kop, 0)
+                  ELSE COALESCE(p.price_kop, 0)
+                END AS price_kop
+            FROM telegram_shop_cart_items c
+            JOIN telegram_shop_products p
+              ON p.tenant_id = c.tenant_id AND p.id = c.product_id
+            WHERE c.tenant_id = :tid
+              AND c.user_id = :uid
+              AND p.is_active = true
+        )
         SELECT
-            c.product_id,
-            c.qty,
-            p.name
-            {sku_select},
-            COALESCE(p.price_kop, 0) AS base_price_kop,
-            CASE
-              WHEN COALESCE(p.promo_price_kop, 0) > 0
-               AND (COALESCE(p.promo_until_ts, 0) = 0 OR COALESCE(p.promo_until_ts, 0) > :now)
-              THEN COALESCE(p.promo_price_kop, 0)
-              ELSE COALESCE(p.price_kop, 0)
-            END AS price_kop
-        FROM telegram_shop_cart_items c
-        JOIN telegram_shop_products p
-          ON p.tenant_id = c.tenant_id AND p.id = c.product_id
-        WHERE c.tenant_id = :tid
-          AND c.user_id = :uid
-          AND p.is_active = true
-        ORDER BY c.updated_ts DESC
+            x.product_id,
+            x.qty,
+            x.name,
+            x.sku,
+            x.base_price_kop,
+            x.price_kop,
+            SUM(x.qty * x.price_kop) OVER () AS total_kop,
+            SUM(x.qty * x.base_price_kop) OVER () AS base_total_kop,
+            SUM(x.qty * GREATEST(x.base_price_kop - x.price_kop, 0)) OVER () AS saved_kop,
+            SUM(x.qty) OVER () AS items_count,
+            COUNT(*) OVER () AS lines_count
+        FROM x
+        ORDER BY x.updated_ts DESC
         """
-        return await db_fetch_all(q, {"tid": tenant_id, "uid": int(user_id), "now": now}) or []
+        rows = await db_fetch_all(q, {"tid": tenant_id, "uid": int(user_id), "now": now}) or []
+
+        first = rows[0] if rows else {}
+        summary: dict[str, Any] = {
+            "items": [
+                {
+                    "product_id": int(r["product_id"]),
+                    "qty": int(r.get("qty") or 0),
+                    "name": r.get("name"),
+                    "sku": str(r.get("sku") or ""),
+                    "base_price_kop": int(r.get("base_price_kop") or 0),
+                    "price_kop": int(r.get("price_kop") or 0),
+                }
+                for r in rows
+            ],
+            "total_kop": int(first.get("total_kop") or 0),
+            "base_total_kop": int(first.get("base_total_kop") or 0),
+            "saved_kop": int(first.get("saved_kop") or 0),
+            "items_count": int(first.get("items_count") or 0),
+            "lines_count": int(first.get("lines_count") or 0),
+        }
+
+        if len(_SUMMARY_CACHE) >= CART_SUMMARY_MAX_CACHED:
+            # спершу викидаємо протерміновані; якщо не допомогло — скидаємо все
+            for k in [k for k, v in _SUMMARY_CACHE.items() if v[1] <= now]:
+                _SUMMARY_CACHE.pop(k, None)
+            if len(_SUMMARY_CACHE) >= CART_SUMMARY_MAX_CACHED:
+                _SUMMARY_CACHE.clear()
+        _SUMMARY_CACHE[key] = (ver, now + CART_SUMMARY_TTL_SEC, summary)
+        return _copy_summary(summary)
 
     @staticmethod
     async def cart_get_total_kop(tenant_id: str, user_id: int) -> int:
         """
-        Total using effective (promo-aware) price in ONE query.
-        """
-        now = int(time.time())
-        q = """
-        SELECT
-          COALESCE(SUM(
-            c.qty * (
-              CASE
-                WHEN COALESCE(p.promo_price_kop, 0) > 0
-                 AND (COALESCE(p.promo_until_ts, 0) = 0 OR COALESCE(p.promo_until_ts, 0) > :now)
-                THEN COALESCE(p.promo_price_kop, 0)
-                ELSE COALESCE(p.price_kop, 0)
-              END
-            )
-          ), 0) AS total_kop
-        FROM telegram_shop_cart_items c
-        JOIN telegram_shop_products p
-          ON p.tenant_id = c.tenant_id AND p.id = c.product_id
-        WHERE c.tenant_id = :tid
-          AND c.user_id = :uid
-          AND p.is_active = true
+        Total using effective (promo-aware) price — з cart_summary (кеш).
         """
-        row = await db_fetch_one(q, {"tid": tenant_id, "uid": int(user_id), "now": now}) or {}
-        return int(row.get("total_kop") or 0)
\ No newline at end of file
+        summary = await TelegramShopCartRepo.cart_summary(tenant_id, user_id)
+        return int(summary.get("total_kop") or 0)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import time
+from typing import Any
+
+from rent_platform.config import settings
+from rent_platform.db.session import db_execute, db_fetch_one
+
+
+class TelegramShopCartSettingsRepo:
+    """
+    Таблиця: telegram_shop_cart_settings (1 рядок на tenant, рядка може не бути => дефолти)
+      - reap_enabled        чистити покинуті кошики
+      - idle_days           через скільки днів тиші кошик вважається покинутим
+      - remind_enabled      надсилати нагадування через бота магазину
+      - remind_after_hours  через скільки годин тиші нагадати (1 раз на період тиші)
+    """
+
+    IDLE_DAYS_CHOICES = (7, 14, 30, 60, 90)
+    REMIND_HOURS_CHOICES = (3, 6, 24, 48, 72)
+
+    @staticmethod
+    def defaults() -> dict[str, Any]:
+        return {
+            "reap_enabled": True,
+            "idle_days": max(1, int(settings.CART_IDLE_DAYS_DEFAULT)),
+            "remind_enabled": False,
+            "remind_after_hours": 24,
+        }
+
+    @staticmethod
+    async def get(tenant_id: str) -> dict[str, Any]:
+        q = """
+        SELECT reap_enabled, idle_days, remind_enabled, remind_after_hours
+        FROM telegram_shop_cart_settings
+        WHERE tenant_id = :tid
+        LIMIT 1
+        """
+        out = TelegramShopCartSettingsRepo.defaults()
+        row = await db_fetch_one(q, {"tid": tenant_id})
+        if row:
+            out.update({k: row[k] for k in out if row.get(k) is not None})
+        return out
+
+    @staticmethod
+    async def upsert(
+        tenant_id: str,
+        *,
+        reap_enabled: bool | None = None,
+        idle_days: int | None = None,
+        remind_enabled: bool | None = None,
+        remind_after_hours: int | None = None,
+    ) -> None:
+        cur = await TelegramShopCartSettingsRepo.get(tenant_id)
+        q = """
+        INSERT INTO telegram_shop_cart_settings
+            (tenant_id, reap_enabled, idle_days, remind_enabled, remind_after_hours, updated_ts)
+        VALUES (:tid, :re, :d, :rm, :h, :ts)
+        ON CONFLICT (tenant_id)
+        DO UPDATE SET
+            reap_enabled = EXCLUDED.reap_enabled,
+            idle_days = EXCLUDED.idle_days,
+            remind_enabled = EXCLUDED.remind_enabled,
+            remind_after_hours = EXCLUDED.remind_after_hours,
+            updated_ts = EXCLUDED.updated_ts
+        """
+        await db_execute(
+            q,
+            {
+                "tid": tenant_id,
+                "re": bool(cur["reap_enabled"] if reap_enabled is None else reap_enabled),
+                "d": max(1, int(cur["idle_days"] if idle_days is None else idle_days)),
+                "rm": bool(cur["remind_enabled"] if remind_enabled is None else remind_enabled),
+                "h": max(1, int(cur["remind_after_hours"] if remind_after_hours is None else remind_after_hours)),
+                "ts": int(time.time()),
+            },
+        )
+
+    @staticmethod
+    def next_choice(cur: int, choices: tuple[int, ...]) -> int:
+        # циклічний перемикач для кнопок адмінки
+        cur = int(cur)
+        for c in choices:
+            if c > cur:
+                return c
+        return choices[0]
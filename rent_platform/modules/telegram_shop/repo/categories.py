@@ -4,6 +4,7 @@ import time
 from typing import Any
 
 from rent_platform.db.session import db_fetch_one, db_fetch_all, db_execute
+from rent_platform.modules.telegram_shop.catalog_cache import bump_catalog_version
 
 
 class CategoriesRepo:
@@ -68,6 +69,7 @@ class CategoriesRepo:
         WHERE tenant_id = :tid AND name = :name
         """
         await db_execute(q, {"tid": tenant_id, "name": CategoriesRepo.DEFAULT_NAME, "s": int(new_sort)})
+        bump_catalog_version(tenant_id)
 
     @staticmethod
     async def is_default_visible(tenant_id: str) -> bool:
@@ -106,6 +108,7 @@ class CategoriesRepo:
         WHERE tenant_id = :tid AND name = :name
         """
         await db_execute(q, {"tid": tenant_id, "name": CategoriesRepo.SHOW_ALL_FLAG_NAME, "s": int(s)})
+        bump_catalog_version(tenant_id)
 
     @staticmethod
     async def is_show_all_enabled(tenant_id: str) -> bool:
@@ -138,6 +141,72 @@ class CategoriesRepo:
         """
         return await db_fetch_all(q, {"tid": tenant_id, "lim": int(limit)}) or []
 
+    @staticmethod
+    async def list_public_with_counts(tenant_id: str, *, now: int | None = None) -> dict[str, Any]:
+        """
+        Для покупця, ОДНИМ запитом і БЕЗ записів (read path):
+        - видимі категорії + кількість активних / хітів / акційних товарів у кожній
+        - прапорець "Усе" (рядок SHOW_ALL_FLAG_NAME з sort >= 0; нема рядка = вимкнено)
+        - next_promo_end_ts: найближчий кінець акції (щоб кеш не пережив акцію)
+        """
+        now_ts = int(now or time.time())
+        q = """
+        SELECT
+            c.id,
+            c.name,
+            c.sort,
+            COUNT(p.id) FILTER (WHERE p.is_active = true) AS active_cnt,
+            COUNT(p.id) FILTER (
+                WHERE p.is_active = true AND COALESCE(p.is_hit, false) = true
+            ) AS hit_cnt,
+            COUNT(p.id) FILTER (
+                WHERE p.is_active = true
+                  AND COALESCE(p.promo_price_kop, 0) > 0
+                  AND (COALESCE(p.promo_until_ts, 0) = 0 OR p.promo_until_ts > :now)
+            ) AS promo_cnt,
+            MIN(p.promo_until_ts) FILTER (
+                WHERE p.is_active = true
+                  AND COALESCE(p.promo_price_kop, 0) > 0
+                  AND p.promo_until_ts > :now
+            ) AS next_promo_end_ts
+        FROM telegram_shop_categories c
+        LEFT JOIN telegram_shop_products p
+               ON p.tenant_id = c.tenant_id AND p.category_id = c.id
+        WHERE c.tenant_id = :tid
+          AND c.sort >= 0
+        GROUP BY c.id, c.name, c.sort
+        ORDER BY c.sort ASC, c.id ASC
+        """
+        rows = await db_fetch_all(q, {"tid": tenant_id, "now": now_ts}) or []
+
+        show_all = False
+        next_promo_end = 0
+        cats: list[dict[str, Any]] = []
+        for r in rows:
+            name = str(r.get("name") or "")
+            if name == CategoriesRepo.SHOW_ALL_FLAG_NAME:
+                show_all = True
+                continue
+            if name.startswith("__"):
+                continue
+
+            end_ts = int(r.get("next_promo_end_ts") or 0)
+            if end_ts > 0 and (next_promo_end == 0 or end_ts < next_promo_end):
+                next_promo_end = end_ts
+
+            cats.append(
+                {
+                    "id": int(r["id"]),
+                    "name": name,
+                    "sort": int(r.get("sort") or 0),
+                    "active_cnt": int(r.get("active_cnt") or 0),
+                    "hit_cnt": int(r.get("hit_cnt") or 0),
+                    "promo_cnt": int(r.get("promo_cnt") or 0),
+                }
+            )
+
+        return {"categories": cats, "show_all": show_all, "next_promo_end_ts": next_promo_end}
+
     @staticmethod
     async def list(tenant_id: str, limit: int = 50) -> list[dict[str, Any]]:
         """
@@ -167,6 +236,7 @@ class CategoriesRepo:
         row = await db_fetch_one(
             q_ins, {"tid": tenant_id, "name": nm, "sort": int(sort), "ts": int(time.time())}
         )
+        bump_catalog_version(tenant_id)
         if row and row.get("id") is not None:
             return int(row["id"])
 
@@ -206,3 +276,4 @@ class CategoriesRepo:
         WHERE tenant_id = :tid AND id = :cid
         """
         await db_execute(q_del, {"tid": tenant_id, "cid": category_id})
+        bump_catalog_version(tenant_id)
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import time
+from typing import Any
+
+from rent_platform.db.session import DbTx, db_fetch_all
+
+# kinds
+EV_CREATED = "created"
+EV_STATUS = "status"
+EV_PAYMENT = "payment"
+EV_ARCHIVE = "archive"
+
+
+class TelegramShopOrderEventsRepo:
+    """
+    Таблиця: telegram_shop_order_events — append-only хронологія замовлення.
+    Пишеться ТІЛЬКИ через add(tx, ...) у транзакції самої зміни:
+    подія є <=> зміна закомічена.
+    """
+
+    @staticmethod
+    async def add(
+        tx: DbTx,
+        tenant_id: str,
+        order_id: int,
+        kind: str,
+        *,
+        old_value: str | None = None,
+        new_value: str | None = None,
+        actor_user_id: int | None = None,
+    ) -> None:
+        q = """
+        INSERT INTO telegram_shop_order_events
+            (tenant_id, order_id, kind, old_value, new_value, actor_user_id, ts)
+        VALUES (:tid, :oid, :kind, :old, :new, :actor, :ts)
+        """
+        await tx.execute(
+            q,
+            {
+                "tid": str(tenant_id),
+                "oid": int(order_id),
+                "kind": str(kind),
+                "old": old_value,
+                "new": new_value,
+                "actor": int(actor_user_id) if actor_user_id else None,
+                "ts": int(time.time()),
+            },
+        )
+
+    @staticmethod
+    async def list_for_order(tenant_id: str, order_id: int, *, limit: int = 50) -> list[dict[str, Any]]:
+        q = """
+        SELECT id, kind, old_value, new_value, actor_user_id, ts
+        FROM telegram_shop_order_events
+        WHERE tenant_id = :tid AND order_id = :oid
+        ORDER BY id ASC
+        LIMIT :lim
+        """
+        return await db_fetch_all(q, {"tid": str(tenant_id), "oid": int(order_id), "lim": int(limit)}) or []
@@ -1,11 +1,36 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
+import logging
 import time
 from typing import Any, Iterable
 
-from rent_platform.db.session import db_fetch_all, db_fetch_one, db_execute
-from rent_platform.modules.telegram_shop.repo.cart import TelegramShopCartRepo
+from rent_platform.db.session import DbTx, db_fetch_all, db_fetch_one, db_execute, db_transaction
+from rent_platform.modules.telegram_shop.repo.cart import TelegramShopCartRepo, invalidate_cart_summary
+from rent_platform.modules.telegram_shop.repo.order_events import EV_CREATED, EV_STATUS, TelegramShopOrderEventsRepo
+from rent_platform.modules.telegram_shop.repo.orders_counters import (
+    TelegramShopOrderCountersRepo,
+    counters_delta,
+    tab_for_status,
+)
+from rent_platform.modules.telegram_shop.repo.outbox import TelegramShopOutboxRepo
+from rent_platform.modules.telegram_shop.repo.sales_rollup import TelegramShopSalesRollupRepo
+
+log = logging.getLogger(__name__)
+
+# статуси, що повертають зарезервований залишок на склад
+STOCK_RELEASE_STATUSES = ("cancelled", "returned")
+
+
+class TelegramShopOutOfStock(Exception):
+    """
+    Checkout відхилено: не вистачає залишку.
+    lines = [{"product_id", "name", "want", "available"}]
+    """
+
+    def __init__(self, lines: list[dict[str, Any]]) -> None:
+        super().__init__("out of stock")
+        self.lines = lines
 
 
 class TelegramShopOrdersRepo:
@@ -47,133 +72,360 @@ class TelegramShopOrdersRepo:
             out.append(v)
         return out
 
-    @staticmethod
-    async def _try_begin() -> bool:
-        try:
-            await db_execute("BEGIN")
-            return True
-        except Exception:
-            return False
-
-    @staticmethod
-    async def _try_commit() -> None:
-        try:
-            await db_execute("COMMIT")
-        except Exception:
-            pass
-
-    @staticmethod
-    async def _try_rollback() -> None:
-        try:
-            await db_execute("ROLLBACK")
-        except Exception:
-            pass
-
     # -----------------------------
     # Core: create order from cart
     # -----------------------------
     @staticmethod
     async def create_order_from_cart(tenant_id: str, user_id: int) -> int | None:
         """
-        Best-effort atomic flow:
-          1) read cart items (already contains effective price_kop)
-          2) compute total
-          3) insert order
-          4) snapshot items (+ sku snapshot if column exists)
+        Атомарно, в ОДНІЙ транзакції:
+          1) cart_summary (items + effective total + sku — один запит, без кешу)
+          2) lock товарів з обліком залишку в порядку id (без deadlock між checkout-ами;
+             товари без обліку не блокуються => tenant не серіалізується)
+          3) умовний декремент stock_qty для всіх рядків ОДНИМ UPDATE;
+             якщо бракує хоч одного — rollback і TelegramShopOutOfStock
+          4) insert order + snapshot items одним multi-row INSERT
           5) clear cart
         """
-        items = await TelegramShopCartRepo.cart_list(tenant_id, user_id)
+        summary = await TelegramShopCartRepo.cart_summary(tenant_id, user_id, cached=False)
+        items = [
+            it
+            for it in summary.get("items") or []
+            if TelegramShopOrdersRepo._to_int(it.get("product_id"), 0) > 0
+            and TelegramShopOrdersRepo._to_int(it.get("qty"), 0) > 0
+            and TelegramShopOrdersRepo._to_int(it.get("price_kop"), 0) > 0
+        ]
         if not items:
             return None
 
-        total_kop = 0
-        for it in items:
-            price_kop = TelegramShopOrdersRepo._to_int(it.get("price_kop"), 0)
-            qty = TelegramShopOrdersRepo._to_int(it.get("qty"), 0)
-            if qty > 0 and price_kop > 0:
-                total_kop += price_kop * qty
-
+        total_kop = sum(int(it["price_kop"]) * int(it["qty"]) for it in items)
         if total_kop <= 0:
             return None
 
-        # sku map (ONE query for all pids)
-        pids = TelegramShopOrdersRepo._uniq_ints(it.get("product_id") for it in items)
-        sku_map: dict[int, str] = {}
-        if pids:
-            qsku_many = """
-            SELECT id, COALESCE(sku,'') AS sku
-            FROM telegram_shop_products
-            WHERE tenant_id = :tid AND id = ANY(:pids)
-            """
-            rows_sku = await db_fetch_all(qsku_many, {"tid": tenant_id, "pids": pids}) or []
-            for r in rows_sku:
-                pid = TelegramShopOrdersRepo._to_int(r.get("id"), 0)
-                if pid > 0:
-                    sku_map[pid] = str(r.get("sku") or "")[:64]
+        pids = [int(it["product_id"]) for it in items]
+        qtys = [int(it["qty"]) for it in items]
+        names = {int(it["product_id"]): str(it.get("name") or "") for it in items}
 
+        q_lock = """
+        SELECT id
+        FROM telegram_shop_products
+        WHERE tenant_id = :tid AND id = ANY(:pids) AND stock_qty IS NOT NULL
+        ORDER BY id
+        FOR UPDATE
+        """
+        q_reserve = """
+        WITH want AS (
+            SELECT w.pid, SUM(w.qty) AS qty
+            FROM unnest(CAST(:pids AS INTEGER[]), CAST(:qtys AS INTEGER[])) AS w(pid, qty)
+            GROUP BY w.pid
+        ),
+        upd AS (
+            UPDATE telegram_shop_products p
+            SET stock_qty = p.stock_qty - want.qty
+            FROM want
+            WHERE p.tenant_id = :tid
+              AND p.id = want.pid
+              AND p.stock_qty IS NOT NULL
+              AND p.stock_qty >= want.qty
+            RETURNING p.id
+        )
+        SELECT
+            want.pid AS product_id,
+            want.qty AS want,
+            p.stock_qty AS available,
+            (p.stock_qty IS NULL) AS unlimited,
+            (upd.id IS NOT NULL) AS reserved
+        FROM want
+        LEFT JOIN telegram_shop_products p ON p.tenant_id = :tid AND p.id = want.pid
+        LEFT JOIN upd ON upd.id = want.pid
+        """
         q_order_ins = """
-        INSERT INTO telegram_shop_orders (tenant_id, user_id, status, total_kop, created_ts)
-        VALUES (:tid, :uid, 'new', :t, :ts)
+        INSERT INTO telegram_shop_orders (tenant_id, user_id, status, total_kop, created_ts, stock_reserved)
+        VALUES (:tid, :uid, 'new', :t, :ts, :sr)
         RETURNING id
         """
-
-        # sku column may not exist -> fallback
-        q_item_ins_with_sku = """
-        INSERT INTO telegram_shop_order_items (order_id, product_id, name, price_kop, qty, sku)
-        VALUES (:oid, :pid, :n, :p, :q, :sku)
-        """
-        q_item_ins = """
-        INSERT INTO telegram_shop_order_items (order_id, product_id, name, price_kop, qty)
-        VALUES (:oid, :pid, :n, :p, :q)
+        q_items_ins = """
+        INSERT INTO telegram_shop_order_items (order_id, product_id, name, price_kop, qty, sku, reserved_qty)
+        SELECT :oid, x.pid, x.n, x.p, x.q, x.sku, x.rq
+        FROM unnest(
+            CAST(:pids AS INTEGER[]),
+            CAST(:ns AS TEXT[]),
+            CAST(:ps AS INTEGER[]),
+            CAST(:qs AS INTEGER[]),
+            CAST(:skus AS TEXT[]),
+            CAST(:rqs AS INTEGER[])
+        ) AS x(pid, n, p, q, sku, rq)
         """
+        q_cart_clear = "DELETE FROM telegram_shop_cart_items WHERE tenant_id = :tid AND user_id = :uid"
 
-        ts = TelegramShopOrdersRepo._now_ts()
-
-        began = await TelegramShopOrdersRepo._try_begin()
         try:
-            row = await db_fetch_one(
-                q_order_ins,
-                {"tid": tenant_id, "uid": int(user_id), "t": int(total_kop), "ts": int(ts)},
-            )
-            if not row or row.get("id") is None:
-                if began:
-                    await TelegramShopOrdersRepo._try_rollback()
-                return None
-
-            order_id = int(row["id"])
-
-            for it in items:
-                pid = TelegramShopOrdersRepo._to_int(it.get("product_id"), 0)
-                qty = TelegramShopOrdersRepo._to_int(it.get("qty"), 0)
-                price_kop = TelegramShopOrdersRepo._to_int(it.get("price_kop"), 0)
-                if pid <= 0 or qty <= 0 or price_kop <= 0:
-                    continue
-
-                payload = {
-                    "oid": order_id,
-                    "pid": pid,
-                    "n": str(it.get("name") or "")[:128],
-                    "p": int(price_kop),
-                    "q": int(qty),
-                    "sku": sku_map.get(pid, "")[:64],
-                }
+            async with db_transaction() as tx:
+                await tx.fetch_all(q_lock, {"tid": tenant_id, "pids": pids})
+                res = await tx.fetch_all(q_reserve, {"tid": tenant_id, "pids": pids, "qtys": qtys})
+
+                short: list[dict[str, Any]] = []
+                reserved: set[int] = set()
+                for r in res:
+                    pid = int(r["product_id"])
+                    if r.get("reserved"):
+                        reserved.add(pid)
+                    elif not r.get("unlimited"):
+                        short.append(
+                            {
+                                "product_id": pid,
+                                "name": names.get(pid, ""),
+                                "want": int(r.get("want") or 0),
+                                "available": max(0, int(r.get("available") or 0)),
+                            }
+                        )
+                if short:
+                    # вихід з db_transaction з винятком => rollback (декремент скасовано)
+                    raise TelegramShopOutOfStock(short)
+
+                row = await tx.fetch_one(
+                    q_order_ins,
+                    {
+                        "tid": tenant_id,
+                        "uid": int(user_id),
+                        "t": int(total_kop),
+                        "ts": TelegramShopOrdersRepo._now_ts(),
+                        "sr": bool(reserved),
+                    },
+                )
+                order_id = int(row["id"])  # type: ignore[index]
+
+                await tx.execute(
+                    q_items_ins,
+                    {
+                        "oid": order_id,
+                        "pids": pids,
+                        "ns": [str(it.get("name") or "")[:128] for it in items],
+                        "ps": [int(it["price_kop"]) for it in items],
+                        "qs": qtys,
+                        "skus": [str(it.get("sku") or "")[:64] for it in items],
+                        "rqs": [int(it["qty"]) if int(it["product_id"]) in reserved else 0 for it in items],
+                    },
+                )
+                await tx.execute(q_cart_clear, {"tid": tenant_id, "uid": int(user_id)})
+                await TelegramShopOrderCountersRepo.bump(tx, tenant_id, {"new": 1})
+                await TelegramShopOrderEventsRepo.add(
+                    tx, tenant_id, order_id, EV_CREATED, new_value="new", actor_user_id=int(user_id)
+                )
+                await TelegramShopSalesRollupRepo.move(tx, tenant_id, order_id, d_valid=1, d_void=0)
+                await TelegramShopOutboxRepo.enqueue_admin_new_order(
+                    tx,
+                    tenant_id,
+                    order_id,
+                    f"#{order_id} — {int(total_kop) // 100}.{int(total_kop) % 100:02d} грн — "
+                    f"{sum(qtys)} шт. — покупець {int(user_id)}",
+                )
+        except TelegramShopOutOfStock:
+            raise
+        except Exception:
+            log.exception("create_order_from_cart failed tenant=%s user=%s", tenant_id, user_id)
+            return None
 
-                try:
-                    await db_execute(q_item_ins_with_sku, payload)
-                except Exception:
-                    await db_execute(q_item_ins, payload)
+        invalidate_cart_summary(tenant_id, user_id)
+        return order_id
 
-            await TelegramShopCartRepo.cart_clear(tenant_id, user_id)
+    @staticmethod
+    async def set_status(
+        tenant_id: str,
+        order_id: int,
+        status: str,
+        *,
+        actor_user_id: int | None = None,
+        notify_text: str | None = None,
+        notify_parse_mode: str | None = None,
+    ) -> str | None:
+        """
+        Одна транзакція: статус + подія в telegram_shop_order_events + лічильники вкладок
+        + залишок (у STOCK_RELEASE_STATUSES — повернути на склад, назад в активний — зарезервувати знову)
+        + (якщо notify_text) сповіщення покупцю в outbox.
+        -> попередній статус або None (замовлення нема).
+        Бракує залишку для повернення з cancelled/returned => TelegramShopOutOfStock, статус не змінено.
+        Після успіху викликач будить outbox (outbox.outbox_wake()).
+        """
+        q_old = """
+        SELECT
+            o.status,
+            o.user_id,
+            EXISTS (
+                SELECT 1 FROM telegram_shop_orders_admin_archive a
+                WHERE a.tenant_id = o.tenant_id AND a.order_id = o.id
+            ) AS archived
+        FROM telegram_shop_orders o
+        WHERE o.tenant_id = :tid AND o.id = :oid
+        FOR UPDATE OF o
+        """
+        q_set = """
+        UPDATE telegram_shop_orders
+        SET status = :st
+        WHERE tenant_id = :tid AND id = :oid
+        """
+        status = (status or "").strip()
+        async with db_transaction() as tx:
+            row = await tx.fetch_one(q_old, {"tid": tenant_id, "oid": int(order_id)})
+            if not row:
+                return None
+            old = str(row.get("status") or "")
+            if old == status:
+                return old
+
+            was_void, now_void = old in STOCK_RELEASE_STATUSES, status in STOCK_RELEASE_STATUSES
+            if now_void and not was_void:
+                await TelegramShopOrdersRepo._release_stock_tx(tx, tenant_id, int(order_id))
+            elif was_void and not now_void:
+                await TelegramShopOrdersRepo._reserve_stock_tx(tx, tenant_id, int(order_id))
+
+            await tx.execute(q_set, {"st": status, "tid": tenant_id, "oid": int(order_id)})
+            await TelegramShopOrderEventsRepo.add(
+                tx, tenant_id, int(order_id), EV_STATUS, old_value=old, new_value=status, actor_user_id=actor_user_id
+            )
+            if not row.get("archived"):
+                await TelegramShopOrderCountersRepo.bump(
+                    tx, tenant_id, counters_delta(tab_for_status(old), tab_for_status(status))
+                )
+            await TelegramShopSalesRollupRepo.move_for_status(tx, tenant_id, int(order_id), old, status)
+
+            user_id = int(row.get("user_id") or 0)
+            if notify_text and user_id > 0:
+                await TelegramShopOutboxRepo.enqueue(
+                    tx,
+                    tenant_id,
+                    user_id,
+                    notify_text,
+                    kind="order_status",
+                    ref_id=int(order_id),
+                    parse_mode=notify_parse_mode,
+                )
+        return old
 
-            if began:
-                await TelegramShopOrdersRepo._try_commit()
+    @staticmethod
+    async def _release_stock_tx(tx: DbTx, tenant_id: str, order_id: int) -> bool:
+        """
+        Повернути зарезервований залишок. Ідемпотентно: orders.stock_reserved скидається
+        в тій самій транзакції, повтор нічого не робить.
+        """
+        q_flag = """
+        UPDATE telegram_shop_orders
+        SET stock_reserved = false
+        WHERE tenant_id = :tid AND id = :oid AND stock_reserved = true
+        RETURNING id
+        """
+        q_lock = """
+        SELECT p.id
+        FROM telegram_shop_products p
+        WHERE p.tenant_id = :tid
+          AND p.id IN (
+              SELECT product_id FROM telegram_shop_order_items
+              WHERE order_id = :oid AND reserved_qty > 0
+          )
+        ORDER BY p.id
+        FOR UPDATE
+        """
+        q_release = """
+        UPDATE telegram_shop_products p
+        SET stock_qty = p.stock_qty + x.qty
+        FROM (
+            SELECT product_id, SUM(reserved_qty) AS qty
+            FROM telegram_shop_order_items
+            WHERE order_id = :oid AND reserved_qty > 0
+            GROUP BY product_id
+        ) x
+        WHERE p.tenant_id = :tid AND p.id = x.product_id AND p.stock_qty IS NOT NULL
+        """
+        row = await tx.fetch_one(q_flag, {"tid": tenant_id, "oid": int(order_id)})
+        if not row:
+            return False
+        # той самий порядок блокувань, що й у checkout
+        await tx.fetch_all(q_lock, {"tid": tenant_id, "oid": int(order_id)})
+        await tx.execute(q_release, {"tid": tenant_id, "oid": int(order_id)})
+        return True
 
-            return order_id
+    @staticmethod
+    async def _reserve_stock_tx(tx: DbTx, tenant_id: str, order_id: int) -> bool:
+        """
+        Знову зарезервувати reserved_qty позицій (замовлення повернули з cancelled/returned).
+        Бракує хоч одного товару => TelegramShopOutOfStock (викликач відкочує транзакцію).
+        Товар, що з тих пір став без обліку чи видалений, пропускається.
+        """
+        q_flag = """
+        UPDATE telegram_shop_orders o
+        SET stock_reserved = true
+        WHERE o.tenant_id = :tid AND o.id = :oid AND o.stock_reserved = false
+          AND EXISTS (
+              SELECT 1 FROM telegram_shop_order_items i
+              WHERE i.order_id = o.id AND i.reserved_qty > 0
+          )
+        RETURNING o.id
+        """
+        q_lock = """
+        SELECT p.id
+        FROM telegram_shop_products p
+        WHERE p.tenant_id = :tid
+          AND p.stock_qty IS NOT NULL
+          AND p.id IN (
+              SELECT product_id FROM telegram_shop_order_items
+              WHERE order_id = :oid AND reserved_qty > 0
+          )
+        ORDER BY p.id
+        FOR UPDATE
+        """
+        q_reserve = """
+        WITH want AS (
+            SELECT product_id AS pid, MAX(name) AS name, SUM(reserved_qty) AS qty
+            FROM telegram_shop_order_items
+            WHERE order_id = :oid AND reserved_qty > 0
+            GROUP BY product_id
+        ),
+        upd AS (
+            UPDATE telegram_shop_products p
+            SET stock_qty = p.stock_qty - want.qty
+            FROM want
+            WHERE p.tenant_id = :tid
+              AND p.id = want.pid
+              AND p.stock_qty IS NOT NULL
+              AND p.stock_qty >= want.qty
+            RETURNING p.id
+        )
+        SELECT
+            want.pid AS product_id,
+            want.name,
+            want.qty AS want,
+            p.stock_qty AS available,
+            (p.id IS NULL OR p.stock_qty IS NULL) AS unlimited,
+            (upd.id IS NOT NULL) AS reserved
+        FROM want
+        LEFT JOIN telegram_shop_products p ON p.tenant_id = :tid AND p.id = want.pid
+        LEFT JOIN upd ON upd.id = want.pid
+        """
+        row = await tx.fetch_one(q_flag, {"tid": tenant_id, "oid": int(order_id)})
+        if not row:
+            return False
+        await tx.fetch_all(q_lock, {"tid": tenant_id, "oid": int(order_id)})
+        res = await tx.fetch_all(q_reserve, {"tid": tenant_id, "oid": int(order_id)}) or []
+        short = [
+            {
+                "product_id": int(r["product_id"]),
+                "name": str(r.get("name") or ""),
+                "want": int(r.get("want") or 0),
+                "available": max(0, int(r.get("available") or 0)),
+            }
+            for r in res
+            if not r.get("reserved") and not r.get("unlimited")
+        ]
+        if short:
+            raise TelegramShopOutOfStock(short)
+        return True
 
-        except Exception:
-            if began:
-                await TelegramShopOrdersRepo._try_rollback()
-            return None
+    @staticmethod
+    async def release_stock(tenant_id: str, order_id: int) -> bool:
+        """
+        Окремою транзакцією (ручне повернення залишку). Зміна статусу робить це сама — в set_status.
+        """
+        async with db_transaction() as tx:
+            return await TelegramShopOrdersRepo._release_stock_tx(tx, tenant_id, int(order_id))
 
     # -----------------------------
     # User archive (telegram_shop_orders_archive)
@@ -282,6 +534,67 @@ class TelegramShopOrdersRepo:
             """
             return await db_fetch_all(q2, {"tid": tenant_id, "uid": int(user_id), "lim": int(limit)}) or []
 
+    @staticmethod
+    async def list_user_orders_page(
+        tenant_id: str,
+        user_id: int,
+        *,
+        scope: str = "active",
+        page: int = 0,
+        per_page: int = 10,
+    ) -> dict[str, Any]:
+        """
+        Сторінка історії користувача + лічильники — максимум 2 запити.
+        scope: "active" | "arch" (telegram_shop_orders_archive, архів користувача)
+        -> {"items", "page", "has_prev", "has_next", "total", "active", "arch"}
+        Сторінка за межами => остання існуюча.
+        """
+        q_cnt = """
+        SELECT
+            COUNT(*) AS total,
+            COUNT(*) FILTER (WHERE a.order_id IS NULL) AS active,
+            COUNT(a.order_id) AS arch
+        FROM telegram_shop_orders o
+        LEFT JOIN telegram_shop_orders_archive a
+          ON a.tenant_id = o.tenant_id AND a.user_id = o.user_id AND a.order_id = o.id
+        WHERE o.tenant_id = :tid AND o.user_id = :uid
+        """
+        q_page = """
+        SELECT o.id, o.status, o.total_kop, o.created_ts
+        FROM telegram_shop_orders o
+        LEFT JOIN telegram_shop_orders_archive a
+          ON a.tenant_id = o.tenant_id AND a.user_id = o.user_id AND a.order_id = o.id
+        WHERE o.tenant_id = :tid AND o.user_id = :uid
+          AND (a.order_id IS NOT NULL) = :arch
+        ORDER BY o.id DESC
+        LIMIT :lim OFFSET :off
+        """
+        scope = scope if scope in ("active", "arch") else "active"
+        per_page = max(1, int(per_page))
+        params = {"tid": tenant_id, "uid": int(user_id)}
+
+        row = await db_fetch_one(q_cnt, params) or {}
+        cnt = {k: int(row.get(k) or 0) for k in ("total", "active", "arch")}
+
+        scoped = cnt[scope]
+        last_page = max(0, (scoped - 1) // per_page)
+        page = min(max(0, int(page or 0)), last_page)
+
+        items: list[dict[str, Any]] = []
+        if scoped > 0:
+            items = await db_fetch_all(
+                q_page,
+                {**params, "arch": scope == "arch", "lim": per_page, "off": page * per_page},
+            ) or []
+
+        return {
+            "items": items,
+            "page": page,
+            "has_prev": page > 0,
+            "has_next": page < last_page,
+            **cnt,
+        }
+
     @staticmethod
     async def get_order(tenant_id: str, order_id: int) -> dict[str, Any] | None:
         q = """
@@ -2,7 +2,11 @@
 from __future__ import annotations
 
 import time
-from rent_platform.db.session import db_fetch_one, db_execute
+from typing import Any
+
+from rent_platform.db.session import db_fetch_one, db_transaction
+from rent_platform.modules.telegram_shop.repo.order_events import EV_ARCHIVE, TelegramShopOrderEventsRepo
+from rent_platform.modules.telegram_shop.repo.orders_counters import TelegramShopOrderCountersRepo, tab_for_status
 
 
 class TelegramShopOrdersAdminArchiveRepo:
@@ -18,19 +22,45 @@ class TelegramShopOrdersAdminArchiveRepo:
         return bool(row)
 
     @staticmethod
-    async def toggle(tenant_id: str, order_id: int) -> bool:
-        if await TelegramShopOrdersAdminArchiveRepo.is_archived(tenant_id, order_id):
-            q = """
-            DELETE FROM telegram_shop_orders_admin_archive
-            WHERE tenant_id = :tid AND order_id = :oid
-            """
-            await db_execute(q, {"tid": str(tenant_id), "oid": int(order_id)})
-            return False
-
-        q = """
+    async def toggle(tenant_id: str, order_id: int, *, actor_user_id: int | None = None) -> bool:
+        """
+        returns True if archived now, False if unarchived now.
+        Одна транзакція: рядок замовлення блокується (серіалізація зі зміною статусу),
+        лічильники вкладок оновлюються тут же.
+        """
+        q_order = """
+        SELECT status
+        FROM telegram_shop_orders
+        WHERE tenant_id = :tid AND id = :oid
+        FOR UPDATE
+        """
+        q_del = """
+        DELETE FROM telegram_shop_orders_admin_archive
+        WHERE tenant_id = :tid AND order_id = :oid
+        RETURNING order_id
+        """
+        q_ins = """
         INSERT INTO telegram_shop_orders_admin_archive (tenant_id, order_id, archived_ts)
         VALUES (:tid, :oid, :ts)
         ON CONFLICT (tenant_id, order_id) DO UPDATE SET archived_ts = EXCLUDED.archived_ts
         """
-        await db_execute(q, {"tid": str(tenant_id), "oid": int(order_id), "ts": int(time.time())})
-        return True
\ No newline at end of file
+        params: dict[str, Any] = {"tid": str(tenant_id), "oid": int(order_id)}
+        async with db_transaction() as tx:
+            o = await tx.fetch_one(q_order, params) or {}
+            tab = tab_for_status(str(o.get("status") or "")) if o else None
+
+            if await tx.fetch_one(q_del, params):
+                await TelegramShopOrderCountersRepo.bump(tx, tenant_id, {"arch": -1, **({tab: 1} if tab else {})})
+                if o:
+                    await TelegramShopOrderEventsRepo.add(
+                        tx, tenant_id, int(order_id), EV_ARCHIVE, old_value="1", new_value="0", actor_user_id=actor_user_id
+                    )
+                return False
+
+            await tx.execute(q_ins, {**params, "ts": int(time.time())})
+            if o:
+                await TelegramShopOrderCountersRepo.bump(tx, tenant_id, {"arch": 1, **({tab: -1} if tab else {})})
+                await TelegramShopOrderEventsRepo.add(
+                    tx, tenant_id, int(order_id), EV_ARCHIVE, old_value="0", new_value="1", actor_user_id=actor_user_id
+                )
+            return True
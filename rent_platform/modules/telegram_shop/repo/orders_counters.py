@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from rent_platform.db.session import DbTx, db_fetch_all, db_fetch_one, db_transaction
+
+log = logging.getLogger(__name__)
+
+# status groups (вкладки адмінки замовлень)
+NEW_STATUSES = ("new",)
+WORK_STATUSES = ("accepted", "packed", "shipped")
+DONE_STATUSES = ("delivered", "not_received", "returned", "cancelled")
+
+TABS = ("new", "work", "done", "arch")
+
+ORDER_COUNTERS_RECONCILE_SEC = 3600
+ORDER_COUNTERS_FOLD_SEC = 60
+
+
+def tab_for_status(status: str) -> str | None:
+    st = (status or "").strip()
+    if st in NEW_STATUSES:
+        return "new"
+    if st in WORK_STATUSES:
+        return "work"
+    if st in DONE_STATUSES:
+        return "done"
+    return None
+
+
+class TelegramShopOrderCountersRepo:
+    """
+    Таблиці:
+      telegram_shop_order_counters        — база (1 рядок на tenant)
+      telegram_shop_order_counter_deltas  — append-only зміни, ще не згорнуті в базу
+    new_cnt / work_cnt / done_cnt — замовлення НЕ в архіві адміна, за групою статусу
+    arch_cnt — в архіві адміна
+
+    bump(tx, ...) у ТІЙ САМІЙ транзакції, що й зміна (створення / статус / архів), лише
+    ДОПИСУЄ рядок дельти — checkout-и tenant-а не стоять у черзі на одному рядку лічильника.
+    get() = база + сума незгорнутих дельт.
+    fold() (цикл звірки, раз на хвилину) переносить дельти в базу; reconcile() — перерахунок
+    з нуля (раз на годину). Обидва тримають FOR UPDATE рядка бази і видаляють дельти в тому ж
+    запиті, що й рахують: видаляється рівно те, що вже увійшло в знімок.
+    """
+
+    @staticmethod
+    async def bump(tx: DbTx, tenant_id: str, deltas: dict[str, int]) -> None:
+        d = {t: int(deltas.get(t) or 0) for t in TABS}
+        if not any(d.values()):
+            return
+        q = """
+        INSERT INTO telegram_shop_order_counter_deltas (tenant_id, new_d, work_d, done_d, arch_d, created_ts)
+        VALUES (:tid, :dn, :dw, :dd, :da, :ts)
+        """
+        await tx.execute(
+            q,
+            {
+                "tid": str(tenant_id),
+                "dn": d["new"],
+                "dw": d["work"],
+                "dd": d["done"],
+                "da": d["arch"],
+                "ts": int(time.time()),
+            },
+        )
+
+    @staticmethod
+    async def get(tenant_id: str) -> dict[str, int]:
+        """
+        -> {"new", "work", "done", "arch"}. Нема рядка бази => reconcile на льоту (1 раз).
+        """
+        q = """
+        SELECT
+            c.new_cnt + COALESCE(d.new_d, 0) AS new_cnt,
+            c.work_cnt + COALESCE(d.work_d, 0) AS work_cnt,
+            c.done_cnt + COALESCE(d.done_d, 0) AS done_cnt,
+            c.arch_cnt + COALESCE(d.arch_d, 0) AS arch_cnt,
+            c.reconciled_ts
+        FROM telegram_shop_order_counters c
+        LEFT JOIN LATERAL (
+            SELECT SUM(new_d) AS new_d, SUM(work_d) AS work_d, SUM(done_d) AS done_d, SUM(arch_d) AS arch_d
+            FROM telegram_shop_order_counter_deltas
+            WHERE tenant_id = c.tenant_id
+        ) d ON true
+        WHERE c.tenant_id = :tid
+        """
+        row = await db_fetch_one(q, {"tid": str(tenant_id)})
+        if not row or int(row.get("reconciled_ts") or 0) <= 0:
+            return await TelegramShopOrderCountersRepo.reconcile(tenant_id)
+        return {
+            "new": max(0, int(row.get("new_cnt") or 0)),
+            "work": max(0, int(row.get("work_cnt") or 0)),
+            "done": max(0, int(row.get("done_cnt") or 0)),
+            "arch": max(0, int(row.get("arch_cnt") or 0)),
+        }
+
+    @staticmethod
+    async def _lock_base(tx: DbTx, tenant_id: str) -> None:
+        q_ensure = """
+        INSERT INTO telegram_shop_order_counters (tenant_id, new_cnt, work_cnt, done_cnt, arch_cnt, reconciled_ts)
+        VALUES (:tid, 0, 0, 0, 0, 0)
+        ON CONFLICT (tenant_id) DO NOTHING
+        """
+        q_lock = "SELECT tenant_id FROM telegram_shop_order_counters WHERE tenant_id = :tid FOR UPDATE"
+        await tx.execute(q_ensure, {"tid": tenant_id})
+        await tx.fetch_one(q_lock, {"tid": tenant_id})
+
+    @staticmethod
+    async def fold(tenant_id: str) -> None:
+        q = """
+        WITH d AS (
+            DELETE FROM telegram_shop_order_counter_deltas
+            WHERE tenant_id = :tid
+            RETURNING new_d, work_d, done_d, arch_d
+        ),
+        s AS (
+            SELECT
+                COALESCE(SUM(new_d), 0) AS dn,
+                COALESCE(SUM(work_d), 0) AS dw,
+                COALESCE(SUM(done_d), 0) AS dd,
+                COALESCE(SUM(arch_d), 0) AS da
+            FROM d
+        )
+        UPDATE telegram_shop_order_counters c
+        SET new_cnt = GREATEST(c.new_cnt + s.dn, 0),
+            work_cnt = GREATEST(c.work_cnt + s.dw, 0),
+            done_cnt = GREATEST(c.done_cnt + s.dd, 0),
+            arch_cnt = GREATEST(c.arch_cnt + s.da, 0)
+        FROM s
+        WHERE c.tenant_id = :tid
+        """
+        tid = str(tenant_id)
+        async with db_transaction() as tx:
+            await TelegramShopOrderCountersRepo._lock_base(tx, tid)
+            await tx.execute(q, {"tid": tid})
+
+    @staticmethod
+    async def reconcile(tenant_id: str) -> dict[str, int]:
+        # підрахунок і видалення дельт — один запит (один знімок):
+        # дельта, закомічена після знімка, лишається і згорнеться наступного разу
+        q = """
+        WITH cnt AS (
+            SELECT
+                COUNT(*) FILTER (WHERE a.order_id IS NULL AND o.status = ANY(:st_new)) AS new_cnt,
+                COUNT(*) FILTER (WHERE a.order_id IS NULL AND o.status = ANY(:st_work)) AS work_cnt,
+                COUNT(*) FILTER (WHERE a.order_id IS NULL AND o.status = ANY(:st_done)) AS done_cnt,
+                COUNT(*) FILTER (WHERE a.order_id IS NOT NULL) AS arch_cnt
+            FROM telegram_shop_orders o
+            LEFT JOIN telegram_shop_orders_admin_archive a
+              ON a.tenant_id = o.tenant_id AND a.order_id = o.id
+            WHERE o.tenant_id = :tid
+        ),
+        gone AS (
+            DELETE FROM telegram_shop_order_counter_deltas
+            WHERE tenant_id = :tid
+        )
+        UPDATE telegram_shop_order_counters c
+        SET new_cnt = cnt.new_cnt,
+            work_cnt = cnt.work_cnt,
+            done_cnt = cnt.done_cnt,
+            arch_cnt = cnt.arch_cnt,
+            reconciled_ts = :ts
+        FROM cnt
+        WHERE c.tenant_id = :tid
+        RETURNING c.new_cnt, c.work_cnt, c.done_cnt, c.arch_cnt
+        """
+        tid = str(tenant_id)
+        async with db_transaction() as tx:
+            await TelegramShopOrderCountersRepo._lock_base(tx, tid)
+            row = await tx.fetch_one(
+                q,
+                {
+                    "tid": tid,
+                    "st_new": list(NEW_STATUSES),
+                    "st_work": list(WORK_STATUSES),
+                    "st_done": list(DONE_STATUSES),
+                    "ts": int(time.time()),
+                },
+            ) or {}
+        return {
+            "new": int(row.get("new_cnt") or 0),
+            "work": int(row.get("work_cnt") or 0),
+            "done": int(row.get("done_cnt") or 0),
+            "arch": int(row.get("arch_cnt") or 0),
+        }
+
+
+async def fold_all_order_counters() -> int:
+    q = "SELECT DISTINCT tenant_id FROM telegram_shop_order_counter_deltas"
+    rows = await db_fetch_all(q) or []
+    done = 0
+    for r in rows:
+        try:
+            await TelegramShopOrderCountersRepo.fold(str(r["tenant_id"]))
+            done += 1
+        except Exception as e:
+            log.warning("order counters fold failed tenant=%s err=%s", r.get("tenant_id"), e)
+    return done
+
+
+async def reconcile_all_order_counters() -> int:
+    q = """
+    SELECT tenant_id
+    FROM tenant_modules
+    WHERE module_key = 'telegram_shop' AND enabled = true
+    ORDER BY tenant_id
+    """
+    rows = await db_fetch_all(q) or []
+    done = 0
+    for r in rows:
+        try:
+            await TelegramShopOrderCountersRepo.reconcile(str(r["tenant_id"]))
+            done += 1
+        except Exception as e:
+            log.warning("order counters reconcile failed tenant=%s err=%s", r.get("tenant_id"), e)
+    return done
+
+
+async def order_counters_reconcile_loop(stop_event: asyncio.Event) -> None:
+    """
+    Раз на хвилину — згортання дельт у базу; раз на годину — страховка від дрейфу
+    (ручні правки в БД, збої між процесами): перерахунок з нуля.
+    """
+    log.info("order counters reconcile started")
+    last_full = time.monotonic()
+    while not stop_event.is_set():
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=ORDER_COUNTERS_FOLD_SEC)
+            break
+        except asyncio.TimeoutError:
+            pass
+
+        started = time.monotonic()
+        try:
+            if started - last_full >= ORDER_COUNTERS_RECONCILE_SEC:
+                last_full = started
+                n = await reconcile_all_order_counters()
+                log.info("order counters reconciled tenants=%s in %.2fs", n, time.monotonic() - started)
+            else:
+                n = await fold_all_order_counters()
+                if n:
+                    log.debug("order counters folded tenants=%s in %.2fs", n, time.monotonic() - started)
+        except Exception as e:
+            log.exception("order counters reconcile tick failed: %s", e)
+    log.info("order counters reconcile stopped")
+
+
+def counters_delta(old_tab: str | None, new_tab: str | None) -> dict[str, int]:
+    d: dict[str, int] = {}
+    if old_tab == new_tab:
+        return d
+    if old_tab:
+        d[old_tab] = d.get(old_tab, 0) - 1
+    if new_tab:
+        d[new_tab] = d.get(new_tab, 0) + 1
+    return d
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import json
+import time
+from typing import Any
+
+from rent_platform.config import settings
+from rent_platform.db.session import DbTx, db_execute, db_fetch_all
+
+KIND_ADMIN_NEW_ORDER = "admin_new_order"
+
+
+class TelegramShopOutboxRepo:
+    """
+    Таблиця: telegram_shop_outbox — повідомлення, які треба надіслати ботом магазину.
+    enqueue(tx, ...) — у транзакції зміни (надішлемо лише закомічене).
+    Доставка — outbox.outbox_loop: claim() бере пачку з "орендою" next_try_ts,
+    тож рядок, який взяв процес, що впав, буде підхоплено знову після оренди.
+    """
+
+    @staticmethod
+    async def enqueue(
+        tx: DbTx,
+        tenant_id: str,
+        chat_id: int,
+        text: str,
+        *,
+        kind: str = "",
+        ref_id: int = 0,
+        parse_mode: str | None = None,
+        reply_markup: dict | None = None,
+    ) -> None:
+        q = """
+        INSERT INTO telegram_shop_outbox
+            (tenant_id, chat_id, kind, ref_id, text, parse_mode, reply_markup, created_ts, next_try_ts)
+        VALUES (:tid, :cid, :kind, :ref, :text, :pm, :kb, :ts, :ts)
+        """
+        now = int(time.time())
+        await tx.execute(
+            q,
+            {
+                "tid": str(tenant_id),
+                "cid": int(chat_id),
+                "kind": str(kind or ""),
+                "ref": int(ref_id or 0),
+                "text": str(text),
+                "pm": parse_mode,
+                "kb": json.dumps(reply_markup, ensure_ascii=False) if reply_markup else None,
+                "ts": now,
+            },
+        )
+
+    @staticmethod
+    async def enqueue_admin_new_order(tx: DbTx, tenant_id: str, order_id: int, line: str) -> None:
+        """
+        Сповіщення власнику магазину про нове замовлення (text = один рядок-підсумок).
+        Тиша (жодного такого сповіщення за вікно) => next_try_ts = зараз, одразу.
+        Інакше приєднуємось до вже запланованого дайджесту або плануємо новий на now + вікно:
+        рядки з однаковим next_try_ts диспетчер бере разом і склеює в одне повідомлення.
+        """
+        q = """
+        INSERT INTO telegram_shop_outbox
+            (tenant_id, chat_id, kind, ref_id, text, parse_mode, created_ts, next_try_ts)
+        SELECT
+            t.id, t.owner_user_id, :kind, :ref, :text, NULL, :now,
+            CASE
+                WHEN :win <= 0 OR NOT EXISTS (
+                    SELECT 1 FROM telegram_shop_outbox b
+                    WHERE b.tenant_id = t.id AND b.kind = :kind AND b.created_ts >= :now - :win
+                ) THEN :now
+                ELSE COALESCE(
+                    (
+                        SELECT MAX(b.next_try_ts) FROM telegram_shop_outbox b
+                        WHERE b.tenant_id = t.id AND b.kind = :kind
+                          AND b.status = 'pending' AND b.attempts = 0 AND b.next_try_ts > :now
+                    ),
+                    :now + :win
+                )
+            END
+        FROM tenants t
+        WHERE t.id = :tid AND COALESCE(t.owner_user_id, 0) > 0
+        """
+        await tx.execute(
+            q,
+            {
+                "tid": str(tenant_id),
+                "kind": KIND_ADMIN_NEW_ORDER,
+                "ref": int(order_id),
+                "text": str(line),
+                "now": int(time.time()),
+                "win": max(0, int(settings.SHOP_ADMIN_DIGEST_WINDOW_SEC)),
+            },
+        )
+
+    @staticmethod
+    async def claim(*, now: int, limit: int, lease_sec: int) -> list[dict[str, Any]]:
+        """
+        Дайджест адміну = рядки KIND_ADMIN_NEW_ORDER з однаковими (tenant_id, chat_id, next_try_ts).
+        Групу бере рівно один процес: advisory lock на групу (до кінця запиту), і вона
+        добирається повністю, навіть понад limit — інакше два процеси надішлють два половинчасті дайджести.
+        """
+        q = """
+        WITH picked AS (
+            SELECT id, tenant_id, chat_id, kind, next_try_ts
+            FROM telegram_shop_outbox
+            WHERE status = 'pending' AND next_try_ts <= :now
+              AND (
+                kind <> :admin_kind
+                OR pg_try_advisory_xact_lock(
+                    hashtext('tgshop_digest:' || tenant_id || ':' || chat_id::text || ':' || next_try_ts::text)
+                )
+              )
+            ORDER BY id
+            LIMIT :lim
+            FOR UPDATE SKIP LOCKED
+        ),
+        grp AS (
+            SELECT DISTINCT tenant_id, chat_id, next_try_ts
+            FROM picked
+            WHERE kind = :admin_kind
+        ),
+        rest AS (
+            SELECT b.id
+            FROM telegram_shop_outbox b
+            JOIN grp g
+              ON g.tenant_id = b.tenant_id AND g.chat_id = b.chat_id AND g.next_try_ts = b.next_try_ts
+            WHERE b.status = 'pending' AND b.kind = :admin_kind
+            FOR UPDATE OF b
+        )
+        UPDATE telegram_shop_outbox o
+        SET next_try_ts = :lease_until,
+            attempts = o.attempts + 1
+        WHERE o.id IN (SELECT id FROM picked UNION SELECT id FROM rest)
+        RETURNING o.id, o.tenant_id, o.chat_id, o.kind, o.ref_id, o.text, o.parse_mode, o.reply_markup, o.attempts
+        """
+        rows = await db_fetch_all(
+            q,
+            {
+                "now": int(now),
+                "lease_until": int(now) + int(lease_sec),
+                "lim": int(limit),
+                "admin_kind": KIND_ADMIN_NEW_ORDER,
+            },
+        ) or []
+        rows.sort(key=lambda r: int(r["id"]))
+        return rows
+
+    @staticmethod
+    async def mark_sent(ids: list[int], *, now: int) -> None:
+        if not ids:
+            return
+        q = """
+        UPDATE telegram_shop_outbox
+        SET status = 'sent', sent_ts = :now, last_error = NULL
+        WHERE id = ANY(CAST(:ids AS BIGINT[]))
+        """
+        await db_execute(q, {"ids": [int(i) for i in ids], "now": int(now)})
+
+    @staticmethod
+    async def mark_retry(outbox_id: int, *, next_try_ts: int, error: str) -> None:
+        q = """
+        UPDATE telegram_shop_outbox
+        SET next_try_ts = :nt, last_error = :err
+        WHERE id = :id
+        """
+        await db_execute(q, {"id": int(outbox_id), "nt": int(next_try_ts), "err": str(error)[:500]})
+
+    @staticmethod
+    async def mark_failed(outbox_id: int, *, error: str) -> None:
+        q = """
+        UPDATE telegram_shop_outbox
+        SET status = 'failed', last_error = :err
+        WHERE id = :id
+        """
+        await db_execute(q, {"id": int(outbox_id), "err": str(error)[:500]})
+
+    @staticmethod
+    async def purge_sent(before_ts: int) -> int:
+        q = """
+        DELETE FROM telegram_shop_outbox
+        WHERE status = 'sent' AND sent_ts < :ts
+        """
+        return await db_execute(q, {"ts": int(before_ts)})
@@ -1,12 +1,22 @@
 from __future__ import annotations
 
+import json
 import time
 from typing import Any
 
-from rent_platform.db.session import db_fetch_all, db_fetch_one, db_execute
+from rent_platform.db.session import db_fetch_all, db_fetch_one, db_execute, db_transaction
+from rent_platform.modules.telegram_shop.catalog_cache import (
+    bump_catalog_version,
+    bump_product_version,
+    photos_cache_get_many,
+    photos_cache_put,
+)
 
 
 class ProductsRepo:
+    # Telegram media group: максимум 10 елементів
+    ALBUM_MAX_PHOTOS = 10
+
     # --------- products list/get ---------
 
     @staticmethod
@@ -124,6 +134,7 @@ class ProductsRepo:
             COALESCE(promo_price_kop, 0) AS promo_price_kop,
             COALESCE(promo_until_ts, 0) AS promo_until_ts,
             COALESCE(description, '') AS description,
+            stock_qty,
             created_ts
         FROM telegram_shop_products
         WHERE tenant_id = :tid AND id = :pid AND is_active = true
@@ -167,6 +178,7 @@ class ProductsRepo:
                 "ts": int(time.time()),
             },
         )
+        bump_catalog_version(tenant_id)
         return int(row["id"]) if row and row.get("id") is not None else None
 
     @staticmethod
@@ -177,6 +189,7 @@ class ProductsRepo:
         WHERE tenant_id = :tid AND id = :pid
         """
         await db_execute(q, {"tid": tenant_id, "pid": int(product_id), "a": bool(is_active)})
+        bump_catalog_version(tenant_id)
 
     @staticmethod
     async def set_category(tenant_id: str, product_id: int, category_id: int | None) -> None:
@@ -193,6 +206,7 @@ class ProductsRepo:
                 "cid": int(category_id) if category_id is not None else None,
             },
         )
+        bump_catalog_version(tenant_id)
 
     @staticmethod
     async def set_hit(tenant_id: str, product_id: int, is_hit: bool) -> None:
@@ -202,6 +216,7 @@ class ProductsRepo:
         WHERE tenant_id = :tid AND id = :pid
         """
         await db_execute(q, {"tid": tenant_id, "pid": int(product_id), "h": bool(is_hit)})
+        bump_catalog_version(tenant_id)
 
     @staticmethod
     async def set_promo(tenant_id: str, product_id: int, promo_price_kop: int, promo_until_ts: int) -> None:
@@ -220,6 +235,7 @@ class ProductsRepo:
                 "pu": int(promo_until_ts),
             },
         )
+        bump_catalog_version(tenant_id)
 
     # --------- navigation helpers (catalog cards) ---------
 
@@ -306,6 +322,7 @@ class ProductsRepo:
         WHERE tenant_id = :tid AND id = :pid
         """
         await db_execute(q, {"tid": tenant_id, "pid": int(product_id), "d": (description or "").strip()})
+        bump_catalog_version(tenant_id)
 
     # --------- sku ---------
 
@@ -318,35 +335,48 @@ class ProductsRepo:
         """
         val = (sku or "").strip()[:64]
         await db_execute(q, {"tid": tenant_id, "pid": int(product_id), "sku": val if val else None})
+        bump_catalog_version(tenant_id)
 
     # --------- product photos (Telegram file_id) ---------
 
     @staticmethod
     async def add_product_photo(tenant_id: str, product_id: int, file_id: str) -> int | None:
-        q_sort = """
-        SELECT COALESCE(MAX(sort), 0) AS mx
-        FROM telegram_shop_product_photos
-        WHERE tenant_id = :tid AND product_id = :pid
+        ids = await ProductsRepo.add_product_photos(tenant_id, product_id, [file_id])
+        return ids[0] if ids else None
+
+    @staticmethod
+    async def add_product_photos(tenant_id: str, product_id: int, file_ids: list[str]) -> list[int]:
+        """
+        Пачка фото (альбом) одним multi-row INSERT.
+        sort = MAX(sort) + порядковий номер у пачці; advisory lock на товар у тій самій
+        транзакції => паралельні альбоми не отримають однакові sort.
         """
-        row = await db_fetch_one(q_sort, {"tid": tenant_id, "pid": int(product_id)})
-        next_sort = int(row["mx"] or 0) + 1 if row else 1
+        fids = [str(f) for f in file_ids or [] if f]
+        if not fids:
+            return []
 
+        q_lock = "SELECT pg_advisory_xact_lock(hashtext(:k))"
         q = """
         INSERT INTO telegram_shop_product_photos (tenant_id, product_id, file_id, sort, created_ts)
-        VALUES (:tid, :pid, :fid, :s, :ts)
+        SELECT :tid, :pid, x.fid, base.mx + x.ord, :ts
+        FROM unnest(CAST(:fids AS TEXT[])) WITH ORDINALITY AS x(fid, ord)
+        CROSS JOIN (
+            SELECT COALESCE(MAX(sort), 0) AS mx
+            FROM telegram_shop_product_photos
+            WHERE tenant_id = :tid AND product_id = :pid
+        ) base
+        ORDER BY x.ord ASC
         RETURNING id
         """
-        ins = await db_fetch_one(
-            q,
-            {
-                "tid": tenant_id,
-                "pid": int(product_id),
-                "fid": str(file_id),
-                "s": int(next_sort),
-                "ts": int(time.time()),
-            },
-        )
-        return int(ins["id"]) if ins and ins.get("id") is not None else None
+        async with db_transaction() as tx:
+            await tx.fetch_one(q_lock, {"k": f"tgshop_photos:{tenant_id}:{int(product_id)}"})
+            rows = await tx.fetch_all(
+                q,
+                {"tid": tenant_id, "pid": int(product_id), "fids": fids, "ts": int(time.time())},
+            )
+
+        bump_product_version(tenant_id, product_id)
+        return [int(r["id"]) for r in rows if r.get("id") is not None]
 
     @staticmethod
     async def list_product_photos(tenant_id: str, product_id: int, limit: int = 10) -> list[dict[str, Any]]:
@@ -360,16 +390,49 @@ class ProductsRepo:
         return await db_fetch_all(q, {"tid": tenant_id, "pid": int(product_id), "lim": int(limit)}) or []
 
     @staticmethod
-    async def get_cover_photo_file_id(tenant_id: str, product_id: int) -> str | None:
+    async def list_photo_file_ids_for_products(tenant_id: str, product_ids: list[int]) -> dict[int, list[str]]:
+        """
+        Фото (file_id, по sort; до ALBUM_MAX_PHOTOS на товар) для ВСІХ переданих товарів одним запитом.
+        Результат кешується per product version (див. catalog_cache).
+        """
+        pids = sorted({int(x) for x in product_ids or [] if int(x or 0) > 0})
+        if not pids:
+            return {}
+
+        found, missing = photos_cache_get_many(tenant_id, pids)
+        if not missing:
+            return found
+
         q = """
-        SELECT file_id
-        FROM telegram_shop_product_photos
-        WHERE tenant_id = :tid AND product_id = :pid
-        ORDER BY sort ASC, id ASC
-        LIMIT 1
+        SELECT product_id, file_id
+        FROM (
+            SELECT
+                product_id,
+                file_id,
+                ROW_NUMBER() OVER (PARTITION BY product_id ORDER BY sort ASC, id ASC) AS rn
+            FROM telegram_shop_product_photos
+            WHERE tenant_id = :tid AND product_id = ANY(:pids)
+        ) x
+        WHERE rn <= :lim
+        ORDER BY product_id ASC, rn ASC
         """
-        row = await db_fetch_one(q, {"tid": tenant_id, "pid": int(product_id)})
-        return str(row["file_id"]) if row and row.get("file_id") else None
+        rows = await db_fetch_all(q, {"tid": tenant_id, "pids": missing, "lim": ProductsRepo.ALBUM_MAX_PHOTOS}) or []
+
+        loaded: dict[int, list[str]] = {pid: [] for pid in missing}
+        for r in rows:
+            loaded.setdefault(int(r["product_id"]), []).append(str(r["file_id"]))
+
+        for pid, fids in loaded.items():
+            photos_cache_put(tenant_id, pid, fids)
+
+        found.update(loaded)
+        return found
+
+    @staticmethod
+    async def get_cover_photo_file_id(tenant_id: str, product_id: int) -> str | None:
+        photos = await ProductsRepo.list_photo_file_ids_for_products(tenant_id, [int(product_id)])
+        fids = photos.get(int(product_id)) or []
+        return fids[0] if fids else None
 
     @staticmethod
     async def set_price_kop(tenant_id: str, product_id: int, price_kop: int) -> None:
@@ -379,6 +442,20 @@ class ProductsRepo:
         WHERE tenant_id = :tid AND id = :pid
         """
         await db_execute(q, {"tid": tenant_id, "pid": int(product_id), "p": int(price_kop)})
+        bump_catalog_version(tenant_id)
+
+    @staticmethod
+    async def set_stock_qty(tenant_id: str, product_id: int, stock_qty: int | None) -> None:
+        """
+        stock_qty=None => без обліку залишку (продаємо без обмежень).
+        """
+        q = """
+        UPDATE telegram_shop_products
+        SET stock_qty = :s
+        WHERE tenant_id = :tid AND id = :pid
+        """
+        s = None if stock_qty is None else max(0, int(stock_qty))
+        await db_execute(q, {"tid": tenant_id, "pid": int(product_id), "s": s})
 
     @staticmethod
     async def set_name(tenant_id: str, product_id: int, name: str) -> None:
@@ -388,6 +465,118 @@ class ProductsRepo:
         WHERE tenant_id = :tid AND id = :pid
         """
         await db_execute(q, {"tid": tenant_id, "pid": int(product_id), "n": (name or "").strip()[:128]})
+        bump_catalog_version(tenant_id)
+
+    # =========================================================
+    # BULK import / export (CSV)
+    # =========================================================
+
+    @staticmethod
+    async def upsert_by_sku_batch(tenant_id: str, items: list[dict[str, Any]]) -> dict[str, int]:
+        """
+        Upsert пачки товарів по SKU ОДНИМ запитом (jsonb_to_recordset -> UPDATE + INSERT).
+        items: sku, name, price_kop, category_id?, description?, is_active?, is_hit?, promo_price_kop?
+        None у полі = "не чіпати" (для існуючого товару).
+        SKU в межах пачки мають бути унікальні (дедуп робить викликач).
+        """
+        if not items:
+            return {"inserted": 0, "updated": 0}
+
+        q = """
+        WITH src AS (
+            SELECT *
+            FROM jsonb_to_recordset(CAST(:rows AS jsonb)) AS x(
+                sku TEXT,
+                name TEXT,
+                price_kop INT,
+                category_id INT,
+                description TEXT,
+                is_active BOOLEAN,
+                is_hit BOOLEAN,
+                promo_price_kop INT
+            )
+        ),
+        upd AS (
+            UPDATE telegram_shop_products p
+            SET name = src.name,
+                price_kop = src.price_kop,
+                category_id = COALESCE(src.category_id, p.category_id),
+                description = COALESCE(src.description, p.description),
+                is_active = COALESCE(src.is_active, p.is_active),
+                is_hit = COALESCE(src.is_hit, p.is_hit),
+                promo_price_kop = COALESCE(src.promo_price_kop, p.promo_price_kop)
+            FROM src
+            WHERE p.tenant_id = :tid AND p.sku = src.sku
+            RETURNING p.sku
+        ),
+        ins AS (
+            INSERT INTO telegram_shop_products
+                (tenant_id, name, sku, price_kop, is_active, is_hit, promo_price_kop, promo_until_ts,
+                 category_id, description, created_ts)
+            SELECT
+                :tid, src.name, src.sku, src.price_kop,
+                COALESCE(src.is_active, true),
+                COALESCE(src.is_hit, false),
+                COALESCE(src.promo_price_kop, 0),
+                0,
+                src.category_id,
+                COALESCE(src.description, ''),
+                :ts
+            FROM src
+            WHERE NOT EXISTS (SELECT 1 FROM upd WHERE upd.sku = src.sku)
+            RETURNING id
+        )
+        SELECT
+            (SELECT COUNT(DISTINCT sku) FROM upd) AS updated,
+            (SELECT COUNT(*) FROM ins) AS inserted
+        """
+        rows = [
+            {
+                "sku": str(it["sku"])[:64],
+                "name": str(it.get("name") or "")[:128],
+                "price_kop": int(it.get("price_kop") or 0),
+                "category_id": int(it["category_id"]) if it.get("category_id") is not None else None,
+                "description": it.get("description"),
+                "is_active": it.get("is_active"),
+                "is_hit": it.get("is_hit"),
+                "promo_price_kop": int(it["promo_price_kop"]) if it.get("promo_price_kop") is not None else None,
+            }
+            for it in items
+        ]
+        row = await db_fetch_one(
+            q,
+            {"tid": tenant_id, "rows": json.dumps(rows, ensure_ascii=False), "ts": int(time.time())},
+        )
+        bump_catalog_version(tenant_id)
+        return {
+            "inserted": int((row or {}).get("inserted") or 0),
+            "updated": int((row or {}).get("updated") or 0),
+        }
+
+    @staticmethod
+    async def list_for_export(tenant_id: str, *, after_id: int = 0, limit: int = 500) -> list[dict[str, Any]]:
+        """
+        Keyset-чанк каталогу для експорту (всі товари, і активні, і вимкнені).
+        """
+        q = """
+        SELECT
+            p.id,
+            COALESCE(p.sku, '') AS sku,
+            p.name,
+            p.price_kop,
+            COALESCE(c.name, '') AS category,
+            COALESCE(p.description, '') AS description,
+            p.is_active,
+            COALESCE(p.is_hit, false) AS is_hit,
+            COALESCE(p.promo_price_kop, 0) AS promo_price_kop
+        FROM telegram_shop_products p
+        LEFT JOIN telegram_shop_categories c
+               ON c.tenant_id = p.tenant_id AND c.id = p.category_id
+        WHERE p.tenant_id = :tid AND p.id > :after
+        ORDER BY p.id ASC
+        LIMIT :lim
+        """
+        return await db_fetch_all(q, {"tid": tenant_id, "after": int(after_id), "lim": int(limit)}) or []
 
     # =========================================================
     # HITS / PROMOS helpers (для "Хіти" та "Акції" як каталог)
@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import asyncio
+import datetime as _dt
+import logging
+import time
+from typing import Any
+from zoneinfo import ZoneInfo
+
+from rent_platform.db.session import DbTx, db_fetch_all, db_fetch_one, db_transaction
+
+log = logging.getLogger(__name__)
+
+# =========================================================
+# Денні rollup-и продажів (на tenant):
+#   telegram_shop_sales_daily           — замовлення / виручка / штуки / скасовані
+#   telegram_shop_sales_daily_products  — штуки / виручка по товару
+#
+# День = дата створення замовлення за Києвом. Скасовані/повернені (VOID_STATUSES)
+# виключені з виручки і рахуються окремо.
+# Інкремент — move(tx, ...) у транзакції створення / зміни статусу: лише ДОПИСУЄ рядки
+# в *_deltas (без upsert-у в гарячий рядок дня). fold() переносить дельти в rollup —
+# цикл sales_rollup_fold_loop і summary() перед читанням.
+# backfill() перераховує діапазон з нуля по одному дню на транзакцію (ідемпотентно).
+# Інкременти беруть shared advisory lock tenant-а, backfill — exclusive (на день):
+# перерахунок не "зʼїдає" паралельні замовлення, а замовлення одне одного не чекають.
+# fold і backfill серіалізуються окремим fold-lock-ом (замовлень він не зачіпає).
+# =========================================================
+
+ROLLUP_TZ = "Europe/Kyiv"
+VOID_STATUSES = ("cancelled", "returned")
+
+_DAY_SQL = f"(to_timestamp(o.created_ts) AT TIME ZONE '{ROLLUP_TZ}')::date"
+
+
+SALES_ROLLUP_FOLD_SEC = 60
+
+
+def _lock_key(tenant_id: str) -> str:
+    return f"tgshop_rollup:{tenant_id}"
+
+
+def _fold_lock_key(tenant_id: str) -> str:
+    return f"tgshop_rollup_fold:{tenant_id}"
+
+
+def today() -> _dt.date:
+    return _dt.datetime.now(ZoneInfo(ROLLUP_TZ)).date()
+
+
+def is_void(status: str | None) -> bool:
+    return (status or "").strip() in VOID_STATUSES
+
+
+class TelegramShopSalesRollupRepo:
+    @staticmethod
+    async def move(tx: DbTx, tenant_id: str, order_id: int, *, d_valid: int, d_void: int) -> None:
+        """
+        Додати замовлення в rollup (d_valid=+1), перенести у скасовані (d_valid=-1, d_void=+1)
+        або назад (d_valid=+1, d_void=-1). Читає сам order + items у тій же транзакції.
+        """
+        if not d_valid and not d_void:
+            return
+        q_day = f"""
+        INSERT INTO telegram_shop_sales_daily_deltas
+            (tenant_id, day, orders_cnt, revenue_kop, items_qty, void_cnt, void_kop)
+        SELECT
+            o.tenant_id,
+            {_DAY_SQL},
+            :dv,
+            :dv * o.total_kop,
+            :dv * COALESCE((SELECT SUM(i.qty) FROM telegram_shop_order_items i WHERE i.order_id = o.id), 0),
+            :dx,
+            :dx * o.total_kop
+        FROM telegram_shop_orders o
+        WHERE o.tenant_id = :tid AND o.id = :oid
+        """
+        q_prod = f"""
+        INSERT INTO telegram_shop_sales_daily_products_deltas
+            (tenant_id, day, product_id, name, qty, revenue_kop)
+        SELECT
+            o.tenant_id,
+            {_DAY_SQL},
+            COALESCE(i.product_id, 0),
+            MAX(COALESCE(i.name, '')),
+            :dv * SUM(i.qty),
+            :dv * SUM(i.qty * i.price_kop)
+        FROM telegram_shop_orders o
+        JOIN telegram_shop_order_items i ON i.order_id = o.id
+        WHERE o.tenant_id = :tid AND o.id = :oid
+        GROUP BY o.tenant_id, {_DAY_SQL}, COALESCE(i.product_id, 0)
+        """
+        tid = str(tenant_id)
+        await tx.fetch_one("SELECT pg_advisory_xact_lock_shared(hashtext(:k))", {"k": _lock_key(tid)})
+        params = {"tid": tid, "oid": int(order_id), "dv": int(d_valid), "dx": int(d_void)}
+        await tx.execute(q_day, params)
+        if d_valid:
+            await tx.execute(q_prod, params)
+
+    @staticmethod
+    async def move_for_status(tx: DbTx, tenant_id: str, order_id: int, old_status: str, new_status: str) -> None:
+        was, now = is_void(old_status), is_void(new_status)
+        if was == now:
+            return
+        await TelegramShopSalesRollupRepo.move(
+            tx, tenant_id, order_id, d_valid=(1 if was else -1), d_void=(-1 if was else 1)
+        )
+
+    @staticmethod
+    async def fold(tenant_id: str) -> None:
+        """
+        Перенести незгорнуті дельти tenant-а в rollup. Кожна таблиця — один запит:
+        видаляються рівно ті дельти, що потрапили в суму (пізніші лишаються до наступного разу).
+        """
+        q_day = """
+        WITH d AS (
+            DELETE FROM telegram_shop_sales_daily_deltas
+            WHERE tenant_id = :tid
+            RETURNING tenant_id, day, orders_cnt, revenue_kop, items_qty, void_cnt, void_kop
+        )
+        INSERT INTO telegram_shop_sales_daily
+            (tenant_id, day, orders_cnt, revenue_kop, items_qty, void_cnt, void_kop)
+        SELECT tenant_id, day, SUM(orders_cnt), SUM(revenue_kop), SUM(items_qty), SUM(void_cnt), SUM(void_kop)
+        FROM d
+        GROUP BY tenant_id, day
+        ON CONFLICT (tenant_id, day)
+        DO UPDATE SET
+            orders_cnt = telegram_shop_sales_daily.orders_cnt + EXCLUDED.orders_cnt,
+            revenue_kop = telegram_shop_sales_daily.revenue_kop + EXCLUDED.revenue_kop,
+            items_qty = telegram_shop_sales_daily.items_qty + EXCLUDED.items_qty,
+            void_cnt = telegram_shop_sales_daily.void_cnt + EXCLUDED.void_cnt,
+            void_kop = telegram_shop_sales_daily.void_kop + EXCLUDED.void_kop
+        """
+        q_prod = """
+        WITH d AS (
+            DELETE FROM telegram_shop_sales_daily_products_deltas
+            WHERE tenant_id = :tid
+            RETURNING id, tenant_id, day, product_id, name, qty, revenue_kop
+        )
+        INSERT INTO telegram_shop_sales_daily_products
+            (tenant_id, day, product_id, name, qty, revenue_kop)
+        SELECT
+            tenant_id, day, product_id,
+            (ARRAY_AGG(name ORDER BY id DESC))[1],
+            SUM(qty), SUM(revenue_kop)
+        FROM d
+        GROUP BY tenant_id, day, product_id
+        ON CONFLICT (tenant_id, day, product_id)
+        DO UPDATE SET
+            name = EXCLUDED.name,
+            qty = telegram_shop_sales_daily_products.qty + EXCLUDED.qty,
+            revenue_kop = telegram_shop_sales_daily_products.revenue_kop + EXCLUDED.revenue_kop
+        """
+        tid = str(tenant_id)
+        async with db_transaction() as tx:
+            await tx.fetch_one("SELECT pg_advisory_xact_lock(hashtext(:k))", {"k": _fold_lock_key(tid)})
+            await tx.execute(q_day, {"tid": tid})
+            await tx.execute(q_prod, {"tid": tid})
+
+    @staticmethod
+    async def _first_day(tenant_id: str) -> _dt.date | None:
+        q = f"""
+        SELECT LEAST(
+            (SELECT MIN({_DAY_SQL}) FROM telegram_shop_orders o WHERE o.tenant_id = :tid),
+            (SELECT MIN(day) FROM telegram_shop_sales_daily WHERE tenant_id = :tid)
+        ) AS first_day
+        """
+        row = await db_fetch_one(q, {"tid": str(tenant_id)}) or {}
+        return row.get("first_day")
+
+    @staticmethod
+    async def _backfill_day(tenant_id: str, day: _dt.date) -> tuple[int, int]:
+        tz = ZoneInfo(ROLLUP_TZ)
+        params: dict[str, Any] = {
+            "tid": str(tenant_id),
+            "day": day,
+            "ts_from": int(_dt.datetime.combine(day, _dt.time(), tz).timestamp()),
+            "ts_to": int(_dt.datetime.combine(day + _dt.timedelta(days=1), _dt.time(), tz).timestamp()),
+            "void": list(VOID_STATUSES),
+        }
+        q_del_day_d = "DELETE FROM telegram_shop_sales_daily_deltas WHERE tenant_id = :tid AND day = :day"
+        q_del_prod_d = "DELETE FROM telegram_shop_sales_daily_products_deltas WHERE tenant_id = :tid AND day = :day"
+        q_del_day = "DELETE FROM telegram_shop_sales_daily WHERE tenant_id = :tid AND day = :day"
+        q_del_prod = "DELETE FROM telegram_shop_sales_daily_products WHERE tenant_id = :tid AND day = :day"
+        q_ins_day = """
+        INSERT INTO telegram_shop_sales_daily
+            (tenant_id, day, orders_cnt, revenue_kop, items_qty, void_cnt, void_kop)
+        SELECT
+            o.tenant_id,
+            CAST(:day AS DATE),
+            COUNT(*) FILTER (WHERE NOT (o.status = ANY(:void))),
+            COALESCE(SUM(o.total_kop) FILTER (WHERE NOT (o.status = ANY(:void))), 0),
+            COALESCE(SUM(iq.qty) FILTER (WHERE NOT (o.status = ANY(:void))), 0),
+            COUNT(*) FILTER (WHERE o.status = ANY(:void)),
+            COALESCE(SUM(o.total_kop) FILTER (WHERE o.status = ANY(:void)), 0)
+        FROM telegram_shop_orders o
+        LEFT JOIN LATERAL (
+            SELECT SUM(i.qty) AS qty
+            FROM telegram_shop_order_items i
+            WHERE i.order_id = o.id
+        ) iq ON true
+        WHERE o.tenant_id = :tid AND o.created_ts >= :ts_from AND o.created_ts < :ts_to
+        GROUP BY o.tenant_id
+        """
+        q_ins_prod = """
+        INSERT INTO telegram_shop_sales_daily_products
+            (tenant_id, day, product_id, name, qty, revenue_kop)
+        SELECT
+            o.tenant_id,
+            CAST(:day AS DATE),
+            COALESCE(i.product_id, 0),
+            MAX(COALESCE(i.name, '')),
+            SUM(i.qty),
+            SUM(i.qty * i.price_kop)
+        FROM telegram_shop_orders o
+        JOIN telegram_shop_order_items i ON i.order_id = o.id
+        WHERE o.tenant_id = :tid
+          AND o.created_ts >= :ts_from AND o.created_ts < :ts_to
+          AND NOT (o.status = ANY(:void))
+        GROUP BY o.tenant_id, COALESCE(i.product_id, 0)
+        """
+        tid = str(tenant_id)
+        async with db_transaction() as tx:
+            # fold-lock першим (як у fold), далі exclusive: усі move-и до цього моменту закомічені,
+            # тож дельти цього дня вже відображені в перерахунку — видаляємо їх.
+            # Lock тримається лише на один день — замовлення tenant-а чекають мілісекунди, а не всю історію.
+            await tx.fetch_one("SELECT pg_advisory_xact_lock(hashtext(:k))", {"k": _fold_lock_key(tid)})
+            await tx.fetch_one("SELECT pg_advisory_xact_lock(hashtext(:k))", {"k": _lock_key(tid)})
+            await tx.execute(q_del_day_d, params)
+            await tx.execute(q_del_prod_d, params)
+            await tx.execute(q_del_day, params)
+            await tx.execute(q_del_prod, params)
+            days = await tx.execute(q_ins_day, params)
+            prods = await tx.execute(q_ins_prod, params)
+        return int(days), int(prods)
+
+    @staticmethod
+    async def backfill(tenant_id: str, *, since: _dt.date | None = None) -> dict[str, int]:
+        """
+        Перерахувати rollup-и tenant-а з since (None => уся історія) по днях: кожен день —
+        окрема транзакція зі своїм exclusive lock-ом. Повторний запуск дає той самий результат.
+        """
+        first = await TelegramShopSalesRollupRepo._first_day(tenant_id)
+        if first is None:
+            return {"days": 0, "product_days": 0}
+        day = max(first, since) if since else first
+        until = today()
+        days = prods = 0
+        while day <= until:
+            d, p = await TelegramShopSalesRollupRepo._backfill_day(tenant_id, day)
+            days += d
+            prods += p
+            day += _dt.timedelta(days=1)
+        return {"days": days, "product_days": prods}
+
+    @staticmethod
+    async def summary(tenant_id: str, *, days: int) -> dict[str, Any]:
+        """
+        Лише rollup-таблиці (після fold): підсумок за період + по днях + топ товарів.
+        """
+        await TelegramShopSalesRollupRepo.fold(tenant_id)
+
+        days = max(1, int(days))
+        until = today()
+        since = until - _dt.timedelta(days=days - 1)
+        params = {"tid": str(tenant_id), "since": since, "until": until}
+
+        q_total = """
+        SELECT
+            COALESCE(SUM(orders_cnt), 0) AS orders_cnt,
+            COALESCE(SUM(revenue_kop), 0) AS revenue_kop,
+            COALESCE(SUM(items_qty), 0) AS items_qty,
+            COALESCE(SUM(void_cnt), 0) AS void_cnt,
+            COALESCE(SUM(void_kop), 0) AS void_kop
+        FROM telegram_shop_sales_daily
+        WHERE tenant_id = :tid AND day BETWEEN :since AND :until
+        """
+        q_days = """
+        SELECT day, orders_cnt, revenue_kop
+        FROM telegram_shop_sales_daily
+        WHERE tenant_id = :tid AND day BETWEEN :since AND :until
+        ORDER BY day DESC
+        LIMIT 7
+        """
+        q_top = """
+        SELECT product_id, MAX(name) AS name, SUM(qty) AS qty, SUM(revenue_kop) AS revenue_kop
+        FROM telegram_shop_sales_daily_products
+        WHERE tenant_id = :tid AND day BETWEEN :since AND :until
+        GROUP BY product_id
+        HAVING SUM(qty) > 0
+        ORDER BY SUM(revenue_kop) DESC, product_id
+        LIMIT 5
+        """
+        total = await db_fetch_one(q_total, params) or {}
+        out: dict[str, Any] = {k: int(total.get(k) or 0) for k in ("orders_cnt", "revenue_kop", "items_qty", "void_cnt", "void_kop")}
+        out["avg_kop"] = out["revenue_kop"] // out["orders_cnt"] if out["orders_cnt"] else 0
+        out["since"] = since
+        out["until"] = until
+        out["by_day"] = await db_fetch_all(q_days, params) or []
+        out["top"] = await db_fetch_all(q_top, params) or []
+        return out
+
+
+async def backfill_all(*, since: _dt.date | None = None, tenant_id: str | None = None) -> int:
+    q = """
+    SELECT tenant_id
+    FROM tenant_modules
+    WHERE module_key = 'telegram_shop' AND enabled = true
+    ORDER BY tenant_id
+    """
+    tids = [str(tenant_id)] if tenant_id else [str(r["tenant_id"]) for r in (await db_fetch_all(q) or [])]
+    done = 0
+    for tid in tids:
+        try:
+            res = await TelegramShopSalesRollupRepo.backfill(tid, since=since)
+            log.info("sales rollup backfill tenant=%s days=%s product_days=%s", tid, res["days"], res["product_days"])
+            done += 1
+        except Exception as e:
+            log.warning("sales rollup backfill failed tenant=%s err=%s", tid, e)
+    return done
+
+
+async def fold_all_sales_rollups() -> int:
+    q = """
+    SELECT tenant_id FROM telegram_shop_sales_daily_deltas
+    UNION
+    SELECT tenant_id FROM telegram_shop_sales_daily_products_deltas
+    """
+    rows = await db_fetch_all(q) or []
+    done = 0
+    for r in rows:
+        try:
+            await TelegramShopSalesRollupRepo.fold(str(r["tenant_id"]))
+            done += 1
+        except Exception as e:
+            log.warning("sales rollup fold failed tenant=%s err=%s", r.get("tenant_id"), e)
+    return done
+
+
+async def sales_rollup_fold_loop(stop_event: asyncio.Event) -> None:
+    log.info("sales rollup fold started")
+    while not stop_event.is_set():
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=SALES_ROLLUP_FOLD_SEC)
+            break
+        except asyncio.TimeoutError:
+            pass
+
+        started = time.monotonic()
+        try:
+            n = await fold_all_sales_rollups()
+            if n:
+                log.debug("sales rollups folded tenants=%s in %.2fs", n, time.monotonic() - started)
+        except Exception as e:
+            log.exception("sales rollup fold tick failed: %s", e)
+    log.info("sales rollup fold stopped")
@@ -18,10 +18,10 @@ from rent_platform.modules.telegram_shop.repo.favorites import TelegramShopFavor
 
 from rent_platform.modules.telegram_shop.ui.user_kb import (
     main_menu_kb,
+    is_cart_btn,
     catalog_kb,
     support_kb,
     BTN_CATALOG,
-    BTN_CART,
     BTN_HITS,
     BTN_FAV,
     BTN_ORDERS,
@@ -34,6 +34,7 @@ from rent_platform.modules.telegram_shop.ui.user_kb import (
 )
 
 from rent_platform.modules.telegram_shop.ui.inline_kb import catalog_categories_kb
+from rent_platform.modules.telegram_shop.catalog_cache import catalog_cache_get, catalog_cache_put
 
 from rent_platform.modules.telegram_shop.user_cart import (
     send_cart,
@@ -135,6 +136,7 @@ def _product_kb(
     has_next: bool,
     category_id: int | None,
     is_fav: bool,
+    photos_count: int = 0,
 ) -> dict:
     """
     Єдина inline-клава для каталогу/акцій/хітів.
@@ -167,6 +169,9 @@ def _product_kb(
         ],
     ]
 
+    if photos_count > 1:
+        rows.append([(f"🖼 Ще фото ({photos_count})", f"tgshop:gal:{product_id}:{cid}:{sc}")])
+
     if cats_action:
         rows.append([("📁 Категорії", f"tgshop:{cats_action}:0:0:{sc}")])
 
@@ -174,7 +179,12 @@ def _product_kb(
 
 
 async def _send_menu(bot: Bot, chat_id: int, text: str, *, is_admin: bool) -> None:
-    await bot.send_message(chat_id, text, parse_mode="Markdown", reply_markup=main_menu_kb(is_admin=is_admin))
+    await bot.send_message(
+        chat_id,
+        text,
+        parse_mode="Markdown",
+        reply_markup=main_menu_kb(is_admin=is_admin),
+    )
 
 
 # =========================================================
@@ -244,6 +254,72 @@ async def _send_support_admin(bot: Bot, chat_id: int, tenant_id: str) -> None:
 # =========================================================
 # Catalog categories
 # =========================================================
+def _scope_categories_kb(cats: list[dict[str, Any]], *, scope: str) -> dict | None:
+    """
+    scope: "promo" | "hit" -> клава лише з категоріями, де є контент (або None)
+    """
+    if scope == "promo":
+        action, cnt_key = "pcat", "promo_cnt"
+    else:
+        action, cnt_key = "hcat", "hit_cnt"
+
+    rows: list[list[tuple[str, str]]] = []
+    for c in cats:
+        cid = int(c["id"])
+        name = str(c.get("name") or "").strip()
+        cnt = int(c.get(cnt_key) or 0)
+        if not name or cnt <= 0:
+            continue
+        rows.append([(f"📁 {name} ({cnt})", f"tgshop:{action}:0:{cid}:{scope}")])
+
+    if not rows:
+        return None
+
+    rows.append([("⬅️ Назад", "tgshop:hp:0:0:0")])
+    return _kb(rows)
+
+
+async def _get_catalog_kb(tenant_id: str, key: str) -> dict | None:
+    """
+    key: "cats" | "promo" | "hit"
+    Кеш по (tenant, версія каталогу). На промах — ОДИН груповий запит,
+    з якого будуються всі три клави одразу. None = показати "порожньо".
+    """
+    hit, kb = catalog_cache_get(tenant_id, key)
+    if hit:
+        return kb
+
+    data = await CategoriesRepo.list_public_with_counts(tenant_id)  # type: ignore[union-attr]
+    cats = data.get("categories") or []
+    include_all = bool(data.get("show_all"))
+
+    # ховаємо порожні категорії
+    visible = [
+        {"id": c["id"], "name": c["name"], "count": c["active_cnt"]}
+        for c in cats
+        if int(c.get("active_cnt") or 0) > 0
+    ][:50]
+
+    built: dict[str, dict | None] = {
+        "cats": catalog_categories_kb(visible, include_all=include_all) if (visible or include_all) else None,
+        "promo": _scope_categories_kb(cats, scope="promo"),
+        "hit": _scope_categories_kb(cats, scope="hit"),
+    }
+
+    expires_ts = int(data.get("next_promo_end_ts") or 0) or None
+    for k, v in built.items():
+        catalog_cache_put(tenant_id, k, v, expires_ts=expires_ts)
+
+    return built.get(key)
+
+
+async def warm_catalog_cache(tenant_id: str) -> None:
+    """Startup warm-up (див. telegram_shop.warmup)."""
+    if CategoriesRepo is None:
+        return
+    await _get_catalog_kb(tenant_id, "cats")
+
+
 async def _send_categories_menu(bot: Bot, chat_id: int, tenant_id: str, *, is_admin: bool) -> None:
     if CategoriesRepo is None:
         await bot.send_message(
@@ -254,13 +330,9 @@ async def _send_categories_menu(bot: Bot, chat_id: int, tenant_id: str, *, is_ad
         )
         return
 
-    await CategoriesRepo.ensure_default(tenant_id)  # type: ignore[misc]
-    await CategoriesRepo.ensure_show_all_flag(tenant_id)  # type: ignore[misc]
+    kb = await _get_catalog_kb(tenant_id, "cats")
 
-    include_all = await CategoriesRepo.is_show_all_enabled(tenant_id)  # type: ignore[misc]
-    cats = await CategoriesRepo.list_public(tenant_id, limit=50)  # type: ignore[misc]
-
-    if not cats and not include_all:
+    if kb is None:
         await bot.send_message(
             chat_id,
             "🛍 *Каталог*\n\nПоки що немає категорій.",
@@ -273,7 +345,7 @@ async def _send_categories_menu(bot: Bot, chat_id: int, tenant_id: str, *, is_ad
         chat_id,
         "🛍 *Каталог*\n\nОбери категорію 👇",
         parse_mode="Markdown",
-        reply_markup=catalog_categories_kb(cats, include_all=bool(include_all)),
+        reply_markup=kb,
     )
 
 
@@ -310,45 +382,25 @@ async def _send_scope_categories(bot: Bot, chat_id: int, tenant_id: str, *, scop
         )
         return
 
-    await CategoriesRepo.ensure_default(tenant_id)  # type: ignore[misc]
-    cats_all = await CategoriesRepo.list_public(tenant_id, limit=100)  # type: ignore[misc]
-
     if scope == "promo":
-        ids = await ProductsRepo.list_promo_category_ids(tenant_id)
-        ids_set = set(ids or [])
         title = "🔥 *Акції*"
         empty_txt = "Немає акційних товарів 😅"
-        action = "pcat"
-        back_scope = "promo"
     else:
-        ids = await ProductsRepo.list_hit_category_ids(tenant_id)
-        ids_set = set(ids or [])
+        scope = "hit"
         title = "⭐ *Хіти*"
         empty_txt = "Немає хітів 😅"
-        action = "hcat"
-        back_scope = "hit"
 
-    cats = [c for c in (cats_all or []) if int(c.get("id") or 0) in ids_set]
+    kb = await _get_catalog_kb(tenant_id, scope)
 
-    if not cats:
+    if kb is None:
         await bot.send_message(chat_id, f"{title}\n\n{empty_txt}", parse_mode="Markdown")
         return
 
-    rows: list[list[tuple[str, str]]] = []
-    for c in cats:
-        cid = int(c["id"])
-        name = str(c.get("name") or "").strip()
-        if not name:
-            continue
-        rows.append([(f"📁 {name}", f"tgshop:{action}:0:{cid}:{back_scope}")])
-
-    rows.append([("⬅️ Назад", "tgshop:hp:0:0:0")])
-
     await bot.send_message(
         chat_id,
         f"{title}\n\nОбери категорію 👇",
         parse_mode="Markdown",
-        reply_markup=_kb(rows),
+        reply_markup=kb,
     )
 
 
@@ -388,7 +440,11 @@ async def _build_product_card(
         prev_p = await ProductsRepo.get_prev_hit_active(tenant_id, pid, category_id=category_id)
         next_p = await ProductsRepo.get_next_hit_active(tenant_id, pid, category_id=category_id)
 
-    cover_file_id = await ProductsRepo.get_cover_photo_file_id(tenant_id, pid)
+    # фото поточного + сусідніх карток одним запитом (сусіди прогріють кеш для ⬅️/➡️)
+    page_ids = [pid] + [int(x["id"]) for x in (prev_p, next_p) if x]
+    photos_by_pid = await ProductsRepo.list_photo_file_ids_for_products(tenant_id, page_ids)
+    photos = photos_by_pid.get(pid) or []
+    cover_file_id = photos[0] if photos else None
 
     badge = "🔥 " if scope == "promo" else ("⭐ " if scope == "hit" else "")
     text = f"{badge}🛍 *{name}*\n\n"
@@ -417,6 +473,7 @@ async def _build_product_card(
         has_next=bool(next_p),
         category_id=category_id,
         is_fav=bool(is_fav),
+        photos_count=len(photos),
     )
 
     return {
@@ -521,6 +578,31 @@ async def _edit_product_card(
                 return False
 
 
+async def _send_product_gallery(bot: Bot, chat_id: int, tenant_id: str, product_id: int) -> bool:
+    """
+    Усі фото товару одним альбомом (media group, до 10 шт).
+    """
+    p = await ProductsRepo.get_active(tenant_id, product_id)
+    if not p:
+        return False
+
+    photos = (await ProductsRepo.list_photo_file_ids_for_products(tenant_id, [int(product_id)])).get(int(product_id)) or []
+    if not photos:
+        return False
+
+    caption = f"🖼 *{p.get('name') or ''}*"
+    if len(photos) == 1:
+        await bot.send_photo(chat_id, photo=photos[0], caption=caption, parse_mode="Markdown")
+        return True
+
+    media = [
+        InputMediaPhoto(media=fid, caption=caption if i == 0 else None, parse_mode="Markdown" if i == 0 else None)
+        for i, fid in enumerate(photos[: ProductsRepo.ALBUM_MAX_PHOTOS])
+    ]
+    await bot.send_media_group(chat_id, media=media)
+    return True
+
+
 async def _edit_product_kb_only(
     bot: Bot,
     chat_id: int,
@@ -712,6 +794,12 @@ async def handle_update(tenant: dict, data: dict[str, Any], bot: Bot) -> bool:
                 await bot.answer_callback_query(cb_id, text="✅ Додано в кошик", show_alert=False)
             return True
 
+        if action == "gal" and pid > 0:
+            ok = await _send_product_gallery(bot, chat_id, tenant_id, pid)
+            if cb_id:
+                await bot.answer_callback_query(cb_id, text=None if ok else "Фото немає 😅", show_alert=False)
+            return True
+
         if action == "fav" and pid > 0:
             added = await TelegramShopFavoritesRepo.toggle(tenant_id, user_id, pid)
             try:
@@ -789,19 +877,21 @@ async def handle_update(tenant: dict, data: dict[str, Any], bot: Bot) -> bool:
     is_admin = is_admin_user(tenant=tenant, user_id=user_id)
 
     text = _get_text(msg)
-    if not text:
-        return False
-
-    log.info("tgshop message text=%r user_id=%s tenant=%s", text, user_id, tenant_id)
 
     # =========================================================
     # 0) ADMIN WIZARD ROUTING (КЛЮЧОВЕ)
     # якщо адмін зараз у стані вводу (товар/банер/автопост/інше) — віддаємо все в адмінку
+    # ВАЖЛИВО: до перевірки тексту — фото/документи (CSV) теж мають дійти до адмінки
     # =========================================================
     if is_admin and admin_has_state(tenant_id, chat_id):
         handled = await admin_handle_update(tenant=tenant, data=data, bot=bot)
         return bool(handled)
 
+    if not text:
+        return False
+
+    log.info("tgshop message text=%r user_id=%s tenant=%s", text, user_id, tenant_id)
+
     # A) pending support edit (admin)
     pend = _PENDING_SUPPORT_EDIT.get((tenant_id, user_id))
     if is_admin and pend:
@@ -827,14 +917,19 @@ async def handle_update(tenant: dict, data: dict[str, Any], bot: Bot) -> bool:
         return True
 
     if text in ("/start", "/shop"):
-        await _send_menu(bot, chat_id, "🛒 *Магазин*\n\nОбирай розділ кнопками нижче 👇", is_admin=is_admin)
+        await _send_menu(
+            bot,
+            chat_id,
+            "🛒 *Магазин*\n\nОбирай розділ кнопками нижче 👇",
+            is_admin=is_admin,
+        )
         return True
 
     if text == _normalize_text(BTN_CATALOG):
         await _send_categories_menu(bot, chat_id, tenant_id, is_admin=is_admin)
         return True
 
-    if text == _normalize_text(BTN_CART):
+    if is_cart_btn(text):
         await send_cart(bot, chat_id, tenant_id, user_id)
         return True
 
@@ -872,7 +967,12 @@ async def handle_update(tenant: dict, data: dict[str, Any], bot: Bot) -> bool:
         return True
 
     if text == _normalize_text(BTN_MENU_BACK):
-        await _send_menu(bot, chat_id, "⬅️ Повернув у меню 👇", is_admin=is_admin)
+        await _send_menu(
+            bot,
+            chat_id,
+            "⬅️ Повернув у меню 👇",
+            is_admin=is_admin,
+        )
         return True
 
     # запасний текст-хелп
@@ -159,6 +159,8 @@ def catalog_categories_kb(categories: list[dict[str, Any]], include_all: bool =
     callback_data:
       tgshop:cat:0:<category_id>:cat
       tgshop:cat:0:0:cat   (для "Усе" коли include_all=True)
+
+    Якщо в категорії є "count" — показуємо кількість товарів у кнопці.
     """
     rows: list[list[tuple[str, str]]] = []
 
@@ -170,7 +172,9 @@ def catalog_categories_kb(categories: list[dict[str, Any]], include_all: bool =
         name = str(c.get("name") or "").strip()
         if cid <= 0 or not name:
             continue
-        rows.append([(f"📁 {name}", f"tgshop:cat:0:{cid}:cat")])
+        cnt = c.get("count")
+        label = f"📁 {name} ({int(cnt)})" if cnt is not None else f"📁 {name}"
+        rows.append([(label, f"tgshop:cat:0:{cid}:cat")])
 
     if not rows:
         rows = [[("🧺 Усе", "tgshop:cat:0:0:cat")]]
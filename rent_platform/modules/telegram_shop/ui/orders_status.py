@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
+from typing import Callable
+
 STATUS_LABELS: dict[str, str] = {
     "new": "🆕 Створено",
     "confirmed": "✅ Прийнято",
@@ -21,4 +23,19 @@ STATUS_LABELS: dict[str, str] = {
 
 def status_label(status: str) -> str:
     s = (status or "").strip()
-    return STATUS_LABELS.get(s, f"ℹ️ {s or 'невідомо'}")
\ No newline at end of file
+    return STATUS_LABELS.get(s, f"ℹ️ {s or 'невідомо'}")
+
+
+def event_label(kind: str, new_value: str | None, *, label: Callable[[str], str] = status_label) -> str:
+    """Рядок хронології з telegram_shop_order_events."""
+    k = (kind or "").strip()
+    v = (new_value or "").strip()
+    if k == "created":
+        return "🆕 Створено"
+    if k == "status":
+        return label(v)
+    if k == "payment":
+        return "💳 Оплачено" if v == "paid" else f"💳 Оплата: {v or '—'}"
+    if k == "archive":
+        return "🗃 В архів" if v == "1" else "🧾 З архіву"
+    return f"ℹ️ {k}"
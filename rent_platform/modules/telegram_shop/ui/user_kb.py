@@ -30,6 +30,15 @@ def _admin_rows() -> list[list[str]]:
     return [[BTN_ADMIN]]
 
 
+def is_cart_btn(text: str) -> bool:
+    # "🛒 Кошик (3)" — старі клавіатури з бейджем, які ще лишились у клієнтів
+    t = (text or "").replace("\ufe0f", "").strip()
+    base = BTN_CART.replace("\ufe0f", "")
+    if t == base:
+        return True
+    return t.startswith(base + " (") and t.endswith(")") and t[len(base) + 2 : -1].isdigit()
+
+
 def main_menu_kb(*, is_admin: bool = False) -> ReplyKeyboardMarkup:
     rows = [
         [BTN_CATALOG, BTN_CART],
@@ -1,14 +1,20 @@
 from __future__ import annotations
 
+import asyncio
+import logging
+import time
 from typing import Any
 
 from aiogram import Bot
 
+from rent_platform.config import settings
+from rent_platform.modules.telegram_shop.outbox import outbox_wake
 from rent_platform.modules.telegram_shop.repo.cart import TelegramShopCartRepo
-from rent_platform.modules.telegram_shop.repo.orders import TelegramShopOrdersRepo
+from rent_platform.modules.telegram_shop.repo.orders import TelegramShopOrdersRepo, TelegramShopOutOfStock
 from rent_platform.modules.telegram_shop.repo.products import ProductsRepo
 from rent_platform.modules.telegram_shop.ui.user_kb import BTN_CLEAR_CART, BTN_CHECKOUT
 
+log = logging.getLogger(__name__)
 
 # -------------------------
 # helpers
@@ -78,14 +84,23 @@ def _cart_item_kb(product_id: int, qty: int, *, cart_message_id: int) -> dict:
     )
 
 
+def _out_of_stock_text(lines: list[dict[str, Any]]) -> str:
+    rows = []
+    for ln in lines:
+        name = _html_escape(str(ln.get("name") or f"#{ln.get('product_id')}"))
+        avail = int(ln.get("available") or 0)
+        have = f"лишилось {avail} шт." if avail > 0 else "немає в наявності"
+        rows.append(f"• <b>{name}</b> — у кошику {int(ln.get('want') or 0)}, {have}")
+    return "⚠️ <b>Не вистачає на складі</b>\n\n" + "\n".join(rows) + "\n\nЗмініть кількість у кошику й оформіть ще раз."
+
+
 async def _render_cart(tenant_id: str, user_id: int) -> tuple[str, list[dict[str, Any]]]:
-    items = await TelegramShopCartRepo.cart_list(tenant_id, user_id)
+    summary = await TelegramShopCartRepo.cart_summary(tenant_id, user_id)
+    items = summary["items"]
 
     if not items:
         return ("🛒 <b>Кошик</b>\n\nПоки що порожньо.", [])
 
-    total_kop = 0
-    saved_kop = 0
     lines: list[str] = []
 
     for it in items:
@@ -95,25 +110,19 @@ async def _render_cart(tenant_id: str, user_id: int) -> tuple[str, list[dict[str
         eff = int(it.get("price_kop") or 0)          # effective unit
         base = int(it.get("base_price_kop") or eff)  # base unit
 
-        eff_total = eff * qty
-        base_total = base * qty
-
-        total_kop += eff_total
-
         if base > eff:
-            saved_kop += (base_total - eff_total)
             lines.append(
                 f"• <b>{name}</b> ×{qty}\n"
-                f"  <s>{_fmt_money(base_total)}</s> → <b>{_fmt_money(eff_total)}</b> 🔥"
+                f"  <s>{_fmt_money(base * qty)}</s> → <b>{_fmt_money(eff * qty)}</b> 🔥"
             )
         else:
-            lines.append(f"• <b>{name}</b> ×{qty} — <b>{_fmt_money(eff_total)}</b>")
+            lines.append(f"• <b>{name}</b> ×{qty} — <b>{_fmt_money(eff * qty)}</b>")
 
     text = "🛒 <b>Кошик</b> ✨\n\n" + "\n".join(lines)
     text += "\n\n" + "──────────────"
-    text += f"\n<b>Разом:</b> {_fmt_money(total_kop)} ✅"
-    if saved_kop > 0:
-        text += f"\n<b>Зекономлено:</b> {_fmt_money(saved_kop)} 🔥"
+    text += f"\n<b>Разом:</b> {_fmt_money(summary['total_kop'])} ✅"
+    if summary["saved_kop"] > 0:
+        text += f"\n<b>Зекономлено:</b> {_fmt_money(summary['saved_kop'])} 🔥"
 
     return (text, items)
 
@@ -146,10 +155,204 @@ async def _edit_cart_message(
     )
 
 
+# -------------------------
+# ➕/➖ write-coalescing
+#
+# Тапи ➕/➖ не пишуть у БД одразу: дельти копляться в RAM на (tenant, user)
+# і через CART_COALESCE_SEC тиші йдуть одним upsert + одним edit карток/кошика.
+# Будь-яке читання кошика (відкрити/оформити/очистити) спершу робить flush.
+#
+# ОБМЕЖЕННЯ: буфер живе в памʼяті одного процесу. Якщо тапи одного юзера можуть
+# потрапити в різні процеси, flush іншого процесу не бачить цих дельт: checkout
+# пропустить тапи останніх CART_COALESCE_SEC, а пізній flush поверне їх у вже
+# оформлений кошик; падіння процесу губить незлиті тапи. Тому буфер вмикається
+# лише з settings.CART_TAP_COALESCE (один процес вебхуків), інакше — _cart_tap_now.
+# -------------------------
+CART_COALESCE_SEC = 0.7
+
+# buf[(tenant_id, user_id)] = {"items": {pid: {"base", "qty", "message_id"}}, "chat_id", "cart_message_id", "last", "task"}
+_CART_BUF: dict[tuple[str, int], dict[str, Any]] = {}
+# flush у процесі: нові тапи чекають його, щоб не прочитати старий base
+_CART_FLUSHING: dict[tuple[str, int], asyncio.Event] = {}
+
+
+async def _cart_buffer_tap(
+    bot: Bot,
+    tenant_id: str,
+    user_id: int,
+    chat_id: int,
+    message_id: int,
+    product_id: int,
+    delta: int,
+    *,
+    cart_message_id: int,
+) -> None:
+    key = (str(tenant_id), int(user_id))
+    pid = int(product_id)
+
+    buf = _CART_BUF.get(key)
+    if not buf or pid not in buf["items"]:
+        ev = _CART_FLUSHING.get(key)
+        if ev:
+            await ev.wait()
+        base = await TelegramShopCartRepo.cart_get_qty(tenant_id, user_id, pid)
+
+        buf = _CART_BUF.get(key)
+        if not buf:
+            buf = {"items": {}, "chat_id": int(chat_id), "cart_message_id": 0, "last": time.monotonic()}
+            _CART_BUF[key] = buf
+            # посилання на task тримаємо в buf, щоб GC не прибив його раніше часу
+            buf["task"] = asyncio.create_task(_cart_flush_later(bot, key, buf))
+        buf["items"].setdefault(pid, {"base": base, "qty": base, "message_id": int(message_id)})
+
+    it = buf["items"][pid]
+    # як послідовні cart_inc: кількість не падає нижче 0 на проміжних тапах
+    it["qty"] = max(int(it["qty"]) + int(delta), 0)
+    it["message_id"] = int(message_id)
+    if cart_message_id > 0:
+        buf["cart_message_id"] = int(cart_message_id)
+    buf["last"] = time.monotonic()
+
+
+async def _cart_tap_now(
+    bot: Bot,
+    tenant_id: str,
+    user_id: int,
+    chat_id: int,
+    message_id: int,
+    product_id: int,
+    delta: int,
+    *,
+    cart_message_id: int,
+) -> None:
+    # без буфера: кожен тап — cart_inc + edit (безпечно для кількох процесів)
+    pid = int(product_id)
+    qty = await TelegramShopCartRepo.cart_inc(tenant_id, user_id, pid, int(delta))
+
+    if qty <= 0:
+        try:
+            await bot.delete_message(chat_id, message_id)
+        except Exception:
+            pass
+
+        if cart_message_id > 0:
+            try:
+                await _edit_cart_message(bot, chat_id, cart_message_id, tenant_id, user_id)
+                return
+            except Exception:
+                pass
+
+        await send_cart(bot, chat_id, tenant_id, user_id, extra_text="Позицію видалено 🗑")
+        return
+
+    await _edit_cart_item_card(
+        bot,
+        chat_id,
+        message_id,
+        tenant_id,
+        user_id,
+        pid,
+        cart_message_id=cart_message_id,
+        qty_override=qty,
+    )
+
+    if cart_message_id > 0:
+        try:
+            await _edit_cart_message(bot, chat_id, cart_message_id, tenant_id, user_id)
+        except Exception:
+            pass
+
+
+async def _cart_flush_later(bot: Bot, key: tuple[str, int], buf: dict[str, Any]) -> None:
+    tenant_id, user_id = key
+    try:
+        while True:
+            wait = buf["last"] + CART_COALESCE_SEC - time.monotonic()
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+
+        # вже злито явним flush_cart_buffer (наприклад, checkout)
+        if _CART_BUF.get(key) is not buf:
+            return
+        await flush_cart_buffer(tenant_id, user_id, bot=bot)
+    except Exception:
+        log.exception("cart flush failed tenant=%s user=%s", tenant_id, user_id)
+
+
+async def flush_cart_buffer(tenant_id: str, user_id: int, *, bot: Bot | None = None) -> None:
+    """
+    Злити накопичені тапи ➕/➖ у БД (один upsert).
+    Викликати перед будь-яким читанням кошика, обовʼязково — перед create_order_from_cart.
+    bot != None => ще й оновити картки позицій і повідомлення кошика (по одному edit).
+    """
+    key = (str(tenant_id), int(user_id))
+    buf = _CART_BUF.pop(key, None)
+    if not buf:
+        return
+
+    items: dict[int, dict[str, Any]] = buf["items"]
+    deltas = {pid: int(it["qty"]) - int(it["base"]) for pid, it in items.items()}
+
+    ev = asyncio.Event()
+    _CART_FLUSHING[key] = ev
+    try:
+        qtys = await TelegramShopCartRepo.cart_apply_deltas(tenant_id, user_id, deltas)
+    finally:
+        ev.set()
+        if _CART_FLUSHING.get(key) is ev:
+            _CART_FLUSHING.pop(key, None)
+
+    if bot is None:
+        return
+
+    chat_id = int(buf["chat_id"])
+    cart_message_id = int(buf.get("cart_message_id") or 0)
+    removed = False
+
+    for pid, it in items.items():
+        if deltas[pid] == 0:
+            # картка і так показує base — edit дав би "message is not modified"
+            continue
+        qty = int(qtys.get(pid, it["qty"]))
+        if qty <= 0:
+            removed = True
+            try:
+                await bot.delete_message(chat_id, int(it["message_id"]))
+            except Exception:
+                pass
+            continue
+
+        await _edit_cart_item_card(
+            bot,
+            chat_id,
+            int(it["message_id"]),
+            tenant_id,
+            user_id,
+            pid,
+            cart_message_id=cart_message_id,
+            qty_override=qty,
+        )
+
+    if not any(deltas.values()):
+        return
+
+    if cart_message_id > 0:
+        try:
+            await _edit_cart_message(bot, chat_id, cart_message_id, tenant_id, user_id)
+            return
+        except Exception:
+            pass
+
+    if removed:
+        await send_cart(bot, chat_id, tenant_id, user_id, extra_text="Позицію видалено 🗑")
+
+
 # -------------------------
 # public API
 # -------------------------
 async def send_cart(bot: Bot, chat_id: int, tenant_id: str, user_id: int, *, extra_text: str = "") -> None:
+    await flush_cart_buffer(tenant_id, user_id)
     text, items = await _render_cart(tenant_id, user_id)
 
     if extra_text:
@@ -180,16 +383,24 @@ async def handle_cart_message(
     text: str,
 ) -> bool:
     # На випадок якщо в когось ще лишились старі reply-кнопки
+    if text in (BTN_CLEAR_CART, BTN_CHECKOUT):
+        await flush_cart_buffer(tenant_id, user_id, bot=bot)
+
     if text == BTN_CLEAR_CART:
         await TelegramShopCartRepo.cart_clear(tenant_id, user_id)
         await send_cart(bot, chat_id, tenant_id, user_id, extra_text="Кошик очищено ✅")
         return True
 
     if text == BTN_CHECKOUT:
-        oid = await TelegramShopOrdersRepo.create_order_from_cart(tenant_id, user_id)
+        try:
+            oid = await TelegramShopOrdersRepo.create_order_from_cart(tenant_id, user_id)
+        except TelegramShopOutOfStock as e:
+            await bot.send_message(chat_id, _out_of_stock_text(e.lines), parse_mode="HTML")
+            return True
         if not oid:
             await send_cart(bot, chat_id, tenant_id, user_id, extra_text="Кошик порожній.")
             return True
+        outbox_wake()  # сповіщення адміну (одразу або в дайджесті)
         await bot.send_message(chat_id, f"✅ Замовлення <b>#{oid}</b> створено!", parse_mode="HTML")
         return True
 
@@ -222,6 +433,23 @@ async def handle_cart_callback(
     if action == "noop":
         return True
 
+    if action == "inc" and arg.isdigit() and arg2.lstrip("-").isdigit():
+        tap = _cart_buffer_tap if settings.CART_TAP_COALESCE else _cart_tap_now
+        await tap(
+            bot,
+            tenant_id,
+            user_id,
+            chat_id,
+            message_id,
+            int(arg),
+            int(arg2),
+            cart_message_id=cart_message_id,
+        )
+        return True
+
+    # решта дій читає/змінює кошик — спершу зливаємо відкладені тапи
+    await flush_cart_buffer(tenant_id, user_id, bot=bot)
+
     if action == "back":
         try:
             await bot.delete_message(chat_id, message_id)
@@ -250,7 +478,11 @@ async def handle_cart_callback(
         return True
 
     if action == "checkout":
-        oid = await TelegramShopOrdersRepo.create_order_from_cart(tenant_id, user_id)
+        try:
+            oid = await TelegramShopOrdersRepo.create_order_from_cart(tenant_id, user_id)
+        except TelegramShopOutOfStock as e:
+            await bot.send_message(chat_id, _out_of_stock_text(e.lines), parse_mode="HTML")
+            return True
         if not oid:
             # просто оновимо кошик
             if cart_message_id > 0:
@@ -261,6 +493,7 @@ async def handle_cart_callback(
             await bot.send_message(chat_id, "🛒 Кошик порожній — нічого оформлювати.", parse_mode="HTML")
             return True
 
+        outbox_wake()  # сповіщення адміну (одразу або в дайджесті)
         await bot.send_message(chat_id, f"✅ Замовлення <b>#{oid}</b> створено!", parse_mode="HTML")
 
         # після оформлення cart вже очищений — оновлюємо кошик
@@ -286,46 +519,6 @@ async def handle_cart_callback(
         )
         return True
 
-    if action == "inc" and arg.isdigit() and arg2.lstrip("-").isdigit():
-        pid = int(arg)
-        delta = int(arg2)
-        qty = await TelegramShopCartRepo.cart_inc(tenant_id, user_id, pid, delta)
-
-        if qty <= 0:
-            try:
-                await bot.delete_message(chat_id, message_id)
-            except Exception:
-                pass
-
-            if cart_message_id > 0:
-                try:
-                    await _edit_cart_message(bot, chat_id, cart_message_id, tenant_id, user_id)
-                    return True
-                except Exception:
-                    pass
-
-            await send_cart(bot, chat_id, tenant_id, user_id, extra_text="Позицію видалено 🗑")
-            return True
-
-        await _edit_cart_item_card(
-            bot,
-            chat_id,
-            message_id,
-            tenant_id,
-            user_id,
-            pid,
-            cart_message_id=cart_message_id,
-            qty_override=qty,
-        )
-
-        if cart_message_id > 0:
-            try:
-                await _edit_cart_message(bot, chat_id, cart_message_id, tenant_id, user_id)
-            except Exception:
-                pass
-
-        return True
-
     if action == "del" and arg.isdigit():
         pid = int(arg)
         await TelegramShopCartRepo.cart_delete_item(tenant_id, user_id, pid)
@@ -352,8 +545,8 @@ async def handle_cart_callback(
 # internal: card render/edit
 # -------------------------
 async def _get_cart_item(tenant_id: str, user_id: int, product_id: int) -> dict[str, Any] | None:
-    items = await TelegramShopCartRepo.cart_list(tenant_id, user_id)
-    for it in items:
+    summary = await TelegramShopCartRepo.cart_summary(tenant_id, user_id)
+    for it in summary["items"]:
         if int(it.get("product_id") or 0) == int(product_id):
             return it
     return None
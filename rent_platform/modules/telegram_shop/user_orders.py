@@ -6,6 +6,7 @@ from typing import Any
 from aiogram import Bot
 from aiogram.types import InputMediaPhoto
 
+from rent_platform.modules.telegram_shop.repo.order_events import EV_ARCHIVE, TelegramShopOrderEventsRepo
 from rent_platform.modules.telegram_shop.repo.orders import TelegramShopOrdersRepo
 from rent_platform.modules.telegram_shop.repo.orders_archive import TelegramShopOrdersArchiveRepo
 from rent_platform.modules.telegram_shop.repo.products import ProductsRepo
@@ -16,7 +17,7 @@ from rent_platform.modules.telegram_shop.ui.inline_orders_kb import (
     order_item_back_kb,
     order_history_back_kb,
 )
-from rent_platform.modules.telegram_shop.ui.orders_status import status_label
+from rent_platform.modules.telegram_shop.ui.orders_status import event_label, status_label
 
 
 # =========================
@@ -109,32 +110,6 @@ async def _send_or_edit_product_card(
 # =========================
 # list logic
 # =========================
-async def _load_orders_for_user(tenant_id: str, user_id: int) -> list[dict]:
-    # беремо з запасом, щоб мати пагінацію без зміни репо
-    return await TelegramShopOrdersRepo.list_orders(tenant_id, user_id, limit=200) or []
-
-
-async def _split_orders_by_archive(
-    tenant_id: str,
-    user_id: int,
-    orders: list[dict],
-) -> tuple[list[dict], list[dict]]:
-    """
-    Повертає (active, arch) з ОДНИМ проходом (щоб не робити зайві запити).
-    """
-    active: list[dict] = []
-    arch: list[dict] = []
-
-    for o in orders or []:
-        oid = int(o.get("id") or 0)
-        if oid <= 0:
-            continue
-        is_arch = await TelegramShopOrdersArchiveRepo.is_archived(tenant_id, user_id, oid)
-        (arch if is_arch else active).append(o)
-
-    return active, arch
-
-
 async def send_orders_list(
     bot: Bot,
     chat_id: int,
@@ -149,18 +124,19 @@ async def send_orders_list(
     per_page = 10
     scope = scope if scope in ("active", "arch") else "active"
 
-    all_orders = await _load_orders_for_user(tenant_id, user_id)
-    active, arch = await _split_orders_by_archive(tenant_id, user_id, all_orders)
-
-    scoped = arch if scope == "arch" else active
+    res = await TelegramShopOrdersRepo.list_user_orders_page(
+        tenant_id, user_id, scope=scope, page=page, per_page=per_page
+    )
+    page = int(res["page"])
+    chunk = res["items"]
 
-    total_all = len(all_orders)
-    total_active = len(active)
-    total_arch = len(arch)
+    total_all = int(res["total"])
+    total_active = int(res["active"])
+    total_arch = int(res["arch"])
 
     title = "🗃 *Архів замовлень*" if scope == "arch" else "🧾 *Історія замовлень*"
 
-    if not scoped:
+    if not chunk:
         empty = "Архів порожній." if scope == "arch" else "Поки що порожньо."
         text = (
             f"{title}\n\n"
@@ -176,10 +152,8 @@ async def send_orders_list(
         )
         return
 
-    start = page * per_page
-    chunk = scoped[start : start + per_page]
-    has_prev = page > 0
-    has_next = len(scoped) > start + per_page
+    has_prev = bool(res["has_prev"])
+    has_next = bool(res["has_next"])
 
     # Текст зверху: без "замовлення 5", просто статистика
     text = (
@@ -321,8 +295,8 @@ async def send_order_history(
     message_id: int | None = None,
 ) -> None:
     """
-    Поки що без БД-історії (бо таблиці ще нема) — покажемо зрозумілу “хронологію-мінімум”.
-    Коли додаси таблицю історії — тут просто замінимо на реальні події.
+    Хронологія з telegram_shop_order_events (архів адміна покупцю не показуємо).
+    Для старих замовлень без подій — “хронологія-мінімум”.
     """
     o = await TelegramShopOrdersRepo.get_order(tenant_id, int(order_id))
     if not o:
@@ -349,15 +323,25 @@ async def send_order_history(
     st_raw = str(o.get("status") or "")
     st = status_label(st_raw)
 
-    lines = [
-        "📜 *Історія статусів*",
-        "",
-        f"• `{created}` — *Створено*",
-        f"• `{_fmt_dt(int(o.get('created_ts') or 0))}` — Поточний статус: *{st}*",
-        "",
-        "ℹ️ Далі додамо повну історію (прийнято → упаковано → відправлено → доставлено),",
-        "і зможемо підв’язати події напряму з Нової Пошти.",
+    events = [
+        ev
+        for ev in await TelegramShopOrderEventsRepo.list_for_order(tenant_id, int(order_id))
+        if str(ev.get("kind") or "") != EV_ARCHIVE
     ]
+    if events:
+        lines = ["📜 *Історія статусів*", ""]
+        for ev in events:
+            lines.append(
+                f"• `{_fmt_dt(int(ev.get('ts') or 0))}` — "
+                f"*{event_label(str(ev.get('kind') or ''), ev.get('new_value'))}*"
+            )
+    else:
+        lines = [
+            "📜 *Історія статусів*",
+            "",
+            f"• `{created}` — *Створено*",
+            f"• Поточний статус: *{st}*",
+        ]
 
     await _send_or_edit_text(
         bot,
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+from rent_platform.db.session import db_fetch_all
+from rent_platform.modules.telegram_shop.repo.products import ProductsRepo
+
+# скільки перших активних товарів прогріваємо (фото/обкладинки)
+WARM_PRODUCTS_LIMIT = 30
+
+
+async def list_active_tenants(since_ts: int, limit: int) -> list[tuple[str, int]]:
+    """
+    Активність магазину = замовлення + рухи кошиків з since_ts.
+    -> [(tenant_id, score), ...] за спаданням.
+    """
+    q = """
+    SELECT tenant_id, COUNT(*) AS score
+    FROM (
+        SELECT tenant_id FROM telegram_shop_orders WHERE created_ts >= :since
+        UNION ALL
+        SELECT tenant_id FROM telegram_shop_cart_items WHERE updated_ts >= :since
+    ) x
+    GROUP BY tenant_id
+    ORDER BY score DESC
+    LIMIT :lim
+    """
+    rows = await db_fetch_all(q, {"since": int(since_ts), "lim": int(limit)}) or []
+    return [(str(r["tenant_id"]), int(r.get("score") or 0)) for r in rows]
+
+
+async def warm_tenant_cache(tenant_id: str) -> None:
+    """
+    Прогрів: клави категорій (каталог / акції / хіти) + фото перших товарів.
+    """
+    # локальний імпорт: router тягне весь модуль магазину
+    from rent_platform.modules.telegram_shop.router import warm_catalog_cache
+
+    await warm_catalog_cache(tenant_id)
+
+    items = await ProductsRepo.list_active(tenant_id, limit=WARM_PRODUCTS_LIMIT)
+    await ProductsRepo.list_photo_file_ids_for_products(tenant_id, [int(p["id"]) for p in items])
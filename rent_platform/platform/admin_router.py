@@ -9,6 +9,7 @@ from fastapi import APIRouter, Header, HTTPException
 from rent_platform.config import settings
 from rent_platform.db.session import db_fetch_one, db_fetch_all, db_execute
 from rent_platform.db.repo import LedgerRepo, AccountRepo
+from rent_platform.platform import storage as platform_storage
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -370,12 +371,8 @@ async def admin_set_tenant_rate(
     except Exception:
         raise HTTPException(status_code=400, detail="Bad rate_per_min_kop")
 
-    q = """
-    UPDATE tenants
-    SET rate_per_min_kop = :r
-    WHERE id = :id
-    """
-    await db_execute(q, {"r": rpm_int, "id": str(tenant_id)})
+    # через storage: той самий шлях, що й у кабінеті (прогноз / кеш маршруту)
+    await platform_storage.admin_set_tenant_rate(str(tenant_id), rpm_int)
     return {"ok": True, "tenant_id": str(tenant_id), "rate_per_min_kop": rpm_int}
 
 
@@ -392,10 +389,5 @@ async def admin_set_tenant_product(
     pk = payload.get("product_key")
     pk = None if pk is None else str(pk).strip() or None
 
-    q = """
-    UPDATE tenants
-    SET product_key = :pk
-    WHERE id = :id
-    """
-    await db_execute(q, {"pk": pk, "id": str(tenant_id)})
+    await platform_storage.admin_set_tenant_product(str(tenant_id), pk)
     return {"ok": True, "tenant_id": str(tenant_id), "product_key": pk}
\ No newline at end of file
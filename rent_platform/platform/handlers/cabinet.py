@@ -94,6 +94,20 @@ async def render_cabinet(message: Message) -> None:
     else:
         vibe = "🟢 *ONLINE* — _все стабільно_"
 
+    # живий білінг: накопичене з останнього списання + коли пауза при поточній витраті
+    burn_kop = int(data.get("burn_kop_per_min") or 0)
+    live = ""
+    if burn_kop > 0:
+        left = int(data.get("time_to_pause_sec") or 0)
+        d, rem = divmod(left // 60, 1440)
+        h, m = divmod(rem, 60)
+        left_txt = (f"{d} дн " if d else "") + f"{h} год {m:02d} хв"
+        live = (
+            f"\n• Накопичено до списання: *{int(data.get('accrued_kop') or 0) / 100.0:.2f} грн*"
+            f"\n• Витрата: *{burn_kop * 1440 / 100.0:.2f} грн/день*"
+            f"\n• До паузи: *{left_txt}*"
+        )
+
     hint = ""
     if paused_billing:
         hint = (
@@ -115,6 +129,7 @@ async def render_cabinet(message: Message) -> None:
         "💳 *Баланс*\n"
         f"• Основний: *{balance_uah:.2f} грн*\n"
         f"• Для виводу: *{withdraw_uah:.2f} грн*"
+        + live
         + hint
     )
 
@@ -213,6 +228,8 @@ def register_cabinet(router: Router) -> None:
             lines.append(f"• *{b['name']}*  (`{b['id']}`)")
             lines.append(f"  Статус: *{b['status']}*")
             lines.append(f"  Тариф: *{b['rate_per_min_uah']:.2f} грн/хв*  (~*{b['rate_per_day_uah']:.2f} грн/день*)")
+            if b.get("accrued_uah"):
+                lines.append(f"  Накопичено до списання: *{b['accrued_uah']:.2f} грн*")
             if b.get("note"):
                 lines.append(f"  _{b['note']}_")
             lines.append("")
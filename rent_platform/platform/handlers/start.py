@@ -1062,7 +1062,7 @@ async def cb_topup_confirm(call: CallbackQuery) -> None:
         await call.answer("Не знайдено інвойс", show_alert=True)
         return
 
-    # навіть якщо already=True — ми могли auto-resume зробити
+    # auto-resume робиться в тій же транзакції, що й зарахування (already => 0)
     resumed_cnt = int(res.get("resumed_cnt") or 0)
 
     if res.get("already"):
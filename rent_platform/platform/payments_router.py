@@ -7,7 +7,11 @@ from typing import Any
 from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import HTMLResponse, JSONResponse
 
-from rent_platform.db.session import db_fetch_one, db_execute
+from rent_platform.core.tenant_routing import get_route
+from rent_platform.db.session import db_fetch_one, db_execute, db_transaction
+from rent_platform.modules.telegram_shop.outbox import outbox_wake
+from rent_platform.modules.telegram_shop.repo.order_events import EV_PAYMENT, TelegramShopOrderEventsRepo
+from rent_platform.modules.telegram_shop.repo.outbox import TelegramShopOutboxRepo
 from rent_platform.modules.telegram_shop.repo.integrations import TelegramShopIntegrationsRepo
 from rent_platform.modules.telegram_shop.payments.wayforpay import (
     build_purchase_signature,
@@ -181,13 +185,37 @@ async def w4p_callback(tenant_id: str, req: Request):
     # Approved -> paid
     paid = status.lower() == "approved"
 
+    # WayForPay повторює callback: подія/сповіщення — лише коли статус оплати реально змінився
     q = """
     UPDATE telegram_shop_orders
     SET payment_status = :ps,
         paid_ts = :pts
     WHERE tenant_id = :tid AND id = :oid
+      AND payment_status IS DISTINCT FROM :ps
+    RETURNING user_id
     """
-    await db_execute(q, {"tid": tenant_id, "oid": int(order_id), "ps": ("paid" if paid else f"w4p:{status}"), "pts": (int(time.time()) if paid else 0)})
+    ps = "paid" if paid else f"w4p:{status}"
+    route = await get_route(tenant_id) if paid else None
+    owner_id = int(((route or {}).get("tenant") or {}).get("owner_user_id") or 0)
+
+    async with db_transaction() as tx:
+        row = await tx.fetch_one(q, {"tid": tenant_id, "oid": int(order_id), "ps": ps, "pts": (int(time.time()) if paid else 0)})
+        if row:
+            await TelegramShopOrderEventsRepo.add(tx, tenant_id, int(order_id), EV_PAYMENT, new_value=ps)
+            if paid:
+                user_id = int(row.get("user_id") or 0)
+                if user_id > 0:
+                    await TelegramShopOutboxRepo.enqueue(
+                        tx, tenant_id, user_id, f"💳 Оплату замовлення #{int(order_id)} отримано. Дякуємо!",
+                        kind="order_paid", ref_id=int(order_id),
+                    )
+                if owner_id > 0:
+                    await TelegramShopOutboxRepo.enqueue(
+                        tx, tenant_id, owner_id, f"💳 Замовлення #{int(order_id)} оплачено ({amount} грн).",
+                        kind="admin_order_paid", ref_id=int(order_id),
+                    )
+    if row and paid:
+        outbox_wake()
 
     # required accept response (WayForPay retries until correct response) 5
     ts = int(time.time())
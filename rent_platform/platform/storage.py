@@ -9,8 +9,12 @@ from typing import Any
 from aiogram import Bot
 
 from rent_platform.config import settings
+from rent_platform.core.billing_state import get_billing_state
+from rent_platform.core.referral_outbox import ref_outbox_wake
+from rent_platform.core.tenant_routing import invalidate_route
 from rent_platform.db.repo import (
     AccountRepo,
+    BillingForecastRepo,
     InvoiceRepo,
     LedgerRepo,
     ModuleRepo,
@@ -211,36 +215,26 @@ async def buy_product(user_id: int, product_key: str) -> dict[str, Any] | None:
 # ======================================================================
 
 async def get_cabinet(user_id: int) -> dict[str, Any]:
-    now = int(time.time())
-
-    await AccountRepo.ensure(user_id)
-    acc = await AccountRepo.get(user_id)
-    balance_kop = int((acc or {}).get("balance_kop") or 0)
-    withdraw_kop = int((acc or {}).get("withdraw_balance_kop") or 0)
-
-    items = await TenantRepo.list_by_owner(user_id)
+    st = await get_billing_state(user_id)
+    now = int(st["now"])
 
     bots: list[dict[str, Any]] = []
     active_count = 0
-    for it in items:
-        st = (it.get("status") or "active").lower()
-        if st == "active":
+    for it in st["bots"]:
+        if it["status"] == "active":
             active_count += 1
 
-        plan = (it.get("plan_key") or "free")
         paid_until = int(it.get("paid_until_ts") or 0)
-        expired = bool(paid_until and paid_until < now)
-
         bots.append(
             {
                 "id": it["id"],
                 "name": it.get("name") or "Bot",
-                "status": st,
-                "plan_key": plan,
+                "status": it["status"],
+                "plan_key": it.get("plan_key") or "free",
                 "paid_until_ts": paid_until,
                 "paused_reason": it.get("paused_reason"),
                 "product_key": it.get("product_key"),
-                "expired": expired,
+                "expired": bool(paid_until and paid_until < now),
             }
         )
 
@@ -248,9 +242,15 @@ async def get_cabinet(user_id: int) -> dict[str, Any]:
         "now": now,
         "user_id": user_id,
         "active_bots": active_count,
-        "balance_kop": balance_kop,
-        "withdraw_balance_kop": withdraw_kop,
+        "balance_kop": st["balance_kop"],
+        "withdraw_balance_kop": st["withdraw_balance_kop"],
         "bots": bots,
+        # живий стан білінгу (core/billing_state)
+        "burn_kop_per_min": st["burn_kop_per_min"],
+        "accrued_kop": st["accrued_kop"],
+        "projected_balance_kop": st["projected_balance_kop"],
+        "pause_at_ts": st["pause_at_ts"],
+        "time_to_pause_sec": st["time_to_pause_sec"],
     }
 
 
@@ -391,39 +391,28 @@ async def cabinet_get_history(user_id: int, limit: int = 20) -> list[dict]:
 
 
 async def cabinet_get_tariffs(user_id: int) -> dict | None:
-    items = await TenantRepo.list_by_owner(user_id)
-    if not items:
+    st = await get_billing_state(user_id)
+    if not st["bots"]:
         return None
 
     bots_out: list[dict] = []
-    for it in items:
-        st = (it.get("status") or "active").lower()
-        name = it.get("name") or "Bot"
-
-        # rate беремо з tenants.rate_per_min_kop якщо є, інакше — з PRODUCT_CATALOG по product_key
-        rate_per_min_kop = it.get("rate_per_min_kop")
-        if rate_per_min_kop is None:
-            pk = it.get("product_key")
-            meta = PRODUCT_CATALOG.get(pk or "")
-            rpm_uah = float((meta or {}).get("rate_per_min_uah") or 0)
-            rate_per_min_kop = int(rpm_uah * 100)
-        else:
-            rate_per_min_kop = int(rate_per_min_kop)
-
-        rate_per_min_uah = rate_per_min_kop / 100.0
+    for it in st["bots"]:
+        # ефективний тариф: tenants.rate_per_min_kop (override) або PRODUCT_CATALOG по product_key
+        rate_per_min_uah = int(it.get("rate_kop") or 0) / 100.0
         rate_per_day_uah = rate_per_min_uah * 60.0 * 24.0
 
         note = None
-        if st != "active":
+        if it["status"] != "active":
             note = "На паузі тариф не списується."
 
         bots_out.append(
             {
                 "id": it["id"],
-                "name": name,
-                "status": st,
+                "name": it.get("name") or "Bot",
+                "status": it["status"],
                 "rate_per_min_uah": rate_per_min_uah,
                 "rate_per_day_uah": rate_per_day_uah,
+                "accrued_uah": int(it.get("accrued_kop") or 0) / 100.0,
                 "note": note,
             }
         )
@@ -441,6 +430,7 @@ async def admin_set_tenant_rate(tenant_id: str, rate_per_min_kop: int | None) ->
     r = int(rate_per_min_kop or 0)
     q = "UPDATE tenants SET rate_per_min_kop = :r WHERE id = :id"
     await db_execute(q, {"r": r, "id": str(tenant_id)})
+    await BillingForecastRepo.mark_tenant_dirty(tenant_id)
 
 
 async def admin_set_tenant_product(tenant_id: str, product_key: str | None) -> None:
@@ -450,6 +440,8 @@ async def admin_set_tenant_product(tenant_id: str, product_key: str | None) -> N
     pk = None if not (product_key or "").strip() else str(product_key).strip()
     q = "UPDATE tenants SET product_key = :pk WHERE id = :id"
     await db_execute(q, {"pk": pk, "id": str(tenant_id)})
+    invalidate_route(tenant_id)
+    await BillingForecastRepo.mark_tenant_dirty(tenant_id)
 
 # ======================================================================
 # TopUp (інвойси)
@@ -492,135 +484,38 @@ async def confirm_topup_paid_test(user_id: int, invoice_id: int) -> dict | None:
     """
     Тестовий confirm: імітуємо оплату інвойса.
 
-    Гарантії:
+    Гарантії (усе — InvoiceRepo.apply_paid_topup, одна транзакція):
     - no double credit: only the FIRST call can flip invoice pending->paid (UPDATE ... WHERE status='pending')
     - idempotent: all other calls return already=True without changing balance
-    - after credit: auto-resume tenants paused by billing
+    - atomic: paid + balance + ledger + auto-resume + referral event commit together or not at all
+    - referral commission: via ref_commission_outbox (core/referral_outbox), після коміту
     """
     invoice_id = int(invoice_id)
 
-    # 0) Перевіряємо, що інвойс існує і належить юзеру (для UI/статусу)
-    inv = await InvoiceRepo.get_for_owner(user_id, invoice_id)
-    log.info("TOPUP confirm requested: uid=%s invoice_id=%s inv=%s", user_id, invoice_id, inv)
-    if not inv:
+    res = await InvoiceRepo.apply_paid_topup(user_id, invoice_id)
+    log.info("TOPUP confirm: uid=%s invoice_id=%s res=%s", user_id, invoice_id, res)
+    if not res:
         return None
 
-    # helper: збирає баланс + пробує auto-resume + список paused billing
-    async def _build_already_response(status: str) -> dict:
-        await AccountRepo.ensure(user_id)
-        acc = await AccountRepo.get(user_id)
-        balance_kop = int((acc or {}).get("balance_kop") or 0)
-
-        resumed_cnt = 0
-        try:
-            resumed_cnt = int(await TenantRepo.system_resume_all_billing_for_owner(user_id) or 0)
-        except Exception:
-            resumed_cnt = 0
-
-        bots = await TenantRepo.list_by_owner(user_id)
-        paused_billing_ids: list[str] = []
-        for b in bots or []:
-            st = (b.get("status") or "").lower()
-            reason = (b.get("paused_reason") or "").lower()
-            if st == "paused" and reason == "billing":
-                paused_billing_ids.append(b["id"])
-
+    if not res["applied"]:
+        # вже paid / canceled / не pending — НІЧОГО не донараховуємо
         return {
             "already": True,
-            "status": (status or "").lower(),
-            "new_balance_kop": balance_kop,
+            "status": res["status"],
+            "new_balance_kop": res["balance_kop"],
             "amount_kop": 0,
-            "resumed_cnt": resumed_cnt,
-            "paused_billing_ids": paused_billing_ids,
+            "resumed_cnt": 0,
+            "paused_billing_ids": res["paused_billing_ids"],
         }
 
-    # 1) Швидка ідемпотентність по ledger (дешево і корисно)
-    #    Але це НЕ основний захист (основний — UPDATE pending->paid).
-    try:
-        if await LedgerRepo.has_topup_invoice(user_id, invoice_id):
-            return await _build_already_response((inv.get("status") or "").lower())
-    except Exception:
-        pass
-
-    # 2) ОСНОВНИЙ захист від double credit:
-    #    намагаємось атомарно pending -> paid.
-    q = """
-    UPDATE billing_invoices
-    SET status = 'paid',
-        paid_ts = :ts
-    WHERE id = :id
-      AND owner_user_id = :uid
-      AND status = 'pending'
-    RETURNING id, owner_user_id, provider, amount_kop, status
-    """
-    paid_row = await db_fetch_one(q, {"id": invoice_id, "uid": int(user_id), "ts": int(time.time())})
-
-    if not paid_row:
-        # або вже paid / canceled / не pending — НІЧОГО не донараховуємо
-        return await _build_already_response((inv.get("status") or "").lower())
-
-    amount_kop = int(paid_row.get("amount_kop") or 0)
-    provider = paid_row.get("provider") or inv.get("provider")
-    if amount_kop <= 0:
-        # дуже дивно, але безпечніше не нараховувати
-        return await _build_already_response("paid")
-
-    # 3) Зарахування балансу (після того як інвойс вже "зафіксовано" як paid)
-    await AccountRepo.add_balance(user_id, +amount_kop)
-
-    # 4) Ledger topup (тепер уже точно один раз)
-    try:
-        await LedgerRepo.add(
-            user_id,
-            "topup",
-            +amount_kop,
-            tenant_id=None,
-            meta={"invoice_id": invoice_id, "provider": provider},
-        )
-    except Exception:
-        # якщо ledger впав — баланс вже поповнений.
-        # для MVP ок, але в логах хай буде видно
-        log.exception("Ledger topup insert failed: uid=%s invoice_id=%s", user_id, invoice_id)
-
-    # 5) Рефералка (не ламає топап)
-    try:
-        await ReferralRepo.apply_commission(
-            user_id=user_id,
-            kind="topup",
-            amount_kop=amount_kop,
-            event_key=f"topup:{invoice_id}",
-            title="Партнерка з поповнення",
-            details=f"invoice_id={invoice_id}, provider={provider}",
-        )
-    except Exception:
-        log.exception("Referral commission failed for topup invoice_id=%s uid=%s", invoice_id, user_id)
-
-    # 6) Auto-resume після поповнення
-    resumed_cnt = 0
-    try:
-        resumed_cnt = int(await TenantRepo.system_resume_all_billing_for_owner(user_id) or 0)
-    except Exception:
-        resumed_cnt = 0
-
-    # 7) Повертаємо баланс і список тих, хто ще на billing pause
-    await AccountRepo.ensure(user_id)
-    acc = await AccountRepo.get(user_id)
-    new_balance = int((acc or {}).get("balance_kop") or 0)
-
-    bots = await TenantRepo.list_by_owner(user_id)
-    paused_billing_ids: list[str] = []
-    for b in bots or []:
-        st = (b.get("status") or "").lower()
-        reason = (b.get("paused_reason") or "").lower()
-        if st == "paused" and reason == "billing":
-            paused_billing_ids.append(b["id"])
-
+    ref_outbox_wake()
     return {
         "ok": True,
-        "new_balance_kop": new_balance,
-        "amount_kop": amount_kop,
-        "resumed_cnt": resumed_cnt,
-        "paused_billing_ids": paused_billing_ids,
+        "new_balance_kop": res["balance_kop"],
+        "amount_kop": res["amount_kop"],
+        "resumed_cnt": len(res["resumed_ids"]),
+        "resumed_ids": res["resumed_ids"],
+        "paused_billing_ids": res["paused_billing_ids"],
     }
 
 
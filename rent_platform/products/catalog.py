@@ -15,7 +15,33 @@ PRODUCT_CATALOG: Dict[str, Dict[str, Any]] = {
         "rate_per_min_uah": 0.02,
         "module_key": "telegram_shop",
         "handler": "rent_platform.modules.telegram_shop.router:handle_update",
+        # startup warm-up (опційно): хто активний + як прогріти кеш tenant-а
+        "warmup_activity": "rent_platform.modules.telegram_shop.warmup:list_active_tenants",
+        "warmup": "rent_platform.modules.telegram_shop.warmup:warm_tenant_cache",
     },
 
     # ❌ СТАРИЙ luna_shop — прибрали з каталогу повністю
-}
\ No newline at end of file
+}
+
+
+def product_rate_kop(product_key: str) -> int:
+    """Тариф продукту, коп/хв (rate_per_min_kop або старий rate_per_min_uah)."""
+    meta = PRODUCT_CATALOG.get(product_key) or {}
+
+    # 1) новий формат: int коп/хв
+    if meta.get("rate_per_min_kop") is not None:
+        try:
+            return max(0, int(meta.get("rate_per_min_kop") or 0))
+        except Exception:
+            return 0
+
+    # 2) старий формат: float грн/хв -> коп/хв
+    try:
+        uah = float(meta.get("rate_per_min_uah", 0) or 0)
+    except Exception:
+        uah = 0.0
+    return max(0, int(round(uah * 100)))
+
+
+def catalog_rates_kop() -> Dict[str, int]:
+    return {str(k): product_rate_kop(str(k)) for k in PRODUCT_CATALOG.keys()}